@@ -0,0 +1,184 @@
+"""
+Live side-by-side arena view for the CLI
+
+Each provider gets a lane that records when its request started, when the
+first token arrived and when the stream ended, so the arena doubles as a
+latency benchmark: time to first token, decode speed (tokens per second after
+the first token) and total latency are shown while the answers stream in.
+
+Answers are shown a page at a time, as many columns as fit the terminal.
+While streaming, pages rotate every PAGE_SECONDS and each column shows the
+tail of its answer; the final view prints every page in full.
+"""
+import textwrap
+import time
+from typing import Dict, List, Optional
+
+from rich.console import Group
+from rich.table import Table
+from rich.text import Text
+
+from cascade import estimate_tokens
+
+# Narrowest useful answer column; decides how many providers fit on a page
+COLUMN_WIDTH = 40
+PAGE_SECONDS = 3.0
+
+
+class ArenaLane:
+    """One provider's stream and its timings (time.perf_counter() seconds)"""
+
+    def __init__(self, provider: str, started: float):
+        self.provider = provider
+        self.started = started
+        self.first_token: Optional[float] = None
+        self.last_token: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.stopped = False
+        self.chunks: List[str] = []
+
+    def add(self, chunk: str, at: float):
+        if self.first_token is None:
+            self.first_token = at
+        self.last_token = at
+        self.chunks.append(chunk)
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.chunks)
+
+    @property
+    def failed(self) -> bool:
+        return self.text.startswith('Error')
+
+    @property
+    def status(self) -> str:
+        if self.finished is not None:
+            if self.failed:
+                return 'error'
+            if self.stopped:
+                return 'stopped'
+            return 'done' if self.chunks else 'no reply'
+        return 'streaming' if self.first_token is not None else 'waiting'
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.text) if self.chunks else 0
+
+    @property
+    def ttft_ms(self) -> Optional[float]:
+        return (self.first_token - self.started) * 1000 if self.first_token is not None else None
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """Decode speed after the first token; None until there are two chunks to time"""
+        if len(self.chunks) < 2 or self.last_token <= self.first_token:
+            return None
+        return self.tokens / (self.last_token - self.first_token)
+
+    def latency_ms(self, now: Optional[float] = None) -> float:
+        if self.finished is not None:
+            now = self.finished
+        elif now is None:
+            now = time.perf_counter()
+        return (now - self.started) * 1000
+
+
+class ArenaView:
+    """Rich renderables for an arena run, fed with arena_stream events"""
+
+    def __init__(self, message: str, providers: List[str], started: Optional[float] = None):
+        started = started if started is not None else time.perf_counter()
+        self.message = message
+        self.lanes: Dict[str, ArenaLane] = {p: ArenaLane(p, started) for p in providers}
+
+    def feed(self, provider: str, chunk: Optional[str], at: float):
+        """Record an arena_stream event; a None chunk ends the provider's stream"""
+        lane = self.lanes[provider]
+        if chunk is None:
+            lane.finished = at
+        else:
+            lane.add(chunk, at)
+
+    def stop(self):
+        """Mark the streams still running as stopped by the user"""
+        for lane in self.lanes.values():
+            if lane.finished is None:
+                lane.stopped = True
+
+    @property
+    def done(self) -> bool:
+        return all(lane.finished is not None for lane in self.lanes.values())
+
+    def pages(self, width: int) -> List[List[str]]:
+        per_page = max(1, width // COLUMN_WIDTH)
+        providers = list(self.lanes)
+        return [providers[i:i + per_page] for i in range(0, len(providers), per_page)]
+
+    def stats_table(self, now: Optional[float] = None) -> Table:
+        """Timings for every provider, fastest time to first token and latency in bold"""
+        lanes = list(self.lanes.values())
+        finished = [lane for lane in lanes if lane.status == 'done']
+        best_ttft = min((lane.ttft_ms for lane in finished), default=None)
+        best_latency = min((lane.latency_ms() for lane in finished), default=None)
+
+        table = Table(title=f"Arena: {self.message}", show_header=True, header_style="bold magenta")
+        table.add_column("Provider", style="cyan")
+        table.add_column("Status")
+        table.add_column("TTFT", justify="right")
+        table.add_column("Tok/s", justify="right")
+        table.add_column("Tokens", justify="right")
+        table.add_column("Latency", justify="right")
+        for lane in lanes:
+            ttft, latency = lane.ttft_ms, lane.latency_ms(now)
+            table.add_row(
+                lane.provider,
+                Text(lane.status, style={'done': 'green', 'error': 'red'}.get(lane.status, 'yellow')),
+                Text(f"{ttft:.0f} ms" if ttft is not None else "-",
+                     style="bold green" if lane in finished and ttft == best_ttft else ""),
+                f"{lane.tokens_per_second:.1f}" if lane.tokens_per_second is not None else "-",
+                str(lane.tokens),
+                Text(f"{latency / 1000:.2f} s",
+                     style="bold green" if lane in finished and latency == best_latency else ""),
+            )
+        return table
+
+    def page_table(self, providers: List[str], width: int, title: str = '',
+                   max_lines: Optional[int] = None) -> Table:
+        """Answers side by side; with max_lines, only the tail of each answer"""
+        table = Table(title=title or None, show_header=True, header_style="bold magenta", show_lines=True,
+                      expand=True)
+        for provider in providers:
+            table.add_column(provider.upper(), style="red" if self.lanes[provider].failed else "cyan",
+                             overflow="fold", ratio=1)
+        column_width = max(10, width // len(providers) - 4)
+        table.add_row(*[_tail(self.lanes[p].text, column_width, max_lines) for p in providers])
+        return table
+
+    def render(self, width: int, height: int, now: Optional[float] = None) -> Group:
+        """The live frame: all timings, then the current page of answers"""
+        now = now if now is not None else time.perf_counter()
+        pages = self.pages(width)
+        index = int(now / PAGE_SECONDS) % len(pages) if pages else 0
+        title = f"Page {index + 1}/{len(pages)}" if len(pages) > 1 else ''
+        # Header, borders and the timing table take the rest of the screen
+        max_lines = max(3, height - len(self.lanes) - 12)
+        answers = self.page_table(pages[index], width, title, max_lines) if pages else Text('')
+        return Group(self.stats_table(now), answers)
+
+    def final(self, width: int) -> List:
+        """Everything to print once the run ends: timings and every page in full"""
+        pages = self.pages(width)
+        return [self.stats_table()] + [
+            self.page_table(page, width, f"Page {i + 1}/{len(pages)}" if len(pages) > 1 else '')
+            for i, page in enumerate(pages)
+        ]
+
+
+def _tail(text: str, width: int, max_lines: Optional[int]) -> str:
+    if max_lines is None:
+        return text or "…"
+    lines = [line for paragraph in text.splitlines() for line in (textwrap.wrap(paragraph, width) or [''])]
+    if len(lines) > max_lines:
+        lines = ['…'] + lines[-(max_lines - 1):]
+    return '\n'.join(lines) or "…"
@@ -0,0 +1,177 @@
+"""
+Background jobs for the interactive CLI
+
+Image, video and arena requests can take from seconds to minutes. The CLI
+starts them here and returns to the prompt at once: each job runs its blocking
+work on a daemon thread while the asyncio loop keeps reading input. A job
+reports progress by setting `job.progress`, which the status bar shows, and
+checks `job.cancel` between steps. When a job ends, the manager calls
+`announce(job)` on the loop so the result is printed above the prompt.
+
+Threads cannot be killed, so `/cancel` cancels the token and stops waiting for
+the job at once. Jobs pass the token on: a video job cancels its prediction
+upstream, and an image job skips the requests it has not sent yet.
+"""
+import asyncio
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from cancellation import CancelToken
+
+
+async def run_in_thread(fn: Callable[[], Any]) -> Any:
+    """
+    Await fn() run on its own daemon thread
+
+    Unlike asyncio.to_thread this does not use the loop's default executor, so
+    a few long video jobs can never starve chat turns of worker threads, and
+    an abandoned job does not keep the interpreter from exiting.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(value=None, error=None):
+        if future.done():
+            return  # cancelled while the thread was still running
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def worker():
+        try:
+            value = fn()
+        except BaseException as e:
+            loop.call_soon_threadsafe(settle, None, e)
+        else:
+            loop.call_soon_threadsafe(settle, value)
+
+    threading.Thread(target=worker, name='cli-job', daemon=True).start()
+    return await future
+
+
+class BackgroundJob:
+    """One running or finished background job"""
+
+    def __init__(self, job_id: int, kind: str, label: str):
+        self.id = job_id
+        self.kind = kind
+        self.label = label
+        self.status = 'running'
+        self.progress = ''
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.cancel = CancelToken()
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self.status == 'running'
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'id': self.id, 'kind': self.kind, 'label': self.label, 'status': self.status,
+                'progress': self.progress, 'elapsed': round(self.elapsed, 1), 'error': self.error}
+
+
+class JobManager:
+    """Starts, lists and cancels background jobs on the running asyncio loop"""
+
+    def __init__(self, announce: Callable[[BackgroundJob], None], keep_finished: int = 20):
+        """
+        Args:
+            announce: Called on the loop with each job once it has finished, failed or been cancelled
+            keep_finished: How many finished jobs /jobs keeps listing
+        """
+        self.announce = announce
+        self.keep_finished = keep_finished
+        self._jobs: Dict[int, BackgroundJob] = {}
+        self._ids = itertools.count(1)
+
+    def start(self, kind: str, label: str, work: Callable[[BackgroundJob], Any]) -> BackgroundJob:
+        """
+        Run work(job) on a background thread; must be called from the loop
+
+        Args:
+            kind: Short job type shown in the status bar ('image', 'video', 'arena')
+            label: What the job is for, usually the prompt
+            work: Blocking function; it may update job.progress and should stop once job.cancel is cancelled
+
+        Returns:
+            The job, already running
+        """
+        job = BackgroundJob(next(self._ids), kind, label)
+        self._jobs[job.id] = job
+        job.task = asyncio.get_running_loop().create_task(self._run(job, work))
+        self._prune()
+        return job
+
+    async def _run(self, job: BackgroundJob, work: Callable[[BackgroundJob], Any]):
+        loop = asyncio.get_running_loop()
+        abandoned = loop.create_future()
+        job.cancel.on_cancel(lambda: loop.call_soon_threadsafe(_settle, abandoned))
+        thread = asyncio.ensure_future(run_in_thread(lambda: work(job)))
+        try:
+            await asyncio.wait({thread, abandoned}, return_when=asyncio.FIRST_COMPLETED)
+            if job.cancel.cancelled:
+                thread.cancel()  # stop waiting; the thread ends when it next checks the token
+                job.status = 'cancelled'
+            else:
+                job.result = thread.result()
+                job.status = 'done'
+        except Exception as e:
+            job.status, job.error = 'failed', str(e)
+        finally:
+            job.finished = time.monotonic()
+        self.announce(job)
+
+    def get(self, job_id: int) -> Optional[BackgroundJob]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[BackgroundJob]:
+        return list(self._jobs.values())
+
+    def running(self) -> List[BackgroundJob]:
+        return [job for job in self._jobs.values() if job.running]
+
+    def cancel(self, job_id: int) -> bool:
+        """Cancel a running job; False if there is no such job or it has already ended"""
+        job = self._jobs.get(job_id)
+        if job is None or not job.running:
+            return False
+        return job.cancel.cancel('cancelled')
+
+    def cancel_all(self) -> int:
+        """Cancel every running job and return how many there were"""
+        return sum(self.cancel(job.id) for job in self.running())
+
+    def status_line(self, width: int = 28) -> str:
+        """One line for the status bar: each running job's id, kind, progress and elapsed time"""
+        parts = []
+        for job in self.running():
+            label = job.label if len(job.label) <= width else job.label[:width - 1] + '…'
+            progress = f" {job.progress}" if job.progress else ''
+            parts.append(f"#{job.id} {job.kind} '{label}'{progress} {format_elapsed(job.elapsed)}")
+        return ' │ '.join(parts)
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if not job.running]
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job.id]
+
+
+def _settle(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+def format_elapsed(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
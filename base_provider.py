@@ -1,8 +1,17 @@
 """
 Base AI Provider interface
 """
+import threading
+import time
+import uuid
 from abc import ABC, abstractmethod
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator, List, Callable, Set
+
+from config import Config
+from singleflight import SingleFlight
+
+# Seconds before a failed model list fetch is tried again (the previous list stays in use meanwhile)
+MODELS_RETRY_SECONDS = 60.0
 
 
 class AIProvider(ABC):
@@ -10,6 +19,10 @@ class AIProvider(ABC):
     
     def __init__(self, api_key: str):
         self.api_key = api_key
+        self._models: Optional[Set[str]] = None
+        self._models_expire = 0.0
+        self._models_lock = threading.RLock()
+        self._models_flight = SingleFlight()
     
     @abstractmethod
     def generate_text(self, prompt: str, **kwargs) -> str:
@@ -20,6 +33,74 @@ class AIProvider(ABC):
     def chat(self, messages: list, **kwargs) -> str:
         """Chat with the AI model using conversation history"""
         pass
+    
+    def stream_text(self, prompt: str, **kwargs) -> Iterator[str]:
+        """
+        Stream a text response in chunks (providers without streaming yield once)
+        
+        Streaming providers honour a `cancel` CancelToken in kwargs by aborting the request.
+        """
+        yield self.generate_text(prompt, **kwargs)
+    
+    def stream_chat(self, messages: list, **kwargs) -> Iterator[str]:
+        """Stream a chat response in chunks (providers without streaming yield once)"""
+        yield self.chat(messages, **kwargs)
+    
+    def list_models(self) -> Optional[List[str]]:
+        """Fetch the names of the models the provider offers (None if it cannot tell); may raise"""
+        return None
+    
+    def remember_models(self, models: Optional[List[str]]):
+        """Cache a fetched model list for MODELS_CACHE_TTL seconds"""
+        with self._models_lock:
+            # Some compatible servers list nothing; treat that as unknown rather than "no models"
+            self._models = set(models) if models else None
+            self._models_expire = time.monotonic() + Config.MODELS_CACHE_TTL
+    
+    def allowed_models(self) -> Optional[Set[str]]:
+        """
+        The models the provider offers, from the cache or fetched once it expires
+        
+        Concurrent callers share one fetch, made without holding the lock, so a
+        slow models endpoint only delays the callers that need the new list.
+        If the fetch fails, the previous list (or None, meaning unknown) is
+        used until MODELS_RETRY_SECONDS pass.
+        """
+        with self._models_lock:
+            if time.monotonic() < self._models_expire:
+                return self._models
+        self._models_flight.do('models', self._refresh_models)
+        with self._models_lock:
+            return self._models
+    
+    def _refresh_models(self):
+        try:
+            models = self.list_models()
+        except Exception:
+            with self._models_lock:
+                self._models_expire = time.monotonic() + MODELS_RETRY_SECONDS
+            return
+        self.remember_models(models)
+    
+    def check_model(self, model: str) -> Optional[str]:
+        """An error message if the provider is known not to offer the model, else None"""
+        models = self.allowed_models()
+        if models is None or model in models:
+            return None
+        shown = ', '.join(sorted(models)[:10]) + (', ...' if len(models) > 10 else '')
+        return f"Error: model '{model}' is not available from {type(self).__name__} (available: {shown})"
+    
+    def probe(self) -> Optional[str]:
+        """
+        Cheap health check: credentials, connectivity and model, without generating anything
+        
+        Also warms the provider up (imports, pooled connection, model lookup),
+        so the first real request takes the fast path.
+        
+        Returns:
+            None when healthy, otherwise an error message
+        """
+        return None
 
 
 class ImageGenerator(ABC):
@@ -32,6 +113,79 @@ class ImageGenerator(ABC):
     def generate_image(self, prompt: str, **kwargs) -> str:
         """Generate an image and return the file path"""
         pass
+    
+    def generate_images(self, prompts: List[str], n: int = 1, **kwargs) -> Iterator[Dict]:
+        """
+        Generate n images per prompt, yielding {'prompt', 'index', 'filepath' or 'error'} as each finishes
+        
+        Images not yet started when the `cancel` token fires are skipped (reported as errors).
+        """
+        cancel = kwargs.get('cancel')
+        for prompt in prompts:
+            for index in range(n):
+                if cancel is not None and cancel.cancelled:
+                    yield {'prompt': prompt, 'index': index, 'error': "Error generating image: cancelled"}
+                    continue
+                result = self.generate_image(prompt, **kwargs)
+                key = 'error' if result.startswith('Error') else 'filepath'
+                yield {'prompt': prompt, 'index': index, key: result}
+
+
+class VideoJob:
+    """Handle for a video that may still be generating"""
+    
+    def __init__(self, prompt: str, job_id: Optional[str] = None,
+                 canceller: Optional[Callable[[], bool]] = None):
+        """
+        Args:
+            prompt: Description of the video
+            job_id: The upstream prediction id, if there is one
+            canceller: Stops the upstream work; returns False if it can no longer be stopped
+        """
+        self.id = job_id or uuid.uuid4().hex
+        self.prompt = prompt
+        self.status = 'starting'
+        self.filepath: Optional[str] = None
+        self.error: Optional[str] = None
+        self.assets: Dict[str, str] = {}  # derived files such as 'poster' and 'hls'
+        self._done = threading.Event()
+        self._callbacks: List[Callable[['VideoJob'], None]] = []
+        self._canceller = canceller
+    
+    def cancel(self, error: str = "Error generating video: cancelled") -> bool:
+        """Stop the job and its upstream work, finishing it with `error`; False if that is not possible"""
+        if self.done() or self._canceller is None or not self._canceller():
+            return False
+        self.finish(error=error)
+        return True
+    
+    def finish(self, filepath: Optional[str] = None, error: Optional[str] = None):
+        self.filepath = filepath
+        self.error = error
+        self.status = 'failed' if error else 'succeeded'
+        self._done.set()
+        for callback in self._callbacks:
+            callback(self)
+    
+    def add_done_callback(self, callback: Callable[['VideoJob'], None]):
+        """Call `callback(job)` when the job finishes (immediately if it already has)"""
+        self._callbacks.append(callback)
+        if self.done():
+            callback(self)
+    
+    def done(self) -> bool:
+        return self._done.is_set()
+    
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+    
+    def result(self) -> str:
+        """The file path, or an error message like generate_video returns"""
+        return self.filepath or self.error or "Error generating video: still running"
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {'id': self.id, 'prompt': self.prompt, 'status': self.status,
+                'filepath': self.filepath, 'error': self.error, 'assets': dict(self.assets)}
 
 
 class VideoGenerator(ABC):
@@ -44,3 +198,13 @@ class VideoGenerator(ABC):
     def generate_video(self, prompt: str, **kwargs) -> str:
         """Generate a video and return the file path"""
         pass
+    
+    def submit_video(self, prompt: str, **kwargs) -> VideoJob:
+        """Start generating a video and return a handle (generators without async support finish first)"""
+        job = VideoJob(prompt)
+        result = self.generate_video(prompt, **kwargs)
+        if result.startswith('Error'):
+            job.finish(error=result)
+        else:
+            job.finish(filepath=result)
+        return job
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Local mock server for benchmarking without real API keys
+
+Speaks enough of the OpenAI chat-completions protocol (including SSE
+streaming), the OpenAI images and models APIs and the Gemini generateContent
+and model REST APIs for the providers in this project to run against it
+unchanged.
+
+With prefill_ms_per_1k set, chat completions also pay a prompt-processing cost
+for every character not covered by a previously seen message prefix, the way
+upstream prompt caches behave, so prefix reuse shows up in time to first token.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+         "tempor incididunt ut labore et dolore magna aliqua").split()
+
+# 1x1 transparent PNG served for image generation requests
+PIXEL_PNG = bytes.fromhex(
+    '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+    '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082'
+)
+
+
+class MockSettings:
+    """Behaviour knobs for the mock server"""
+
+    def __init__(self, latency_ms: float = 50.0, jitter_ms: float = 10.0,
+                 tokens: int = 40, token_delay_ms: float = 2.0,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 1.0, seed: Optional[int] = None,
+                 prefill_ms_per_1k: float = 0.0, prefix_cache: bool = True):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tokens = tokens
+        self.token_delay_ms = token_delay_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.prefill_ms_per_1k = prefill_ms_per_1k
+        self.prefix_cache = prefix_cache
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def roll(self) -> float:
+        with self.lock:
+            return self.random.random()
+
+    def delay(self) -> float:
+        """Time to first byte in seconds"""
+        with self.lock:
+            jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, self.latency_ms + jitter) / 1000.0
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Request handler; settings and counters live on the server object"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        return json.loads(body or b'{}')
+
+    def _send_json(self, status: int, payload, headers: Optional[dict] = None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_sse(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+    def _sse(self, payload):
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        self.wfile.write(f"data: {data}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def _inject_failure(self) -> bool:
+        """Emulate upstream 429s and 5xx errors; returns True if a failure was sent"""
+        settings = self.server.settings
+        roll = settings.roll()
+        if roll < settings.rate_limit_rate:
+            self.server.count('rate_limited')
+            self._send_json(429, {'error': {'message': 'Rate limit exceeded', 'type': 'rate_limit_error'}},
+                            {'Retry-After': str(settings.retry_after)})
+            return True
+        if roll < settings.rate_limit_rate + settings.error_rate:
+            self.server.count('errors')
+            self._send_json(500, {'error': {'message': 'Mock upstream failure', 'type': 'server_error'}})
+            return True
+        return False
+
+    def _prefill(self, messages: list) -> int:
+        """Sleep for the uncached part of the prompt; returns the cached character count"""
+        settings = self.server.settings
+        if not settings.prefill_ms_per_1k:
+            return 0
+        # Caches match on exact bytes at message boundaries
+        blobs = [json.dumps(m, separators=(',', ':')).encode('utf-8') for m in messages]
+        digest = hashlib.sha256()
+        keys, offsets, total = [], [], 0
+        for blob in blobs:
+            digest.update(blob)
+            total += len(blob)
+            keys.append(digest.hexdigest())
+            offsets.append(total)
+        cached = 0
+        if settings.prefix_cache:
+            for key, offset in zip(keys, offsets):
+                if not self.server.seen_prefix(key):
+                    break
+                cached = offset
+            self.server.remember_prefixes(keys)
+        time.sleep(settings.prefill_ms_per_1k * (total - cached) / 1000.0 / 1000.0)
+        self.server.count('cached_prompt_chars', cached)
+        return cached
+
+    def _reply_tokens(self, prompt: str, max_tokens: Optional[int]):
+        count = self.server.settings.tokens
+        if max_tokens:
+            count = min(count, int(max_tokens))
+        words = [WORDS[(len(prompt) + i) % len(WORDS)] for i in range(count)]
+        return [w if i == 0 else ' ' + w for i, w in enumerate(words)]
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.endswith('/models') and path.startswith('/v1beta'):
+            # Gemini model list (genai.list_models)
+            self._send_json(200, {'models': [
+                {'name': f"models/{model}", 'baseModelId': model, 'version': '001', 'displayName': model,
+                 'inputTokenLimit': 30720, 'outputTokenLimit': 2048,
+                 'supportedGenerationMethods': ['generateContent']}
+                for model in ('gemini-pro', 'gemini-1.5-flash')
+            ]})
+        elif path.endswith('/models'):
+            self._send_json(200, {'object': 'list', 'data': [
+                {'id': model, 'object': 'model', 'owned_by': 'mock'} for model in self.server.models
+            ]})
+        elif '/models/' in path:
+            # Gemini model metadata (genai.get_model)
+            name = path.split('/models/', 1)[1]
+            self._send_json(200, {'name': f"models/{name}", 'baseModelId': name, 'version': '001',
+                                  'displayName': name, 'inputTokenLimit': 30720, 'outputTokenLimit': 2048,
+                                  'supportedGenerationMethods': ['generateContent']})
+        elif path.startswith('/files/'):
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(PIXEL_PNG)))
+            self.end_headers()
+            self.wfile.write(PIXEL_PNG)
+        elif path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': {'message': f'Unknown path {path}'}})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self._read_json()
+        self.server.count('requests')
+
+        if self._inject_failure():
+            return
+        time.sleep(self.server.settings.delay())
+
+        if url.path.endswith('/chat/completions'):
+            self._chat_completions(body)
+        elif url.path.endswith('/images/generations'):
+            self._images(body)
+        elif ':generateContent' in url.path:
+            self._gemini(body, stream=False, query=parse_qs(url.query))
+        elif ':streamGenerateContent' in url.path:
+            self._gemini(body, stream=True, query=parse_qs(url.query))
+        else:
+            self._send_json(404, {'error': {'message': f'Unknown path {url.path}'}})
+
+    def _chat_completions(self, body: dict):
+        messages = body.get('messages') or []
+        prompt = ''.join(str(m.get('content', '')) for m in messages)
+        model = body.get('model', 'mock-model')
+        cached = self._prefill(messages)
+        tokens = self._reply_tokens(prompt, body.get('max_tokens'))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if not body.get('stream'):
+            time.sleep(self.server.settings.token_delay_ms * len(tokens) / 1000.0)
+            self._send_json(200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': created,
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': ''.join(tokens)},
+                    'finish_reason': 'stop',
+                }],
+                'usage': {
+                    'prompt_tokens': len(prompt.split()),
+                    'completion_tokens': len(tokens),
+                    'total_tokens': len(prompt.split()) + len(tokens),
+                    'prompt_tokens_details': {'cached_tokens': cached // 4},
+                },
+            })
+            return
+
+        self._start_sse()
+        for index, token in enumerate(tokens):
+            delta = {'content': token}
+            if index == 0:
+                delta['role'] = 'assistant'
+            try:
+                self._sse({
+                    'id': completion_id,
+                    'object': 'chat.completion.chunk',
+                    'created': created,
+                    'model': model,
+                    'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}],
+                })
+            except (BrokenPipeError, ConnectionResetError):
+                # The client hung up; a real API stops generating (and billing) here
+                self.server.count('aborted_streams')
+                return
+            self.server.count('streamed_tokens')
+            time.sleep(self.server.settings.token_delay_ms / 1000.0)
+        self._sse({
+            'id': completion_id,
+            'object': 'chat.completion.chunk',
+            'created': created,
+            'model': model,
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+        })
+        self._sse('[DONE]')
+
+    def _images(self, body: dict):
+        host, port = self.server.server_address[:2]
+        count = int(body.get('n') or 1)
+        self._send_json(200, {
+            'created': int(time.time()),
+            'data': [{'url': f"http://{host}:{port}/files/{uuid.uuid4().hex}.png"} for _ in range(count)],
+        })
+
+    def _gemini(self, body: dict, stream: bool, query: dict):
+        parts = [p.get('text', '') for c in body.get('contents') or [] for p in c.get('parts') or []]
+        config = body.get('generationConfig') or body.get('generation_config') or {}
+        tokens = self._reply_tokens(''.join(parts), config.get('maxOutputTokens') or config.get('max_output_tokens'))
+
+        def candidate(text, finished):
+            payload = {'content': {'role': 'model', 'parts': [{'text': text}]}, 'index': 0}
+            if finished:
+                payload['finishReason'] = 'STOP'
+            return {'candidates': [payload]}
+
+        if not stream:
+            time.sleep(self.server.settings.token_delay_ms * len(tokens) / 1000.0)
+            self._send_json(200, candidate(''.join(tokens), True))
+            return
+
+        if query.get('alt') == ['sse']:
+            self._start_sse()
+            for index, token in enumerate(tokens):
+                self._sse(candidate(token, index == len(tokens) - 1))
+                time.sleep(self.server.settings.token_delay_ms / 1000.0)
+            return
+
+        # The REST transport reads streaming responses as one JSON array
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        self.wfile.write(b'[')
+        for index, token in enumerate(tokens):
+            if index:
+                self.wfile.write(b',')
+            self.wfile.write(json.dumps(candidate(token, index == len(tokens) - 1)).encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(self.server.settings.token_delay_ms / 1000.0)
+        self.wfile.write(b']')
+
+
+class MockServer(ThreadingHTTPServer):
+    """Threaded mock API server that can run in the background of a benchmark"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, settings: Optional[MockSettings] = None,
+                 models=('gpt-4', 'gpt-4o-mini', 'deepseek-chat', 'grok-beta', 'dall-e-3')):
+        super().__init__((host, port), MockHandler)
+        self.settings = settings or MockSettings()
+        self.models = list(models)
+        self.counters = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'cached_prompt_chars': 0,
+                         'streamed_tokens': 0, 'aborted_streams': 0}
+        self._counter_lock = threading.Lock()
+        self._prefixes = set()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name: str, amount: int = 1):
+        with self._counter_lock:
+            self.counters[name] += amount
+
+    def seen_prefix(self, key: str) -> bool:
+        with self._counter_lock:
+            return key in self._prefixes
+
+    def remember_prefixes(self, keys):
+        with self._counter_lock:
+            self._prefixes.update(keys)
+
+    def start(self) -> 'MockServer':
+        self._thread = threading.Thread(target=self.serve_forever, name='mock-api', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    """Run the mock server in the foreground"""
+    parser = argparse.ArgumentParser(description="Mock OpenAI/Gemini API server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Time to first byte')
+    parser.add_argument('--jitter-ms', type=float, default=10.0)
+    parser.add_argument('--tokens', type=int, default=40, help='Tokens per response')
+    parser.add_argument('--token-delay-ms', type=float, default=2.0, help='Delay between streamed tokens')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failing with 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of requests failing with 429')
+    parser.add_argument('--prefill-ms-per-1k', type=float, default=0.0,
+                        help='Prompt processing time per 1000 uncached prompt characters')
+    parser.add_argument('--no-prefix-cache', action='store_true', help='Disable the emulated prompt cache')
+    args = parser.parse_args()
+
+    settings = MockSettings(args.latency_ms, args.jitter_ms, args.tokens, args.token_delay_ms,
+                            args.error_rate, args.rate_limit_rate,
+                            prefill_ms_per_1k=args.prefill_ms_per_1k, prefix_cache=not args.no_prefix_cache)
+    server = MockServer(args.host, args.port, settings)
+    print(f"Mock API listening on {server.url}")
+    print(f"  OPENAI_BASE_URL={server.url}/v1")
+    print(f"  GEMINI_API_ENDPOINT={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
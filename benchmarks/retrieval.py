@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Retrieval latency at scale for the local document index
+
+Builds an index of synthetic chunks (clustered random vectors, so the
+inverted lists behave like real topics do), reopens it the way a starting
+process does, and times searches against it. Reports the open time, the
+search latency percentiles with the embedding of the query excluded and
+included, and recall against an exact scan of every vector.
+
+Usage:
+    python -m benchmarks.retrieval --chunks 1000000 --queries 200
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from benchmarks.run import percentile
+from config import Config
+from document_index import DocumentIndex
+
+TOPICS = 2000
+
+
+def synthetic_vectors(count: int, dim: int, seed: int = 7) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((TOPICS, dim), dtype=np.float32)
+    vectors = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, 100_000):
+        end = min(count, start + 100_000)
+        block = topics[rng.integers(0, TOPICS, end - start)] + rng.standard_normal((end - start, dim), dtype=np.float32)
+        vectors[start:end] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunks', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=Config.RAG_TOP_K)
+    parser.add_argument('--nprobe', type=int, default=Config.RAG_NPROBE)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = DocumentIndex(Path(directory) / 'index')
+        dim = index.embedder.dim
+        vectors = synthetic_vectors(args.chunks, dim)
+        texts = [f"synthetic chunk {i}" for i in range(args.chunks)]
+        start = time.perf_counter()
+        index.add([('synthetic', {}, texts)], vectors=vectors)
+        print(f"Built {args.chunks:,} chunks in {time.perf_counter() - start:.1f}s")
+        del index, texts
+
+        start = time.perf_counter()
+        index = DocumentIndex(Path(directory) / 'index')
+        print(f"Opened in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        rng = np.random.default_rng(11)
+        picked = vectors[rng.integers(0, args.chunks, args.queries)].astype(np.float32)
+        queries = picked + 0.3 * rng.standard_normal(picked.shape, dtype=np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+        manifest, segments, live = index._state
+        latencies, found = [], []
+        for query in queries:
+            start = time.perf_counter()
+            rows = [segment.search(query, args.k, args.nprobe, live)[1] for segment in segments]
+            latencies.append((time.perf_counter() - start) * 1000)
+            found.append({(n, int(row)) for n, segment_rows in enumerate(rows) for row in segment_rows})
+
+        text_latencies = []
+        for i in range(args.queries):
+            start = time.perf_counter()
+            index.search(f"synthetic chunk {i} about the topic", args.k, args.nprobe)
+            text_latencies.append((time.perf_counter() - start) * 1000)
+
+        # Segments store their rows grouped by cluster, so the exact scan runs over them too
+        hits = 0
+        for query, rows in zip(queries[:20], found):
+            scored = []
+            for n, segment in enumerate(segments):
+                scores = np.asarray(segment.vectors) @ query
+                best = np.argpartition(-scores, args.k)[:args.k]
+                scored += [(float(scores[row]), n, int(row)) for row in best]
+            exact = {(n, row) for _, n, row in sorted(scored, reverse=True)[:args.k]}
+            hits += len(exact & rows)
+        recall = hits / (min(20, args.queries) * args.k)
+
+    print(f"Search p50 {percentile(latencies, 50):.2f} ms, p99 {percentile(latencies, 99):.2f} ms "
+          f"(k={args.k}, nprobe={args.nprobe})")
+    print(f"With query embedding p50 {percentile(text_latencies, 50):.2f} ms, "
+          f"p99 {percentile(text_latencies, 99):.2f} ms")
+    print(f"Recall@{args.k} against an exact scan: {recall:.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for the Unified AI Chatbot
+
+Starts the local mock API server, points every provider at it and drives the
+chatbot, arena mode, main.py batch runs and the Flask endpoints at several
+concurrency levels. Reports throughput, latency percentiles and memory, and
+can compare against a saved baseline to catch regressions.
+
+Usage:
+    python -m benchmarks.run
+    python -m benchmarks.run --scenarios chat,web-chat --concurrency 1,8,32 --json results.json
+    python -m benchmarks.run --compare results.json --tolerance 0.15
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.mock_server import MockServer, MockSettings
+from http_compression import decompress
+
+# A long, stable system prompt for the prefix-caching scenarios
+SYSTEM_PROMPT = ' '.join(f"Rule {n}: answer precisely, cite sources and keep the tone friendly." for n in range(80))
+
+
+def configure_environment(server_url: str, output_dir: str):
+    """Point every provider at the mock server (must run before importing config)"""
+    os.environ.update({
+        'OPENAI_API_KEY': 'bench-openai',
+        'OPENAI_BASE_URL': f"{server_url}/v1",
+        'DEEPSEEK_API_KEY': 'bench-deepseek',
+        'DEEPSEEK_BASE_URL': f"{server_url}/v1",
+        'XAI_API_KEY': 'bench-xai',
+        'XAI_BASE_URL': f"{server_url}/v1",
+        'GEMINI_API_KEY': 'bench-gemini',
+        'GEMINI_API_ENDPOINT': server_url,
+        'DEFAULT_AI_PROVIDER': 'openai',
+        'IMAGE_OUTPUT_DIR': str(Path(output_dir) / 'images'),
+        'VIDEO_OUTPUT_DIR': str(Path(output_dir) / 'videos'),
+        'REPLICATE_API_TOKEN': '',
+    })
+    # The mock server has no quota; measure the code path, not client-side throttling
+    for name in ('openai', 'gemini', 'deepseek', 'grok'):
+        os.environ[f"PROVIDER_{name.upper()}_REQUESTS_PER_MINUTE"] = '0'
+        os.environ[f"PROVIDER_{name.upper()}_MAX_CONCURRENCY"] = '0'
+
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def is_error(response) -> bool:
+    """Providers report failures as strings starting with 'Error'"""
+    return isinstance(response, str) and response.startswith('Error')
+
+
+class Sample:
+    """Timing of a single benchmark operation"""
+
+    def __init__(self, latency: float, ok: bool, ttft: Optional[float] = None, size: Optional[int] = None):
+        self.latency = latency
+        self.ok = ok
+        self.ttft = ttft
+        self.size = size
+
+
+def run_load(operation: Callable[[int], Sample], requests: int, concurrency: int) -> Dict:
+    """Run an operation `requests` times with `concurrency` workers and summarise it"""
+    samples: List[Sample] = []
+    lock = threading.Lock()
+
+    def worker(index):
+        sample = operation(index)
+        with lock:
+            samples.append(sample)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(requests)))
+    return summarise(samples, time.perf_counter() - start)
+
+
+def summarise(samples: List[Sample], elapsed: float) -> Dict:
+    """Throughput and latency percentiles for a set of samples"""
+    latencies = [s.latency * 1000 for s in samples]
+    ttfts = [s.ttft * 1000 for s in samples if s.ttft is not None]
+    result = {
+        'requests': len(samples),
+        'errors': sum(1 for s in samples if not s.ok),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+    if ttfts:
+        result['ttft_p50_ms'] = round(percentile(ttfts, 50), 2)
+        result['ttft_p95_ms'] = round(percentile(ttfts, 95), 2)
+    sizes = [s.size for s in samples if s.size is not None]
+    if sizes:
+        result['bytes_per_req'] = round(sum(sizes) / len(sizes))
+    return result
+
+
+def timed(fn: Callable[[], str]) -> Sample:
+    start = time.perf_counter()
+    try:
+        response = fn()
+        ok = not is_error(response)
+    except Exception:
+        ok = False
+    return Sample(time.perf_counter() - start, ok)
+
+
+def timed_web(fn: Callable[[], object]) -> Sample:
+    """Time a test-client request, recording the body size as sent on the wire"""
+    start = time.perf_counter()
+    try:
+        response = fn()
+        ok = not is_error(_web_result(response))
+        size = len(response.data)
+    except Exception:
+        ok, size = False, None
+    return Sample(time.perf_counter() - start, ok, size=size)
+
+
+def timed_stream(fn: Callable[[], object]) -> Sample:
+    start = time.perf_counter()
+    ttft = None
+    ok = True
+    try:
+        for chunk in fn():
+            if ttft is None:
+                ttft = time.perf_counter() - start
+                ok = not is_error(chunk)
+    except Exception:
+        ok = False
+    return Sample(time.perf_counter() - start, ok, ttft)
+
+
+def build_scenarios(turns_per_conversation: int, accept_encoding: str = '') -> Tuple[Dict[str, Callable], Callable]:
+    """
+    Scenario factories: each takes a concurrency level and returns an operation.
+    Factories marked `whole_run` take (requests, concurrency) and return a summary.
+    """
+    from chatbot import UnifiedAIChatbot
+    import main as batch_main
+    import web_app
+
+    shared = UnifiedAIChatbot()
+    web_app.chatbot = shared
+    local = threading.local()
+    web_headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+
+    def thread_bot(slot='bot'):
+        # Each worker holds its own conversation, like one user per thread
+        bot = getattr(local, slot, None)
+        if bot is None:
+            bot = UnifiedAIChatbot()
+            bot.turns = 0
+            setattr(local, slot, bot)
+        if bot.turns >= turns_per_conversation:
+            bot.reset_conversation()
+            bot.turns = 0
+        bot.turns += 1
+        return bot
+
+    def chat(concurrency):
+        return lambda i: timed(lambda: thread_bot().chat(f"Question {i}: how fast is this?"))
+
+    def stream(concurrency):
+        return lambda i: timed_stream(lambda: thread_bot().stream_chat(f"Question {i}: stream it"))
+
+    def prompted_stream(slot, system_prompt):
+        def operation(i):
+            bot = thread_bot(slot)
+            bot.system_prompt = system_prompt()
+            return timed_stream(lambda: bot.stream_chat(f"Question {i}: stream it"))
+        return operation
+
+    def prefix(concurrency):
+        # Stable system prompt and history: the upstream prompt cache covers all but the new message
+        return prompted_stream('prefix_bot', lambda: SYSTEM_PROMPT)
+
+    def prefix_cold(concurrency):
+        # A per-request header (e.g. the current time) ahead of the same prompt defeats prefix caching
+        return prompted_stream('cold_bot', lambda: f"Request {uuid.uuid4()}\n{SYSTEM_PROMPT}")
+
+    def gemini(concurrency):
+        return lambda i: timed(lambda: shared.generate_text(f"Gemini prompt {i}", provider='gemini'))
+
+    def arena(concurrency):
+        return lambda i: timed(lambda: next(
+            (r for r in shared.arena_chat(f"Arena {i}", ['openai', 'deepseek', 'grok', 'gemini']).values()
+             if is_error(r)), 'ok'))
+
+    def batch(requests, concurrency):
+        # One main.py batch of `requests` prompts; the batch itself runs `concurrency` at a time
+        samples = []
+        lock = threading.Lock()
+
+        class TimedBot:
+            def generate_text(self, prompt, provider=None):
+                sample = timed(lambda: shared.generate_text(prompt, provider=provider))
+                with lock:
+                    samples.append(sample)
+                return 'ok' if sample.ok else 'Error'
+
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            f.write('\n'.join(f"Batch prompt {n}" for n in range(requests)))
+        try:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                batch_main.run_batch(TimedBot(), 'openai', f.name, concurrency)
+            return summarise(samples, time.perf_counter() - start)
+        finally:
+            os.unlink(f.name)
+
+    batch.whole_run = True
+
+    def web_chat(concurrency):
+        def operation(i):
+            client = web_app.app.test_client()
+            return timed_web(lambda: client.post('/api/chat', json={'message': f"Web {i}"}, headers=web_headers))
+        return operation
+
+    def web_image(concurrency):
+        def operation(i):
+            client = web_app.app.test_client()
+            return timed_web(lambda: client.post('/api/generate-image', json={'prompt': f"Image {i}"},
+                                                 headers=web_headers))
+        return operation
+
+    def web_history(concurrency):
+        # Serialization and compression of a long conversation, without provider calls
+        history = [
+            {'role': 'user' if n % 2 == 0 else 'assistant',
+             'content': f"Turn {n}: " + ' '.join(f"word{w}" for w in range(150))}
+            for n in range(60)
+        ]
+        web_app.sessions.save('bench-history', history, None)
+        headers = {**web_headers, 'X-Session-Id': 'bench-history'}
+
+        def operation(i):
+            client = web_app.app.test_client()
+            return timed_web(lambda: client.get('/api/history', headers=headers))
+        return operation
+
+    def web_mixed(requests, concurrency):
+        # Interactive chat latency while batch clients flood the same endpoint at twice the slot count
+        flooders = 2 * (web_app.scheduler.slots if web_app.scheduler else 16)
+        done = threading.Event()
+        batch_counts = {'ok': 0, 'rejected': 0}
+        lock = threading.Lock()
+
+        def flood(n):
+            client = web_app.app.test_client()
+            while not done.is_set():
+                response = client.post('/api/chat', json={'message': f"Bulk {n}"}, headers={'X-Priority': 'batch'})
+                with lock:
+                    batch_counts['ok' if response.status_code == 200 else 'rejected'] += 1
+
+        threads = [threading.Thread(target=flood, args=(n,), daemon=True) for n in range(flooders)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        start = time.perf_counter()
+        try:
+            result = run_load(web_chat(concurrency), requests, concurrency)
+        finally:
+            done.set()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - start
+        result['batch_throughput_rps'] = round(batch_counts['ok'] / elapsed, 2) if elapsed else 0.0
+        result['batch_rejected'] = batch_counts['rejected']
+        return result
+
+    web_mixed.whole_run = True
+
+    def reset():
+        shared.reset_conversation()
+
+    return {
+        'chat': chat,
+        'stream': stream,
+        'prefix': prefix,
+        'prefix-cold': prefix_cold,
+        'gemini': gemini,
+        'arena': arena,
+        'batch': batch,
+        'web-chat': web_chat,
+        'web-image': web_image,
+        'web-history': web_history,
+        'web-mixed': web_mixed,
+    }, reset
+
+
+def _web_result(response) -> str:
+    if response.status_code != 200:
+        return f"Error: HTTP {response.status_code}"
+    body = decompress(response.data, response.headers.get('Content-Encoding'))
+    payload = json.loads(body) if body else {}
+    if 'response' in payload:
+        return payload['response']
+    return payload.get('filepath', 'ok')
+
+
+def max_rss_mb() -> float:
+    """Peak resident set size of this process in MB"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else rss / 1024.0, 1)
+
+
+def compare(results: List[Dict], baseline_path: str, tolerance: float) -> List[str]:
+    """Return a description of every result that regressed beyond the tolerance"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['scenario'], r['concurrency']): r for r in json.load(f)['results']}
+
+    regressions = []
+    for result in results:
+        before = baseline.get((result['scenario'], result['concurrency']))
+        if not before:
+            continue
+        label = f"{result['scenario']}@{result['concurrency']}"
+        if before['throughput_rps'] and result['throughput_rps'] < before['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s")
+        for key in ('p95_ms', 'p99_ms', 'bytes_per_req'):
+            if before.get(key) and result.get(key, 0) > before[key] * (1 + tolerance):
+                regressions.append(f"{label}: {key} {before[key]} -> {result[key]}")
+    return regressions
+
+
+def print_table(results: List[Dict]):
+    header = (f"{'scenario':<11} {'conc':>4} {'reqs':>5} {'err':>4} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} "
+              f"{'ttft50':>8} {'cpu ms':>7} {'B/req':>7} {'rss MB':>7} {'heap MB':>7}")
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['scenario']:<11} {r['concurrency']:>4} {r['requests']:>5} {r['errors']:>4} "
+              f"{r['throughput_rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} "
+              f"{r.get('ttft_p50_ms', '-'):>8} {r.get('cpu_ms_per_req', '-'):>7} {r.get('bytes_per_req', '-'):>7} "
+              f"{r['max_rss_mb']:>7} {r.get('heap_peak_mb', '-'):>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the chatbot against a local mock API")
+    parser.add_argument('--scenarios', default='chat,stream,prefix,prefix-cold,gemini,arena,batch,web-chat,web-image,web-history,web-mixed',
+                        help='Comma-separated scenarios to run')
+    parser.add_argument('--concurrency', default='1,4,16', help='Comma-separated concurrency levels')
+    parser.add_argument('--requests', type=int, default=64, help='Requests per scenario and level')
+    parser.add_argument('--turns', type=int, default=4, help='Chat turns before a conversation is reset')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Mock time to first byte')
+    parser.add_argument('--jitter-ms', type=float, default=10.0)
+    parser.add_argument('--tokens', type=int, default=40, help='Mock tokens per response')
+    parser.add_argument('--token-delay-ms', type=float, default=2.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of mock 500 responses')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of mock 429 responses')
+    parser.add_argument('--prefill-ms-per-1k', type=float, default=20.0,
+                        help='Mock prompt processing time per 1000 uncached prompt characters')
+    parser.add_argument('--accept-encoding', default='gzip, br, zstd',
+                        help="Accept-Encoding sent by the web scenarios ('' for uncompressed responses)")
+    parser.add_argument('--trace-memory', action='store_true', help='Track Python heap peak (slower)')
+    parser.add_argument('--json', dest='json_path', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed relative regression')
+    args = parser.parse_args()
+
+    settings = MockSettings(args.latency_ms, args.jitter_ms, args.tokens, args.token_delay_ms,
+                            args.error_rate, args.rate_limit_rate, seed=1234,
+                            prefill_ms_per_1k=args.prefill_ms_per_1k)
+    server = MockServer(settings=settings).start()
+    output_dir = tempfile.mkdtemp(prefix='chatbot-bench-')
+    configure_environment(server.url, output_dir)
+
+    scenarios, reset = build_scenarios(args.turns, args.accept_encoding)
+    selected = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = [s for s in selected if s not in scenarios]
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(unknown)}. Available: {', '.join(scenarios)}")
+    levels = [int(c) for c in args.concurrency.split(',') if c.strip()]
+
+    results = []
+    try:
+        for name in selected:
+            for concurrency in levels:
+                reset()
+                if args.trace_memory:
+                    tracemalloc.start()
+                scenario = scenarios[name]
+                # Process CPU includes the in-process mock server, so compare like with like
+                cpu_start = time.process_time()
+                if getattr(scenario, 'whole_run', False):
+                    result = scenario(args.requests, concurrency)
+                else:
+                    result = run_load(scenario(concurrency), args.requests, concurrency)
+                if result['requests']:
+                    result['cpu_ms_per_req'] = round((time.process_time() - cpu_start) * 1000 / result['requests'], 3)
+                if args.trace_memory:
+                    result['heap_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024.0 * 1024.0), 1)
+                    tracemalloc.stop()
+                result.update({'scenario': name, 'concurrency': concurrency, 'max_rss_mb': max_rss_mb()})
+                results.append(result)
+                print(f"  {name} @ {concurrency}: {result['throughput_rps']} req/s, p95 {result['p95_ms']} ms",
+                      file=sys.stderr)
+    finally:
+        server.stop()
+
+    print()
+    print_table(results)
+    print(f"\nMock server: {server.counters}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print("\nRegressions detected:")
+            for line in regressions:
+                print(f"  ✗ {line}")
+            sys.exit(1)
+        print("\n✓ No regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Horizontal scaling load test for the web tier
+
+Starts the mock API, then 1, 2, 4... `web_app.py` processes sharing one
+state store, and drives POST /api/chat across them round-robin, the way the
+compose profile's proxy does. Each client keeps one session whose requests
+land on different replicas, so the run also checks that no replica needs
+to be "the" replica for a session. Reports throughput per replica count and
+the scaling efficiency relative to one replica.
+
+Scaling is only near-linear with a core per replica; on fewer cores the
+replicas compete for CPU.
+
+Usage:
+    python -m benchmarks.scale --replicas 1,2,4 --concurrency 32 --requests 600
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.mock_server import MockServer, MockSettings
+from benchmarks.run import configure_environment, percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def start_replicas(count: int, base_port: int, env: Dict[str, str]) -> List[subprocess.Popen]:
+    processes = []
+    for i in range(count):
+        replica_env = {**env, 'FLASK_HOST': '127.0.0.1', 'FLASK_PORT': str(base_port + i)}
+        processes.append(subprocess.Popen([sys.executable, str(ROOT / 'web_app.py')], env=replica_env,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    for i in range(count):
+        wait_ready(base_port + i)
+    return processes
+
+
+def wait_ready(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/api/providers')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Replica on port {port} did not start")
+
+
+def request(port: int, method: str, path: str, session: str, body=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request(method, path, body=json.dumps(body) if body is not None else None,
+                           headers={'Content-Type': 'application/json', 'X-Session-Id': session})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b'{}')
+    finally:
+        connection.close()
+
+
+def run_load(ports: List[int], requests: int, concurrency: int, turns: int) -> Dict:
+    latencies, errors = [], []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def client(worker: int):
+        session, turn = f"scale-{len(ports)}-{worker}-0", 0
+        for i in counter:
+            if turn == turns:
+                session, turn = f"scale-{len(ports)}-{worker}-{i}", 0
+            # Round-robin like the proxy: consecutive turns of a session hit different replicas
+            port = ports[i % len(ports)]
+            start = time.perf_counter()
+            status, payload = request(port, 'POST', '/api/chat', session, {'message': f"Question {i}"})
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+                if status != 200 or str(payload.get('response', '')).startswith('Error'):
+                    errors.append(status)
+            turn += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput_rps': round(len(latencies) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50), 1),
+        'p95_ms': round(percentile(latencies, 95), 1),
+    }
+
+
+def check_sessions(ports: List[int], session: str) -> bool:
+    """Every replica sees the same conversation for a session"""
+    lengths = {len(request(port, 'GET', '/api/history', session)[1].get('messages', [])) for port in ports}
+    return len(lengths) == 1 and lengths.pop() > 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of 1..N stateless web replicas")
+    parser.add_argument('--replicas', default='1,2,4', help='Comma-separated replica counts')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=600, help='Chat requests per replica count')
+    parser.add_argument('--turns', type=int, default=4, help='Turns per session before starting a new one')
+    parser.add_argument('--base-port', type=int, default=5100)
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Mock time to first byte')
+    parser.add_argument('--tokens', type=int, default=40, help='Mock tokens per response')
+    parser.add_argument('--json', dest='json_path', help='Write results to this JSON file')
+    args = parser.parse_args()
+
+    server = MockServer(settings=MockSettings(args.latency_ms, 5.0, args.tokens, 1.0, seed=1234)).start()
+    output_dir = tempfile.mkdtemp(prefix='chatbot-scale-')
+    configure_environment(server.url, output_dir)
+    env = {**os.environ, 'SHARED_STATE_URL': f"sqlite:///{Path(output_dir) / 'state.sqlite3'}"}
+
+    results = []
+    try:
+        for count in [int(c) for c in args.replicas.split(',') if c.strip()]:
+            ports = list(range(args.base_port, args.base_port + count))
+            processes = start_replicas(count, args.base_port, env)
+            try:
+                result = run_load(ports, args.requests, args.concurrency, args.turns)
+                result['sessions_consistent'] = check_sessions(ports, f"scale-{count}-0-0")
+            finally:
+                for process in processes:
+                    process.terminate()
+                for process in processes:
+                    process.wait()
+            result['replicas'] = count
+            results.append(result)
+            print(f"  {count} replica(s): {result['throughput_rps']} req/s, p95 {result['p95_ms']} ms",
+                  file=sys.stderr)
+    finally:
+        server.stop()
+
+    base = results[0]['throughput_rps'] / results[0]['replicas'] if results else 0
+    print(f"\n{'replicas':>8} {'req/s':>8} {'p50':>8} {'p95':>8} {'err':>5} {'efficiency':>10} {'sessions':>9}")
+    for r in results:
+        efficiency = r['throughput_rps'] / (base * r['replicas']) if base else 0
+        r['efficiency'] = round(efficiency, 2)
+        print(f"{r['replicas']:>8} {r['throughput_rps']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['errors']:>5} "
+              f"{r['efficiency']:>10} {'ok' if r['sessions_consistent'] else 'MISMATCH':>9}")
+    print(f"\nCPU cores available: {os.cpu_count()}")
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Cancellation tokens
+
+A CancelToken travels with a chat turn from the CLI or web request down to the
+provider. Cancelling it (Ctrl+C, a closed browser tab, a WebSocket "stop")
+runs the callbacks registered by whoever is blocked on the work, typically
+closing the provider's HTTP stream, so the worker is freed right away instead
+of after the model finishes and no more tokens are paid for.
+"""
+import threading
+from typing import Callable, List, Optional
+
+
+class Cancelled(Exception):
+    """Raised by CancelToken.raise_if_cancelled"""
+
+
+class CancelToken:
+    """One-shot, thread-safe cancellation signal with callbacks"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = 'cancelled') -> bool:
+        """Cancel and run the callbacks; False if the token was already cancelled"""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass  # a failing callback must not keep the others from running
+        return True
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Run callback when the token is cancelled (immediately if it already is)
+
+        Returns:
+            A function that unregisters the callback
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until cancelled or timeout; True if cancelled"""
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled(self.reason)
+
+    def _discard(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
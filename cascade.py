@@ -0,0 +1,223 @@
+"""
+Cheap-model-first cascade routing
+
+A request goes to a fast, cheap provider first. If its answer fails a quick
+quality check (error, refusal or hedging, too short for the question, cut
+off), the request is escalated to the stronger provider. With racing
+enabled, the strong provider starts after a short hedge delay and whichever
+acceptable answer arrives first wins and the other call is cancelled. Savings are measured against sending
+everything to the strong provider, priced from the provider catalog.
+"""
+import queue
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from cancellation import CancelToken
+from ensemble import fan_out, is_error
+from shared_state import Counters
+import tracing
+
+# Pseudo-provider name that selects cascade routing
+CASCADE = 'cascade'
+
+UNCERTAIN = re.compile(
+    r"\b(i'?m not sure|i don'?t know|i cannot|i can'?t help|as an ai|unable to (answer|help)|"
+    r"i do not have (enough )?information)\b", re.IGNORECASE)
+
+# Prompts asking for depth deserve more than a one-liner
+DETAILED = re.compile(r'\b(explain|describe|compare|why|how|write|implement|step[- ]by[- ]step)\b', re.IGNORECASE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def escalation_reason(prompt: str, answer: str, max_tokens: int = 1000) -> Optional[str]:
+    """
+    Why a cheap answer should be escalated, or None if it is good enough
+
+    Args:
+        prompt: The user's prompt
+        answer: The cheap provider's answer
+        max_tokens: Completion limit; answers using nearly all of it were likely cut off
+    """
+    text = (answer or '').strip()
+    if is_error(text):
+        return 'error'
+    if UNCERTAIN.search(text[:300]):
+        return 'uncertain'
+    if DETAILED.search(prompt) and len(text.split()) < 15:
+        return 'too_short'
+    if estimate_tokens(text) >= max_tokens * 0.95 and text[-1] not in '.!?`)"\'':
+        return 'truncated'
+    return None
+
+
+class CascadeStats:
+    """
+    Counters for cascade routing, including savings against always using the strong provider
+
+    Totals are kept in shared counters, so with SHARED_STATE_URL set every
+    worker reports the same figures.
+    """
+
+    def __init__(self, namespace: str = 'cascade'):
+        self.lock = threading.Lock()
+        self.counters = Counters(namespace)
+        self.strong_latency_ewma: Optional[float] = None
+
+    def record(self, cheap_served: bool, reason: Optional[str], cost: float, baseline_cost: float,
+               latency: float, strong_latency: Optional[float]):
+        with self.lock:
+            if strong_latency is not None:
+                ewma = self.strong_latency_ewma
+                self.strong_latency_ewma = strong_latency if ewma is None else 0.8 * ewma + 0.2 * strong_latency
+            # Without a strong-provider sample yet, assume no latency was saved
+            baseline_latency = strong_latency if strong_latency is not None else (self.strong_latency_ewma or latency)
+        values = {
+            'requests': 1,
+            'served_by_cheap': 1 if cheap_served else 0,
+            'cost_usd': cost,
+            'baseline_cost_usd': baseline_cost,
+            'latency_s': latency,
+            'baseline_latency_s': baseline_latency,
+        }
+        if reason:
+            values[f"escalation.{reason}"] = 1
+        self.counters.update(values)
+
+    def to_dict(self) -> Dict:
+        totals = self.counters.snapshot()
+        requests = int(totals.get('requests', 0))
+        cost, baseline_cost = totals.get('cost_usd', 0.0), totals.get('baseline_cost_usd', 0.0)
+        latency = totals.get('latency_s', 0.0)
+        return {
+            'requests': requests,
+            'served_by_cheap': int(totals.get('served_by_cheap', 0)),
+            'escalations': {name[len('escalation.'):]: int(count) for name, count in totals.items()
+                            if name.startswith('escalation.')},
+            'cost_usd': round(cost, 6),
+            'baseline_cost_usd': round(baseline_cost, 6),
+            'cost_saved_usd': round(baseline_cost - cost, 6),
+            'mean_latency_ms': round(1000 * latency / requests, 1) if requests else 0.0,
+            'latency_saved_ms': round(1000 * (totals.get('baseline_latency_s', 0.0) - latency), 1),
+        }
+
+
+class CascadeRouter:
+    """Routes a call to a cheap provider first and escalates when needed"""
+
+    def __init__(self, spec: Callable[[str], object], cheap: str, strong: str,
+                 race: bool = False, hedge_delay: float = 2.0):
+        """
+        Args:
+            spec: Returns the catalog spec for a provider (used for pricing)
+            cheap: Provider tried first
+            strong: Provider used on escalation
+            race: Start the strong provider too if the cheap one has not answered after hedge_delay
+            hedge_delay: Seconds the cheap provider has before the race starts
+        """
+        self.spec = spec
+        self.cheap = cheap
+        self.strong = strong
+        self.race = race
+        self.hedge_delay = hedge_delay
+        self.stats = CascadeStats(f"cascade.{cheap}.{strong}")
+
+    def run(self, call: Callable[[str, CancelToken], str], prompt: str, context: str = '',
+            max_tokens: int = 1000) -> Tuple[str, str]:
+        """
+        Answer a request through the cascade
+
+        Args:
+            call: Sends the request to one provider and returns its response; the token
+                it gets is cancelled when a race makes the call unnecessary
+            prompt: Text of the user's request, used by the quality check
+            context: Everything else sent with the prompt (history), for cost estimates
+            max_tokens: Completion limit used by the truncation check
+
+        Returns:
+            (answer, provider that served it)
+        """
+        with tracing.span('cascade.run', cheap=self.cheap, strong=self.strong, race=self.race):
+            start = time.perf_counter()
+            if self.race:
+                answer, served, reason, timings = self._race(call, prompt, max_tokens)
+            else:
+                answer, served, reason, timings = self._sequential(call, prompt, max_tokens)
+            latency = time.perf_counter() - start
+            tracing.set_attribute('served_by', served)
+            if reason:
+                tracing.set_attribute('escalation', reason)
+
+        # Every provider that was started is billed, including a race loser for what it generated before cancelling
+        prompt_tokens, answer_tokens = estimate_tokens(context + prompt), estimate_tokens(answer)
+        cost = sum(self.spec(p).estimate_cost(prompt_tokens, answer_tokens) for p in timings)
+        baseline = self.spec(self.strong).estimate_cost(prompt_tokens, answer_tokens)
+        self.stats.record(served == self.cheap, reason, cost, baseline, latency, timings.get(self.strong))
+        return answer, served
+
+    def _sequential(self, call, prompt, max_tokens):
+        timings = {}
+        start = time.perf_counter()
+        answer = call(self.cheap, CancelToken())
+        timings[self.cheap] = time.perf_counter() - start
+        reason = escalation_reason(prompt, answer, max_tokens)
+        if reason is None:
+            return answer, self.cheap, None, timings
+        start = time.perf_counter()
+        answer = call(self.strong, CancelToken())
+        timings[self.strong] = time.perf_counter() - start
+        return answer, self.strong, reason, timings
+
+    def _race(self, call, prompt, max_tokens):
+        """
+        Cheap provider first; the strong one joins after the hedge delay or a failed check
+
+        The first acceptable answer wins and the other call, if still running, is cancelled.
+        """
+        timings: Dict[str, Optional[float]] = {self.cheap: None}
+        results: queue.Queue = queue.Queue()
+        tokens: Dict[str, CancelToken] = {}
+        fan_out(call, [self.cheap], results, tokens)
+        pending, reason, cheap_answer, strong_answer = 1, None, None, None
+
+        def escalate(why):
+            nonlocal pending, reason
+            reason = reason or why
+            timings[self.strong] = None
+            fan_out(call, [self.strong], results, tokens)
+            pending += 1
+
+        while pending:
+            try:
+                hedging = self.strong not in timings
+                provider, answer, latency = results.get(timeout=self.hedge_delay if hedging else None)
+            except queue.Empty:
+                tracing.add_event('cascade.hedge', after_s=self.hedge_delay)
+                escalate('slow')
+                continue
+            pending -= 1
+            timings[provider] = latency
+            if provider == self.strong:
+                if not is_error(answer):
+                    tokens[self.cheap].cancel('race lost')
+                    return answer, self.strong, reason, timings
+                strong_answer = answer
+                continue
+            failed = escalation_reason(prompt, answer, max_tokens)
+            if failed is None:
+                if self.strong in tokens:
+                    tokens[self.strong].cancel('race lost')
+                return answer, self.cheap, None, timings
+            cheap_answer, reason = answer, failed
+            if self.strong not in timings:
+                escalate(failed)
+
+        # Neither answer passed: a weak cheap answer beats an error from the strong provider
+        if cheap_answer is not None and not is_error(cheap_answer):
+            return cheap_answer, self.cheap, reason, timings
+        return strong_answer or cheap_answer, self.strong if strong_answer else self.cheap, reason, timings
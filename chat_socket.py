@@ -0,0 +1,293 @@
+"""
+WebSocket chat sessions
+
+One long-lived connection per browser carries what the page otherwise does
+with separate POSTs: chat turns with streamed tokens, provider switches and
+image/video job updates. Every message is a JSON object with a `type`:
+
+Client to server:
+    {"type": "chat", "id": "t1", "message": "...", "provider": "openai"}
+        (optionally with "model", "temperature" and "max_tokens")
+    {"type": "stop", "id": "t1"}             (without an id, stops every turn)
+    {"type": "switch", "provider": "gemini"}
+    {"type": "image", "id": "j1", "prompt": "...", "n": 2}
+    {"type": "video", "id": "j2", "prompt": "..."}
+    {"type": "ping"}
+
+Server to client: token, done, error, switched, job, image and pong frames,
+each carrying the `id` of the turn or job it belongs to.
+
+Outgoing frames go through a bounded queue drained by one writer thread. When
+a slow client lets the queue fill, token frames are merged instead of queued,
+so a fast model never builds an unbounded backlog and the client simply gets
+fewer, larger frames. "stop" and a closed connection cancel the turn's
+CancelToken, which aborts the upstream request.
+
+Turns and jobs take a slot from the same request scheduler as the REST API
+(chat turns as interactive, media as background work), so a socket cannot
+jump the queue; refused work gets an error frame with `retry_after`.
+"""
+import contextlib
+import queue
+import threading
+import uuid
+from typing import Callable, ContextManager, Dict, Optional
+
+from cancellation import CancelToken
+from config import Config
+from request_options import InvalidOptions, parse_options
+from scheduler import BACKGROUND, INTERACTIVE, DeadlineExceeded, Overloaded, retry_after_header
+import fast_json
+import tracing
+
+# Longest a video job is followed over the socket (seconds)
+VIDEO_FOLLOW_TIMEOUT = 3600
+
+
+class ChatSocketSession:
+    """Protocol handler for one WebSocket connection"""
+
+    def __init__(self, bot, send: Callable[[str], None], outbox_size: int = 64,
+                 describe_image: Optional[Callable[[Dict], Dict]] = None,
+                 describe_video: Optional[Callable[[object], Dict]] = None,
+                 on_change: Optional[Callable[[], None]] = None,
+                 admit: Optional[Callable[[str], ContextManager]] = None):
+        """
+        Args:
+            bot: The UnifiedAIChatbot serving requests
+            send: Sends one text frame to the client (blocks while the socket is congested)
+            outbox_size: Frames buffered before token frames start being merged
+            describe_image: Turns a generate_images result into the frame payload (e.g. adds a URL)
+            describe_video: Turns a VideoJob into the frame payload
+            on_change: Called after each turn and provider switch (e.g. to save the session)
+            admit: Returns a context manager holding a scheduler slot of the given priority;
+                entering it raises Overloaded or DeadlineExceeded when the work is refused
+        """
+        self.bot = bot
+        self.send = send
+        self.outbox: queue.Queue = queue.Queue(maxsize=outbox_size)
+        self.describe_image = describe_image or (lambda result: result)
+        self.describe_video = describe_video or (lambda job: job.to_dict())
+        self.on_change = on_change or (lambda: None)
+        self.admit = admit or (lambda priority: contextlib.nullcontext())
+        self.turns: Dict[str, CancelToken] = {}
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.writer = threading.Thread(target=self._write, name='ws-writer', daemon=True)
+        self.handlers = {
+            'chat': self._chat,
+            'stop': self._stop,
+            'switch': self._switch,
+            'image': self._image,
+            'video': self._video,
+            'ping': lambda data: self.emit({'type': 'pong'}),
+        }
+
+    def serve(self, receive: Callable[[], Optional[str]]):
+        """Handle client messages until the connection closes"""
+        self.writer.start()
+        try:
+            while not self.closed.is_set():
+                try:
+                    raw = receive()
+                except Exception:
+                    # The WebSocket library signals a closed connection with an exception
+                    break
+                if raw is None:
+                    break
+                self.handle(raw)
+        finally:
+            self.close()
+
+    def handle(self, raw: str):
+        """Dispatch one client message"""
+        if Config.MAX_REQUEST_BYTES and len(raw) > Config.MAX_REQUEST_BYTES:
+            self.emit({'type': 'error', 'error': f"Message larger than {Config.MAX_REQUEST_BYTES:,} bytes"})
+            return
+        try:
+            data = fast_json.loads(raw)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            self.emit({'type': 'error', 'error': 'Messages must be JSON objects'})
+            return
+        handler = self.handlers.get(data.get('type'))
+        if handler is None:
+            self.emit({'type': 'error', 'id': data.get('id'), 'error': f"Unknown type: {data.get('type')}"})
+            return
+        handler(data)
+
+    def emit(self, frame: Dict) -> bool:
+        """Queue a frame, waiting for room; False once the connection is gone"""
+        while not self.closed.is_set():
+            try:
+                self.outbox.put(frame, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def close(self):
+        """Stop every turn and the writer"""
+        self.closed.set()
+        with self.lock:
+            for cancel in self.turns.values():
+                cancel.cancel('disconnected')
+        try:
+            self.outbox.put_nowait(None)
+        except queue.Full:
+            pass  # the writer notices `closed` on its next frame
+
+    def _write(self):
+        while True:
+            try:
+                frame = self.outbox.get(timeout=1.0)
+            except queue.Empty:
+                if self.closed.is_set():
+                    return
+                continue
+            if frame is None:
+                return
+            try:
+                self.send(fast_json.dumps(frame))
+            except Exception:
+                self.close()
+                return
+
+    def _start(self, name: str, target: Callable, *args):
+        threading.Thread(target=target, args=args, name=f"ws-{name}", daemon=True).start()
+
+    def _refuse(self, frame_id: str, error: Exception):
+        """Tell the client the scheduler turned the work away, and when to retry"""
+        retry_after = error.retry_after if isinstance(error, Overloaded) else 1
+        self.emit({'type': 'error', 'id': frame_id, 'error': f"Server busy: {error}",
+                   'retry_after': int(retry_after_header(retry_after))})
+
+    def _chat(self, data: Dict):
+        turn_id = str(data.get('id') or uuid.uuid4().hex[:8])
+        message = data.get('message', '')
+        if not message:
+            self.emit({'type': 'error', 'id': turn_id, 'error': 'No message provided'})
+            return
+        try:
+            options = parse_options(data)
+        except InvalidOptions as e:
+            self.emit({'type': 'error', 'id': turn_id, 'error': str(e)})
+            return
+        with self.lock:
+            # Turns share the conversation history, so they run one at a time
+            if self.turns:
+                self.emit({'type': 'error', 'id': turn_id, 'error': 'A reply is still being generated'})
+                return
+            cancel = self.turns[turn_id] = CancelToken()
+        self._start('chat', self._run_turn, turn_id, message, data.get('provider'), cancel, options)
+
+    def _run_turn(self, turn_id: str, message: str, provider: Optional[str], cancel: CancelToken,
+                  options: Optional[Dict] = None):
+        options = options or {}
+        try:
+            with self.admit(INTERACTIVE):
+                # May fetch the provider's model list once, so it runs here rather than on the reader thread
+                error = options and self.bot.check_options(provider or self.bot.current_provider, options)
+                if error:
+                    self.emit({'type': 'error', 'id': turn_id, 'error': error})
+                    return
+                with tracing.span('ws.chat', turn=turn_id):
+                    chunks = self.bot.stream_chat(message, provider=provider, cancel=cancel, **options)
+                    pending = ''
+                    try:
+                        for chunk in chunks:
+                            if cancel.cancelled:
+                                break
+                            pending += chunk
+                            try:
+                                self.outbox.put_nowait({'type': 'token', 'id': turn_id, 'text': pending})
+                                pending = ''
+                            except queue.Full:
+                                # The client is behind: merge into the next frame instead of queueing
+                                tracing.add_event('ws.backpressure')
+                    finally:
+                        # Closing the stream records the partial reply
+                        chunks.close()
+                        self.on_change()
+                    if pending:
+                        self.emit({'type': 'token', 'id': turn_id, 'text': pending})
+                    self.emit({'type': 'done', 'id': turn_id, 'stopped': cancel.cancelled,
+                               'provider': provider or self.bot.current_provider})
+        except (Overloaded, DeadlineExceeded) as e:
+            self._refuse(turn_id, e)
+        except Exception as e:
+            self.emit({'type': 'error', 'id': turn_id, 'error': str(e)})
+        finally:
+            with self.lock:
+                self.turns.pop(turn_id, None)
+
+    def _stop(self, data: Dict):
+        with self.lock:
+            targets = [self.turns[data['id']]] if data.get('id') in self.turns else (
+                [] if data.get('id') else list(self.turns.values()))
+        for cancel in targets:
+            cancel.cancel('stopped')
+
+    def _switch(self, data: Dict):
+        provider = data.get('provider')
+        if self.bot.set_provider(provider):
+            self.on_change()
+            self.emit({'type': 'switched', 'provider': provider})
+        else:
+            self.emit({'type': 'error', 'error': f"Provider {provider} not available"})
+
+    def _image(self, data: Dict):
+        job_id = str(data.get('id') or uuid.uuid4().hex[:8])
+        prompt = data.get('prompt', '')
+        try:
+            n = int(data.get('n', 1))
+        except (TypeError, ValueError):
+            n = 0
+        if not prompt or not 1 <= n <= 10:
+            self.emit({'type': 'error', 'id': job_id, 'error': 'A prompt and 1 to 10 images are required'})
+            return
+        self._start('image', self._run_images, job_id, prompt, n)
+
+    def _run_images(self, job_id: str, prompt: str, n: int):
+        try:
+            with self.admit(BACKGROUND):
+                self.emit({'type': 'job', 'id': job_id, 'kind': 'image', 'status': 'running'})
+                for result in self.bot.generate_images([prompt], n):
+                    if not self.emit({**self.describe_image(result), 'type': 'image', 'id': job_id}):
+                        return
+                self.emit({'type': 'job', 'id': job_id, 'kind': 'image', 'status': 'succeeded'})
+        except (Overloaded, DeadlineExceeded) as e:
+            self._refuse(job_id, e)
+        except Exception as e:
+            self.emit({'type': 'job', 'id': job_id, 'kind': 'image', 'status': 'failed', 'error': str(e)})
+
+    def _video(self, data: Dict):
+        job_id = str(data.get('id') or uuid.uuid4().hex[:8])
+        if not data.get('prompt'):
+            self.emit({'type': 'error', 'id': job_id, 'error': 'No prompt provided'})
+            return
+        self._start('video', self._follow_video, job_id, data['prompt'])
+
+    def _follow_video(self, job_id: str, prompt: str):
+        """Submit a video job and push a frame whenever its status changes"""
+        try:
+            # Only the submission holds a slot; the prediction then runs upstream
+            with self.admit(BACKGROUND):
+                job = self.bot.submit_video(prompt)
+        except (Overloaded, DeadlineExceeded) as e:
+            self._refuse(job_id, e)
+            return
+        except Exception as e:
+            self.emit({'type': 'job', 'id': job_id, 'kind': 'video', 'status': 'failed', 'error': str(e)})
+            return
+        status = None
+        for _ in range(VIDEO_FOLLOW_TIMEOUT):
+            if job.status != status:
+                status = job.status
+                if not self.emit({**self.describe_video(job), 'job': job.id, 'type': 'job', 'id': job_id,
+                                  'kind': 'video'}):
+                    return
+            if job.done() and status == job.status:
+                return
+            job.wait(1.0)
@@ -3,51 +3,100 @@ Unified AI Chatbot Interface
 This module provides a single interface to interact with multiple AI providers
 and media generation capabilities.
 """
-from typing import Optional, List, Dict
+import contextvars
+import copy
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, List, Dict, Iterator, Tuple
 from pathlib import Path
 
 from config import Config
-from openai_provider import OpenAIProvider, DALLEGenerator
-from gemini_provider import GeminiProvider
-from deepseek_provider import DeepSeekProvider
-from grok_provider import GrokProvider
-from duckduckgo_provider import DuckDuckGoProvider
+from base_provider import VideoJob
+from openai_provider import DALLEGenerator
+from provider_registry import ProviderRegistry, default_registry
 from video_provider import ReplicateVideoGenerator, SimpleVideoGenerator
+from video_postprocess import VideoPostProcessor
+from media_store import get_store
+from singleflight import SingleFlight, request_key
+from rate_limit import RateLimitExceeded, limiter_for
+from prompt_cache import canonical_messages
+from ensemble import fan_out, run_ensemble
+from cascade import CASCADE, CascadeRouter
+from cancellation import CancelToken
+from shared_state import get_state
+from health import HealthMonitor
+from token_budget import InputTooLarge, tokenizer_for
+from document_index import format_context, open_index
+import tracing
+
+# How long other workers can look up a video job started here
+VIDEO_JOB_INDEX_TTL = 24 * 3600
+# Reply length providers default to, kept free in the context window when max_tokens is not given
+DEFAULT_REPLY_TOKENS = 1000
+# Tokens left over for a summarization prompt's wording (and re-tokenization of split chunks)
+SUMMARY_PROMPT_SLACK = 64
+
+SUMMARY_PROMPT = (
+    "Summarize the following text. Keep names, numbers, error messages and any questions or "
+    "instructions it contains word for word.{focus}\n\n{text}"
+)
+SUMMARY_PART_PROMPT = (
+    "This is part {index} of {total} of a longer text. Summarize this part in a few sentences or "
+    "bullet points. Keep names, numbers, error messages and any questions or instructions it "
+    "contains word for word.{focus}\n\n{text}"
+)
+SUMMARY_COMBINE_PROMPT = (
+    "These are summaries of consecutive parts of one text. Combine them into a single summary "
+    "of the whole text, keeping any questions or instructions word for word.{focus}\n\n{text}"
+)
 
 
 class UnifiedAIChatbot:
     """Unified chatbot that can use multiple AI providers"""
     
-    def __init__(self):
-        """Initialize the unified chatbot with all available providers"""
+    def __init__(self, registry: Optional[ProviderRegistry] = None):
+        """
+        Initialize the unified chatbot with all available providers
+        
+        Args:
+            registry: Text providers to use (defaults to the registry AIManager shares)
+        """
         Config.ensure_output_dirs()
         
-        self.providers = {}
+        # Text providers are built on first use; their clients are shared process-wide
+        self.providers = registry if registry is not None else default_registry
         self.image_generators = {}
         self.video_generators = {}
+        self.video_jobs: 'OrderedDict[str, VideoJob]' = OrderedDict()
         self.conversation_history = []
-        
-        # Initialize text AI providers
-        if Config.OPENAI_API_KEY:
-            self.providers['openai'] = OpenAIProvider(Config.OPENAI_API_KEY)
-        
-        if Config.GEMINI_API_KEY:
-            self.providers['gemini'] = GeminiProvider(Config.GEMINI_API_KEY)
-
-        if Config.DEEPSEEK_API_KEY:
-            self.providers['deepseek'] = DeepSeekProvider(Config.DEEPSEEK_API_KEY)
-
-        if Config.XAI_API_KEY:
-            self.providers['grok'] = GrokProvider(Config.XAI_API_KEY)
-
-        # DuckDuckGo is free, always add it
-        self.providers['duckduckgo'] = DuckDuckGoProvider()
+        self.system_prompt = Config.SYSTEM_PROMPT
+        # What happens to input too large for the provider's context: reject, truncate or summarize
+        self.input_policy = Config.INPUT_POLICY
+        # Local documents retrieved into chat turns (None without an index or numpy); forks share it
+        self.documents = open_index() if Config.RAG_ENABLED else None
+        self.use_documents = True
+        self.inflight = SingleFlight()
+        self._cascade: Optional[CascadeRouter] = None
+        # Warm-up and health of the text providers; real requests report to it as well
+        self.health = HealthMonitor(
+            self.providers,
+            deadline=Config.WARMUP_DEADLINE,
+            interval=Config.HEALTH_PROBE_INTERVAL,
+            failure_threshold=Config.HEALTH_FAILURE_THRESHOLD,
+            required=[p.strip() for p in Config.HEALTH_REQUIRED_PROVIDERS.split(',')]
+        )
         
         # Initialize image generators
         if Config.OPENAI_API_KEY:
             self.image_generators['dalle'] = DALLEGenerator(
                 Config.OPENAI_API_KEY, 
-                Config.IMAGE_OUTPUT_DIR
+                Config.IMAGE_OUTPUT_DIR,
+                Config.OPENAI_BASE_URL,
+                concurrency=Config.IMAGE_CONCURRENCY,
+                quota_mb=Config.IMAGE_STORE_QUOTA_MB
             )
         
         # Initialize video generators
@@ -55,27 +104,57 @@ class UnifiedAIChatbot:
             try:
                 self.video_generators['replicate'] = ReplicateVideoGenerator(
                     Config.REPLICATE_API_TOKEN,
-                    Config.VIDEO_OUTPUT_DIR
+                    Config.VIDEO_OUTPUT_DIR,
+                    quota_mb=Config.VIDEO_STORE_QUOTA_MB,
+                    webhook_url=Config.REPLICATE_WEBHOOK_URL,
+                    max_poll_interval=Config.VIDEO_POLL_MAX_INTERVAL,
+                    timeout=Config.VIDEO_TIMEOUT,
+                    max_age=Config.VIDEO_MAX_AGE,
+                    download_workers=Config.VIDEO_DOWNLOAD_WORKERS,
+                    postprocessor=self._video_postprocessor()
                 )
             except ImportError:
                 # Fallback to simple generator if replicate not available
                 self.video_generators['simple'] = SimpleVideoGenerator(
                     '',
-                    Config.VIDEO_OUTPUT_DIR
+                    Config.VIDEO_OUTPUT_DIR,
+                    quota_mb=Config.VIDEO_STORE_QUOTA_MB
                 )
         else:
             self.video_generators['simple'] = SimpleVideoGenerator(
                 '',
-                Config.VIDEO_OUTPUT_DIR
+                Config.VIDEO_OUTPUT_DIR,
+                quota_mb=Config.VIDEO_STORE_QUOTA_MB
             )
         
         self.current_provider = Config.DEFAULT_AI_PROVIDER
         if self.current_provider not in self.providers and self.providers:
-            self.current_provider = list(self.providers.keys())[0]
+            # Without the local model, fall back to the DuckDuckGo stub as before
+            if 'duckduckgo' in self.providers:
+                self.current_provider = 'duckduckgo'
+            else:
+                self.current_provider = list(self.providers.keys())[0]
+    
+    def fork(self, history: Optional[List[Dict]] = None, provider: Optional[str] = None) -> 'UnifiedAIChatbot':
+        """
+        A chatbot with its own conversation and provider choice
+        
+        Providers, generators, video jobs and in-flight request sharing stay
+        shared with this instance, so a fork per web session is cheap.
+        
+        Args:
+            history: Conversation to continue
+            provider: Provider to use (ignored if not available here)
+        """
+        bot = copy.copy(self)
+        bot.conversation_history = list(history or [])
+        if provider and (provider in self.providers or provider == CASCADE):
+            bot.current_provider = provider
+        return bot
     
     def set_provider(self, provider_name: str) -> bool:
         """Switch to a different AI provider"""
-        if provider_name in self.providers:
+        if provider_name in self.providers or (provider_name == CASCADE and self.cascade_router()):
             self.current_provider = provider_name
             return True
         return False
@@ -84,13 +163,319 @@ class UnifiedAIChatbot:
         """List all available AI providers"""
         return list(self.providers.keys())
     
-    def chat(self, message: str, provider: Optional[str] = None, **kwargs) -> str:
+    def cascade_router(self) -> Optional[CascadeRouter]:
+        """The cascade router, or None unless two distinct providers are available for it"""
+        if self._cascade is None:
+            priced = [p for p in self.list_providers() if self.providers.spec(p).input_price_per_1k > 0]
+            cost = lambda p: self.providers.spec(p).estimate_cost(1000, 500)
+            cheap = Config.CASCADE_CHEAP or min(priced, key=cost, default=None)
+            strong = Config.CASCADE_STRONG or max(priced, key=cost, default=None)
+            if cheap in self.providers and strong in self.providers and cheap != strong:
+                self._cascade = CascadeRouter(self.providers.spec, cheap, strong, race=Config.CASCADE_RACE,
+                                              hedge_delay=Config.CASCADE_HEDGE_DELAY)
+        return self._cascade
+    
+    def check_options(self, provider_name: str, options: Dict) -> Optional[str]:
+        """
+        Check per-request options against a provider without calling it
+        
+        Args:
+            provider_name: Provider the request goes to
+            options: Options from request_options.parse_options
+        
+        Returns:
+            An error message, or None if the request can be sent
+        """
+        if provider_name == CASCADE:
+            if options.get('model'):
+                return "Error: a model cannot be chosen with cascade routing (it picks the provider)"
+            return None
+        if provider_name not in self.providers:
+            return None
+        spec = self.providers.spec(provider_name)
+        max_tokens = options.get('max_tokens')
+        if max_tokens and max_tokens > spec.context_length:
+            return f"Error: max_tokens {max_tokens} exceeds {provider_name}'s context of {spec.context_length} tokens"
+        if options.get('model'):
+            return self.providers[provider_name].check_model(options['model'])
+        return None
+    
+    def list_models(self, provider: Optional[str] = None) -> Optional[List[str]]:
+        """The models a provider offers (cached), or None if it cannot tell"""
+        provider_name = provider or self.current_provider
+        if provider_name not in self.providers:
+            return None
+        models = self.providers[provider_name].allowed_models()
+        return sorted(models) if models is not None else None
+    
+    def _context_spec(self, provider_name: str):
+        """The spec whose context window limits a request, or None if the provider is unknown"""
+        if provider_name == CASCADE:
+            router = self.cascade_router()
+            if router is None:
+                return None
+            # Either provider may end up answering, so the smaller window applies
+            return min((self.providers.spec(router.cheap), self.providers.spec(router.strong)),
+                       key=lambda spec: spec.context_length)
+        if provider_name not in self.providers:
+            return None
+        return self.providers.spec(provider_name)
+    
+    def fit_input(self, provider_name: str, text: str, options: Dict, history: Optional[List[Dict]] = None,
+                  cancel: Optional[CancelToken] = None) -> str:
+        """
+        Make sure an input fits the provider's context window, applying the input policy if not
+        
+        The room for `text` is the context length minus the reply's max_tokens
+        and whatever `history` (the messages sent along with it) takes up.
+        Tokens are counted locally, so nothing is sent for input that cannot fit.
+        
+        Args:
+            provider_name: Provider the request goes to
+            text: The new message or prompt
+            options: Per-request options (model and max_tokens matter here)
+            history: Messages sent with `text`, including the system prompt
+            cancel: Token that aborts a summarization
+        
+        Returns:
+            `text`, or with the 'truncate' / 'summarize' policies a shorter form of it
+        
+        Raises:
+            InputTooLarge: With the 'reject' policy, or when even the history leaves no room
+        """
+        spec = self._context_spec(provider_name)
+        if spec is None:
+            return text
+        model = options.get('model') or spec.default_model or spec.name
+        tokenizer = tokenizer_for(model)
+        reserve = options.get('max_tokens') or DEFAULT_REPLY_TOKENS
+        used = tokenizer.count_messages(history) if history else 0
+        budget = tokenizer.budget(spec.context_length - reserve - used)
+        if tokenizer.fits(text, budget):
+            return text
+        
+        with tracing.span('chatbot.fit_input', provider=provider_name, policy=self.input_policy):
+            tokens = tokenizer.count(text)
+            tracing.set_attribute('tokens', tokens)
+            tracing.set_attribute('budget', budget)
+            counts = (f"{spec.context_length:,} context, {reserve:,} kept for the reply"
+                      + (f", {used:,} used by the conversation" if used else ''))
+            if budget <= 0:
+                raise InputTooLarge(f"Error: the conversation already fills {provider_name}'s context window "
+                                    f"({counts}); reset it or lower max_tokens", tokens, budget)
+            if self.input_policy == 'truncate':
+                return tokenizer.truncate(text, budget)
+            if self.input_policy == 'summarize':
+                summary = self.summarize(text, provider_name, cancel=cancel, **options)
+                if summary.startswith('Error'):
+                    raise InputTooLarge(summary, tokens, budget)
+                note = f"[The original message was {tokens:,} tokens, too long to send; this is a summary of it]\n\n"
+                return tokenizer.truncate(note + summary, budget)
+            raise InputTooLarge(f"Error: the message is {tokens:,} tokens but {provider_name} ({model}) has room "
+                                f"for {budget:,} ({counts})", tokens, budget)
+    
+    def oversized(self, provider_name: str, message: str, options: Dict) -> Optional[InputTooLarge]:
+        """The error a chat message would be rejected with, or None (always None unless the policy is 'reject')"""
+        if self.input_policy != 'reject':
+            return None
+        try:
+            self.fit_input(provider_name, message, options,
+                           history=canonical_messages(self.conversation_history, self.system_prompt))
+        except InputTooLarge as e:
+            return e
+        return None
+    
+    def with_documents(self, provider_name: str, messages: List[Dict], options: Dict) -> List[Dict]:
+        """
+        Put the local document chunks most relevant to the last message in front of it
+        
+        Only chunks scoring at least RAG_MIN_SCORE are used, best first, and only
+        as many as fit in RAG_MAX_TOKENS and the room the context window has left.
+        The stored history keeps the message as the user wrote it.
+        
+        Args:
+            provider_name: Provider the request goes to
+            messages: The messages to send, ending with the new user message
+            options: Per-request options (model and max_tokens matter here)
+        
+        Returns:
+            `messages`, with the excerpts added to the last one if any were relevant
+        """
+        if self.documents is None or not self.use_documents or not messages:
+            return messages
+        spec = self._context_spec(provider_name)
+        if spec is None:
+            return messages
+        with tracing.span('chatbot.retrieve', provider=provider_name):
+            hits = [hit for hit in self.documents.search(messages[-1]['content'], Config.RAG_TOP_K)
+                    if hit.score >= Config.RAG_MIN_SCORE]
+            tokenizer = tokenizer_for(options.get('model') or spec.default_model or spec.name)
+            reserve = options.get('max_tokens') or DEFAULT_REPLY_TOKENS
+            room = tokenizer.budget(spec.context_length - reserve - tokenizer.count_messages(messages))
+            room = min(Config.RAG_MAX_TOKENS, room)
+            selected = []
+            for hit in hits:
+                if tokenizer.count(format_context(selected + [hit])) > room:
+                    break
+                selected.append(hit)
+            tracing.set_attribute('hits', len(hits))
+            tracing.set_attribute('used', len(selected))
+        if not selected:
+            return messages
+        last = messages[-1]
+        return messages[:-1] + [{**last, 'content': f"{format_context(selected)}\n\n{last['content']}"}]
+    
+    def summarize(self, text: str, provider: Optional[str] = None, focus: str = '',
+                  cancel: Optional[CancelToken] = None, **kwargs) -> str:
+        """
+        Summarize text of any length (map-reduce over chunks that fit the context window)
+        
+        Text that fits is summarized in one call. Longer text is cut into
+        chunks, the chunks are summarized concurrently (SUMMARY_CONCURRENCY at
+        a time, within the provider's rate limits) and the partial summaries
+        are combined the same way until one call can merge them.
+        
+        Args:
+            text: The text to summarize
+            provider: Optional provider name (cascade uses its cheap provider)
+            focus: Optional instruction, e.g. "the errors and their causes"
+            cancel: Token that aborts the remaining calls
+            **kwargs: Generation options for every call
+        
+        Returns:
+            The summary, or an 'Error...' message
+        """
+        provider_name = provider or self.current_provider
+        if provider_name == CASCADE and self.cascade_router() is not None:
+            provider_name = self.cascade_router().cheap
+        if provider_name not in self.providers:
+            return f"Error: Provider '{provider_name}' not available"
+        spec = self.providers.spec(provider_name)
+        tokenizer = tokenizer_for(kwargs.get('model') or spec.default_model or spec.name)
+        focus = f"\nFocus on: {focus}" if focus else ''
+        reserve = kwargs.get('max_tokens') or DEFAULT_REPLY_TOKENS
+        chunk_tokens = (tokenizer.budget(spec.context_length - reserve) - SUMMARY_PROMPT_SLACK
+                        - tokenizer.count(SUMMARY_PART_PROMPT.format(index=0, total=0, focus=focus, text='')))
+        if chunk_tokens < SUMMARY_PROMPT_SLACK:
+            return f"Error: {provider_name}'s context window is too small to summarize with max_tokens {reserve}"
+        
+        def call(prompt):
+            if cancel is not None and cancel.cancelled:
+                return "Error: cancelled"
+            return self.generate_text(prompt, provider_name, cancel=cancel, **kwargs)
+        
+        with tracing.span('chatbot.summarize', provider=provider_name):
+            template, level = SUMMARY_PROMPT, 0
+            while not tokenizer.fits(text, chunk_tokens):
+                chunks = tokenizer.split(text, chunk_tokens)
+                tracing.set_attribute(f"level{level}.chunks", len(chunks))
+                prompts = [SUMMARY_PART_PROMPT.format(index=i, total=len(chunks), focus=focus, text=chunk)
+                           for i, chunk in enumerate(chunks, 1)]
+                with ThreadPoolExecutor(max_workers=max(1, Config.SUMMARY_CONCURRENCY),
+                                        thread_name_prefix='summarize') as pool:
+                    summaries = list(pool.map(lambda p: contextvars.copy_context().run(call, p), prompts))
+                for index, summary in enumerate(summaries, 1):
+                    if summary.startswith('Error'):
+                        return f"Error summarizing part {index} of {len(chunks)}: {summary}"
+                combined = '\n\n'.join(f"Part {i}:\n{s}" for i, s in enumerate(summaries, 1))
+                if tokenizer.count(combined) >= tokenizer.count(text):
+                    # Summaries that do not shrink would never converge
+                    combined = tokenizer.truncate(combined, chunk_tokens)
+                text, template, level = combined, SUMMARY_COMBINE_PROMPT, level + 1
+            return call(template.format(focus=focus, text=text))
+    
+    def _cascade_dispatch(self, method: str, prompt: str, payload, cancel: Optional[CancelToken] = None,
+                          **kwargs) -> str:
+        router = self.cascade_router()
+        if router is None:
+            return "Error: Cascade routing needs two text providers (set CASCADE_CHEAP and CASCADE_STRONG)"
+        
+        def call(provider_name, token):
+            # A cancelled turn is not escalated
+            if cancel is not None and cancel.cancelled:
+                return "Error: cancelled"
+            # Streamed, so a race loser's request is closed when the router cancels it
+            return self._dispatch_cancellable(provider_name, method, payload, token, parent=cancel, **kwargs)
+        
+        context = '' if payload is prompt else ' '.join(m['content'] for m in payload[:-1])
+        answer, _served = router.run(call, prompt, context, max_tokens=kwargs.get('max_tokens', 1000))
+        return answer
+    
+    def _dispatch(self, provider_name: str, method: str, payload, **kwargs) -> str:
+        """Call a provider, sharing the upstream call with identical in-flight requests"""
+        provider_obj = self.providers[provider_name]
+        limiter = limiter_for(self.providers.spec(provider_name))
+        
+        def call():
+            try:
+                with limiter.admit():
+                    response = getattr(provider_obj, method)(payload, **kwargs)
+                self.health.record(provider_name, response)
+                return response
+            except RateLimitExceeded as e:
+                return f"Error: {provider_name} rate limit reached ({e})"
+        
+        with tracing.span('chatbot.dispatch', provider=provider_name, method=method):
+            if not Config.COALESCE_REQUESTS:
+                return call()
+            key = request_key(provider_name, method, payload, **kwargs)
+            return self.inflight.do(key, call)
+    
+    def _dispatch_stream(self, provider_name: str, method: str, payload,
+                         cancel: Optional[CancelToken] = None, **kwargs) -> Iterator[str]:
+        """
+        Stream from a provider, fanning one upstream stream out to identical requests
+        
+        A shared upstream call has its own token, cancelled once every caller
+        reading it has been cancelled or gone away.
+        """
+        provider_obj = self.providers[provider_name]
+        limiter = limiter_for(self.providers.spec(provider_name))
+        coalesce = Config.COALESCE_REQUESTS
+        upstream = CancelToken() if coalesce or cancel is None else cancel
+        
+        def call():
+            try:
+                first = True
+                for chunk in limiter.stream(lambda: getattr(provider_obj, method)(payload, cancel=upstream, **kwargs)):
+                    if first:
+                        # Providers report failures as an 'Error...' first chunk
+                        self.health.record(provider_name, chunk)
+                        first = False
+                    yield chunk
+            except RateLimitExceeded as e:
+                yield f"Error: {provider_name} rate limit reached ({e})"
+        
+        if not coalesce:
+            return call()
+        key = request_key(provider_name, method, payload, **kwargs)
+        return self.inflight.stream(key, call, cancel=cancel, on_abandon=lambda: upstream.cancel('abandoned'))
+    
+    def _dispatch_cancellable(self, provider_name: str, method: str, payload, cancel: CancelToken,
+                              parent: Optional[CancelToken] = None, **kwargs) -> str:
+        """
+        A complete response, read from the provider's stream so that `cancel` can abort it upstream
+        
+        Cancelling `parent` (the caller's token, e.g. a stopped turn) cancels the call too.
+        """
+        stream_method = {'chat': 'stream_chat', 'generate_text': 'stream_text'}[method]
+        unlink = parent.on_cancel(lambda: cancel.cancel(parent.reason)) if parent is not None else (lambda: None)
+        try:
+            response = ''.join(self._dispatch_stream(provider_name, stream_method, payload, cancel=cancel, **kwargs))
+        finally:
+            unlink()
+        # Whatever arrived before the cancel is not a complete answer
+        return "Error: cancelled" if cancel.cancelled else response
+    
+    def chat(self, message: str, provider: Optional[str] = None, cancel: Optional[CancelToken] = None,
+             **kwargs) -> str:
         """
         Send a message to the AI and get a response
         
         Args:
             message: The user's message
             provider: Optional provider name to use (defaults to current provider)
+            cancel: Token that aborts the request; the partial reply is kept in the history
             **kwargs: Additional parameters to pass to the provider
         
         Returns:
@@ -98,34 +483,135 @@ class UnifiedAIChatbot:
         """
         provider_name = provider or self.current_provider
         
-        if provider_name not in self.providers:
+        if provider_name not in self.providers and provider_name != CASCADE:
             return f"Error: Provider '{provider_name}' not available. Available providers: {', '.join(self.list_providers())}"
         
-        # Add message to conversation history
-        self.conversation_history.append({
-            'role': 'user',
-            'content': message
-        })
+        # Invalid options fail before the message enters the history
+        error = self.check_options(provider_name, kwargs)
+        if error:
+            return error
         
-        # Get response from provider
-        provider_obj = self.providers[provider_name]
-        response = provider_obj.chat(self.conversation_history, **kwargs)
+        if cancel is not None and provider_name != CASCADE:
+            # Only a stream can be aborted midway, so cancellable turns stream internally
+            return ''.join(self.stream_chat(message, provider_name, cancel=cancel, **kwargs))
         
-        # Add response to conversation history
-        self.conversation_history.append({
-            'role': 'assistant',
-            'content': response
-        })
+        with tracing.span('chatbot.chat', provider=provider_name):
+            # Oversized input is rejected, truncated or summarized before anything is sent
+            try:
+                message = self.fit_input(provider_name, message, kwargs, cancel=cancel,
+                                         history=canonical_messages(self.conversation_history, self.system_prompt))
+            except InputTooLarge as e:
+                return str(e)
+            
+            # Add message to conversation history
+            with tracing.span('chatbot.history', messages=len(self.conversation_history) + 1):
+                turn = {
+                    'role': 'user',
+                    'content': message
+                }
+                self.conversation_history.append(turn)
+                messages = canonical_messages(self.conversation_history, self.system_prompt)
+            messages = self.with_documents(provider_name, messages, kwargs)
+            
+            # Get response from provider
+            if provider_name == CASCADE:
+                response = self._cascade_dispatch('chat', message, messages, cancel=cancel, **kwargs)
+            else:
+                response = self._dispatch(provider_name, 'chat', messages, **kwargs)
+            
+            if response.startswith('Error'):
+                # A failed turn is not part of the conversation, so it is not resent with the next message
+                self._drop_turn(turn)
+                return response
+            
+            # Add response to conversation history
+            self.conversation_history.append({
+                'role': 'assistant',
+                'content': response
+            })
+            
+            return response
+    
+    def _drop_turn(self, turn: Dict):
+        """Remove a user message whose turn failed from the history"""
+        if self.conversation_history and self.conversation_history[-1] is turn:
+            self.conversation_history.pop()
+    
+    def stream_chat(self, message: str, provider: Optional[str] = None, cancel: Optional[CancelToken] = None,
+                    **kwargs) -> Iterator[str]:
+        """
+        Send a message to the AI and stream the response as it is generated
+        
+        Args:
+            message: The user's message
+            provider: Optional provider name to use (defaults to current provider)
+            cancel: Token that ends the stream and aborts the upstream request
+            **kwargs: Additional parameters to pass to the provider
+        
+        Yields:
+            Chunks of the AI's response
+        """
+        provider_name = provider or self.current_provider
+        
+        if provider_name == CASCADE:
+            # The cheap answer must be checked before anything is shown, so it arrives in one piece
+            yield self.chat(message, provider_name, cancel=cancel, **kwargs)
+            return
         
-        return response
+        if provider_name not in self.providers:
+            yield f"Error: Provider '{provider_name}' not available. Available providers: {', '.join(self.list_providers())}"
+            return
+        
+        error = self.check_options(provider_name, kwargs)
+        if error:
+            yield error
+            return
+        
+        try:
+            message = self.fit_input(provider_name, message, kwargs, cancel=cancel,
+                                     history=canonical_messages(self.conversation_history, self.system_prompt))
+        except InputTooLarge as e:
+            yield str(e)
+            return
+        
+        turn = {
+            'role': 'user',
+            'content': message
+        }
+        self.conversation_history.append(turn)
+        
+        messages = self.with_documents(provider_name, canonical_messages(self.conversation_history, self.system_prompt),
+                                       kwargs)
+        chunks = []
+        try:
+            for chunk in self._dispatch_stream(provider_name, 'stream_chat', messages, cancel=cancel, **kwargs):
+                if cancel is not None and cancel.cancelled:
+                    break
+                chunks.append(chunk)
+                yield chunk
+        finally:
+            # Record whatever was received, even if the consumer stopped early or the turn was cancelled
+            if cancel is not None and cancel.cancelled:
+                tracing.add_event('chatbot.cancelled', reason=cancel.reason, chunks=len(chunks))
+            if not chunks or (len(chunks) == 1 and chunks[0].startswith('Error')):
+                # Nothing arrived (cancelled before the first chunk), or the request failed:
+                # providers report a failed request as a single 'Error...' chunk
+                self._drop_turn(turn)
+            else:
+                self.conversation_history.append({
+                    'role': 'assistant',
+                    'content': ''.join(chunks)
+                })
     
-    def generate_text(self, prompt: str, provider: Optional[str] = None, **kwargs) -> str:
+    def generate_text(self, prompt: str, provider: Optional[str] = None, cancel: Optional[CancelToken] = None,
+                      **kwargs) -> str:
         """
         Generate text without conversation history
         
         Args:
             prompt: The prompt to generate text from
             provider: Optional provider name to use
+            cancel: Token that aborts the request, returning what was generated so far
             **kwargs: Additional parameters
         
         Returns:
@@ -133,11 +619,64 @@ class UnifiedAIChatbot:
         """
         provider_name = provider or self.current_provider
         
+        error = self.check_options(provider_name, kwargs)
+        if error:
+            return error
+        
+        if provider_name != CASCADE:
+            if provider_name not in self.providers:
+                return f"Error: Provider '{provider_name}' not available"
+            if cancel is not None:
+                return ''.join(self.stream_text(prompt, provider_name, cancel=cancel, **kwargs))
+        
+        try:
+            prompt = self.fit_input(provider_name, prompt, kwargs, cancel=cancel)
+        except InputTooLarge as e:
+            return str(e)
+        
+        if provider_name == CASCADE:
+            return self._cascade_dispatch('generate_text', prompt, prompt, cancel=cancel, **kwargs)
+        return self._dispatch(provider_name, 'generate_text', prompt, **kwargs)
+    
+    def stream_text(self, prompt: str, provider: Optional[str] = None, cancel: Optional[CancelToken] = None,
+                    **kwargs) -> Iterator[str]:
+        """
+        Stream generated text without conversation history
+        
+        Args:
+            prompt: The prompt to generate text from
+            provider: Optional provider name to use
+            cancel: Token that ends the stream and aborts the upstream request
+            **kwargs: Additional parameters
+        
+        Yields:
+            Chunks of the generated text
+        """
+        provider_name = provider or self.current_provider
+        
+        if provider_name == CASCADE:
+            yield self.generate_text(prompt, provider_name, cancel=cancel, **kwargs)
+            return
+        
         if provider_name not in self.providers:
-            return f"Error: Provider '{provider_name}' not available"
+            yield f"Error: Provider '{provider_name}' not available"
+            return
         
-        provider_obj = self.providers[provider_name]
-        return provider_obj.generate_text(prompt, **kwargs)
+        error = self.check_options(provider_name, kwargs)
+        if error:
+            yield error
+            return
+        
+        try:
+            prompt = self.fit_input(provider_name, prompt, kwargs, cancel=cancel)
+        except InputTooLarge as e:
+            yield str(e)
+            return
+        
+        for chunk in self._dispatch_stream(provider_name, 'stream_text', prompt, cancel=cancel, **kwargs):
+            if cancel is not None and cancel.cancelled:
+                return
+            yield chunk
     
     def generate_image(self, prompt: str, generator: Optional[str] = None, **kwargs) -> str:
         """
@@ -159,6 +698,31 @@ class UnifiedAIChatbot:
         generator_obj = self.image_generators[generator_name]
         return generator_obj.generate_image(prompt, **kwargs)
     
+    def generate_images(self, prompts: List[str], n: int = 1, generator: Optional[str] = None,
+                        **kwargs) -> Iterator[Dict]:
+        """
+        Generate n images for each prompt, concurrently where the generator supports it
+        
+        Args:
+            prompts: Descriptions of the images to generate
+            n: Number of images per prompt
+            generator: Optional generator name (defaults to dalle)
+            **kwargs: Additional parameters, including a `cancel` token that skips images not yet requested
+        
+        Yields:
+            {'prompt', 'index', 'filepath'} or {'prompt', 'index', 'error'} as each image completes
+        """
+        generator_name = generator or Config.DEFAULT_IMAGE_GENERATOR
+        
+        if generator_name not in self.image_generators:
+            error = f"Error: Image generator '{generator_name}' not available. Available: {', '.join(self.image_generators.keys())}"
+            for prompt in prompts:
+                for index in range(n):
+                    yield {'prompt': prompt, 'index': index, 'error': error}
+            return
+        
+        yield from self.image_generators[generator_name].generate_images(prompts, n, **kwargs)
+    
     def generate_video(self, prompt: str, generator: Optional[str] = None, **kwargs) -> str:
         """
         Generate a video from a text prompt
@@ -171,34 +735,80 @@ class UnifiedAIChatbot:
         Returns:
             Path to the generated video file
         """
+        return self._video_generator().generate_video(prompt, **kwargs)
+    
+    def submit_video(self, prompt: str, **kwargs) -> VideoJob:
+        """
+        Start generating a video without waiting for it
+        
+        Args:
+            prompt: Description of the video to generate
+            **kwargs: Additional parameters
+        
+        Returns:
+            A job handle; look it up later with get_video_job
+        """
+        job = self._video_generator().submit_video(prompt, **kwargs)
+        self.video_jobs[job.id] = job
+        # Keep only recent jobs; finished videos stay in the media store
+        while len(self.video_jobs) > 1000:
+            self.video_jobs.popitem(last=False)
+        if get_state() is not None:
+            # Publish the job so any worker can answer status requests for it
+            self._publish_video_job(job)
+            job.add_done_callback(self._publish_video_job)
+        return job
+    
+    def _publish_video_job(self, job: VideoJob):
+        get_state().set(f"video_job:{job.id}", job.to_dict(), ttl=VIDEO_JOB_INDEX_TTL)
+    
+    def get_video_job(self, job_id: str) -> Optional[VideoJob]:
+        return self.video_jobs.get(job_id)
+    
+    def video_job_status(self, job_id: str) -> Optional[Dict]:
+        """Status of a video job started by this or (with shared state) any other worker"""
+        job = self.video_jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        state = get_state()
+        return state.get(f"video_job:{job_id}") if state is not None else None
+    
+    def video_webhook(self, prediction_id: str) -> bool:
+        """Check a Replicate prediction now; the webhook body itself is not trusted"""
+        generator = self.video_generators.get('replicate')
+        return generator is not None and generator.poke(prediction_id)
+    
+    def _video_postprocessor(self) -> Optional[VideoPostProcessor]:
+        if not Config.VIDEO_TRANSCODE:
+            return None
+        store = get_store(Config.VIDEO_OUTPUT_DIR, Config.VIDEO_STORE_QUOTA_MB)
+        return VideoPostProcessor(store, workers=Config.VIDEO_TRANSCODE_WORKERS, hls=Config.VIDEO_HLS)
+    
+    def _video_generator(self):
         # Use replicate if available, otherwise simple
         if 'replicate' in self.video_generators:
-            generator_name = 'replicate'
-        else:
-            generator_name = 'simple'
-        
-        generator_obj = self.video_generators[generator_name]
-        return generator_obj.generate_video(prompt, **kwargs)
+            return self.video_generators['replicate']
+        return self.video_generators['simple']
     
     def reset_conversation(self):
         """Clear the conversation history"""
         self.conversation_history = []
-        
-        # Reset chat sessions for providers that maintain state
-        if 'gemini' in self.providers:
-            self.providers['gemini'].reset_chat()
     
     def get_conversation_history(self) -> List[Dict]:
         """Get the current conversation history"""
         return self.conversation_history
     
-    def arena_chat(self, message: str, providers: List[str] = None) -> Dict[str, str]:
+    def arena_chat(self, message: str, providers: List[str] = None,
+                   on_result: Optional[Callable[[str, str], None]] = None,
+                   cancel: Optional[CancelToken] = None) -> Dict[str, str]:
         """
         Send a message to multiple providers and get their responses
 
         Args:
             message: The user's message
             providers: List of provider names to query. If None, uses all available.
+            on_result: Called with (provider, response) as each contestant answers
+            cancel: Token that aborts every contestant's upstream request
 
         Returns:
             Dictionary mapping provider names to their responses
@@ -206,15 +816,89 @@ class UnifiedAIChatbot:
         if not providers:
             providers = self.list_providers()
 
-        results = {}
+        results = {p: f"Error: Provider {p} not available" for p in providers if p not in self.providers}
+        available = [p for p in providers if p in self.providers]
+        # Query all contestants at once; generate_text keeps the conversation history untouched
+        completed = fan_out(lambda p, token: self._dispatch_cancellable(p, 'generate_text', message, token,
+                                                                         parent=cancel), available)
+        for _ in available:
+            provider, response, _latency = completed.get()
+            results[provider] = response
+            if on_result:
+                on_result(provider, response)
+
+        return {p: results[p] for p in providers}
+
+    def arena_stream(self, message: str, providers: List[str] = None,
+                     cancel: Optional[CancelToken] = None) -> Iterator[Tuple[str, Optional[str], float]]:
+        """
+        Stream a message from several providers at once
+        
+        Args:
+            message: The user's message
+            providers: Provider names to query. If None, uses all available.
+            cancel: Token that stops every stream and aborts the upstream requests
+        
+        Yields:
+            (provider, chunk, time.perf_counter() when it arrived) as chunks come in from any
+            provider; each provider ends with a None chunk
+        """
+        providers = providers or self.list_providers()
+        events = queue.Queue()
+        
+        def worker(provider):
+            try:
+                for chunk in self.stream_text(message, provider, cancel=cancel):
+                    events.put((provider, chunk, time.perf_counter()))
+            except Exception as e:
+                events.put((provider, f"Error: {e}", time.perf_counter()))
+            events.put((provider, None, time.perf_counter()))
+        
         for provider in providers:
-            if provider in self.providers:
-                # Use generate_text for arena mode to avoid affecting conversation history state
-                results[provider] = self.providers[provider].generate_text(message)
-            else:
-                results[provider] = f"Error: Provider {provider} not available"
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(worker, provider), name=f"arena-{provider}",
+                             daemon=True).start()
+        remaining = len(providers)
+        while remaining:
+            event = events.get()
+            remaining -= event[1] is None
+            yield event
+    
+    def ensemble_chat(self, message: str, providers: List[str] = None, strategy: str = 'auto',
+                      quorum: Optional[int] = None, judge: Optional[str] = None,
+                      cancel: Optional[CancelToken] = None) -> Dict:
+        """
+        Ask several providers at once and settle on a single answer
 
-        return results
+        Args:
+            message: The user's message
+            providers: Provider names to query. If None, uses all available.
+            strategy: 'vote' (majority of short answers), 'judge' (a model picks the best) or 'auto'
+            quorum: Matching answers that end the vote early (default: a majority)
+            judge: Provider used as judge (defaults to ENSEMBLE_JUDGE, else the cheapest one queried)
+            cancel: Token that aborts the providers' and the judge's upstream requests
+
+        Returns:
+            The chosen answer with per-provider latency, status and contribution
+        """
+        providers = [p for p in (providers or self.list_providers()) if p in self.providers]
+        judge_name = judge or self._ensemble_judge(providers)
+        judge_call = (lambda prompt: self._dispatch_cancellable(judge_name, 'generate_text', prompt, CancelToken(),
+                                                                parent=cancel, temperature=0)) \
+            if judge_name else None
+        # Through the stream, so the calls a quorum makes unnecessary are aborted upstream
+        call = lambda p, token: self._dispatch_cancellable(p, 'generate_text', message, token, parent=cancel)
+        result = run_ensemble(call, providers, message,
+                              strategy=strategy, quorum=quorum, judge=judge_call,
+                              timeout=Config.ENSEMBLE_TIMEOUT)
+        result['judge'] = judge_name if result['strategy'] == 'judge' else None
+        return result
+
+    def _ensemble_judge(self, providers: List[str]) -> Optional[str]:
+        if Config.ENSEMBLE_JUDGE in self.providers:
+            return Config.ENSEMBLE_JUDGE
+        priced = [p for p in providers if self.providers.spec(p).input_price_per_1k > 0]
+        return min(priced, key=lambda p: self.providers.spec(p).estimate_cost(1000, 100), default=None)
 
     def get_status(self) -> Dict:
         """Get the status of all providers and generators"""
@@ -223,5 +907,14 @@ class UnifiedAIChatbot:
             'available_text_providers': self.list_providers(),
             'available_image_generators': list(self.image_generators.keys()),
             'available_video_generators': list(self.video_generators.keys()),
-            'conversation_length': len(self.conversation_history)
+            'conversation_length': len(self.conversation_history),
+            'in_flight_requests': self.inflight.in_flight(),
+            'cascade': self._cascade_status(),
+            'documents': self.documents.stats() if self.documents is not None else None
         }
+    
+    def _cascade_status(self) -> Optional[Dict]:
+        router = self.cascade_router()
+        if router is None:
+            return None
+        return {'cheap': router.cheap, 'strong': router.strong, 'race': router.race, **router.stats.to_dict()}
@@ -3,15 +3,29 @@
 CLI Interface for the Unified AI Chatbot
 """
 import sys
+import signal
+import asyncio
 import argparse
+from typing import List, Optional
 from rich.console import Console
+from rich.live import Live
 from rich.panel import Panel
 from rich.markdown import Markdown
 from rich.prompt import Prompt, Confirm
 from rich.table import Table
 
+try:
+    from prompt_toolkit import PromptSession
+    from prompt_toolkit.patch_stdout import patch_stdout
+except ImportError:
+    PromptSession = None
+
+from arena_view import ArenaView
+from background_jobs import BackgroundJob, JobManager, format_elapsed, run_in_thread
+from cancellation import CancelToken
 from chatbot import UnifiedAIChatbot
 from config import Config
+from request_options import OPTION_NAMES, InvalidOptions, parse_assignments, parse_options
 
 
 console = Console()
@@ -34,12 +48,18 @@ Welcome to the Unified AI Chatbot! This chatbot integrates multiple AI providers
 **Commands:**
 - `/help` - Show this help message
 - `/providers` - List available AI providers
-- `/switch <provider>` - Switch to a different AI provider
-- `/image <prompt>` - Generate an image
-- `/video <prompt>` - Generate a video
-- `/arena <message>` - Compare responses from multiple providers
+- `/switch <provider>` - Switch to a different AI provider (`cascade`: cheap model first, escalate when needed)
+- `/models` - List the current provider's models
+- `/set model=<name> temperature=<0-2> max_tokens=<n>` - Set generation options (`model=` resets one; `/set` shows them)
+- `/image [-n K] <prompt> [| <prompt> ...]` - Generate K images per prompt (in the background)
+- `/video <prompt>` - Generate a video (in the background)
+- `/arena [-b] <message>` - Stream every provider's answer side by side with its timings (`-b`: in the background)
+- `/ensemble <message>` - Ask all providers and agree on one answer
+- `/docs [on|off]` - Use the local document index in chat turns (`python document_index.py ingest <paths>` builds it)
 - `/reset` - Clear conversation history
 - `/status` - Show current status
+- `/jobs` - List background jobs
+- `/cancel <id>` - Cancel a background job
 - `/exit` or `/quit` - Exit the chatbot
 """
     console.print(Panel(Markdown(welcome_text), title="Welcome", border_style="blue"))
@@ -58,16 +78,424 @@ def display_status(chatbot: UnifiedAIChatbot):
     table.add_row("Image Generators", ", ".join(status['available_image_generators']))
     table.add_row("Video Generators", ", ".join(status['available_video_generators']))
     table.add_row("Conversation Messages", str(status['conversation_length']))
+    cascade = status.get('cascade')
+    if cascade:
+        table.add_row("Cascade", f"{cascade['cheap']} → {cascade['strong']}"
+                                 f"{' (race)' if cascade['race'] else ''}")
+        if cascade['requests']:
+            table.add_row("Cascade Savings",
+                          f"{cascade['served_by_cheap']}/{cascade['requests']} served cheap, "
+                          f"${cascade['cost_saved_usd']:.4f} and {cascade['latency_saved_ms'] / 1000:.1f}s saved")
+    documents = status.get('documents')
+    if documents:
+        table.add_row("Documents", f"{documents['documents']} files, {documents['chunks']:,} chunks"
+                                   f"{'' if chatbot.use_documents else ' (off)'}")
     
     console.print(table)
 
 
+def display_ensemble(result: dict):
+    """Show an ensemble answer and how each provider took part"""
+    table = Table(title="Ensemble", show_header=True, header_style="bold magenta")
+    table.add_column("Provider", style="cyan")
+    table.add_column("Status")
+    table.add_column("Latency", justify="right")
+    table.add_column("Contributed", justify="center")
+    for provider, entry in result['providers'].items():
+        latency = f"{entry['latency_ms']:.0f} ms" if entry['latency_ms'] is not None else "-"
+        table.add_row(provider, entry['status'], latency, "✓" if entry['contributed'] else "")
+    console.print(table)
+    
+    title = f"{result['winner'] or 'no answer'} · {result['strategy']} · agreement {result['agreement']}"
+    console.print(Panel(Markdown(result['answer']), title=title, border_style="green"))
+
+
+def parse_image_args(arg: str):
+    """Split '/image [-n K] a | b' into the image count and the list of prompts"""
+    count = 1
+    parts = arg.split(maxsplit=2)
+    if len(parts) >= 2 and parts[0] == '-n' and parts[1].isdigit():
+        count = max(1, int(parts[1]))
+        arg = parts[2] if len(parts) > 2 else ''
+    prompts = [p.strip() for p in arg.split('|') if p.strip()]
+    return count, prompts
+
+
+def display_arena(results: dict):
+    """Show the contestants' answers side by side"""
+    table = Table(title="Arena Result", show_header=True, header_style="bold magenta", show_lines=True)
+    for provider in results:
+        table.add_column(provider.upper(), style="cyan", overflow="fold")
+    
+    # Add a single row with all responses
+    table.add_row(*[results[p] or "No response" for p in results])
+    console.print(table)
+
+
+def display_jobs(jobs: List[BackgroundJob]):
+    """List background jobs, running and recently finished"""
+    if not jobs:
+        console.print("[yellow]No background jobs[/yellow]")
+        return
+    
+    table = Table(title="Background Jobs", show_header=True, header_style="bold magenta")
+    table.add_column("ID", justify="right")
+    table.add_column("Kind", style="cyan")
+    table.add_column("Status")
+    table.add_column("Progress")
+    table.add_column("Elapsed", justify="right")
+    table.add_column("Prompt", overflow="fold")
+    for job in jobs:
+        table.add_row(str(job.id), job.kind, job.status, job.progress, format_elapsed(job.elapsed), job.label)
+    console.print(table)
+
+
+def announce_job(job: BackgroundJob):
+    """Print a background job's result above the prompt once it ends"""
+    heading = f"Job #{job.id} ({job.kind}) {job.status} after {format_elapsed(job.elapsed)}"
+    if job.status == 'cancelled':
+        console.print(f"\n[yellow]{heading}[/yellow] [dim]({job.label})[/dim]")
+        return
+    if job.status == 'failed':
+        console.print(f"\n[red]{heading}: {job.error}[/red] [dim]({job.label})[/dim]")
+        return
+    
+    console.print(f"\n[green]{heading}[/green] [dim]({job.label})[/dim]")
+    if job.kind == 'image':
+        for result in job.result:
+            label = f"{result['prompt'][:40]} #{result['index'] + 1}"
+            if 'filepath' in result:
+                console.print(f"[green]Image saved to:[/green] {result['filepath']} [dim]({label})[/dim]")
+            else:
+                console.print(f"[red]{result['error']}[/red] [dim]({label})[/dim]")
+    elif job.kind == 'video':
+        if job.result.startswith('Error'):
+            console.print(f"[red]{job.result}[/red]")
+        else:
+            console.print(f"[green]Video saved to:[/green] {job.result}")
+    elif job.kind == 'arena':
+        display_arena(job.result)
+
+
+def image_job(chatbot: UnifiedAIChatbot, prompts: List[str], count: int):
+    """Background work for /image: images are counted as they are saved"""
+    total = count * len(prompts)
+    
+    def work(job: BackgroundJob):
+        results = []
+        job.progress = f"0/{total}"
+        # Requests not yet sent are skipped once the job is cancelled
+        for result in chatbot.generate_images(prompts, count, cancel=job.cancel):
+            results.append(result)
+            job.progress = f"{len(results)}/{total}"
+            if job.cancel.cancelled:
+                break
+        return results
+    return work
+
+
+def video_job(chatbot: UnifiedAIChatbot, prompt: str):
+    """Background work for /video: follows the video job until it finishes"""
+    def work(job: BackgroundJob):
+        handle = chatbot.submit_video(prompt)
+        # Cancelling the job cancels the prediction, so it stops running (and billing) upstream
+        job.cancel.on_cancel(handle.cancel)
+        while not handle.wait(0.5):
+            if job.cancel.cancelled:
+                return None
+            job.progress = handle.status
+        return handle.result()
+    return work
+
+
+def arena_job(chatbot: UnifiedAIChatbot, message: str, providers: List[str]):
+    """Background work for /arena: counts the contestants that have answered"""
+    def work(job: BackgroundJob):
+        answered = []
+        job.progress = f"0/{len(providers)}"
+        
+        def on_result(provider, _response):
+            answered.append(provider)
+            job.progress = f"{len(answered)}/{len(providers)}"
+        return chatbot.arena_chat(message, providers, on_result=on_result, cancel=job.cancel)
+    return work
+
+
+class ChatREPL:
+    """
+    The interactive loop
+    
+    Runs on asyncio: chat turns and the live arena are awaited in the
+    foreground (Ctrl+C stops them), while image, video and `/arena -b`
+    requests become background jobs so the prompt comes straight back. With prompt_toolkit installed and a
+    terminal attached, a status bar shows the running jobs and finished jobs
+    are printed above the prompt; otherwise input is read with rich on a
+    thread and the jobs are announced all the same.
+    """
+    
+    def __init__(self, chatbot: UnifiedAIChatbot, options: Optional[dict] = None):
+        self.chatbot = chatbot
+        # Generation options (model, temperature, max_tokens) sent with every chat turn
+        self.options = dict(options or {})
+        self.jobs = JobManager(announce_job)
+        self.foreground: Optional[CancelToken] = None
+        self.session = None
+        if PromptSession is not None and sys.stdin.isatty():
+            self.session = PromptSession(bottom_toolbar=self.status_bar, refresh_interval=0.5)
+    
+    def status_bar(self) -> str:
+        jobs = self.jobs.status_line()
+        provider = self.chatbot.current_provider
+        if self.options.get('model'):
+            provider += f" ({self.options['model']})"
+        return f" {provider} │ {jobs or 'no background jobs'}"
+    
+    async def read_line(self) -> str:
+        if self.session is not None:
+            # SIGINT stays with our handler; at the prompt Ctrl+C arrives as a key press anyway
+            return await self.session.prompt_async('\nYou: ', handle_sigint=False)
+        return await run_in_thread(lambda: Prompt.ask("\n[bold cyan]You[/bold cyan]"))
+    
+    def interrupt(self):
+        """Ctrl+C: stop the reply being generated, if any"""
+        if self.foreground is not None:
+            self.foreground.cancel('interrupted')
+        else:
+            console.print("\n[yellow]Interrupted. Type /exit to quit.[/yellow]")
+    
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGINT, self.interrupt)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+        
+        if self.session is not None:
+            with patch_stdout(raw=True):
+                await self.loop()
+        else:
+            await self.loop()
+    
+    async def loop(self):
+        while True:
+            try:
+                user_input = (await self.read_line()).strip()
+            except KeyboardInterrupt:
+                console.print("[yellow]Interrupted. Type /exit to quit.[/yellow]")
+                continue
+            except EOFError:
+                user_input = '/exit'
+            
+            if not user_input:
+                continue
+            try:
+                if user_input.startswith('/'):
+                    if not await self.command(user_input):
+                        break
+                else:
+                    await self.chat_turn(user_input)
+            except Exception as e:
+                console.print(f"[red]Error: {e}[/red]")
+    
+    async def chat_turn(self, user_input: str):
+        console.print("[yellow]Thinking... (Ctrl+C to stop)[/yellow]")
+        cancel = self.foreground = CancelToken()
+        try:
+            response = await run_in_thread(lambda: self.chatbot.chat(user_input, cancel=cancel, **self.options))
+        finally:
+            self.foreground = None
+        
+        console.print(f"\n[bold green]{self.chatbot.current_provider.upper()}[/bold green]")
+        if response:
+            console.print(Panel(Markdown(response), border_style="green"))
+        if cancel.cancelled:
+            console.print("[yellow]Stopped. The partial reply was kept in the conversation.[/yellow]")
+    
+    async def arena(self, message: str, providers: List[str]):
+        """Stream every provider's answer live, then print the timings and answers in full"""
+        console.print("[yellow]Streaming... (Ctrl+C to stop)[/yellow]")
+        cancel = self.foreground = CancelToken()
+        view = ArenaView(message, providers)
+        cancel.on_cancel(view.stop)
+        # Live redraws in place, so it writes to the terminal itself rather than above the prompt
+        screen = Console(file=sys.__stdout__)
+        
+        def stream():
+            with Live(get_renderable=lambda: view.render(screen.width, screen.height), console=screen,
+                      refresh_per_second=8, transient=True, redirect_stdout=False, redirect_stderr=False):
+                for provider, chunk, at in self.chatbot.arena_stream(message, providers, cancel=cancel):
+                    view.feed(provider, chunk, at)
+        
+        try:
+            await run_in_thread(stream)
+        finally:
+            self.foreground = None
+        for renderable in view.final(screen.width):
+            console.print(renderable)
+        if cancel.cancelled:
+            console.print("[yellow]Stopped. Timings cover what arrived before the stop.[/yellow]")
+    
+    async def set_options(self, assignments: str):
+        """/set name=value ...: validate the new options against the current provider, then keep them"""
+        try:
+            values = {**self.options, **parse_assignments(assignments)}
+            options = parse_options(values)
+        except InvalidOptions as e:
+            console.print(f"[red]✗[/red] {e}")
+            return
+        provider = self.chatbot.current_provider
+        error = await run_in_thread(lambda: self.chatbot.check_options(provider, options))
+        if error:
+            console.print(f"[red]✗[/red] {error}")
+            return
+        self.options = options
+        shown = ', '.join(f"{name}={options[name]}" for name in OPTION_NAMES if name in options)
+        console.print(f"[green]Options:[/green] {shown or 'provider defaults'}")
+    
+    def start_job(self, kind: str, label: str, work):
+        job = self.jobs.start(kind, label, work)
+        console.print(f"[yellow]Started job #{job.id} ({kind}). /jobs to list, /cancel {job.id} to stop.[/yellow]")
+    
+    async def command(self, user_input: str) -> bool:
+        """Handle a /command; False means exit"""
+        chatbot = self.chatbot
+        command_parts = user_input.split(maxsplit=1)
+        command = command_parts[0].lower()
+        command_arg = command_parts[1] if len(command_parts) > 1 else ""
+        
+        if command in ['/exit', '/quit']:
+            cancelled = self.jobs.cancel_all()
+            if cancelled:
+                console.print(f"[yellow]Cancelled {cancelled} background job(s)[/yellow]")
+            console.print("[yellow]Goodbye![/yellow]")
+            return False
+        
+        elif command == '/help':
+            display_welcome()
+        
+        elif command == '/providers':
+            providers = chatbot.list_providers()
+            console.print(f"[green]Available providers:[/green] {', '.join(providers)}")
+            if chatbot.cascade_router():
+                router = chatbot.cascade_router()
+                console.print(f"[green]Cascade:[/green] {router.cheap} → {router.strong} (/switch cascade)")
+            console.print(f"[cyan]Current provider:[/cyan] {chatbot.current_provider}")
+        
+        elif command == '/switch':
+            if command_arg:
+                if chatbot.set_provider(command_arg):
+                    console.print(f"[green]✓[/green] Switched to {command_arg}")
+                    if self.options.pop('model', None):
+                        # Model names belong to one provider
+                        console.print("[yellow]Model reset to the provider's default[/yellow]")
+                else:
+                    console.print(f"[red]✗[/red] Provider {command_arg} not available")
+            else:
+                console.print("[red]Usage: /switch <provider>[/red]")
+        
+        elif command == '/models':
+            provider = chatbot.current_provider
+            models = await run_in_thread(lambda: chatbot.list_models(provider))
+            if models:
+                console.print(f"[green]Models from {provider}:[/green] {', '.join(models)}")
+            else:
+                console.print(f"[yellow]{provider} does not list its models[/yellow]")
+        
+        elif command == '/set':
+            await self.set_options(command_arg)
+        
+        elif command == '/docs':
+            if chatbot.documents is None:
+                console.print("[yellow]No document index; build one with "
+                              "python document_index.py ingest <paths> and restart[/yellow]")
+            elif command_arg.lower() in ('on', 'off'):
+                chatbot.use_documents = command_arg.lower() == 'on'
+                console.print(f"[green]✓[/green] Documents {command_arg.lower()}")
+            else:
+                stats = chatbot.documents.stats()
+                console.print(f"[green]Documents:[/green] {stats['documents']} files, {stats['chunks']:,} chunks "
+                              f"in {stats['directory']} ({'on' if chatbot.use_documents else 'off'})")
+        
+        elif command == '/reset':
+            chatbot.reset_conversation()
+            console.print("[green]✓[/green] Conversation history cleared")
+        
+        elif command == '/status':
+            display_status(chatbot)
+        
+        elif command == '/jobs':
+            display_jobs(self.jobs.jobs())
+        
+        elif command == '/cancel':
+            if command_arg.lstrip('#').isdigit():
+                job_id = int(command_arg.lstrip('#'))
+                if self.jobs.cancel(job_id):
+                    console.print(f"[green]✓[/green] Cancelling job #{job_id}")
+                else:
+                    console.print(f"[red]✗[/red] No running job #{job_id}")
+            else:
+                console.print("[red]Usage: /cancel <job id>[/red]")
+        
+        elif command == '/image':
+            count, prompts = parse_image_args(command_arg)
+            if prompts:
+                self.start_job('image', ' | '.join(prompts), image_job(chatbot, prompts, count))
+            else:
+                console.print("[red]Usage: /image [-n K] <description> [| <description> ...][/red]")
+        
+        elif command == '/video':
+            if command_arg:
+                self.start_job('video', command_arg, video_job(chatbot, command_arg))
+            else:
+                console.print("[red]Usage: /video <description>[/red]")
+        
+        elif command == '/arena':
+            background = command_arg.startswith('-b ')
+            message = command_arg[3:].strip() if background else command_arg
+            if message:
+                available_providers = chatbot.list_providers()
+                if not available_providers:
+                    console.print("[red]No providers available[/red]")
+                elif background:
+                    console.print(f"[yellow]Contestants: {', '.join(available_providers)}[/yellow]")
+                    self.start_job('arena', message, arena_job(chatbot, message, available_providers))
+                else:
+                    await self.arena(message, available_providers)
+            else:
+                console.print("[red]Usage: /arena [-b] <message>[/red]")
+        
+        elif command == '/ensemble':
+            if command_arg:
+                console.print(f"[yellow]Asking {', '.join(chatbot.list_providers())}... (Ctrl+C to stop)[/yellow]")
+                cancel = self.foreground = CancelToken()
+                try:
+                    result = await run_in_thread(lambda: chatbot.ensemble_chat(command_arg, cancel=cancel))
+                finally:
+                    self.foreground = None
+                display_ensemble(result)
+            else:
+                console.print("[red]Usage: /ensemble <message>[/red]")
+        
+        else:
+            console.print(f"[red]Unknown command: {command}[/red]")
+            console.print("[yellow]Type /help for available commands[/yellow]")
+        
+        return True
+
+
 def main():
     """Main CLI application"""
     parser = argparse.ArgumentParser(description="Multi-AI Chatbot CLI")
     parser.add_argument('--provider', type=str, help='Default AI provider to use')
     parser.add_argument('--no-interactive', action='store_true', help='Non-interactive mode')
+    parser.add_argument('--model', type=str, help="Model to use instead of the provider's default")
+    parser.add_argument('--temperature', type=float, help='Sampling temperature (0-2)')
+    parser.add_argument('--max-tokens', type=int, help='Maximum tokens per response')
     args = parser.parse_args()
+    try:
+        options = parse_options(vars(args))
+    except InvalidOptions as e:
+        parser.error(str(e))
     
     # Validate configuration
     valid, errors = Config.validate()
@@ -94,6 +522,9 @@ def main():
     
     # Display welcome message
     if not args.no_interactive:
+        if Config.WARMUP_ENABLED:
+            # Connect to every provider while the user reads the welcome text
+            chatbot.health.probe_all()
         display_welcome()
         display_status(chatbot)
         console.print()
@@ -101,114 +532,13 @@ def main():
         # In non-interactive mode, just exit after initialization verification
         console.print("[green]Chatbot initialized successfully in non-interactive mode.[/green]")
         return
-
-    # Main interaction loop
-    while True:
-        try:
-            # Get user input
-            user_input = Prompt.ask("\n[bold cyan]You[/bold cyan]").strip()
-            
-            if not user_input:
-                continue
-            
-            # Handle commands
-            if user_input.startswith('/'):
-                command_parts = user_input.split(maxsplit=1)
-                command = command_parts[0].lower()
-                command_arg = command_parts[1] if len(command_parts) > 1 else ""
-                
-                if command in ['/exit', '/quit']:
-                    console.print("[yellow]Goodbye![/yellow]")
-                    break
-                
-                elif command == '/help':
-                    display_welcome()
-                
-                elif command == '/providers':
-                    providers = chatbot.list_providers()
-                    console.print(f"[green]Available providers:[/green] {', '.join(providers)}")
-                    console.print(f"[cyan]Current provider:[/cyan] {chatbot.current_provider}")
-                
-                elif command == '/switch':
-                    if command_arg:
-                        if chatbot.set_provider(command_arg):
-                            console.print(f"[green]✓[/green] Switched to {command_arg}")
-                        else:
-                            console.print(f"[red]✗[/red] Provider {command_arg} not available")
-                    else:
-                        console.print("[red]Usage: /switch <provider>[/red]")
-                
-                elif command == '/reset':
-                    chatbot.reset_conversation()
-                    console.print("[green]✓[/green] Conversation history cleared")
-                
-                elif command == '/status':
-                    display_status(chatbot)
-                
-                elif command == '/image':
-                    if command_arg:
-                        console.print(f"[yellow]Generating image...[/yellow]")
-                        result = chatbot.generate_image(command_arg)
-                        console.print(f"[green]Image saved to:[/green] {result}")
-                    else:
-                        console.print("[red]Usage: /image <description>[/red]")
-                
-                elif command == '/video':
-                    if command_arg:
-                        console.print(f"[yellow]Generating video... (this may take a while)[/yellow]")
-                        result = chatbot.generate_video(command_arg)
-                        console.print(f"[green]Video saved to:[/green] {result}")
-                    else:
-                        console.print("[red]Usage: /video <description>[/red]")
-
-                elif command == '/arena':
-                    if command_arg:
-                        console.print(f"[yellow]Entering Arena with message: {command_arg}[/yellow]")
-
-                        available_providers = chatbot.list_providers()
-                        if not available_providers:
-                             console.print("[red]No providers available[/red]")
-                             continue
-
-                        console.print(f"[yellow]Contestants: {', '.join(available_providers)}[/yellow]")
-
-                        # Limit to 3 providers for display sanity if too many
-                        if len(available_providers) > 3:
-                            console.print("[yellow]Warning: Limiting display to first 3 providers[/yellow]")
-                            available_providers = available_providers[:3]
-
-                        results = chatbot.arena_chat(command_arg, available_providers)
-
-                        # Display results in a table
-                        table = Table(title=f"Arena Result", show_header=True, header_style="bold magenta", show_lines=True)
-                        for provider in available_providers:
-                            table.add_column(provider.upper(), style="cyan", overflow="fold")
-
-                        # Add a single row with all responses
-                        responses = [results.get(p, "No response") for p in available_providers]
-                        table.add_row(*responses)
-
-                        console.print(table)
-                    else:
-                        console.print("[red]Usage: /arena <message>[/red]")
-                
-                else:
-                    console.print(f"[red]Unknown command: {command}[/red]")
-                    console.print("[yellow]Type /help for available commands[/yellow]")
-                
-                continue
-            
-            # Regular chat message
-            console.print("[yellow]Thinking...[/yellow]")
-            response = chatbot.chat(user_input)
-            
-            console.print(f"\n[bold green]{chatbot.current_provider.upper()}[/bold green]")
-            console.print(Panel(Markdown(response), border_style="green"))
-        
-        except KeyboardInterrupt:
-            console.print("\n[yellow]Interrupted. Type /exit to quit.[/yellow]")
-        except Exception as e:
-            console.print(f"[red]Error: {e}[/red]")
+    
+    error = chatbot.check_options(chatbot.current_provider, options)
+    if error:
+        console.print(f"[red]✗[/red] {error}")
+        sys.exit(1)
+    
+    asyncio.run(ChatREPL(chatbot, options).run())
 
 
 if __name__ == "__main__":
@@ -21,13 +21,146 @@ class Config:
     STABILITY_API_KEY = os.getenv('STABILITY_API_KEY', '')
     REPLICATE_API_TOKEN = os.getenv('REPLICATE_API_TOKEN', '')
     
+    # API endpoints (override to point at a proxy or local mock server)
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None
+    DEEPSEEK_BASE_URL = os.getenv('DEEPSEEK_BASE_URL', 'https://api.deepseek.com')
+    XAI_BASE_URL = os.getenv('XAI_BASE_URL', 'https://api.x.ai/v1')
+    GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT') or None
+    
+    # Provider catalog file (TOML, JSON or YAML), see providers.example.toml
+    PROVIDER_CATALOG = Path(os.getenv('PROVIDER_CATALOG', 'providers.toml'))
+    
+    # Local llama.cpp model (offline default provider when configured)
+    LOCAL_MODEL_PATH = os.getenv('LOCAL_MODEL_PATH', '')
+    LOCAL_MODEL_THREADS = int(os.getenv('LOCAL_MODEL_THREADS', '0'))  # 0 = all cores
+    LOCAL_MODEL_PRELOAD = os.getenv('LOCAL_MODEL_PRELOAD', 'true').lower() == 'true'
+    
+    # System prompt sent first in every conversation; keep it stable so upstream prompt caches hit
+    SYSTEM_PROMPT = os.getenv('SYSTEM_PROMPT', '')
+    # Memory for the local model's KV-state snapshots per conversation prefix (0 disables)
+    PREFIX_CACHE_MB = int(os.getenv('PREFIX_CACHE_MB', '512'))
+    
+    # Ensemble mode: judge provider for long answers (default: cheapest queried) and overall wait
+    ENSEMBLE_JUDGE = os.getenv('ENSEMBLE_JUDGE', '')
+    ENSEMBLE_TIMEOUT = float(os.getenv('ENSEMBLE_TIMEOUT', '60'))
+    
+    # Cascade routing (provider 'cascade'): cheap provider first, strong one on escalation.
+    # Empty picks the cheapest / most expensive priced provider. With CASCADE_RACE the strong
+    # provider also starts when the cheap one has not answered within CASCADE_HEDGE_DELAY seconds
+    CASCADE_CHEAP = os.getenv('CASCADE_CHEAP', '')
+    CASCADE_STRONG = os.getenv('CASCADE_STRONG', '')
+    CASCADE_RACE = os.getenv('CASCADE_RACE', 'false').lower() == 'true'
+    CASCADE_HEDGE_DELAY = float(os.getenv('CASCADE_HEDGE_DELAY', '2'))
+    
+    # Request scheduling in the web app: concurrent slots, slots kept free for interactive requests,
+    # waiting requests per class before 503, default deadlines (seconds) and tenant weights
+    SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', 'true').lower() == 'true'
+    SCHEDULER_SLOTS = int(os.getenv('SCHEDULER_SLOTS', '16'))
+    SCHEDULER_INTERACTIVE_RESERVE = int(os.getenv('SCHEDULER_INTERACTIVE_RESERVE', '4'))
+    SCHEDULER_QUEUE_DEPTH = int(os.getenv('SCHEDULER_QUEUE_DEPTH', '64'))
+    SCHEDULER_DEADLINES = os.getenv('SCHEDULER_DEADLINES', 'interactive=30,batch=600,background=900')
+    SCHEDULER_TENANT_WEIGHTS = os.getenv('SCHEDULER_TENANT_WEIGHTS', '')  # e.g. "team-key=2,demo-key=0.5"
+    
+    # Web responses: negotiated compression above a size threshold (server preference order; zstd and
+    # br need the zstandard / brotli packages) and orjson serialization when installed
+    COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+    COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', '1024'))
+    COMPRESSION_ENCODINGS = os.getenv('COMPRESSION_ENCODINGS', 'zstd,br,gzip')
+    FAST_JSON = os.getenv('FAST_JSON', 'true').lower() == 'true'
+    
+    # State shared by web worker processes (rate limits, counters, job index):
+    # '' keeps it per process, sqlite:///path/state.sqlite3 for one host, redis://host:6379/0 across hosts.
+    # Concurrency slots are leases that expire after SHARED_LEASE_SECONDS if a worker dies holding them
+    SHARED_STATE_URL = os.getenv('SHARED_STATE_URL', '')
+    SHARED_LEASE_SECONDS = float(os.getenv('SHARED_LEASE_SECONDS', '600'))
+    
+    # Web chat sessions (conversation and provider per browser or X-Session-Id), kept in the shared
+    # store when configured: idle lifetime in seconds and messages kept per conversation
+    SESSION_TTL = float(os.getenv('SESSION_TTL', str(7 * 24 * 3600)))
+    SESSION_MAX_MESSAGES = int(os.getenv('SESSION_MAX_MESSAGES', '200'))
+    
+    # Reverse proxies in front of the web app whose X-Forwarded-For/-Proto headers are trusted
+    PROXY_HOPS = int(os.getenv('PROXY_HOPS', '0'))
+    
+    # Provider warm-up at web startup: every provider is built and probed in parallel (no tokens are
+    # generated), waiting at most WARMUP_DEADLINE seconds before readiness is decided. Probes repeat
+    # every HEALTH_PROBE_INTERVAL seconds (0 = only at startup), and a provider is marked failing after
+    # HEALTH_FAILURE_THRESHOLD errors in a row. /readyz needs the HEALTH_REQUIRED_PROVIDERS
+    # (comma-separated) to be healthy, or any one provider when empty
+    WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+    WARMUP_DEADLINE = float(os.getenv('WARMUP_DEADLINE', '10'))
+    HEALTH_PROBE_INTERVAL = float(os.getenv('HEALTH_PROBE_INTERVAL', '60'))
+    HEALTH_FAILURE_THRESHOLD = int(os.getenv('HEALTH_FAILURE_THRESHOLD', '3'))
+    HEALTH_REQUIRED_PROVIDERS = os.getenv('HEALTH_REQUIRED_PROVIDERS', '')
+    
+    # Seconds a provider's model list (used to reject unknown per-request models locally) is cached
+    MODELS_CACHE_TTL = float(os.getenv('MODELS_CACHE_TTL', '3600'))
+    
+    # Input that does not fit the provider's context window (counted locally, see token_budget.py):
+    # 'reject' answers with an error naming the counts, 'truncate' keeps its start and end, 'summarize'
+    # sends a map-reduce summary made SUMMARY_CONCURRENCY chunks at a time. Web request bodies above
+    # MAX_REQUEST_BYTES are refused with 413 before they are read
+    INPUT_POLICY = os.getenv('INPUT_POLICY', 'reject').lower()
+    SUMMARY_CONCURRENCY = int(os.getenv('SUMMARY_CONCURRENCY', '4'))
+    MAX_REQUEST_BYTES = int(os.getenv('MAX_REQUEST_BYTES', str(8 * 1024 * 1024)))
+    
+    # Retrieval over local documents (needs numpy): `python document_index.py ingest docs/` builds the index in
+    # RAG_INDEX_DIR, and chat turns then get up to RAG_TOP_K excerpts scoring at least RAG_MIN_SCORE, within
+    # RAG_MAX_TOKENS and the context window. RAG_EMBED_MODEL names a sentence-transformers model to embed with
+    # instead of the built-in hashing embedder; RAG_NPROBE is how many clusters a search visits per segment
+    RAG_ENABLED = os.getenv('RAG_ENABLED', 'true').lower() == 'true'
+    RAG_INDEX_DIR = Path(os.getenv('RAG_INDEX_DIR', 'rag_index'))
+    RAG_TOP_K = int(os.getenv('RAG_TOP_K', '4'))
+    RAG_MIN_SCORE = float(os.getenv('RAG_MIN_SCORE', '0.2'))
+    RAG_MAX_TOKENS = int(os.getenv('RAG_MAX_TOKENS', '1500'))
+    RAG_CHUNK_TOKENS = int(os.getenv('RAG_CHUNK_TOKENS', '200'))
+    RAG_EMBED_MODEL = os.getenv('RAG_EMBED_MODEL', '')
+    RAG_NPROBE = int(os.getenv('RAG_NPROBE', '32'))
+    
+    # Seconds a request may wait for its provider's rate limit before failing
+    RATE_LIMIT_WAIT = float(os.getenv('RATE_LIMIT_WAIT', '30'))
+    
     # Default providers
-    DEFAULT_AI_PROVIDER = os.getenv('DEFAULT_AI_PROVIDER', 'duckduckgo')
+    DEFAULT_AI_PROVIDER = os.getenv('DEFAULT_AI_PROVIDER', 'local')
     DEFAULT_IMAGE_GENERATOR = os.getenv('DEFAULT_IMAGE_GENERATOR', 'dalle')
     
+    # Media store quotas (least recently used files are deleted beyond these; 0 = unlimited)
+    IMAGE_STORE_QUOTA_MB = int(os.getenv('IMAGE_STORE_QUOTA_MB', '2048'))
+    VIDEO_STORE_QUOTA_MB = int(os.getenv('VIDEO_STORE_QUOTA_MB', '8192'))
+    THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', '256'))
+    
+    # Video jobs: public URL of /webhooks/replicate (optional), poll backoff cap, wait limit, the age
+    # after which a prediction still running is cancelled, and concurrent downloads of finished videos
+    REPLICATE_WEBHOOK_URL = os.getenv('REPLICATE_WEBHOOK_URL', '')
+    VIDEO_POLL_MAX_INTERVAL = float(os.getenv('VIDEO_POLL_MAX_INTERVAL', '30'))
+    VIDEO_TIMEOUT = float(os.getenv('VIDEO_TIMEOUT', '900'))
+    VIDEO_MAX_AGE = float(os.getenv('VIDEO_MAX_AGE', '3600'))
+    VIDEO_DOWNLOAD_WORKERS = int(os.getenv('VIDEO_DOWNLOAD_WORKERS', '4'))
+    # Re-encode videos to faststart H.264 with a poster frame (needs ffmpeg), optionally with HLS
+    VIDEO_TRANSCODE = os.getenv('VIDEO_TRANSCODE', 'true').lower() == 'true'
+    VIDEO_HLS = os.getenv('VIDEO_HLS', 'false').lower() == 'true'
+    VIDEO_TRANSCODE_WORKERS = int(os.getenv('VIDEO_TRANSCODE_WORKERS', '2'))
+    
+    # Concurrent image requests and downloads per generate_images call
+    IMAGE_CONCURRENCY = int(os.getenv('IMAGE_CONCURRENCY', '4'))
+    
     # Output directories
     IMAGE_OUTPUT_DIR = Path(os.getenv('IMAGE_OUTPUT_DIR', 'generated_images'))
     VIDEO_OUTPUT_DIR = Path(os.getenv('VIDEO_OUTPUT_DIR', 'generated_videos'))
+    # Media index and temporary files, one subdirectory per output directory (default: .media-index/
+    # next to it). They must stay out of the served directories; replicas sharing media share this too
+    MEDIA_INDEX_DIR = os.getenv('MEDIA_INDEX_DIR', '')
+    
+    # Share one upstream call between concurrent identical requests
+    COALESCE_REQUESTS = os.getenv('COALESCE_REQUESTS', 'true').lower() == 'true'
+    
+    # Tracing and profiling (opt-in)
+    TRACING_ENABLED = os.getenv('TRACING_ENABLED', 'false').lower() == 'true'
+    TRACE_EXPORT_PATH = Path(os.getenv('TRACE_EXPORT_PATH', 'traces/spans.jsonl'))
+    TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'pilothub')
+    PROFILING = os.getenv('PROFILING', 'off').lower()  # off, param (?profile=1) or always
+    PROFILE_OUTPUT_DIR = Path(os.getenv('PROFILE_OUTPUT_DIR', 'profiles'))
+    PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
     
     @classmethod
     def ensure_output_dirs(cls):
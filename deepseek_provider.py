@@ -6,9 +6,9 @@ from openai_provider import OpenAIProvider
 class DeepSeekProvider(OpenAIProvider):
     """DeepSeek AI provider"""
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, base_url: str = "https://api.deepseek.com"):
         super().__init__(
             api_key=api_key,
-            base_url="https://api.deepseek.com",
+            base_url=base_url,
             model="deepseek-chat"
         )
@@ -0,0 +1,613 @@
+#!/usr/bin/env python3
+"""
+Local document index for retrieval-augmented chat
+
+Files are cut into chunks of about RAG_CHUNK_TOKENS tokens (paragraph
+boundaries, each chunk labelled with its Markdown heading), embedded on the
+CPU and stored in RAG_INDEX_DIR. UnifiedAIChatbot searches the index on every
+chat turn and puts the best chunks that fit the context window in front of
+the message, so the documents never have to be pasted into a prompt.
+
+Embeddings come from a built-in hashing embedder (words and word pairs
+hashed into 256 dimensions: no model download, deterministic) or, with
+RAG_EMBED_MODEL set and sentence-transformers installed, from that model.
+
+The index is a list of immutable segments plus a manifest. Each ingest run
+writes one new segment holding the new and changed files; chunks of changed
+or deleted files stay in older segments but are skipped, until compaction
+merges the segments. A segment is a set of .npy files and a text blob, all
+opened with mmap, so loading is instant whatever the size and pages are read
+on demand. Large segments are clustered (an IVF index: rows sorted by nearest
+k-means centroid) and a search only scans the RAG_NPROBE closest clusters,
+which keeps it at a few milliseconds for a million chunks (see
+benchmarks/retrieval.py).
+
+Usage:
+    python document_index.py ingest docs/ README.md
+    python document_index.py search "how do I rotate the API key"
+    python document_index.py compact
+"""
+import argparse
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from config import Config
+from token_budget import CHARS_PER_TOKEN
+import tracing
+
+MANIFEST = 'manifest.json'
+FORMAT_VERSION = 1
+# File types ingested from directories (files named explicitly are always read)
+TEXT_SUFFIXES = {'.md', '.markdown', '.txt', '.rst', '.adoc', '.html', '.py', '.js', '.ts', '.json',
+                 '.yaml', '.yml', '.toml', '.ini', '.cfg', '.csv', '.sql', '.sh'}
+MAX_FILE_BYTES = 20 * 1024 * 1024
+# Segments below this many rows are scanned in full rather than clustered
+IVF_MIN_ROWS = 4096
+KMEANS_SAMPLE = 65536
+KMEANS_ITERATIONS = 8
+# Compaction runs when there are more segments than this, or this share of rows is stale
+MAX_SEGMENTS = 8
+MAX_STALE_SHARE = 0.3
+# Seconds between checks for a newer manifest written by another process
+RELOAD_INTERVAL = 2.0
+EMBED_BATCH = 256
+
+# Identifiers such as SHARED_STATE_URL are split into words, so they match prose about them
+WORD_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    'a an and are as at be but by do does for from has have how i if in into is it its of on or so '
+    'than that the their then there these they this to was we what when where which who why will with '
+    'you your'.split()
+)
+HASHING = 'hashing'
+
+
+def available() -> bool:
+    return np is not None
+
+
+class HashingEmbedder:
+    """Bag of words and word pairs, feature-hashed into `dim` signed buckets"""
+
+    def __init__(self, dim: int = 256):
+        self.name = f"{HASHING}-{dim}"
+        self.dim = dim
+
+    def embed(self, texts: Sequence[str]) -> 'np.ndarray':
+        """Unit vectors, one row per text (float32)"""
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = [_stem(w) for w in WORD_RE.findall(text.lower()) if w not in STOPWORDS]
+            features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            if not features:
+                continue
+            hashes = np.fromiter((_feature_hash(f) for f in features), dtype=np.uint32, count=len(features))
+            # The top bit picks the sign, so colliding features tend to cancel out instead of adding up;
+            # word pairs count half, as they mostly confirm words already matched
+            signs = np.where(hashes & np.uint32(0x80000000), -1.0, 1.0).astype(np.float32)
+            signs[len(words):] *= 0.5
+            np.add.at(out[row], hashes % self.dim, signs)
+        # Dampen repeated words, then normalize so a dot product is the cosine similarity
+        np.copysign(np.log1p(np.abs(out)), out, out=out)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+def _stem(word: str) -> str:
+    """Plural to singular, crudely ("checks" and "check" should match)"""
+    return word[:-1] if len(word) > 3 and word.endswith('s') and not word.endswith('ss') else word
+
+
+@lru_cache(maxsize=1 << 17)
+def _feature_hash(feature: str) -> int:
+    # crc32 rather than hash(): the index must mean the same thing in every process
+    return zlib.crc32(feature.encode('utf-8'))
+
+
+class SentenceTransformerEmbedder:
+    """A sentence-transformers model run on the CPU"""
+
+    def __init__(self, model_name: str):
+        # Imported here: it pulls in torch, which only this embedder needs
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.name = f"st:{model_name}"
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: Sequence[str]) -> 'np.ndarray':
+        return self.model.encode(list(texts), batch_size=32, normalize_embeddings=True,
+                                 convert_to_numpy=True).astype(np.float32)
+
+
+def embedder_for(name: str):
+    """The embedder a manifest or RAG_EMBED_MODEL names ('' or 'hashing[-dim]' for the built-in one)"""
+    if not name or name.startswith(HASHING):
+        dim = name.split('-', 1)[1] if '-' in (name or '') else '256'
+        return HashingEmbedder(int(dim))
+    return SentenceTransformerEmbedder(name[3:] if name.startswith('st:') else name)
+
+
+def chunk_text(text: str, max_tokens: int = 200) -> List[str]:
+    """
+    Cut a document into chunks of at most about `max_tokens`
+
+    Chunks end at paragraph breaks where possible, and each one starts with
+    the Markdown heading it falls under, so it still makes sense on its own.
+    """
+    max_chars = max(80, int(max_tokens * CHARS_PER_TOKEN))
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    heading = chunk_heading = ''
+
+    def flush():
+        nonlocal current, size
+        # Headings alone are not worth a chunk; the next chunk carries them
+        if not all(piece.startswith('#') and '\n' not in piece for piece in current):
+            body = '\n\n'.join(current)
+            if chunk_heading and not body.startswith('#'):
+                body = f"{chunk_heading}\n\n{body}"
+            chunks.append(body)
+        current, size = [], 0
+
+    for block in re.split(r'\n\s*\n', text):
+        block = block.strip()
+        if not block:
+            continue
+        if block.startswith('#'):
+            flush()
+            heading = block.splitlines()[0]
+        for piece in _hard_split(block, max_chars):
+            if current and size + len(piece) > max_chars:
+                flush()
+            if not current:
+                chunk_heading = heading
+            current.append(piece)
+            size += len(piece) + 2
+    flush()
+    return chunks
+
+
+def _hard_split(block: str, max_chars: int) -> List[str]:
+    """Split a paragraph longer than `max_chars` into even pieces at whitespace"""
+    # Even pieces rather than full ones, so no piece is a stray line or two
+    width = math.ceil(len(block) / math.ceil(len(block) / max_chars))
+    pieces = []
+    while len(block) > max_chars:
+        cut = max(block.rfind(' ', 0, width + 1), block.rfind('\n', 0, width + 1))
+        cut = cut if cut > width // 2 else width
+        pieces.append(block[:cut].strip())
+        block = block[cut:].strip()
+    if block:
+        pieces.append(block)
+    return pieces
+
+
+def _kmeans(vectors: 'np.ndarray', clusters: int, iterations: int = KMEANS_ITERATIONS) -> 'np.ndarray':
+    """Spherical k-means centroids for unit vectors, trained on a sample"""
+    rng = np.random.default_rng(0)
+    if len(vectors) > KMEANS_SAMPLE:
+        vectors = vectors[np.sort(rng.choice(len(vectors), KMEANS_SAMPLE, replace=False))]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(vectors, centroids)
+        order = np.argsort(assign, kind='stable')
+        counts = np.bincount(assign, minlength=clusters)
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        # Empty clusters keep their centroid
+        centroids[filled] = np.add.reduceat(vectors[order], starts)
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        np.divide(centroids, norms, out=centroids, where=norms > 0)
+    return centroids
+
+
+def _nearest(vectors, centroids: 'np.ndarray', batch: int = 65536) -> 'np.ndarray':
+    """Index of the closest centroid for every row"""
+    assign = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), batch):
+        block = np.asarray(vectors[start:start + batch], dtype=np.float32)
+        assign[start:start + batch] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+
+class DocumentHit:
+    """One retrieved chunk"""
+
+    def __init__(self, score: float, source: str, text: str):
+        self.score = score
+        self.source = source
+        self.text = text
+
+    def to_dict(self) -> Dict:
+        return {'score': round(self.score, 4), 'source': self.source, 'text': self.text}
+
+
+class Segment:
+    """One immutable batch of chunks, memory-mapped from its directory"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.vectors = np.load(directory / 'vectors.npy', mmap_mode='r')
+        self.sources = np.load(directory / 'sources.npy', mmap_mode='r')
+        self.text_offsets = np.load(directory / 'text_offsets.npy', mmap_mode='r')
+        # Small arrays, read whenever the segment is searched
+        self.centroids = np.load(directory / 'centroids.npy')
+        self.lists = np.load(directory / 'lists.npy')
+        with open(directory / 'text.bin', 'rb') as f:
+            self.text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.text_offsets[-1] else b''
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def text_at(self, row: int) -> str:
+        return self.text[int(self.text_offsets[row]):int(self.text_offsets[row + 1])].decode('utf-8')
+
+    def search(self, query: 'np.ndarray', k: int, nprobe: int, live: 'np.ndarray') -> Tuple['np.ndarray', 'np.ndarray']:
+        """The best `k` live rows as (scores, rows), visiting the `nprobe` closest clusters"""
+        if len(self.centroids) <= 1:
+            ranges = [(0, len(self))]
+        else:
+            closeness = self.centroids @ query
+            probe = np.argpartition(-closeness, min(nprobe, len(closeness) - 1))[:nprobe]
+            ranges = [(int(self.lists[c]), int(self.lists[c + 1])) for c in probe]
+        scores, rows = [], []
+        for start, end in ranges:
+            if end > start:
+                scores.append(self.vectors[start:end] @ query)
+                rows.append(np.arange(start, end))
+        if not scores:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        scores, rows = np.concatenate(scores), np.concatenate(rows)
+        sources = np.asarray(self.sources[rows])
+        keep = (sources < len(live)) & live[np.minimum(sources, len(live) - 1)]
+        scores, rows = scores[keep], rows[keep]
+        if len(scores) > k:
+            best = np.argpartition(-scores, k)[:k]
+            scores, rows = scores[best], rows[best]
+        return scores, rows
+
+    def close(self):
+        if isinstance(self.text, mmap.mmap):
+            self.text.close()
+
+
+def write_segment(directory: Path, vectors: 'np.ndarray', texts: List[str], sources: 'np.ndarray'):
+    """Write a segment, clustering its rows when there are enough of them"""
+    count = len(vectors)
+    if count >= IVF_MIN_ROWS:
+        centroids = _kmeans(vectors, int(math.sqrt(count)))
+        assign = _nearest(vectors, centroids)
+    else:
+        centroids = np.zeros((1, vectors.shape[1]), dtype=np.float32)
+        assign = np.zeros(count, dtype=np.int64)
+    # Rows of a cluster are stored together, so a search reads contiguous slices
+    order = np.argsort(assign, kind='stable')
+    lists = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=len(centroids))))).astype(np.int64)
+
+    temporary = directory.with_name(directory.name + '.tmp')
+    shutil.rmtree(temporary, ignore_errors=True)
+    temporary.mkdir(parents=True)
+    # float32 takes twice the space of float16 but is scanned without a conversion, several times faster
+    np.save(temporary / 'vectors.npy', np.asarray(vectors, dtype=np.float32)[order])
+    np.save(temporary / 'sources.npy', np.asarray(sources, dtype=np.int32)[order])
+    np.save(temporary / 'centroids.npy', centroids.astype(np.float32))
+    np.save(temporary / 'lists.npy', lists)
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    with open(temporary / 'text.bin', 'wb') as f:
+        for position, row in enumerate(order):
+            data = texts[row].encode('utf-8')
+            f.write(data)
+            offsets[position + 1] = offsets[position] + len(data)
+    np.save(temporary / 'text_offsets.npy', offsets)
+    os.replace(temporary, directory)
+
+
+class DocumentIndex:
+    """Segments plus a manifest of the ingested files; safe to search from many threads"""
+
+    def __init__(self, directory: Path, embedder_name: Optional[str] = None):
+        """
+        Args:
+            directory: Index directory (created on the first ingest)
+            embedder_name: Embedder for a new index (default RAG_EMBED_MODEL); an
+                existing index keeps the one it was built with
+        """
+        if np is None:
+            raise RuntimeError("The document index needs numpy (pip install numpy)")
+        self.directory = Path(directory)
+        self._write_lock = threading.Lock()
+        self._manifest_mtime = None
+        self._checked_at = 0.0
+        self._state = ({'version': FORMAT_VERSION, 'embedder': embedder_name or Config.RAG_EMBED_MODEL or
+                        HashingEmbedder().name, 'segments': [], 'sources': {}, 'next_source': 0}, [], None)
+        self._embedder = None
+        self.reload()
+
+    # Loading
+
+    def reload(self) -> bool:
+        """Open the current manifest and its segments if they changed; True if anything was loaded"""
+        path = self.directory / MANIFEST
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._manifest_mtime:
+            return False
+        with tracing.span('documents.load', directory=str(self.directory)):
+            manifest = json.loads(path.read_text(encoding='utf-8'))
+            current = {segment.directory.name: segment for segment in self._state[1]}
+            segments = [current.get(name) or Segment(self.directory / name) for name in manifest['segments']]
+            live = np.zeros(manifest['next_source'], dtype=bool)
+            live[[entry['id'] for entry in manifest['sources'].values()]] = True
+            self._state = (manifest, segments, live)
+            self._manifest_mtime = mtime
+        return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at >= RELOAD_INTERVAL:
+            self._checked_at = now
+            self.reload()
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            self._embedder = embedder_for(self._state[0]['embedder'])
+        return self._embedder
+
+    def __len__(self) -> int:
+        """Rows stored, including stale ones not yet compacted away"""
+        return sum(len(segment) for segment in self._state[1])
+
+    def stats(self) -> Dict:
+        manifest, segments, live = self._state
+        rows = len(self)
+        live_rows = sum(entry.get('chunks', 0) for entry in manifest['sources'].values())
+        return {'documents': len(manifest['sources']), 'chunks': live_rows, 'stale_chunks': rows - live_rows,
+                'segments': len(segments), 'embedder': manifest['embedder'], 'directory': str(self.directory)}
+
+    # Search
+
+    def search(self, query: str, k: int = 4, nprobe: Optional[int] = None) -> List[DocumentHit]:
+        """
+        The `k` chunks most similar to `query`
+
+        Args:
+            query: Text to look up (usually the user's message)
+            k: Number of hits
+            nprobe: Clusters visited per segment (default RAG_NPROBE); more is slower but finds more
+
+        Returns:
+            Hits, best first
+        """
+        self._maybe_reload()
+        manifest, segments, live = self._state
+        if not segments or live is None:
+            return []
+        nprobe = nprobe or Config.RAG_NPROBE
+        with tracing.span('documents.search', segments=len(segments)):
+            vector = self.embedder.embed([query])[0]
+            found = []
+            for segment in segments:
+                scores, rows = segment.search(vector, k, nprobe, live)
+                found += [(float(score), segment, int(row)) for score, row in zip(scores, rows)]
+            found.sort(key=lambda hit: hit[0], reverse=True)
+            names = {entry['id']: name for name, entry in manifest['sources'].items()}
+            hits = [DocumentHit(score, names.get(int(segment.sources[row]), ''), segment.text_at(row))
+                    for score, segment, row in found[:k]]
+            tracing.set_attribute('hits', len(hits))
+            return hits
+
+    # Ingestion
+
+    def ingest(self, paths: Iterable, chunk_tokens: Optional[int] = None, prune: bool = True) -> Dict:
+        """
+        Add new and changed files below `paths`, dropping deleted ones
+
+        Unchanged files (same size and modification time) are skipped, so
+        re-running an ingest only embeds what changed.
+
+        Args:
+            paths: Files and directories to index
+            chunk_tokens: Chunk size (default RAG_CHUNK_TOKENS)
+            prune: Forget indexed files below the given directories that no longer exist
+
+        Returns:
+            Counts of added, updated, unchanged and removed files and new chunks
+        """
+        chunk_tokens = chunk_tokens or Config.RAG_CHUNK_TOKENS
+        roots = [Path(p).resolve() for p in paths]
+        files = sorted({f for root in roots for f in _discover(root)})
+        manifest = self._state[0]
+        summary = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'chunks': 0}
+        documents = []
+        seen = set()
+        for path in files:
+            key = str(path)
+            seen.add(key)
+            stat = path.stat()
+            entry = manifest['sources'].get(key)
+            if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                summary['unchanged'] += 1
+                continue
+            chunks = chunk_text(path.read_text(encoding='utf-8', errors='replace'), chunk_tokens)
+            summary['updated' if entry else 'added'] += 1
+            documents.append((key, {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}, chunks))
+        removed = []
+        if prune:
+            removed = [key for key in manifest['sources'] if key not in seen
+                       and any(Path(key).is_relative_to(root) for root in roots if root.is_dir())]
+            summary['removed'] = len(removed)
+        summary['chunks'] = sum(len(chunks) for _, _, chunks in documents)
+        with tracing.span('documents.ingest', files=len(documents), chunks=summary['chunks']):
+            self.add(documents, removed)
+        return summary
+
+    def add(self, documents: List[Tuple[str, Dict, List[str]]], removed: Iterable[str] = (),
+            vectors: Optional['np.ndarray'] = None):
+        """
+        Write one segment for new or replaced documents and update the manifest
+
+        Args:
+            documents: (name, metadata, chunks) per document; a name already in
+                the index replaces that document
+            removed: Names of documents to forget
+            vectors: Precomputed embeddings for all chunks in order (default: embed them)
+        """
+        with self._write_lock:
+            self.reload()
+            manifest = json.loads(json.dumps(self._state[0]))
+            texts, sources = [], []
+            for name, metadata, chunks in documents:
+                source_id = manifest['next_source']
+                manifest['next_source'] += 1
+                manifest['sources'][name] = {**metadata, 'id': source_id, 'chunks': len(chunks)}
+                texts += chunks
+                sources += [source_id] * len(chunks)
+            for name in removed:
+                manifest['sources'].pop(name, None)
+            if texts:
+                if vectors is None:
+                    vectors = np.concatenate([self.embedder.embed(texts[i:i + EMBED_BATCH])
+                                              for i in range(0, len(texts), EMBED_BATCH)])
+                name = f"segment-{manifest['next_source']:08d}-{time.time_ns():x}"
+                write_segment(self.directory / name, vectors, texts, np.asarray(sources))
+                manifest['segments'].append(name)
+            if not texts and not removed and (self.directory / MANIFEST).exists():
+                return
+            self._write_manifest(manifest)
+            if self._needs_compaction():
+                self._compact()
+
+    def _write_manifest(self, manifest: Dict):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temporary = self.directory / f"{MANIFEST}.tmp"
+        temporary.write_text(json.dumps(manifest, indent=1), encoding='utf-8')
+        os.replace(temporary, self.directory / MANIFEST)
+        self._manifest_mtime = None
+        self.reload()
+
+    def _needs_compaction(self) -> bool:
+        stats = self.stats()
+        rows = stats['chunks'] + stats['stale_chunks']
+        return stats['segments'] > MAX_SEGMENTS or (rows and stats['stale_chunks'] / rows > MAX_STALE_SHARE)
+
+    def compact(self):
+        """Merge every segment into one, dropping stale rows"""
+        with self._write_lock:
+            self.reload()
+            self._compact()
+
+    def _compact(self):
+        manifest, segments, live = self._state
+        if not segments:
+            return
+        with tracing.span('documents.compact', segments=len(segments)):
+            vectors, texts, sources = [], [], []
+            for segment in segments:
+                source_ids = np.asarray(segment.sources)
+                rows = np.flatnonzero(live[source_ids])
+                vectors.append(np.asarray(segment.vectors[rows], dtype=np.float32))
+                sources.append(source_ids[rows])
+                texts += [segment.text_at(int(row)) for row in rows]
+            manifest = json.loads(json.dumps(manifest))
+            old = manifest['segments']
+            manifest['segments'] = []
+            if texts:
+                name = f"segment-{manifest['next_source']:08d}-{time.time_ns():x}"
+                write_segment(self.directory / name, np.concatenate(vectors), texts, np.concatenate(sources))
+                manifest['segments'] = [name]
+            self._write_manifest(manifest)
+            # Processes still reading the old files keep their mappings until they reload
+            for name in old:
+                shutil.rmtree(self.directory / name, ignore_errors=True)
+
+
+def _discover(root: Path) -> Iterable[Path]:
+    if root.is_file():
+        yield root
+        return
+    for directory, subdirectories, names in os.walk(root):
+        subdirectories[:] = [d for d in subdirectories if not d.startswith('.') and d != '__pycache__']
+        for name in names:
+            path = Path(directory) / name
+            if path.suffix.lower() in TEXT_SUFFIXES and path.stat().st_size <= MAX_FILE_BYTES:
+                yield path
+
+
+def open_index(directory: Optional[Path] = None) -> Optional[DocumentIndex]:
+    """The index in `directory` (default RAG_INDEX_DIR), or None if there is none or numpy is missing"""
+    directory = Path(directory or Config.RAG_INDEX_DIR)
+    if np is None or not (directory / MANIFEST).exists():
+        return None
+    return DocumentIndex(directory)
+
+
+def format_context(hits: List[DocumentHit]) -> str:
+    """The excerpts block placed before a message"""
+    parts = [f"[{n}] {_display_path(hit.source)}\n{hit.text}" for n, hit in enumerate(hits, 1)]
+    return ("Excerpts from the local documentation that may help; cite them as [1], [2]... "
+            "if you use them, and ignore them if they are not relevant.\n\n" + '\n\n'.join(parts))
+
+
+def _display_path(source: str) -> str:
+    try:
+        return str(Path(source).relative_to(Path.cwd()))
+    except ValueError:
+        return source
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and query the local document index")
+    parser.add_argument('--index', default=str(Config.RAG_INDEX_DIR), help='Index directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+    ingest = commands.add_parser('ingest', help='Add new and changed files, drop deleted ones')
+    ingest.add_argument('paths', nargs='+')
+    ingest.add_argument('--chunk-tokens', type=int, default=Config.RAG_CHUNK_TOKENS)
+    search = commands.add_parser('search', help='Show the chunks a chat turn would get')
+    search.add_argument('query')
+    search.add_argument('-k', type=int, default=Config.RAG_TOP_K)
+    commands.add_parser('compact', help='Merge segments and drop stale chunks')
+    commands.add_parser('stats', help='Show what is indexed')
+    args = parser.parse_args()
+
+    index = DocumentIndex(Path(args.index))
+    if args.command == 'ingest':
+        start = time.perf_counter()
+        summary = index.ingest(args.paths, args.chunk_tokens)
+        print(f"{summary['added']} added, {summary['updated']} updated, {summary['unchanged']} unchanged, "
+              f"{summary['removed']} removed; {summary['chunks']} chunks embedded "
+              f"in {time.perf_counter() - start:.1f}s")
+    elif args.command == 'search':
+        start = time.perf_counter()
+        hits = index.search(args.query, args.k)
+        elapsed = (time.perf_counter() - start) * 1000
+        for n, hit in enumerate(hits, 1):
+            print(f"[{n}] {hit.score:.3f} {_display_path(hit.source)}\n{hit.text}\n")
+        print(f"{len(hits)} hits in {elapsed:.1f} ms")
+    elif args.command == 'compact':
+        index.compact()
+    print(json.dumps(index.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+"""
+Ensemble (consensus) answers across providers
+
+The same prompt goes to several providers at once. Short answers are settled
+by majority vote, and as soon as a quorum agrees the remaining calls are
+cancelled, so one slow provider cannot hold up the result (or keep billing). Longer answers
+are settled by a judge model picking the best candidate, falling back to the
+candidate that agrees most with the others.
+"""
+import contextvars
+import difflib
+import queue
+import re
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from cancellation import CancelToken
+import tracing
+
+# Answers up to this many words are compared by vote; longer ones go to the judge
+SHORT_ANSWER_WORDS = 12
+
+JUDGE_PROMPT = """Several assistants answered the same question. Pick the most accurate and helpful answer.
+
+Question:
+{question}
+
+{candidates}
+
+Reply with the number of the best answer only."""
+
+
+def is_error(response: str) -> bool:
+    """Providers report failures as strings starting with 'Error'"""
+    return not response or response.startswith('Error')
+
+
+def normalize_answer(text: str) -> str:
+    """Canonical form used to compare short answers"""
+    text = re.sub(r'[^\w\s]', ' ', text.lower())
+    return ' '.join(text.split())
+
+
+def fan_out(call: Callable[[str, CancelToken], str], providers: List[str],
+            results: Optional[queue.Queue] = None,
+            tokens: Optional[Dict[str, CancelToken]] = None) -> queue.Queue:
+    """
+    Call every provider concurrently
+
+    Each call is `call(provider, token)` with a token of its own, also stored
+    in `tokens` when given; cancelling it should abort the provider's request.
+    Each (provider, response, latency in seconds) is put on the returned queue
+    (`results` when given, so later calls can join an existing fan-out) as it
+    completes.
+    """
+    results = results if results is not None else queue.Queue()
+
+    def worker(provider, token):
+        start = time.perf_counter()
+        try:
+            response = call(provider, token)
+        except Exception as e:
+            response = f"Error: {e}"
+        results.put((provider, response, time.perf_counter() - start))
+
+    for provider in providers:
+        token = CancelToken()
+        if tokens is not None:
+            tokens[provider] = token
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(worker, provider, token), name=f"fan-out-{provider}",
+                         daemon=True).start()
+    return results
+
+
+def _consensus(answers: Dict[str, str]) -> Optional[str]:
+    """The provider whose answer agrees most with the others (mean similarity)"""
+    if not answers:
+        return None
+    if len(answers) == 1:
+        return next(iter(answers))
+
+    def agreement(name):
+        return sum(difflib.SequenceMatcher(None, answers[name], answers[other]).ratio()
+                   for other in answers if other != name)
+
+    return max(answers, key=agreement)
+
+
+def _judge(judge: Callable[[str], str], question: str, answers: Dict[str, str]) -> Optional[str]:
+    names = list(answers)
+    candidates = '\n\n'.join(f"Answer {i + 1}:\n{answers[name]}" for i, name in enumerate(names))
+    with tracing.span('ensemble.judge', candidates=len(names)):
+        verdict = judge(JUDGE_PROMPT.format(question=question, candidates=candidates))
+    match = re.search(r'\d+', verdict or '')
+    if is_error(verdict) or not match or not 1 <= int(match.group()) <= len(names):
+        return None
+    return names[int(match.group()) - 1]
+
+
+def run_ensemble(call: Callable[[str, CancelToken], str], providers: List[str], question: str,
+                 strategy: str = 'auto', quorum: Optional[int] = None,
+                 judge: Optional[Callable[[str], str]] = None, timeout: float = 60.0) -> Dict:
+    """
+    Ask several providers and settle on one answer
+
+    Args:
+        call: Sends the question to one provider and returns its response; the token it
+            gets is cancelled once the answer is no longer needed
+        providers: Provider names to query
+        question: The user's question (shown to the judge)
+        strategy: 'vote', 'judge' or 'auto' (vote when all answers are short)
+        quorum: Matching answers needed to stop early (default: a majority)
+        judge: Sends a prompt to the judge model; without one, judging picks the consensus answer
+        timeout: Seconds to wait for providers before deciding with what has arrived
+
+    Returns:
+        {'answer', 'winner', 'strategy', 'agreement', 'elapsed_ms', 'providers'} where
+        'providers' maps each provider to its latency, status, answer and whether it contributed
+    """
+    quorum = quorum or len(providers) // 2 + 1
+    start = time.perf_counter()
+    deadline = start + timeout
+    report = {p: {'status': 'pending', 'latency_ms': None, 'contributed': False, 'answer': None}
+              for p in providers}
+    tokens: Dict[str, CancelToken] = {}
+    answers: Dict[str, str] = {}
+    votes: Counter = Counter()
+    early = None
+
+    with tracing.span('ensemble.run', providers=len(providers), strategy=strategy, quorum=quorum):
+        results = fan_out(call, providers, tokens=tokens)
+        pending = len(providers)
+        while pending:
+            try:
+                provider, response, latency = results.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            pending -= 1
+            entry = report[provider]
+            entry['latency_ms'] = round(latency * 1000, 1)
+            entry['answer'] = response
+            if is_error(response):
+                entry['status'] = 'error'
+                continue
+            entry['status'] = 'ok'
+            answers[provider] = response
+            if strategy != 'judge' and len(response.split()) <= SHORT_ANSWER_WORDS:
+                key = normalize_answer(response)
+                votes[key] += 1
+                if votes[key] >= quorum:
+                    early = key
+                    tracing.add_event('ensemble.quorum', answer=key)
+                    break
+
+        # Calls still running after a quorum or the timeout are aborted, not left to finish and bill
+        for provider, entry in report.items():
+            if entry['status'] == 'pending':
+                entry['status'] = 'cancelled'
+                tokens[provider].cancel('quorum' if early is not None else 'timeout')
+
+        if early is not None:
+            used = 'vote'
+            contributors = [p for p, a in answers.items() if normalize_answer(a) == early]
+            winner = contributors[0]
+        else:
+            short = answers and all(len(a.split()) <= SHORT_ANSWER_WORDS for a in answers.values())
+            if strategy == 'vote' or (strategy == 'auto' and short and votes.most_common(1)[0][1] > 1):
+                used = 'vote'
+                key = votes.most_common(1)[0][0] if votes else None
+                contributors = [p for p, a in answers.items() if normalize_answer(a) == key]
+                winner = contributors[0] if contributors else _consensus(answers)
+            else:
+                used = 'judge'
+                winner = _judge(judge, question, answers) if judge and len(answers) > 1 else None
+                if winner is None:
+                    used = 'consensus'
+                    winner = _consensus(answers)
+                contributors = [winner] if winner else []
+
+        if winner and not contributors:
+            contributors = [winner]
+        for provider in contributors:
+            report[provider]['contributed'] = True
+        tracing.set_attribute('winner', winner or '')
+
+    return {
+        'answer': answers[winner] if winner else "Error: no provider returned an answer",
+        'winner': winner,
+        'strategy': used,
+        'agreement': f"{len(contributors)}/{len(providers)}",
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1),
+        'providers': report,
+    }
@@ -0,0 +1,74 @@
+"""
+JSON serialization for web responses and WebSocket frames
+
+Uses orjson when it is installed (several times faster than the standard
+library and produces bytes directly, saving an encode step per response),
+and falls back to the json module otherwise. Output is compact and keeps
+dict insertion order.
+"""
+import json
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from config import Config
+
+# Dates go through Flask's default so both encoders format them the same way
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson is not None else 0
+
+
+def enabled() -> bool:
+    return orjson is not None and Config.FAST_JSON
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Serialize to UTF-8 JSON bytes"""
+    if enabled():
+        try:
+            return orjson.dumps(obj, default=DefaultJSONProvider.default, option=_OPTIONS)
+        except TypeError:
+            # Integers beyond 64 bits and other values orjson rejects
+            pass
+    return json.dumps(obj, default=DefaultJSONProvider.default, separators=(',', ':'),
+                      ensure_ascii=False).encode('utf-8')
+
+
+def dumps(obj: Any) -> str:
+    """Serialize to a JSON string"""
+    return dumps_bytes(obj).decode('utf-8')
+
+
+def loads(data) -> Any:
+    """Parse JSON from str or bytes"""
+    if enabled():
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson; `jsonify` and `request.json` go through it"""
+
+    # Insertion order is kept: sorting keys costs time on every response
+    sort_keys = False
+    compact = True
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def loads(self, s, **kwargs: Any) -> Any:
+        if kwargs or not enabled():
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        if not enabled():
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
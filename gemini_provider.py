@@ -1,70 +1,127 @@
 """
 Google Gemini Provider
 """
+import threading
+from typing import Dict, List, Optional
+
 import google.generativeai as genai
 from base_provider import AIProvider
+import tracing
 
 
 class GeminiProvider(AIProvider):
     """Google Gemini AI provider"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, api_endpoint: str = None, model: str = 'gemini-pro'):
         super().__init__(api_key)
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-pro')
-        self.chat_session = None
+        if api_endpoint:
+            # Custom endpoints (proxies, mock servers) are reached over REST
+            genai.configure(api_key=api_key, transport='rest',
+                            client_options={'api_endpoint': api_endpoint})
+        else:
+            genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model or 'gemini-pro')
+        # Models chosen per request, built on first use
+        self._models_by_name: Dict[str, genai.GenerativeModel] = {}
+        self._models_by_name_lock = threading.Lock()
+    
+    def _model(self, kwargs) -> genai.GenerativeModel:
+        """The request's `model` if it names a different one, else the default"""
+        name = kwargs.get('model')
+        if not name or f"models/{name}" == self.model.model_name or name == self.model.model_name:
+            return self.model
+        with self._models_by_name_lock:
+            model = self._models_by_name.get(name)
+            if model is None:
+                model = self._models_by_name[name] = genai.GenerativeModel(name)
+            return model
+    
+    def list_models(self) -> Optional[List[str]]:
+        """Models that can generate content, without the 'models/' prefix"""
+        return [m.name.split('/', 1)[-1] for m in genai.list_models()
+                if 'generateContent' in m.supported_generation_methods]
     
     def generate_text(self, prompt: str, **kwargs) -> str:
         """Generate text using Gemini"""
-        try:
-            response = self.model.generate_content(
-                prompt,
-                generation_config={
-                    'temperature': kwargs.get('temperature', 0.7),
-                    'max_output_tokens': kwargs.get('max_tokens', 1000),
-                }
-            )
-            return response.text
-        except Exception as e:
-            return f"Error generating text: {str(e)}"
+        with tracing.span('provider.generate_text', provider=type(self).__name__):
+            try:
+                response = self._model(kwargs).generate_content(
+                    prompt,
+                    generation_config={
+                        'temperature': kwargs.get('temperature', 0.7),
+                        'max_output_tokens': kwargs.get('max_tokens', 1000),
+                    }
+                )
+                tracing.add_event('response.received')
+                return response.text
+            except Exception as e:
+                tracing.set_attribute('error', str(e))
+                return f"Error generating text: {str(e)}"
+    
+    def probe(self) -> Optional[str]:
+        """Look up the model's metadata, which needs a valid key but generates nothing"""
+        with tracing.span('provider.probe', provider=type(self).__name__):
+            try:
+                genai.get_model(self.model.model_name)
+                return None
+            except Exception as e:
+                tracing.set_attribute('error', str(e))
+                return f"Error probing {self.model.model_name}: {str(e)}"
+    
+    def stream_text(self, prompt: str, **kwargs):
+        """Stream text from Gemini as it is generated"""
+        with tracing.span('provider.stream', provider=type(self).__name__):
+            try:
+                response = self._model(kwargs).generate_content(
+                    prompt,
+                    generation_config={
+                        'temperature': kwargs.get('temperature', 0.7),
+                        'max_output_tokens': kwargs.get('max_tokens', 1000),
+                    },
+                    stream=True
+                )
+                cancel = kwargs.get('cancel')
+                first = True
+                for chunk in response:
+                    if cancel is not None and cancel.cancelled:
+                        # Stop reading; the SDK drops the connection with the response iterator
+                        tracing.add_event('cancelled', reason=cancel.reason)
+                        break
+                    if chunk.text:
+                        if first:
+                            tracing.add_event('first_token')
+                            first = False
+                        yield chunk.text
+            except Exception as e:
+                tracing.set_attribute('error', str(e))
+                yield f"Error generating text: {str(e)}"
     
     def chat(self, messages: list, **kwargs) -> str:
         """Chat with Gemini using conversation history"""
-        try:
-            # Convert messages to Gemini format
-            history = []
-            last_message = None
-            
-            for msg in messages:
-                role = 'user' if msg['role'] == 'user' else 'model'
-                if msg['role'] in ['user', 'assistant']:
-                    if role == 'user' and last_message:
-                        last_message = msg['content']
-                    else:
-                        history.append({
-                            'role': role if role != 'assistant' else 'model',
-                            'parts': [msg['content']]
-                        })
-                        last_message = msg['content']
-            
-            # Start or continue chat session
-            if not self.chat_session:
-                self.chat_session = self.model.start_chat(history=history[:-1] if history else [])
-            
-            # Get the last user message
-            user_message = messages[-1]['content'] if messages else ""
-            
-            response = self.chat_session.send_message(
-                user_message,
-                generation_config={
-                    'temperature': kwargs.get('temperature', 0.7),
-                    'max_output_tokens': kwargs.get('max_tokens', 1000),
-                }
-            )
-            return response.text
-        except Exception as e:
-            return f"Error in chat: {str(e)}"
-    
-    def reset_chat(self):
-        """Reset the chat session"""
-        self.chat_session = None
+        with tracing.span('provider.chat', provider=type(self).__name__, messages=len(messages)):
+            try:
+                # Convert everything before the last message to Gemini format
+                history = [{'role': 'user' if msg['role'] == 'user' else 'model', 'parts': [msg['content']]}
+                           for msg in messages[:-1] if msg['role'] in ['user', 'assistant']]
+                
+                tracing.add_event('history.converted')
+                
+                # A session per request, built from `messages`: the provider is shared by every
+                # conversation, so it must not keep one of its own
+                session = self._model(kwargs).start_chat(history=history)
+                
+                # Get the last user message
+                user_message = messages[-1]['content'] if messages else ""
+                
+                response = session.send_message(
+                    user_message,
+                    generation_config={
+                        'temperature': kwargs.get('temperature', 0.7),
+                        'max_output_tokens': kwargs.get('max_tokens', 1000),
+                    }
+                )
+                tracing.add_event('response.received')
+                return response.text
+            except Exception as e:
+                tracing.set_attribute('error', str(e))
+                return f"Error in chat: {str(e)}"
@@ -6,9 +6,9 @@ from openai_provider import OpenAIProvider
 class GrokProvider(OpenAIProvider):
     """Grok AI provider"""
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, base_url: str = "https://api.x.ai/v1"):
         super().__init__(
             api_key=api_key,
-            base_url="https://api.x.ai/v1",
+            base_url=base_url,
             model="grok-beta"
         )
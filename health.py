@@ -0,0 +1,184 @@
+"""
+Provider warm-up and health
+
+The first request to a provider pays for SDK imports, client construction,
+DNS, the TLS handshake and model resolution. HealthMonitor.start() does that
+work up front: every configured text provider is built and probed in
+parallel (AIProvider.probe lists models or looks one up, so no tokens are
+generated), which leaves a warm pooled connection behind for the first real
+request. Startup waits at most `deadline` seconds; slower probes finish in
+the background.
+
+Health then stays current two ways: probes repeat every `interval` seconds,
+and real requests report their outcome, so a provider that starts failing
+is marked down after `failure_threshold` errors in a row without waiting
+for the next probe. `ready()` backs the web app's /readyz endpoint, so an
+orchestrator only routes to instances that have warmed up and can reach a
+healthy provider.
+"""
+import contextvars
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import tracing
+
+OK = 'ok'
+FAILING = 'failing'
+UNKNOWN = 'unknown'
+
+
+class ProviderHealth:
+    """What is known about one provider"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = UNKNOWN
+        self.error: Optional[str] = None
+        self.probe_ms: Optional[float] = None
+        self.checked_at: Optional[float] = None
+        self.failures = 0
+
+    def to_dict(self) -> Dict:
+        return {'state': self.state, 'error': self.error, 'probe_ms': self.probe_ms,
+                'checked_at': self.checked_at, 'consecutive_failures': self.failures}
+
+
+class HealthMonitor:
+    """Warms up the providers of a registry and tracks whether they are healthy"""
+
+    def __init__(self, providers, deadline: float = 10.0, interval: float = 60.0,
+                 failure_threshold: int = 3, required: Optional[List[str]] = None):
+        """
+        Args:
+            providers: The ProviderRegistry to warm up and probe
+            deadline: Seconds warm_up waits for the probes
+            interval: Seconds between background probes (0 probes only once)
+            failure_threshold: Consecutive errors that mark a provider as failing
+            required: Providers that must be healthy to be ready (default: any one)
+        """
+        self.providers = providers
+        self.deadline = deadline
+        self.interval = interval
+        self.failure_threshold = max(1, failure_threshold)
+        self.required = [name for name in (required or []) if name]
+        self.started_at = time.time()
+        self._health: Dict[str, ProviderHealth] = {name: ProviderHealth(name) for name in providers}
+        self._probing: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+        self._warmed = threading.Event()
+        self._warming = False
+        self._stop = threading.Event()
+
+    def _entry(self, name: str) -> ProviderHealth:
+        with self._lock:
+            entry = self._health.get(name)
+            if entry is None:
+                entry = self._health[name] = ProviderHealth(name)
+            return entry
+
+    def _update(self, name: str, error: Optional[str], probe_ms: Optional[float] = None):
+        entry = self._entry(name)
+        with self._lock:
+            entry.checked_at = time.time()
+            if probe_ms is not None:
+                entry.probe_ms = round(probe_ms, 1)
+            if error is None:
+                entry.state, entry.error, entry.failures = OK, None, 0
+            else:
+                entry.error = error
+                entry.failures += 1
+                # A failed probe is conclusive; request errors may be the request's own fault
+                if probe_ms is not None or entry.failures >= self.failure_threshold:
+                    entry.state = FAILING
+
+    def probe(self, name: str) -> Optional[str]:
+        """Build (if needed) and probe one provider now; returns its error or None"""
+        start = time.perf_counter()
+        with tracing.span('health.probe', provider=name):
+            try:
+                error = self.providers[name].probe()
+            except Exception as e:
+                error = f"Error starting {name}: {e}"
+        self._update(name, error, (time.perf_counter() - start) * 1000)
+        return error
+
+    def probe_all(self) -> List[threading.Thread]:
+        """Probe every provider in parallel, skipping those whose last probe is still running"""
+        threads = []
+        for name in self.providers:
+            with self._lock:
+                running = self._probing.get(name)
+                if running is not None and running.is_alive():
+                    continue
+                context = contextvars.copy_context()
+                thread = threading.Thread(target=context.run, args=(self.probe, name),
+                                          name=f"health-{name}", daemon=True)
+                self._probing[name] = thread
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def warm_up(self, deadline: Optional[float] = None) -> Dict[str, Dict]:
+        """
+        Probe every provider in parallel and wait for them, at most `deadline` seconds
+
+        Returns:
+            The health snapshot once all probes finished or the deadline passed
+        """
+        self._warming = True
+        deadline = self.deadline if deadline is None else deadline
+        with tracing.span('health.warm_up', providers=len(self._health)):
+            end = time.monotonic() + deadline
+            for thread in self.probe_all():
+                thread.join(max(0.0, end - time.monotonic()))
+        self._warmed.set()
+        return self.snapshot()
+
+    def start(self) -> threading.Thread:
+        """Warm up in the background, then keep probing every `interval` seconds"""
+        def run():
+            self.warm_up()
+            while self.interval > 0 and not self._stop.wait(self.interval):
+                self.probe_all()
+
+        self._warming = True
+        thread = threading.Thread(target=run, name='health-monitor', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
+
+    def record(self, name: str, response: str):
+        """Report a real request's outcome: an 'Error...' response counts as a failure"""
+        if isinstance(response, str) and response.startswith('Error'):
+            self._update(name, response)
+        else:
+            self._update(name, None)
+
+    @property
+    def warmed(self) -> bool:
+        return self._warmed.is_set()
+
+    def healthy(self, name: str) -> bool:
+        """Known good; providers never probed count as healthy unless a warm-up is expected"""
+        with self._lock:
+            entry = self._health.get(name)
+            state = entry.state if entry is not None else UNKNOWN
+        return state == OK or (state == UNKNOWN and not self._warming)
+
+    def ready(self) -> Tuple[bool, List[str]]:
+        """Whether this instance should receive traffic, with the reasons if not"""
+        reasons = []
+        if self._warming and not self.warmed:
+            reasons.append('warming up')
+        elif self.required:
+            reasons += [f"{name} is not healthy" for name in self.required if not self.healthy(name)]
+        elif not any(self.healthy(name) for name in self.providers):
+            reasons.append('no healthy provider')
+        return not reasons, reasons
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {name: entry.to_dict() for name, entry in self._health.items()}
@@ -0,0 +1,185 @@
+"""
+Negotiated HTTP response compression
+
+Picks the best encoding the client accepts (zstd with `zstandard`, brotli
+with `brotli`, gzip always) and compresses text and JSON bodies above a
+size threshold; small bodies are not worth the CPU or the header. Streamed
+responses (NDJSON, server-sent events) are compressed incrementally and
+flushed after every chunk, so each event still reaches the client as soon
+as it is produced.
+"""
+import zlib
+from typing import Iterable, Iterator, List, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Levels favour speed: responses are compressed on the request path
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/x-ndjson', 'application/javascript', 'image/svg+xml',
+)
+
+
+def available_encodings() -> List[str]:
+    """Encodings this process can produce, best first"""
+    encodings = []
+    if zstandard is not None:
+        encodings.append('zstd')
+    if brotli is not None:
+        encodings.append('br')
+    encodings.append('gzip')
+    return encodings
+
+
+def negotiate(accept_encoding: str, preferred: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Choose a content coding from an Accept-Encoding header
+
+    Args:
+        accept_encoding: The request's Accept-Encoding value
+        preferred: Server preference order (default: available_encodings())
+
+    Returns:
+        The encoding to use, or None to send the body as is
+    """
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in preferred or available_encodings():
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(mimetype: Optional[str]) -> bool:
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress a complete body"""
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    raise ValueError(f"Unsupported encoding {encoding!r}")
+
+
+def decompress(data: bytes, encoding: Optional[str]) -> bytes:
+    """Decode a body sent with the given Content-Encoding (None: as is)"""
+    if not encoding:
+        return data
+    if encoding == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if encoding == 'br':
+        return brotli.decompress(data)
+    if encoding == 'gzip':
+        return zlib.decompress(data, 31)
+    raise ValueError(f"Unsupported encoding {encoding!r}")
+
+
+class StreamCompressor:
+    """Incremental compressor that flushes a decodable block per chunk"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == 'zstd':
+            self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        elif encoding == 'br':
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        elif encoding == 'gzip':
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        else:
+            raise ValueError(f"Unsupported encoding {encoding!r}")
+
+    def compress(self, chunk: bytes) -> bytes:
+        """Compress a chunk and flush it so the client can decode it immediately"""
+        if self.encoding == 'zstd':
+            return self._compressor.compress(chunk) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.encoding == 'br':
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        """End the stream"""
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress_stream(chunks: Iterable, encoding: str) -> Iterator[bytes]:
+    """Compress a streamed body chunk by chunk, closing the source when done"""
+    compressor = StreamCompressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield compressor.compress(chunk)
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def compress_response(response, accept_encoding: str, min_bytes: int = 1024,
+                      preferred: Optional[List[str]] = None):
+    """
+    Compress a werkzeug/Flask response in place if the client accepts it
+
+    Files sent with send_file (images, videos) and already-encoded bodies
+    are left alone.
+
+    Args:
+        response: The response to compress
+        accept_encoding: The request's Accept-Encoding value
+        min_bytes: Bodies smaller than this are sent uncompressed
+        preferred: Server preference order of encodings
+
+    Returns:
+        The same response
+    """
+    if (response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or not is_compressible(response.mimetype)):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(accept_encoding, preferred)
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < min_bytes:
+            return response
+        response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,219 @@
+"""
+Local model provider (llama.cpp, CPU-only)
+
+Serves GGUF models in-process through the llama-cpp-python bindings, so short
+latency-critical prompts need no network round trip and the chatbot works
+fully offline.
+
+After each reply the model's KV state is snapshotted under the hash of the
+conversation so far. The next turn starts with exactly that prefix, so
+restoring the snapshot lets llama.cpp evaluate only the new message, whichever
+pool instance serves it.
+"""
+import os
+import queue
+import threading
+from typing import Iterator, List, Optional
+
+try:
+    import llama_cpp
+except ImportError:
+    llama_cpp = None
+
+from base_provider import AIProvider
+from config import Config
+from prompt_cache import PrefixStateCache, canonical_messages, prefix_key
+import tracing
+
+
+class ModelPool:
+    """
+    A warm pool of model instances
+
+    llama.cpp contexts are not thread-safe, so each concurrent request needs
+    its own instance. Weights are memory-mapped, so extra instances share the
+    page cache and mostly cost their KV cache.
+    """
+
+    def __init__(self, factory, size: int = 1):
+        self.factory = factory
+        self.size = max(1, size)
+        self._idle: queue.Queue = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _create(self) -> bool:
+        with self._lock:
+            if self._created >= self.size:
+                return False
+            self._created += 1
+        try:
+            self._idle.put(self.factory())
+        except BaseException:
+            with self._lock:
+                self._created -= 1
+            raise
+        return True
+
+    def warm(self):
+        """Load every instance up front"""
+        while self._create():
+            pass
+
+    def acquire(self, timeout: Optional[float] = None):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        self._create()
+        return self._idle.get(timeout=timeout)
+
+    def release(self, instance):
+        self._idle.put(instance)
+
+    @property
+    def loaded(self) -> int:
+        return self._created
+
+
+class LocalLlamaProvider(AIProvider):
+    """CPU-only local model served with llama.cpp"""
+
+    def __init__(self, model_path: str, threads: int = 0, context_length: int = 4096,
+                 pool_size: int = 1, preload: bool = True, prefix_cache_mb: Optional[int] = None):
+        super().__init__(api_key="")
+        if llama_cpp is None:
+            raise ImportError("llama-cpp-python not installed. Install with: pip install llama-cpp-python")
+        if not model_path or not os.path.isfile(model_path):
+            raise FileNotFoundError(f"Local model not found: {model_path}")
+
+        self.model = os.path.basename(model_path)
+        self.model_path = model_path
+        self.threads = threads or os.cpu_count() or 1
+        self.context_length = context_length
+        self.pool = ModelPool(self._load, pool_size)
+        prefix_cache_mb = Config.PREFIX_CACHE_MB if prefix_cache_mb is None else prefix_cache_mb
+        self.prefix_cache = PrefixStateCache(prefix_cache_mb * 1024 * 1024) if prefix_cache_mb > 0 else None
+        self._warmup: Optional[threading.Thread] = None
+
+        if preload:
+            # Load in the background so startup is not blocked; requests wait for it
+            self._warmup = threading.Thread(target=self.pool.warm, name='local-model-preload', daemon=True)
+            self._warmup.start()
+
+    def list_models(self) -> Optional[List[str]]:
+        """The one model file this provider serves"""
+        return [self.model]
+
+    def probe(self) -> Optional[str]:
+        """Finish loading the weights (instead of on the first request) and check one instance loaded"""
+        try:
+            if self._warmup is not None:
+                self._warmup.join()
+            else:
+                self.pool.warm()
+        except Exception as e:
+            return f"Error loading local model: {str(e)}"
+        return None if self.pool.loaded else "Error loading local model: no instance could be loaded"
+
+    def _load(self):
+        with tracing.span('local.load_model', model=self.model, threads=self.threads):
+            return llama_cpp.Llama(
+                model_path=self.model_path,
+                n_ctx=self.context_length,
+                n_threads=self.threads,
+                use_mmap=True,
+                use_mlock=False,
+                verbose=False,
+            )
+
+    def _options(self, kwargs) -> dict:
+        return {
+            'max_tokens': kwargs.get('max_tokens', 1000),
+            'temperature': kwargs.get('temperature', 0.7),
+        }
+
+    def _restore_prefix(self, llm, messages: list):
+        """Load the KV state saved for everything before the newest message"""
+        if self.prefix_cache is None or len(messages) < 2:
+            return
+        state = self.prefix_cache.get(prefix_key(messages[:-1]))
+        if state is not None:
+            with tracing.span('local.load_state', messages=len(messages) - 1):
+                llm.load_state(state)
+
+    def _save_prefix(self, llm, messages: list, reply: str):
+        """Snapshot the KV state under the prefix the next turn will start with"""
+        if self.prefix_cache is None:
+            return
+        with tracing.span('local.save_state', messages=len(messages) + 1):
+            state = llm.save_state()
+        key = prefix_key(messages + [{'role': 'assistant', 'content': reply}])
+        self.prefix_cache.put(key, state, getattr(state, 'llama_state_size', 0))
+
+    def generate_text(self, prompt: str, **kwargs) -> str:
+        """Generate text with the local model"""
+        return self._complete([{"role": "user", "content": prompt}], "Error generating text", **kwargs)
+
+    def chat(self, messages: list, **kwargs) -> str:
+        """Chat with the local model using conversation history"""
+        return self._complete(messages, "Error in chat", **kwargs)
+
+    def stream_text(self, prompt: str, **kwargs) -> Iterator[str]:
+        """Stream text from the local model as it is generated"""
+        return self._stream([{"role": "user", "content": prompt}], "Error generating text", **kwargs)
+
+    def stream_chat(self, messages: list, **kwargs) -> Iterator[str]:
+        """Stream a chat response from the local model as it is generated"""
+        return self._stream(messages, "Error in chat", **kwargs)
+
+    def _complete(self, messages: list, error_prefix: str, **kwargs) -> str:
+        messages = canonical_messages(messages)
+        with tracing.span('provider.chat', provider=type(self).__name__, model=self.model,
+                          messages=len(messages)):
+            try:
+                llm = self.pool.acquire()
+            except Exception as e:
+                return f"{error_prefix}: {str(e)}"
+            try:
+                self._restore_prefix(llm, messages)
+                response = llm.create_chat_completion(messages=messages, **self._options(kwargs))
+                content = response['choices'][0]['message']['content']
+                self._save_prefix(llm, messages, content)
+                return content
+            except Exception as e:
+                tracing.set_attribute('error', str(e))
+                return f"{error_prefix}: {str(e)}"
+            finally:
+                self.pool.release(llm)
+
+    def _stream(self, messages: list, error_prefix: str, **kwargs) -> Iterator[str]:
+        messages = canonical_messages(messages)
+        with tracing.span('provider.stream', provider=type(self).__name__, model=self.model,
+                          messages=len(messages)):
+            try:
+                llm = self.pool.acquire()
+            except Exception as e:
+                yield f"{error_prefix}: {str(e)}"
+                return
+            try:
+                self._restore_prefix(llm, messages)
+                cancel = kwargs.get('cancel')
+                parts = []
+                for chunk in llm.create_chat_completion(messages=messages, stream=True, **self._options(kwargs)):
+                    if cancel is not None and cancel.cancelled:
+                        # Stop decoding and hand the model back to the pool; a partial reply is not cached
+                        tracing.add_event('cancelled', reason=cancel.reason)
+                        return
+                    content = chunk['choices'][0].get('delta', {}).get('content')
+                    if content:
+                        if not parts:
+                            tracing.add_event('first_token')
+                        parts.append(content)
+                        yield content
+                self._save_prefix(llm, messages, ''.join(parts))
+            except Exception as e:
+                tracing.set_attribute('error', str(e))
+                yield f"{error_prefix}: {str(e)}"
+            finally:
+                self.pool.release(llm)
@@ -1,13 +1,24 @@
 import argparse
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from chatbot import UnifiedAIChatbot
 from config import Config
+from request_options import InvalidOptions, parse_options
 
 def main():
     parser = argparse.ArgumentParser(description="AI Tool Integrator (ChatGPT, DeepSeek, Grok, Gemini, DuckDuckGo)")
     parser.add_argument('--provider', type=str, required=False, help='The AI provider to use.')
     parser.add_argument('--prompt', type=str, required=False, help='The prompt to send to the AI.')
     parser.add_argument('--list-providers', action='store_true', help='List available providers.')
+    parser.add_argument('--batch', type=str, required=False, help='File with one prompt per line to run as a batch.')
+    parser.add_argument('--concurrency', type=int, default=4, help='Number of batch prompts to run at once.')
+    parser.add_argument('--model', type=str, required=False, help="Model to use instead of the provider's default.")
+    parser.add_argument('--temperature', type=float, required=False, help='Sampling temperature (0-2).')
+    parser.add_argument('--max-tokens', type=int, required=False, help='Maximum tokens in the response.')
+    parser.add_argument('--list-models', action='store_true', help="List the provider's models.")
+    parser.add_argument('--summarize', type=str, required=False,
+                        help='File to summarize, in parallel chunks when it exceeds the context window.')
+    parser.add_argument('--focus', type=str, default='', help='What the summary should concentrate on.')
 
     args = parser.parse_args()
 
@@ -22,7 +33,7 @@ def main():
         print(f"Available providers: {', '.join(chatbot.list_providers())}")
         return
 
-    if not args.prompt:
+    if not args.prompt and not args.batch and not args.list_models and not args.summarize:
         parser.print_help()
         sys.exit(1)
 
@@ -32,15 +43,60 @@ def main():
          print(f"Error: Provider '{provider}' not available. Available: {', '.join(chatbot.list_providers())}")
          sys.exit(1)
 
+    if args.list_models:
+        models = chatbot.list_models(provider)
+        print(f"Models from {provider}: {', '.join(models) if models else 'unknown (the provider does not list them)'}")
+        return
+
+    try:
+        options = parse_options(vars(args))
+    except InvalidOptions as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    # Checked once up front, so a bad model fails before any prompt is sent
+    error = chatbot.check_options(provider, options)
+    if error:
+        print(error)
+        sys.exit(1)
+
+    if args.batch:
+        run_batch(chatbot, provider, args.batch, args.concurrency, options)
+        return
+
+    if args.summarize:
+        try:
+            with open(args.summarize, encoding='utf-8', errors='replace') as f:
+                text = f.read()
+        except OSError as e:
+            print(f"Error reading file to summarize: {e}")
+            sys.exit(1)
+        summary = chatbot.summarize(text, provider, focus=args.focus, **options)
+        print(f"Summary from {provider}:\n{summary}")
+        sys.exit(1 if summary.startswith('Error') else 0)
+
     try:
         # Use chat method or generate_text? Chat is better as it mimics the interactive mode logic
         # But for one-off CLI, generate_text is fine. However, chatbot.py's chat method is what CLI uses.
         # But main.py is stateless one-off. generate_text seems appropriate.
-        response = chatbot.generate_text(args.prompt, provider=provider)
+        response = chatbot.generate_text(args.prompt, provider=provider, **options)
         print(f"Response from {provider}:\n{response}")
     except Exception as e:
         print(f"Error: {e}")
         sys.exit(1)
 
+def run_batch(chatbot, provider, path, concurrency, options=None):
+    """Run every prompt in a file through the provider, several at a time"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            prompts = [line.strip() for line in f if line.strip()]
+    except OSError as e:
+        print(f"Error reading batch file: {e}")
+        sys.exit(1)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        responses = pool.map(lambda p: chatbot.generate_text(p, provider=provider, **(options or {})), prompts)
+        for index, (prompt, response) in enumerate(zip(prompts, responses), 1):
+            print(f"[{index}/{len(prompts)}] {prompt}\nResponse from {provider}:\n{response}\n")
+
 if __name__ == "__main__":
     main()
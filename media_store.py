@@ -0,0 +1,304 @@
+"""
+Content-addressed media store
+
+Generated images and videos are saved under the SHA-256 of their content in
+sharded directories (ab/cd/abcd....png), so concurrent writes never collide
+and identical outputs are stored once. A SQLite index keeps the prompt,
+provider, size and timestamps; it and the temporary files live outside the
+store directory (MEDIA_INDEX_DIR, default .media-index/ next to it), which
+is served to the web. Thumbnails and video posters are
+made on a background thread, and the least recently used files are deleted
+once the store grows past its quota. Several web replicas can share one store
+directory (e.g. a shared volume): the index is the source of truth for sizes.
+"""
+import hashlib
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from config import Config
+import tracing
+
+# The only paths a store serves: stored files, thumbnails and derived assets (e.g. HLS segments)
+MEDIA_PATH = re.compile(r'[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]{1,5}'
+                        r'|thumbs/[0-9a-f]{2}/[0-9a-f]{64}\.jpg'
+                        r'|assets/[0-9a-f]{2}/[0-9a-f]{64}/[\w-]+/[\w-]+\.[a-z0-9]{1,5}')
+INDEX_FILES = ('index.sqlite3', 'index.sqlite3-wal', 'index.sqlite3-shm')
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.gif'}
+VIDEO_EXTENSIONS = {'.mp4', '.webm', '.mov', '.gif'}
+
+_stores: Dict[Path, 'MediaStore'] = {}
+_stores_lock = threading.Lock()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    hash TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    prompt TEXT,
+    provider TEXT,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL,
+    thumbnail TEXT,
+    assets TEXT
+);
+CREATE INDEX IF NOT EXISTS media_accessed ON media (accessed);
+"""
+
+
+class MediaStore:
+    """Hash-named media files with a metadata index and quota-based eviction"""
+
+    def __init__(self, root: Path, quota_bytes: int = 0, thumbnail_size: int = 256,
+                 index_dir: Optional[Path] = None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.quota_bytes = quota_bytes
+        self.thumbnail_size = thumbnail_size
+        # The index holds every prompt, so it must not be reachable through the served directory
+        self.index_dir = Path(index_dir) if index_dir else self.root.parent / '.media-index' / self.root.name
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self._move_legacy_index()
+        self.tmp_dir = self.index_dir / 'tmp'
+        self.tmp_dir.mkdir(exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.index_dir / 'index.sqlite3'), check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+        columns = {row[1] for row in self._db.execute('PRAGMA table_info(media)')}
+        if 'assets' not in columns:
+            self._db.execute('ALTER TABLE media ADD COLUMN assets TEXT')
+        self.size_bytes = self._total_size()
+        # Thumbnails and garbage collection never run on the request path
+        self._background = ThreadPoolExecutor(max_workers=1, thread_name_prefix='media-store')
+        self._gc_pending = False
+
+    def _move_legacy_index(self):
+        """Move an index kept inside the store directory by earlier versions out of it"""
+        if (self.root / INDEX_FILES[0]).exists() and not (self.index_dir / INDEX_FILES[0]).exists():
+            for name in INDEX_FILES:
+                if (self.root / name).exists():
+                    shutil.move(str(self.root / name), str(self.index_dir / name))
+        shutil.rmtree(self.root / '.tmp', ignore_errors=True)
+
+    def _total_size(self) -> int:
+        # Replicas sharing the directory all write to the index, so it holds the true total
+        return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM media').fetchone()[0]
+
+    def path_for(self, digest: str, extension: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / f"{digest}{extension}"
+
+    def put_bytes(self, data: bytes, extension: str, prompt: str = '', provider: str = '') -> Path:
+        """Store content and return its path (an existing copy is reused)"""
+        return self.put_stream([data], extension, prompt, provider)
+
+    def put_stream(self, chunks: Iterable[bytes], extension: str, prompt: str = '', provider: str = '') -> Path:
+        """
+        Stream content into the store without holding it in memory
+
+        Args:
+            chunks: Byte chunks, e.g. response.iter_content()
+            extension: File extension including the dot
+            prompt: Prompt that produced the content
+            provider: Generator that produced the content
+
+        Returns:
+            Path of the stored file
+        """
+        extension = extension.lower()
+        digest = hashlib.sha256()
+        size = 0
+        with tracing.span('media.store', extension=extension):
+            fd, tmp_name = tempfile.mkstemp(dir=self.tmp_dir, suffix=extension)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    for chunk in chunks:
+                        if chunk:
+                            digest.update(chunk)
+                            f.write(chunk)
+                            size += len(chunk)
+                return self._commit(Path(tmp_name), digest.hexdigest(), extension, size, prompt, provider)
+            finally:
+                if os.path.exists(tmp_name):
+                    os.unlink(tmp_name)
+
+    def put_file(self, source: Path, prompt: str = '', provider: str = '') -> Path:
+        """Move a finished file (best created under tmp_dir) into the store"""
+        source = Path(source)
+        digest = hashlib.sha256()
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        try:
+            return self._commit(source, digest.hexdigest(), source.suffix.lower(), source.stat().st_size,
+                                prompt, provider)
+        finally:
+            if source.exists():
+                source.unlink()
+
+    def attach(self, path, directory: Path):
+        """Move a directory of derived files (e.g. HLS segments) next to a stored file; removed with it"""
+        digest = Path(path).stem
+        target = self.root / 'assets' / digest[:2] / digest / Path(directory).name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if target.exists():
+            shutil.rmtree(directory, ignore_errors=True)
+        else:
+            shutil.move(str(directory), str(target))
+        with self._lock:
+            self._db.execute('UPDATE media SET assets = ? WHERE hash = ?',
+                             (target.parent.relative_to(self.root).as_posix(), digest))
+            self._db.commit()
+        return target
+
+    def _commit(self, tmp_path: Path, digest: str, extension: str, size: int, prompt: str, provider: str) -> Path:
+        path = self.path_for(digest, extension)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute('SELECT path FROM media WHERE hash = ?', (digest,)).fetchone()
+            if row is not None and path.exists():
+                tracing.set_attribute('deduplicated', True)
+                self._db.execute('UPDATE media SET accessed = ? WHERE hash = ?', (now, digest))
+                self._db.commit()
+                return path
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # tmp_dir may be on another filesystem, where a move is a copy; only a finished file is renamed in
+            partial = path.with_name(f".{path.name}.partial")
+            shutil.move(str(tmp_path), str(partial))
+            os.replace(partial, path)
+            self._db.execute(
+                'INSERT OR REPLACE INTO media (hash, path, prompt, provider, size, created, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (digest, path.relative_to(self.root).as_posix(), prompt, provider, size, now, now))
+            self._db.commit()
+            self.size_bytes = self._total_size()
+            over_quota = self.quota_bytes and self.size_bytes > self.quota_bytes and not self._gc_pending
+            if over_quota:
+                self._gc_pending = True
+        self._background.submit(self._make_thumbnail, digest, path)
+        if over_quota:
+            self._background.submit(self.collect_garbage)
+        return path
+
+    def touch(self, relative_path: str):
+        """Mark a file as recently used (call when it is served)"""
+        with self._lock:
+            self._db.execute('UPDATE media SET accessed = ? WHERE path = ?', (time.time(), relative_path))
+            self._db.commit()
+
+    def info(self, path) -> Optional[Dict]:
+        """Index entry for a stored file, or None"""
+        digest = Path(path).stem
+        with self._lock:
+            cursor = self._db.execute('SELECT * FROM media WHERE hash = ?', (digest,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            return dict(zip([c[0] for c in cursor.description], row))
+
+    @staticmethod
+    def is_media_path(relative_path: str) -> bool:
+        """Whether a relative path has the layout of a file the store serves"""
+        return MEDIA_PATH.fullmatch(relative_path) is not None
+
+    def relative(self, path) -> str:
+        """Path of a stored file relative to the store root, as used in URLs"""
+        return Path(path).resolve().relative_to(self.root.resolve()).as_posix()
+
+    def collect_garbage(self, target_bytes: Optional[int] = None) -> List[str]:
+        """
+        Delete least recently used files until the store is under its quota
+
+        Args:
+            target_bytes: Size to shrink to (defaults to 90% of the quota)
+
+        Returns:
+            Relative paths of the deleted files
+        """
+        if target_bytes is None:
+            target_bytes = int(self.quota_bytes * 0.9)
+        removed = []
+        with tracing.span('media.gc', size_bytes=self.size_bytes, target_bytes=target_bytes):
+            with self._lock:
+                self._gc_pending = False
+                self.size_bytes = self._total_size()
+                rows = self._db.execute(
+                    'SELECT hash, path, size, thumbnail, assets FROM media ORDER BY accessed').fetchall()
+                for digest, relative_path, size, thumbnail, assets in rows:
+                    if self.size_bytes <= target_bytes:
+                        break
+                    if assets:
+                        shutil.rmtree(self.root / assets, ignore_errors=True)
+                    for name in (relative_path, thumbnail):
+                        if name:
+                            try:
+                                (self.root / name).unlink()
+                            except FileNotFoundError:
+                                pass
+                    self._db.execute('DELETE FROM media WHERE hash = ?', (digest,))
+                    self.size_bytes -= size
+                    removed.append(relative_path)
+                self._db.commit()
+            tracing.set_attribute('removed', len(removed))
+        return removed
+
+    def _make_thumbnail(self, digest: str, path: Path):
+        extension = path.suffix.lower()
+        thumbnail = self.root / 'thumbs' / digest[:2] / f"{digest}.jpg"
+        try:
+            thumbnail.parent.mkdir(parents=True, exist_ok=True)
+            if extension in IMAGE_EXTENSIONS and Image is not None:
+                with Image.open(path) as image:
+                    image.thumbnail((self.thumbnail_size, self.thumbnail_size))
+                    image.convert('RGB').save(thumbnail, 'JPEG', quality=80)
+            elif extension in VIDEO_EXTENSIONS and shutil.which('ffmpeg'):
+                subprocess.run(
+                    ['ffmpeg', '-y', '-loglevel', 'error', '-i', str(path), '-frames:v', '1',
+                     '-vf', f"scale={self.thumbnail_size}:-2", str(thumbnail)],
+                    check=True, timeout=60)
+            else:
+                return
+        except Exception:
+            # Previews are best effort; the original file is what matters
+            return
+        with self._lock:
+            self._db.execute('UPDATE media SET thumbnail = ? WHERE hash = ?',
+                             (thumbnail.relative_to(self.root).as_posix(), digest))
+            self._db.commit()
+
+    def flush(self):
+        """Wait for queued thumbnail and garbage collection work"""
+        self._background.submit(lambda: None).result()
+
+    def close(self):
+        self._background.shutdown(wait=True)
+        with self._lock:
+            self._db.close()
+
+
+def get_store(root: Path, quota_mb: int = 0) -> MediaStore:
+    """The shared store for a directory, so every generator writing there shares one index"""
+    key = Path(root).resolve()
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            index_dir = Path(Config.MEDIA_INDEX_DIR) / key.name if Config.MEDIA_INDEX_DIR else None
+            store = MediaStore(root, quota_mb * 1024 * 1024, Config.THUMBNAIL_SIZE, index_dir)
+            _stores[key] = store
+        elif quota_mb:
+            store.quota_bytes = quota_mb * 1024 * 1024
+        return store
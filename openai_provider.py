@@ -1,82 +1,227 @@
 """
 OpenAI Provider (ChatGPT and DALL-E)
 """
+import base64
+import contextvars
 import os
+import queue
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from datetime import datetime
-from openai import OpenAI
+from typing import Dict, Iterator, List, Optional
 from base_provider import AIProvider, ImageGenerator
+from provider_registry import get_openai_client
+from prompt_cache import canonical_messages
+from media_store import get_store
+import tracing
 
 
 class OpenAIProvider(AIProvider):
     """OpenAI ChatGPT provider"""
     
-    def __init__(self, api_key: str, base_url: str = None, model: str = "gpt-4"):
+    def __init__(self, api_key: str, base_url: str = None, model: str = "gpt-4", pool_size: int = 0):
         super().__init__(api_key)
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.client = get_openai_client(api_key, base_url, pool_size)
         self.model = model
     
     def generate_text(self, prompt: str, **kwargs) -> str:
         """Generate text using ChatGPT"""
-        try:
-            response = self.client.chat.completions.create(
-                model=kwargs.get('model', self.model),
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=kwargs.get('max_tokens', 1000),
-                temperature=kwargs.get('temperature', 0.7)
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"Error generating text: {str(e)}"
+        with tracing.span('provider.generate_text', provider=type(self).__name__,
+                          model=kwargs.get('model', self.model)):
+            try:
+                response = self.client.chat.completions.create(
+                    model=kwargs.get('model', self.model),
+                    messages=[{"role": "user", "content": prompt}],
+                    max_tokens=kwargs.get('max_tokens', 1000),
+                    temperature=kwargs.get('temperature', 0.7)
+                )
+                return response.choices[0].message.content
+            except Exception as e:
+                tracing.set_attribute('error', str(e))
+                return f"Error generating text: {str(e)}"
     
     def chat(self, messages: list, **kwargs) -> str:
         """Chat with ChatGPT using conversation history"""
-        try:
-            response = self.client.chat.completions.create(
-                model=kwargs.get('model', self.model),
-                messages=messages,
-                max_tokens=kwargs.get('max_tokens', 1000),
-                temperature=kwargs.get('temperature', 0.7)
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"Error in chat: {str(e)}"
+        # Byte-identical prefixes let the server's prompt cache skip reprocessing them
+        messages = canonical_messages(messages)
+        with tracing.span('provider.chat', provider=type(self).__name__,
+                          model=kwargs.get('model', self.model), messages=len(messages)):
+            try:
+                response = self.client.chat.completions.create(
+                    model=kwargs.get('model', self.model),
+                    messages=messages,
+                    max_tokens=kwargs.get('max_tokens', 1000),
+                    temperature=kwargs.get('temperature', 0.7)
+                )
+                return response.choices[0].message.content
+            except Exception as e:
+                tracing.set_attribute('error', str(e))
+                return f"Error in chat: {str(e)}"
+    
+    def list_models(self) -> Optional[List[str]]:
+        """Model ids from the endpoint's /models"""
+        return [model.id for model in self.client.models.list()]
+    
+    def probe(self) -> Optional[str]:
+        """List the endpoint's models: authenticates, opens a pooled connection and checks the model"""
+        with tracing.span('provider.probe', provider=type(self).__name__, model=self.model):
+            try:
+                self.remember_models(self.list_models())
+            except Exception as e:
+                tracing.set_attribute('error', str(e))
+                return f"Error probing {self.model}: {str(e)}"
+            # Some compatible servers list no models, or serve aliases they do not list
+            if self.check_model(self.model):
+                return f"Error probing {self.model}: model not offered by the endpoint"
+            return None
+    
+    def stream_text(self, prompt: str, **kwargs):
+        """Stream text from ChatGPT as it is generated"""
+        return self._stream([{"role": "user", "content": prompt}], "Error generating text", **kwargs)
+    
+    def stream_chat(self, messages: list, **kwargs):
+        """Stream a chat response from ChatGPT as it is generated"""
+        return self._stream(messages, "Error in chat", **kwargs)
+    
+    def _stream(self, messages: list, error_prefix: str, **kwargs):
+        """
+        Yield content deltas from a streaming chat completion
+        
+        Cancelling the `cancel` token closes the HTTP response, which ends the
+        read this generator is blocked in and stops upstream generation.
+        """
+        messages = canonical_messages(messages)
+        cancel = kwargs.get('cancel')
+        with tracing.span('provider.stream', provider=type(self).__name__,
+                          model=kwargs.get('model', self.model), messages=len(messages)):
+            stream = None
+            try:
+                stream = self.client.chat.completions.create(
+                    model=kwargs.get('model', self.model),
+                    messages=messages,
+                    max_tokens=kwargs.get('max_tokens', 1000),
+                    temperature=kwargs.get('temperature', 0.7),
+                    stream=True
+                )
+                if cancel is not None:
+                    cancel.on_cancel(stream.close)
+                first = True
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first:
+                            tracing.add_event('first_token')
+                            first = False
+                        yield chunk.choices[0].delta.content
+            except Exception as e:
+                if cancel is not None and cancel.cancelled:
+                    # The read failed because the stream was closed on purpose
+                    tracing.add_event('cancelled', reason=cancel.reason)
+                    return
+                tracing.set_attribute('error', str(e))
+                yield f"{error_prefix}: {str(e)}"
+            finally:
+                if stream is not None:
+                    stream.close()
 
 
 class DALLEGenerator(ImageGenerator):
     """DALL-E image generator"""
     
-    def __init__(self, api_key: str, output_dir: Path):
+    # Images per request each model accepts; larger counts are split across requests
+    MAX_IMAGES_PER_REQUEST = {'dall-e-3': 1, 'dall-e-2': 10, 'gpt-image-1': 10}
+    
+    def __init__(self, api_key: str, output_dir: Path, base_url: str = None, concurrency: int = 4,
+                 quota_mb: int = 0):
         super().__init__(api_key)
-        self.client = OpenAI(api_key=api_key)
+        self.client = get_openai_client(api_key, base_url)
         self.output_dir = output_dir
-        self.output_dir.mkdir(exist_ok=True)
+        self.store = get_store(output_dir, quota_mb)
+        self.concurrency = max(1, concurrency)
+        self.session = requests.Session()
     
     def generate_image(self, prompt: str, **kwargs) -> str:
         """Generate an image using DALL-E"""
+        result = next(self.generate_images([prompt], 1, **kwargs))
+        return result.get('filepath') or result['error']
+    
+    def generate_images(self, prompts: List[str], n: int = 1, **kwargs) -> Iterator[Dict]:
+        """
+        Generate several images for several prompts concurrently
+        
+        Upstream requests and downloads run on a shared thread pool, so total
+        time is close to the slowest single image rather than the sum.
+        
+        Args:
+            prompts: Image descriptions
+            n: Images per prompt
+            **kwargs: model, size and quality, and a `cancel` token that skips requests not yet sent
+        
+        Yields:
+            {'prompt', 'index', 'filepath'} or {'prompt', 'index', 'error'}
+            per image, in completion order
+        """
+        model = kwargs.get('model', 'dall-e-3')
+        per_request = self.MAX_IMAGES_PER_REQUEST.get(model, 1)
+        results: queue.Queue = queue.Queue()
+        expected = 0
+        
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='dalle') as pool:
+            for prompt in prompts:
+                for first in range(0, n, per_request):
+                    count = min(per_request, n - first)
+                    expected += count
+                    pool.submit(contextvars.copy_context().run, self._request,
+                                pool, results, prompt, first, count, **kwargs)
+            for _ in range(expected):
+                yield results.get()
+    
+    def _request(self, pool, results, prompt: str, first: int, count: int, **kwargs):
+        """One images.generate call; queues a download per returned image and an error for every other index"""
+        # generate_images waits for exactly `count` results, so every index must get one whatever fails
+        queued = 0
+        cancel = kwargs.get('cancel')
+        if cancel is not None and cancel.cancelled:
+            for index in range(first, first + count):
+                results.put({'prompt': prompt, 'index': index, 'error': "Error generating image: cancelled"})
+            return
         try:
-            response = self.client.images.generate(
-                model=kwargs.get('model', 'dall-e-3'),
-                prompt=prompt,
-                size=kwargs.get('size', '1024x1024'),
-                quality=kwargs.get('quality', 'standard'),
-                n=1
-            )
-            
-            # Get the image URL
-            image_url = response.data[0].url
-            
-            # Download and save the image
-            image_response = requests.get(image_url)
+            with tracing.span('provider.generate_image', provider=type(self).__name__,
+                              model=kwargs.get('model', 'dall-e-3'), n=count):
+                # Models name their quality levels differently, so only a requested one is sent
+                options = {'quality': kwargs['quality']} if kwargs.get('quality') else {}
+                try:
+                    response = self.client.images.generate(
+                        model=kwargs.get('model', 'dall-e-3'),
+                        prompt=prompt,
+                        size=kwargs.get('size', '1024x1024'),
+                        n=count,
+                        **options
+                    )
+                except Exception as e:
+                    tracing.set_attribute('error', str(e))
+                    raise
             
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"dalle_{timestamp}.png"
-            filepath = self.output_dir / filename
-            
-            with open(filepath, 'wb') as f:
-                f.write(image_response.content)
+            for image in list(response.data)[:count]:
+                pool.submit(contextvars.copy_context().run, self._save, results, prompt, first + queued, image)
+                queued += 1
+            error = "Error generating image: no image returned"
+        except Exception as e:
+            error = f"Error generating image: {str(e)}"
+        for index in range(first + queued, first + count):
+            results.put({'prompt': prompt, 'index': index, 'error': error})
+    
+    def _save(self, results, prompt: str, index: int, image):
+        """Download (or decode) one image into the media store"""
+        try:
+            if image.url:
+                with tracing.span('provider.download', url=image.url):
+                    with self.session.get(image.url, timeout=60, stream=True) as image_response:
+                        image_response.raise_for_status()
+                        filepath = self.store.put_stream(image_response.iter_content(64 * 1024), '.png',
+                                                         prompt, 'dalle')
+            else:
+                filepath = self.store.put_bytes(base64.b64decode(image.b64_json), '.png', prompt, 'dalle')
             
-            return str(filepath)
+            results.put({'prompt': prompt, 'index': index, 'filepath': str(filepath)})
         except Exception as e:
-            return f"Error generating image: {str(e)}"
+            results.put({'prompt': prompt, 'index': index, 'error': f"Error generating image: {str(e)}"})
@@ -0,0 +1,154 @@
+"""
+Shared poller for long-running predictions
+
+Video models run for minutes. Rather than holding a thread per job, jobs are
+registered with one poller: a scheduler thread keeps a heap of due times and a
+small worker pool performs the status checks, backing off from
+`initial_interval` to `max_interval` between checks. A webhook can call poke()
+to check a prediction immediately instead of waiting for its next poll.
+Predictions still running after `max_age` are given up on (and cancelled
+upstream through `on_expire`), so a stuck job is not polled forever.
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from typing import Callable, Dict, Optional
+
+import tracing
+
+TERMINAL_STATUSES = {'succeeded', 'failed', 'canceled'}
+
+
+class _Tracked:
+    """Polling state for one prediction"""
+
+    def __init__(self, prediction_id: str, on_done: Callable, interval: float):
+        self.id = prediction_id
+        self.on_done = on_done
+        self.interval = interval
+        self.polls = 0
+        self.started = time.monotonic()
+        self.generation = 0
+        self.finished = False
+
+
+class PredictionPoller:
+    """Tracks many predictions with one scheduler thread and a few workers"""
+
+    def __init__(self, fetch: Callable[[str], object], workers: int = 4,
+                 initial_interval: float = 1.0, max_interval: float = 30.0, max_age: float = 0,
+                 on_expire: Optional[Callable[[str], None]] = None):
+        """
+        Args:
+            fetch: Returns the current prediction (with a `status`) for an id
+            workers: Threads used for status checks and completion callbacks
+            initial_interval: Seconds before the first check
+            max_interval: Upper bound for the backoff between checks
+            max_age: Seconds after which an unfinished prediction is given up on (0: never)
+            on_expire: Called with the id of a prediction given up on, e.g. to cancel it upstream
+        """
+        self.fetch = fetch
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.max_age = max_age
+        self.on_expire = on_expire
+        self._tracked: Dict[str, _Tracked] = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prediction-poll')
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def track(self, prediction_id: str, on_done: Callable[[object], None]):
+        """Poll a prediction until it finishes, then call on_done(prediction) on a worker"""
+        with self._cond:
+            entry = _Tracked(prediction_id, on_done, self.initial_interval)
+            self._tracked[prediction_id] = entry
+            self._schedule(entry, self.initial_interval)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='prediction-poller', daemon=True)
+                self._thread.start()
+
+    def poke(self, prediction_id: str) -> bool:
+        """Check a prediction now (e.g. after a webhook); returns False if it is not tracked"""
+        with self._cond:
+            entry = self._tracked.get(prediction_id)
+            if entry is None:
+                return False
+            self._schedule(entry, 0)
+            return True
+
+    def untrack(self, prediction_id: str) -> bool:
+        """Stop polling a prediction without calling its on_done; False if it is not tracked"""
+        with self._cond:
+            entry = self._tracked.pop(prediction_id, None)
+            if entry is None:
+                return False
+            entry.finished = True
+            return True
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._tracked)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._workers.shutdown(wait=False)
+
+    def _schedule(self, entry: _Tracked, delay: float):
+        # A newer schedule (e.g. from poke) supersedes any older heap item
+        entry.generation += 1
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), entry.generation, entry))
+        self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                if self._stopped:
+                    return
+                _, _, generation, entry = heapq.heappop(self._heap)
+                if entry.finished or generation != entry.generation:
+                    continue
+            self._workers.submit(self._poll, entry)
+
+    def _poll(self, entry: _Tracked):
+        if entry.finished:
+            return
+        entry.polls += 1
+        try:
+            prediction = self.fetch(entry.id)
+            status = getattr(prediction, 'status', None)
+        except Exception as e:
+            # Transient API errors: keep polling with backoff
+            tracing.add_event('prediction.poll_error', id=entry.id, error=str(e))
+            status = None
+        if status not in TERMINAL_STATUSES and self.max_age and time.monotonic() - entry.started > self.max_age:
+            if not self.untrack(entry.id):
+                return
+            tracing.add_event('prediction.expired', id=entry.id, status=status)
+            if self.on_expire is not None:
+                self.on_expire(entry.id)
+            entry.on_done(SimpleNamespace(id=entry.id, status='canceled', output=None,
+                                          error=f"still {status or 'unknown'} after {self.max_age:.0f}s"))
+            return
+        if status not in TERMINAL_STATUSES:
+            with self._cond:
+                if not entry.finished:
+                    entry.interval = min(self.max_interval, entry.interval * 1.5)
+                    self._schedule(entry, entry.interval * random.uniform(0.9, 1.1))
+            return
+        with self._cond:
+            if entry.finished:
+                return
+            entry.finished = True
+            self._tracked.pop(entry.id, None)
+        entry.on_done(prediction)
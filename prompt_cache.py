@@ -0,0 +1,84 @@
+"""
+Prompt-prefix caching helpers
+
+Upstream prompt caches (OpenAI, DeepSeek, vLLM's automatic prefix caching,
+llama.cpp server) only hit when the start of a request is byte-identical to an
+earlier one. canonical_messages keeps the system prompt first and every
+message in one fixed shape so the shared prefix never drifts.
+
+For in-process backends PrefixStateCache keeps KV-state snapshots keyed by a
+hash of the message prefix they were computed from, with LRU eviction by size.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+def canonical_messages(messages: List[Dict], system_prompt: Optional[str] = None) -> List[Dict]:
+    """
+    Normalise messages so identical conversations serialise identically
+
+    Args:
+        messages: Chat messages (role/content dicts, possibly with extra keys)
+        system_prompt: Optional system prompt placed first if not already present
+
+    Returns:
+        New list of {'role', 'content'} dicts with system messages first
+    """
+    system = [m for m in messages if m.get('role') == 'system']
+    rest = [m for m in messages if m.get('role') != 'system']
+    if system_prompt and not any(m.get('content') == system_prompt for m in system):
+        system.insert(0, {'role': 'system', 'content': system_prompt})
+    return [{'role': m['role'], 'content': str(m.get('content') or '')} for m in system + rest]
+
+
+def prefix_key(messages: List[Dict]) -> str:
+    """Stable hash of a message prefix"""
+    blob = json.dumps([[m['role'], m['content']] for m in messages], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+class PrefixStateCache:
+    """LRU cache of backend state snapshots keyed by prefix hash, bounded by bytes"""
+
+    def __init__(self, capacity_bytes: int):
+        self.capacity_bytes = capacity_bytes
+        self._entries: 'OrderedDict[str, Any]' = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        with self._lock:
+            state = self._entries.get(key)
+            if state is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return state
+
+    def put(self, key: str, state, size: int):
+        if size > self.capacity_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.size_bytes -= self._sizes[key]
+                del self._entries[key]
+            self._entries[key] = state
+            self._sizes[key] = size
+            self.size_bytes += size
+            while self.size_bytes > self.capacity_bytes and self._entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self.size_bytes -= self._sizes.pop(evicted)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        return {'entries': len(self._entries), 'size_bytes': self.size_bytes,
+                'hits': self.hits, 'misses': self.misses}
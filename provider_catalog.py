@@ -0,0 +1,328 @@
+"""
+Declarative provider catalog
+
+Text providers are described by data rather than code. The built-in catalog
+below can be extended or overridden by a TOML, JSON or YAML file
+(PROVIDER_CATALOG, see providers.example.toml) and by environment variables:
+
+    PROVIDER_<NAME>_BASE_URL=http://127.0.0.1:8000/v1
+    PROVIDER_<NAME>_MODEL=qwen2.5-7b-instruct
+    PROVIDER_<NAME>_API_KEY=...            (optional for local servers)
+    PROVIDER_<NAME>_POOL_SIZE=8            (any catalog field, upper-cased)
+
+Any OpenAI-compatible endpoint (vLLM, llama.cpp server, Ollama, ...) can be
+added this way without writing a provider class. Each entry also carries the
+parameters the performance layers use: context length, pricing, rate limits
+and connection pool size.
+"""
+import importlib.util
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from config import Config
+
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+
+BUILTIN_CATALOG = {
+    'openai': {
+        'kind': 'openai',
+        'api_key_env': 'OPENAI_API_KEY',
+        'base_url': 'https://api.openai.com/v1',
+        'base_url_env': 'OPENAI_BASE_URL',
+        'model': 'gpt-4',
+        'context_length': 8192,
+        'input_price_per_1k': 0.03,
+        'output_price_per_1k': 0.06,
+        'requests_per_minute': 500,
+        'max_concurrency': 16,
+        'pool_size': 16,
+    },
+    'gemini': {
+        'kind': 'gemini',
+        'api_key_env': 'GEMINI_API_KEY',
+        'base_url_env': 'GEMINI_API_ENDPOINT',
+        'model': 'gemini-pro',
+        'context_length': 32768,
+        'input_price_per_1k': 0.0005,
+        'output_price_per_1k': 0.0015,
+        'requests_per_minute': 60,
+        'max_concurrency': 8,
+    },
+    'deepseek': {
+        'kind': 'openai',
+        'api_key_env': 'DEEPSEEK_API_KEY',
+        'base_url': 'https://api.deepseek.com',
+        'base_url_env': 'DEEPSEEK_BASE_URL',
+        'model': 'deepseek-chat',
+        'context_length': 65536,
+        'input_price_per_1k': 0.00027,
+        'output_price_per_1k': 0.0011,
+        'requests_per_minute': 0,
+        'max_concurrency': 16,
+        'pool_size': 16,
+    },
+    'grok': {
+        'kind': 'openai',
+        'api_key_env': 'XAI_API_KEY',
+        'base_url': 'https://api.x.ai/v1',
+        'base_url_env': 'XAI_BASE_URL',
+        'model': 'grok-beta',
+        'context_length': 131072,
+        'input_price_per_1k': 0.005,
+        'output_price_per_1k': 0.015,
+        'requests_per_minute': 60,
+        'max_concurrency': 8,
+        'pool_size': 8,
+    },
+    # In-process llama.cpp model, available once LOCAL_MODEL_PATH points at a GGUF file
+    'local': {
+        'kind': 'local',
+        'model_path_env': 'LOCAL_MODEL_PATH',
+        'context_length': 4096,
+        'max_concurrency': 1,
+        'pool_size': 1,
+    },
+    # DuckDuckGo is free, always available
+    'duckduckgo': {
+        'kind': 'duckduckgo',
+        'model': 'duckduckgo',
+        'context_length': 4096,
+    },
+}
+
+# Catalog fields and their types, used to parse environment overrides
+FIELDS = {
+    'kind': str,
+    'api_key': str,
+    'api_key_env': str,
+    'base_url': str,
+    'base_url_env': str,
+    'model': str,
+    'context_length': int,
+    'input_price_per_1k': float,
+    'output_price_per_1k': float,
+    'requests_per_minute': int,
+    'max_concurrency': int,
+    'pool_size': int,
+    'model_path': str,
+    'model_path_env': str,
+    'threads': int,
+}
+
+
+def _setting(name: Optional[str]) -> str:
+    """Read a setting from Config if it defines it, otherwise from the environment"""
+    if not name:
+        return ''
+    if hasattr(Config, name):
+        return getattr(Config, name) or ''
+    return os.getenv(name, '')
+
+
+class ProviderSpec:
+    """One catalog entry describing a text provider"""
+
+    def __init__(self, name: str, kind: str = 'openai', model: Optional[str] = None,
+                 api_key: str = '', api_key_env: Optional[str] = None,
+                 base_url: Optional[str] = None, base_url_env: Optional[str] = None,
+                 context_length: int = 4096, input_price_per_1k: float = 0.0,
+                 output_price_per_1k: float = 0.0, requests_per_minute: int = 0,
+                 max_concurrency: int = 0, pool_size: int = 0, model_path: str = '',
+                 model_path_env: Optional[str] = None, threads: int = 0):
+        self.name = name
+        self.kind = kind
+        self.default_model = model
+        self._api_key = api_key
+        self.api_key_setting = api_key_env
+        self._base_url = base_url
+        self.base_url_setting = base_url_env
+        self.context_length = context_length
+        self.input_price_per_1k = input_price_per_1k
+        self.output_price_per_1k = output_price_per_1k
+        self.requests_per_minute = requests_per_minute
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self._model_path = model_path
+        self.model_path_setting = model_path_env
+        self.threads = threads
+
+    @property
+    def api_key(self) -> str:
+        """The configured API key, read at call time"""
+        return _setting(self.api_key_setting) or self._api_key
+
+    @property
+    def base_url(self) -> Optional[str]:
+        return _setting(self.base_url_setting) or self._base_url
+
+    @property
+    def model_path(self) -> str:
+        return _setting(self.model_path_setting) or self._model_path
+
+    @property
+    def available(self) -> bool:
+        """Keyless providers are available; keyed ones need their key"""
+        if self.kind == 'duckduckgo':
+            return True
+        if self.kind == 'local':
+            return (bool(self.model_path) and os.path.isfile(self.model_path)
+                    and importlib.util.find_spec('llama_cpp') is not None)
+        if self.api_key_setting or self.kind != 'openai':
+            return bool(self.api_key)
+        # Keyless OpenAI-compatible endpoints (e.g. a local vLLM server)
+        return bool(self.base_url)
+
+    @property
+    def openai_compatible(self) -> bool:
+        return self.kind == 'openai'
+
+    @property
+    def factory(self) -> Callable[['ProviderSpec'], object]:
+        if self.kind not in FACTORIES:
+            raise ValueError(f"Unknown provider kind '{self.kind}' for provider '{self.name}'")
+        return FACTORIES[self.kind]
+
+    def estimate_cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        """Estimated price in USD of a call with the given token counts"""
+        return (prompt_tokens * self.input_price_per_1k + completion_tokens * self.output_price_per_1k) / 1000.0
+
+    def to_dict(self) -> Dict:
+        return {
+            'kind': self.kind,
+            'model': self.default_model,
+            'base_url': self.base_url,
+            'context_length': self.context_length,
+            'input_price_per_1k': self.input_price_per_1k,
+            'output_price_per_1k': self.output_price_per_1k,
+            'requests_per_minute': self.requests_per_minute,
+            'max_concurrency': self.max_concurrency,
+            'pool_size': self.pool_size,
+        }
+
+
+def _build_openai(spec: ProviderSpec):
+    from openai_provider import OpenAIProvider
+    options = {'pool_size': spec.pool_size}
+    if spec.default_model:
+        options['model'] = spec.default_model
+    # Local servers ignore the key, but the SDK requires one
+    return OpenAIProvider(spec.api_key or 'not-needed', spec.base_url, **options)
+
+
+def _build_gemini(spec: ProviderSpec):
+    from gemini_provider import GeminiProvider
+    return GeminiProvider(spec.api_key, spec.base_url, spec.default_model or 'gemini-pro')
+
+
+def _build_local(spec: ProviderSpec):
+    from local_provider import LocalLlamaProvider
+    return LocalLlamaProvider(
+        spec.model_path,
+        threads=spec.threads or Config.LOCAL_MODEL_THREADS,
+        context_length=spec.context_length,
+        pool_size=spec.pool_size or 1,
+        preload=Config.LOCAL_MODEL_PRELOAD,
+    )
+
+
+def _build_duckduckgo(spec: ProviderSpec):
+    from duckduckgo_provider import DuckDuckGoProvider
+    return DuckDuckGoProvider()
+
+
+FACTORIES: Dict[str, Callable[[ProviderSpec], object]] = {
+    'openai': _build_openai,
+    'gemini': _build_gemini,
+    'local': _build_local,
+    'duckduckgo': _build_duckduckgo,
+}
+
+
+def load_file(path: Path) -> Dict[str, Dict]:
+    """Read the `providers` table from a TOML, JSON or YAML catalog file"""
+    suffix = path.suffix.lower()
+    if suffix == '.toml':
+        if tomllib is None:
+            raise RuntimeError("Reading TOML catalogs needs Python 3.11+ or: pip install tomli")
+        with open(path, 'rb') as f:
+            data = tomllib.load(f)
+    elif suffix in ('.yaml', '.yml'):
+        if yaml is None:
+            raise RuntimeError("Reading YAML catalogs needs PyYAML. Install with: pip install pyyaml")
+        with open(path, encoding='utf-8') as f:
+            data = yaml.safe_load(f) or {}
+    else:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    return data.get('providers', data)
+
+
+def load_env(environ=None) -> Dict[str, Dict]:
+    """Collect PROVIDER_<NAME>_<FIELD> variables into catalog entries"""
+    environ = os.environ if environ is None else environ
+    entries: Dict[str, Dict] = {}
+    for variable, value in environ.items():
+        if not variable.startswith('PROVIDER_') or not value:
+            continue
+        rest = variable[len('PROVIDER_'):]
+        for field, cast in FIELDS.items():
+            suffix = '_' + field.upper()
+            if rest.endswith(suffix) and len(rest) > len(suffix):
+                name = rest[:-len(suffix)].lower()
+                try:
+                    entries.setdefault(name, {})[field] = cast(value)
+                except ValueError:
+                    print(f"Warning: ignoring {variable}={value!r} (expected {cast.__name__})", file=sys.stderr)
+                break
+    return entries
+
+
+def load_catalog(path: Optional[Path] = None, environ=None) -> List[ProviderSpec]:
+    """
+    Build provider specs from the built-in catalog, a catalog file and the environment
+
+    Later sources override earlier ones field by field; an entry with
+    `enabled = false` removes a provider.
+
+    Args:
+        path: Catalog file (defaults to PROVIDER_CATALOG, skipped if missing)
+        environ: Environment mapping (defaults to os.environ)
+
+    Returns:
+        Provider specs in catalog order
+    """
+    entries = {name: dict(fields) for name, fields in BUILTIN_CATALOG.items()}
+
+    path = Path(path or Config.PROVIDER_CATALOG)
+    if path.is_file():
+        for name, fields in load_file(path).items():
+            entries.setdefault(name, {}).update(fields)
+
+    for name, fields in load_env(environ).items():
+        entries.setdefault(name, {}).update(fields)
+
+    specs = []
+    for name, fields in entries.items():
+        if not fields.pop('enabled', True):
+            continue
+        fields = {k: v for k, v in fields.items() if k in FIELDS}
+        specs.append(ProviderSpec(name, **fields))
+
+    # Keep the offline providers last, the stub after the local model
+    specs.sort(key=lambda s: {'local': 1, 'duckduckgo': 2}.get(s.kind, 0))
+    return specs
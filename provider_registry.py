@@ -0,0 +1,142 @@
+"""
+Shared provider registry
+
+One place that builds the text providers described by the provider catalog
+(see provider_catalog.py). Both UnifiedAIChatbot and src.ai_manager.AIManager
+use it. OpenAI-compatible clients are cached per (base_url, api_key) so every
+provider, image generator and manager talking to the same endpoint shares one
+connection pool, and providers are only constructed on first use.
+"""
+import threading
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from openai import OpenAI
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from config import Config
+from provider_catalog import ProviderSpec, load_catalog
+import tracing
+
+OPENAI_DEFAULT_BASE_URL = 'https://api.openai.com/v1'
+
+_clients: Dict[Tuple[str, str], OpenAI] = {}
+_clients_lock = threading.Lock()
+
+
+def _http_client(pool_size: int = 0):
+    """A custom HTTP client when pool limits or tracing hooks are needed, else None"""
+    options = {}
+    if pool_size and httpx is not None:
+        options['limits'] = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    hooks = tracing.http_event_hooks()
+    if hooks:
+        options['event_hooks'] = hooks
+    if not options:
+        return None
+    from openai import DefaultHttpxClient
+    return DefaultHttpxClient(**options)
+
+
+def get_openai_client(api_key: str, base_url: Optional[str] = None, pool_size: int = 0) -> OpenAI:
+    """
+    Get the shared OpenAI-compatible client for an endpoint and key
+
+    Args:
+        api_key: API key for the endpoint
+        base_url: Endpoint URL (defaults to OPENAI_BASE_URL or api.openai.com)
+        pool_size: Maximum pooled connections (0 keeps the SDK default);
+            only applies when the client is first created
+
+    Returns:
+        A cached OpenAI client
+    """
+    base_url = base_url or Config.OPENAI_BASE_URL or OPENAI_DEFAULT_BASE_URL
+    key = (base_url, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            options = {'base_url': base_url, 'api_key': api_key}
+            http_client = _http_client(pool_size)
+            if http_client is not None:
+                options['http_client'] = http_client
+            client = OpenAI(**options)
+            _clients[key] = client
+        return client
+
+
+def clear_client_cache():
+    """Drop all cached clients (used by tests and after key rotation)"""
+    with _clients_lock:
+        _clients.clear()
+
+
+def client_count() -> int:
+    """Number of distinct cached clients"""
+    with _clients_lock:
+        return len(_clients)
+
+
+class ProviderRegistry(Mapping):
+    """
+    Lazily constructed text providers, keyed by name
+
+    Behaves like a read-only dict of the available providers: membership and
+    iteration never construct anything, indexing builds the provider once.
+    """
+
+    def __init__(self, specs: Optional[List[ProviderSpec]] = None):
+        self.specs: Dict[str, ProviderSpec] = {s.name: s for s in (specs or load_catalog())}
+        self._instances: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def spec(self, name: str) -> ProviderSpec:
+        if name not in self.specs:
+            raise KeyError(name)
+        return self.specs[name]
+
+    def available(self) -> List[str]:
+        """Names of providers whose credentials are configured"""
+        return [name for name, spec in self.specs.items() if spec.available]
+
+    def get(self, name: str, default=None):
+        """Get a provider, constructing it on first use"""
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def __getitem__(self, name: str):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        spec = self.specs.get(name)
+        if spec is None or not spec.available:
+            raise KeyError(name)
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                with tracing.span('registry.construct', provider=name):
+                    instance = spec.factory(spec)
+                self._instances[name] = instance
+        return instance
+
+    def __contains__(self, name) -> bool:
+        spec = self.specs.get(name)
+        return spec is not None and spec.available
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.available())
+
+    def __len__(self) -> int:
+        return len(self.available())
+
+
+default_registry = ProviderRegistry()
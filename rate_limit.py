@@ -0,0 +1,170 @@
+"""
+Per-provider client-side rate limiting
+
+Each provider's catalog entry sets `requests_per_minute` (a token bucket) and
+`max_concurrency` (in-flight calls). Limiters are shared process-wide so
+every chatbot instance talking to a provider draws from the same budget, and
+with `SHARED_STATE_URL` set the bucket and slots live in the shared store so
+all worker processes draw from it too.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from config import Config
+from shared_state import get_state
+
+_limiters: Dict[str, 'ProviderLimiter'] = {}
+_limiters_lock = threading.Lock()
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call could not be admitted within the wait budget"""
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class SharedTokenBucket:
+    """Token bucket kept in the shared store, drawn from by every worker process"""
+
+    def __init__(self, state, name: str, rate: float, capacity: float):
+        self.state = state
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+
+    def acquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            wait = self.state.take_token(self.name, self.rate, self.capacity)
+            if wait <= 0:
+                return True
+            if time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class LocalSlots:
+    """Concurrency cap within this process"""
+
+    def __init__(self, limit: int):
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    def acquire(self, timeout: float) -> bool:
+        return self._semaphore.acquire(timeout=timeout)
+
+    def release(self, lease):
+        self._semaphore.release()
+
+
+class SharedSlots:
+    """
+    Concurrency cap across worker processes
+
+    Slots are leases that expire after `lease` seconds, so a worker that dies
+    mid-request cannot hold them forever. Waiters poll for a free slot.
+    """
+
+    poll_interval = 0.05
+
+    def __init__(self, state, name: str, limit: int, lease: float):
+        self.state = state
+        self.name = name
+        self.limit = limit
+        self.lease = lease
+
+    def acquire(self, timeout: float) -> Optional[str]:
+        """Returns the lease to pass to release(), or None on timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            holder = self.state.acquire_lease(self.name, self.limit, self.lease)
+            if holder is not None:
+                return holder
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+
+    def release(self, lease: str):
+        self.state.release_lease(self.name, lease)
+
+
+class ProviderLimiter:
+    """Concurrency cap plus requests-per-minute budget for one provider"""
+
+    def __init__(self, requests_per_minute: int = 0, max_concurrency: int = 0, name: str = '', state=None):
+        """
+        Args:
+            requests_per_minute: Token bucket rate (0 = unlimited)
+            max_concurrency: Calls in flight at once (0 = unlimited)
+            name: Provider name, used as the key in the shared store
+            state: Shared store (see shared_state.py); None keeps the limits in this process
+        """
+        self.bucket = None
+        if requests_per_minute:
+            # Allow bursts of up to ten seconds' worth of requests
+            rate, capacity = requests_per_minute / 60.0, max(1.0, requests_per_minute / 6.0)
+            self.bucket = (SharedTokenBucket(state, f"rpm:{name}", rate, capacity) if state is not None
+                           else TokenBucket(rate, capacity))
+        self.slots = None
+        if max_concurrency:
+            self.slots = (SharedSlots(state, f"concurrency:{name}", max_concurrency, Config.SHARED_LEASE_SECONDS)
+                          if state is not None else LocalSlots(max_concurrency))
+
+    @contextmanager
+    def admit(self, timeout: Optional[float] = None):
+        """Wait for a slot and a token, or raise RateLimitExceeded"""
+        timeout = Config.RATE_LIMIT_WAIT if timeout is None else timeout
+        start = time.monotonic()
+        lease = None
+        if self.slots is not None:
+            lease = self.slots.acquire(timeout)
+            if not lease:
+                raise RateLimitExceeded("too many concurrent requests")
+        try:
+            remaining = max(0.0, timeout - (time.monotonic() - start))
+            if self.bucket is not None and not self.bucket.acquire(remaining):
+                raise RateLimitExceeded("requests per minute exceeded")
+            yield
+        finally:
+            if self.slots is not None:
+                self.slots.release(lease)
+
+    def stream(self, source_fn, timeout: Optional[float] = None) -> Iterator[str]:
+        """Hold an admission slot for the whole lifetime of a stream"""
+        with self.admit(timeout):
+            yield from source_fn()
+
+
+def limiter_for(spec) -> ProviderLimiter:
+    """The shared limiter for a catalog entry"""
+    with _limiters_lock:
+        limiter = _limiters.get(spec.name)
+        if limiter is None:
+            limiter = ProviderLimiter(spec.requests_per_minute, spec.max_concurrency, spec.name, get_state())
+            _limiters[spec.name] = limiter
+        return limiter
@@ -0,0 +1,83 @@
+"""
+Per-request generation options
+
+`/api/chat`, the WebSocket chat frame, main.py and the CLI let a request pick
+the model, temperature and max_tokens. parse_options() checks their types and
+ranges without any network access; UnifiedAIChatbot.check_options() then
+checks the model against the provider's cached model list (see
+AIProvider.allowed_models), so a misspelt model fails here instead of costing
+an upstream round trip.
+"""
+from typing import Dict, Mapping, Optional
+
+OPTION_NAMES = ('model', 'temperature', 'max_tokens')
+MAX_TEMPERATURE = 2.0
+
+
+class InvalidOptions(ValueError):
+    """A generation option has the wrong type or is out of range"""
+
+
+def parse_options(values: Optional[Mapping]) -> Dict:
+    """
+    Validate the generation options present in `values`
+
+    Args:
+        values: Request data; keys other than OPTION_NAMES are ignored, and
+            missing, None or empty values leave the provider default
+
+    Returns:
+        The options to pass to the provider, e.g. {'model': 'gpt-4o-mini', 'temperature': 0.2}
+
+    Raises:
+        InvalidOptions: If an option has the wrong type or is out of range
+    """
+    options = {}
+    for name in OPTION_NAMES:
+        value = (values or {}).get(name)
+        if value is None or value == '':
+            continue
+        if name == 'model':
+            if not isinstance(value, str) or not value.strip():
+                raise InvalidOptions('model must be a model name')
+            options[name] = value.strip()
+        elif name == 'temperature':
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                raise InvalidOptions('temperature must be a number') from None
+            if not 0.0 <= value <= MAX_TEMPERATURE:
+                raise InvalidOptions(f"temperature must be between 0 and {MAX_TEMPERATURE:g}")
+            options[name] = value
+        else:
+            # bool is an int subclass, and 12.5 tokens is a typo rather than 12
+            if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+                raise InvalidOptions('max_tokens must be a whole number')
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise InvalidOptions('max_tokens must be a whole number') from None
+            if value < 1:
+                raise InvalidOptions('max_tokens must be at least 1')
+            options[name] = value
+    return options
+
+
+def parse_assignments(text: str) -> Dict:
+    """
+    Parse "model=gpt-4o-mini temperature=0.2" (as typed after the CLI's /set)
+
+    Returns:
+        The raw values by name; an empty value ("model=") means reset to the default
+
+    Raises:
+        InvalidOptions: For words without '=' or unknown option names
+    """
+    values = {}
+    for word in text.split():
+        name, sep, value = word.partition('=')
+        name = name.replace('-', '_')
+        if not sep or name not in OPTION_NAMES:
+            raise InvalidOptions(f"Expected name=value with name one of {', '.join(OPTION_NAMES)}")
+        values[name] = value
+    return values
@@ -0,0 +1,246 @@
+"""
+Request scheduling with priority classes and per-tenant fairness
+
+Requests run in a fixed number of slots. When all slots are busy, requests
+wait in one queue per priority class:
+
+- interactive: a person is waiting (chat turns); always served first
+- batch: bulk text work (scripts, evaluations); soaks up spare capacity
+- background: media generation
+
+A few slots are reserved for interactive traffic, so a burst of long batch
+or media requests can never occupy everything and make the next chat turn
+wait behind it. Within a class, tenants (users or API keys) share slots by
+weighted fair queuing: a tenant that submits a thousand requests does not
+delay another tenant's first one by a thousand places.
+
+Admission control keeps queues short. A full queue, or an expected wait that
+would blow the request's deadline, is rejected immediately with an estimate
+of when to retry. Requests whose deadline passes while queued are dropped
+rather than run for a client that has given up.
+"""
+import math
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from shared_state import Counters
+import tracing
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+BACKGROUND = 'background'
+PRIORITIES = (INTERACTIVE, BATCH, BACKGROUND)
+
+
+class Overloaded(Exception):
+    """The request was not admitted; retry after `retry_after` seconds"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before it could start"""
+
+
+class _Waiter:
+    def __init__(self, priority: str, tenant: str, deadline: Optional[float], tag: float):
+        self.priority = priority
+        self.tenant = tenant
+        self.deadline = deadline
+        self.tag = tag
+        self.enqueued = time.monotonic()
+        self.event = threading.Event()
+        self.granted = False
+        self.dropped = False
+
+
+class Ticket:
+    """A held slot; release it when the request is finished"""
+
+    def __init__(self, scheduler: 'RequestScheduler', priority: str, waited: float):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.waited = waited
+        self.started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.scheduler._release(self)
+
+
+class RequestScheduler:
+    """Slot-based scheduler with strict class priority and weighted fair queuing per tenant"""
+
+    def __init__(self, slots: int = 16, interactive_reserve: int = 4, queue_depth: int = 64,
+                 tenant_weights: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            slots: Requests allowed to run at once
+            interactive_reserve: Slots batch and background work may not use
+            queue_depth: Waiting requests allowed per priority class before rejecting
+            tenant_weights: Relative share per tenant (default 1)
+        """
+        self.slots = max(1, slots)
+        self.interactive_reserve = min(max(0, interactive_reserve), self.slots - 1)
+        self.queue_depth = queue_depth
+        self.tenant_weights = tenant_weights or {}
+        self._lock = threading.Lock()
+        self._queues: Dict[str, List[_Waiter]] = {p: [] for p in PRIORITIES}
+        self._virtual: Dict[str, float] = {p: 0.0 for p in PRIORITIES}
+        self._last_tag: Dict[tuple, float] = {}
+        self._running: Counter = Counter()
+        # Recent service time per class, for Retry-After and deadline estimates
+        self._service: Dict[str, float] = {p: 1.0 for p in PRIORITIES}
+        # Admission counters, summed across workers when shared state is configured
+        self._counters = Counters('scheduler')
+
+    def acquire(self, priority: str = INTERACTIVE, tenant: str = '', deadline: Optional[float] = None) -> Ticket:
+        """
+        Wait for a slot
+
+        Args:
+            priority: 'interactive', 'batch' or 'background'
+            tenant: User or API key the request is accounted to
+            deadline: time.monotonic() after which the result is no longer wanted
+
+        Raises:
+            Overloaded: The queue is full or the wait would exceed the deadline
+            DeadlineExceeded: The deadline passed while waiting
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority {priority!r}")
+        with self._lock:
+            if self._can_start(priority) and not self._waiting_ahead(priority):
+                self._running[priority] += 1
+                self._counters.add(f"{priority}.admitted")
+                return Ticket(self, priority, 0.0)
+            queue = self._queues[priority]
+            if len(queue) >= self.queue_depth:
+                self._counters.add(f"{priority}.rejected")
+                raise Overloaded(f"{priority} queue is full", self._estimate_wait(priority))
+            expected = self._estimate_wait(priority)
+            if deadline is not None and time.monotonic() + expected > deadline:
+                self._counters.add(f"{priority}.rejected")
+                raise Overloaded(f"expected wait of {expected:.1f}s exceeds the deadline", expected)
+            waiter = _Waiter(priority, tenant, deadline, self._tag(priority, tenant))
+            queue.append(waiter)
+            self._counters.add(f"{priority}.enqueued")
+
+        with tracing.span('scheduler.wait', priority=priority):
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            waiter.event.wait(timeout)
+            with self._lock:
+                if not waiter.granted:
+                    if not waiter.dropped:
+                        waiter.dropped = True
+                        self._queues[priority].remove(waiter)
+                    self._counters.add(f"{priority}.dropped")
+                    raise DeadlineExceeded(f"deadline passed after {time.monotonic() - waiter.enqueued:.1f}s in queue")
+                self._counters.add(f"{priority}.admitted")
+            waited = time.monotonic() - waiter.enqueued
+            tracing.set_attribute('waited_ms', round(waited * 1000, 1))
+            return Ticket(self, priority, waited)
+
+    @contextmanager
+    def slot(self, priority: str = INTERACTIVE, tenant: str = '',
+             deadline: Optional[float] = None) -> Iterator[Ticket]:
+        """Hold a slot for the duration of a with block"""
+        ticket = self.acquire(priority, tenant, deadline)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def stats(self) -> Dict:
+        """Running and queued requests in this worker plus counters per class (across workers if shared)"""
+        counts = {p: {} for p in PRIORITIES}
+        for name, value in self._counters.snapshot().items():
+            priority, _, event = name.partition('.')
+            counts[priority][event] = int(value)
+        with self._lock:
+            return {
+                'slots': self.slots,
+                'interactive_reserve': self.interactive_reserve,
+                **{p: {'running': self._running[p], 'queued': len(self._queues[p]),
+                       'service_ms': round(self._service[p] * 1000, 1), **counts[p]}
+                   for p in PRIORITIES},
+            }
+
+    def _can_start(self, priority: str) -> bool:
+        busy = sum(self._running.values())
+        if busy >= self.slots:
+            return False
+        if priority == INTERACTIVE:
+            return True
+        return busy - self._running[INTERACTIVE] < self.slots - self.interactive_reserve
+
+    def _waiting_ahead(self, priority: str) -> bool:
+        """Whether queued requests of this or a higher class should go first"""
+        return any(self._queues[p] for p in PRIORITIES[:PRIORITIES.index(priority) + 1])
+
+    def _tag(self, priority: str, tenant: str) -> float:
+        """Virtual finish time: tenants with a backlog fall behind those without one"""
+        weight = self.tenant_weights.get(tenant, 1.0)
+        if len(self._last_tag) > 10000:
+            # Tags at or behind the virtual clock no longer affect ordering
+            self._last_tag = {k: t for k, t in self._last_tag.items() if t > self._virtual[k[0]]}
+        start = max(self._virtual[priority], self._last_tag.get((priority, tenant), 0.0))
+        tag = start + 1.0 / weight
+        self._last_tag[(priority, tenant)] = tag
+        return tag
+
+    def _estimate_wait(self, priority: str) -> float:
+        """Rough seconds until a new request of this class would start"""
+        ahead = sum(len(self._queues[p]) for p in PRIORITIES[:PRIORITIES.index(priority) + 1]) + 1
+        usable = self.slots if priority == INTERACTIVE else self.slots - self.interactive_reserve
+        return ahead * self._service[priority] / max(1, usable)
+
+    def _release(self, ticket: Ticket):
+        with self._lock:
+            self._running[ticket.priority] -= 1
+            elapsed = time.monotonic() - ticket.started
+            self._service[ticket.priority] = 0.8 * self._service[ticket.priority] + 0.2 * elapsed
+            self._dispatch()
+
+    def _dispatch(self):
+        """Start waiting requests while slots are free (called with the lock held)"""
+        now = time.monotonic()
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue and self._can_start(priority):
+                waiter = min(queue, key=lambda w: w.tag)
+                queue.remove(waiter)
+                if waiter.deadline is not None and waiter.deadline <= now:
+                    # Nobody is waiting for this result any more
+                    waiter.dropped = True
+                    waiter.event.set()
+                    continue
+                self._virtual[priority] = waiter.tag
+                self._running[priority] += 1
+                waiter.granted = True
+                waiter.event.set()
+            if queue:
+                # Lower classes never overtake a higher class that is still waiting
+                return
+
+
+def retry_after_header(seconds: float) -> str:
+    """Retry-After value in whole seconds (at least 1)"""
+    return str(max(1, math.ceil(seconds)))
+
+
+def parse_pairs(value: str) -> Dict[str, float]:
+    """Parse 'name=number,other=number' settings (tenant weights, deadlines)"""
+    pairs = {}
+    for item in value.split(','):
+        name, _, number = item.partition('=')
+        if name.strip() and number.strip():
+            pairs[name.strip()] = float(number)
+    return pairs
@@ -0,0 +1,79 @@
+"""
+Web chat sessions
+
+Each browser (by cookie) or API client (by `X-Session-Id` header) has its
+own conversation and provider choice. With `SHARED_STATE_URL` set, sessions
+live in the shared store, so any web replica can serve any request and no
+sticky routing is needed. Without it they are kept in this process.
+
+Sessions are loaded at the start of a request and saved at the end. Two
+requests for one session racing on different replicas keep the later save.
+"""
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from shared_state import get_state
+
+_SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{8,128}$')
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def valid_session_id(session_id: Optional[str]) -> bool:
+    return bool(session_id) and bool(_SESSION_ID.match(session_id))
+
+
+class SessionStore:
+    """Session data ({'history': [...], 'provider': ...}) by session id"""
+
+    def __init__(self, ttl: float = 7 * 24 * 3600, max_messages: int = 200, max_local: int = 10000):
+        """
+        Args:
+            ttl: Seconds an idle session is kept
+            max_messages: Most recent messages kept per conversation
+            max_local: Sessions kept in memory when there is no shared store
+        """
+        self.ttl = ttl
+        self.max_messages = max_messages
+        self.max_local = max_local
+        self._local: 'OrderedDict[str, Tuple[float, Dict]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, session_id: str) -> Dict:
+        """The session's data, or an empty session"""
+        state = get_state()
+        if state is not None:
+            return state.get(f"session:{session_id}") or {}
+        with self._lock:
+            entry = self._local.get(session_id)
+            if entry is None or entry[0] < time.monotonic():
+                return {}
+            self._local.move_to_end(session_id)
+            return entry[1]
+
+    def save(self, session_id: str, history, provider: Optional[str]):
+        """Store a session's conversation and provider choice"""
+        data = {'history': list(history)[-self.max_messages:], 'provider': provider}
+        state = get_state()
+        if state is not None:
+            state.set(f"session:{session_id}", data, ttl=self.ttl)
+            return
+        with self._lock:
+            self._local[session_id] = (time.monotonic() + self.ttl, data)
+            self._local.move_to_end(session_id)
+            while len(self._local) > self.max_local:
+                self._local.popitem(last=False)
+
+    def delete(self, session_id: str):
+        state = get_state()
+        if state is not None:
+            state.delete(f"session:{session_id}")
+            return
+        with self._lock:
+            self._local.pop(session_id, None)
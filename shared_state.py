@@ -0,0 +1,286 @@
+"""
+State shared between web worker processes
+
+With several workers (gunicorn, multiple `web_app.py` processes) each process
+otherwise keeps its own rate-limit buckets, counters and job index, so limits
+are multiplied by the worker count and a job started on one worker is
+unknown to the others. Setting `SHARED_STATE_URL` moves that state into one
+store so the workers behave as one server:
+
+- `sqlite:///path/to/state.sqlite3`: a memory-mapped SQLite file in WAL mode,
+  for workers on the same host
+- `redis://host:6379/0`: Redis (needs the `redis` package), for workers on
+  several hosts
+
+Without it everything stays in-process, as before.
+
+The store offers a small set of atomic operations: token-bucket takes,
+leased concurrency slots (released automatically if a worker dies),
+counters, and a key-value cache with expiry.
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+from config import Config
+
+
+class SQLiteState:
+    """Shared state in a SQLite file; safe for concurrent processes on one host"""
+
+    def __init__(self, path: str, mmap_mb: int = 64):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # One connection per process; SQLite's file locks serialize writers across processes
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(f'PRAGMA mmap_size={mmap_mb * 1024 * 1024}')
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL);
+            CREATE TABLE IF NOT EXISTS leases (name TEXT, holder TEXT PRIMARY KEY, expires REAL);
+            CREATE INDEX IF NOT EXISTS leases_name ON leases (name);
+            CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value REAL);
+            CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT, expires REAL);
+        """)
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                result = fn(self._db)
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+            return result
+
+    def take_token(self, name: str, rate: float, capacity: float) -> float:
+        """Take one token from a bucket; returns 0 on success, otherwise seconds until one is available"""
+        def take(db):
+            now = time.time()
+            row = db.execute('SELECT tokens, updated FROM buckets WHERE name = ?', (name,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            db.execute('INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)', (name, tokens, now))
+            return wait
+        return self._transaction(take)
+
+    def acquire_lease(self, name: str, limit: int, ttl: float) -> Optional[str]:
+        """Take one of `limit` slots for up to `ttl` seconds; returns a holder id or None if all are taken"""
+        def acquire(db):
+            now = time.time()
+            db.execute('DELETE FROM leases WHERE name = ? AND expires < ?', (name, now))
+            held = db.execute('SELECT COUNT(*) FROM leases WHERE name = ?', (name,)).fetchone()[0]
+            if held >= limit:
+                return None
+            holder = uuid.uuid4().hex
+            db.execute('INSERT INTO leases VALUES (?, ?, ?)', (name, holder, now + ttl))
+            return holder
+        return self._transaction(acquire)
+
+    def release_lease(self, name: str, holder: str):
+        with self._lock:
+            self._db.execute('DELETE FROM leases WHERE holder = ?', (holder,))
+
+    def add_counters(self, values: Dict[str, float]):
+        """Add to several counters at once"""
+        def add(db):
+            db.executemany('INSERT INTO counters VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?',
+                           [(name, amount, amount) for name, amount in values.items()])
+        self._transaction(add)
+
+    def counters(self, prefix: str) -> Dict[str, float]:
+        """Counters whose names start with `prefix`, keyed without it"""
+        with self._lock:
+            rows = self._db.execute('SELECT name, value FROM counters WHERE substr(name, 1, ?) = ?',
+                                    (len(prefix), prefix)).fetchall()
+        return {name[len(prefix):]: value for name, value in rows}
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            row = self._db.execute('SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                                   (key, time.time())).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO kv VALUES (?, ?, ?)',
+                             (key, json.dumps(value), time.time() + ttl if ttl else None))
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                # Sweep expired entries now and then so the file does not grow without bound
+                self._db.execute('DELETE FROM kv WHERE expires < ?', (time.time(),))
+
+    def delete(self, key: str):
+        with self._lock:
+            self._db.execute('DELETE FROM kv WHERE key = ?', (key,))
+
+
+class RedisState:
+    """Shared state in Redis, for workers on several hosts"""
+
+    _TAKE = """
+        local rate, capacity, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = capacity
+        if state[1] then tokens = math.min(capacity, tonumber(state[1]) + (now - tonumber(state[2])) * rate) end
+        local wait = 0
+        if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+        return tostring(wait)
+    """
+    _LEASE = """
+        local now, limit, ttl = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+        if redis.call('ZCARD', KEYS[1]) >= limit then return 0 end
+        redis.call('ZADD', KEYS[1], now + ttl, ARGV[4])
+        redis.call('EXPIRE', KEYS[1], math.ceil(ttl) + 60)
+        return 1
+    """
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("SHARED_STATE_URL uses redis://, but the redis package is not installed")
+        self._redis = redis.Redis.from_url(url)
+        self._take = self._redis.register_script(self._TAKE)
+        self._lease = self._redis.register_script(self._LEASE)
+
+    def take_token(self, name: str, rate: float, capacity: float) -> float:
+        return float(self._take(keys=[f"bucket:{name}"], args=[rate, capacity, time.time()]))
+
+    def acquire_lease(self, name: str, limit: int, ttl: float) -> Optional[str]:
+        holder = uuid.uuid4().hex
+        granted = self._lease(keys=[f"lease:{name}"], args=[time.time(), limit, ttl, holder])
+        return holder if granted else None
+
+    def release_lease(self, name: str, holder: str):
+        self._redis.zrem(f"lease:{name}", holder)
+
+    def add_counters(self, values: Dict[str, float]):
+        pipe = self._redis.pipeline()
+        for name, amount in values.items():
+            pipe.hincrbyfloat('counters', name, amount)
+        pipe.execute()
+
+    def counters(self, prefix: str) -> Dict[str, float]:
+        return {name.decode()[len(prefix):]: float(value)
+                for name, value in self._redis.hgetall('counters').items() if name.decode().startswith(prefix)}
+
+    def get(self, key: str) -> Any:
+        value = self._redis.get(f"kv:{key}")
+        return None if value is None else json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        self._redis.set(f"kv:{key}", json.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, key: str):
+        self._redis.delete(f"kv:{key}")
+
+
+_state = None
+_state_pid = None
+_state_lock = threading.Lock()
+
+
+def get_state():
+    """The configured shared store, or None when state is per-process"""
+    global _state, _state_pid
+    url = Config.SHARED_STATE_URL
+    if not url:
+        return None
+    with _state_lock:
+        # Connections are not inherited across fork: each worker opens its own
+        if _state is None or _state_pid != os.getpid():
+            if url.startswith('sqlite:///'):
+                _state = SQLiteState(url[len('sqlite:///'):])
+            elif url.startswith(('redis://', 'rediss://', 'unix://')):
+                _state = RedisState(url)
+            else:
+                raise ValueError(f"Unsupported SHARED_STATE_URL {url!r}")
+            _state_pid = os.getpid()
+        return _state
+
+
+def reset_state():
+    """Forget the open store (used by tests and after changing SHARED_STATE_URL)"""
+    global _state
+    with _state_lock:
+        _state = None
+
+
+_all_counters = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all_counters():
+    for counters in list(_all_counters):
+        counters.flush()
+
+
+class Counters:
+    """
+    Named counters, summed across workers when shared state is configured
+
+    Increments are buffered locally and written in one batch at most every
+    `flush_interval` seconds, so counting stays off the request's critical
+    path. Reads include this worker's unwritten increments.
+    """
+
+    def __init__(self, namespace: str, flush_interval: float = 1.0):
+        self.prefix = f"{namespace}."
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending: Dict[str, float] = {}
+        self._flushed = time.monotonic()
+        _all_counters.add(self)
+
+    def add(self, name: str, amount: float = 1):
+        self.update({name: amount})
+
+    def update(self, values: Dict[str, float]):
+        """Add to several counters"""
+        with self._lock:
+            for name, amount in values.items():
+                self._pending[name] = self._pending.get(name, 0) + amount
+            due = get_state() is not None and time.monotonic() - self._flushed >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write buffered increments to the shared store"""
+        state = get_state()
+        if state is None:
+            return
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushed = time.monotonic()
+        if pending:
+            state.add_counters({self.prefix + name: amount for name, amount in pending.items()})
+
+    def snapshot(self) -> Dict[str, float]:
+        """Current totals"""
+        state = get_state()
+        if state is None:
+            with self._lock:
+                return dict(self._pending)
+        self.flush()
+        return state.counters(self.prefix)
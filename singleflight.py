@@ -0,0 +1,250 @@
+"""
+Single-flight request coalescing
+
+Concurrent callers asking for the same thing (same provider, model, params and
+prompt) share one upstream call instead of each paying for their own.
+"""
+import contextvars
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+
+def request_key(provider: str, method: str, payload: Any, **params) -> str:
+    """Build a stable key identifying an upstream request"""
+    blob = json.dumps([provider, method, payload, params], sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+class _Call:
+    """An in-flight blocking call shared by every waiter"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 1
+
+
+class _StreamCall:
+    """An in-flight streaming call whose chunks are fanned out to every waiter"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.chunks: List[str] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.waiters = 1
+        self.abandoned = False
+        self.on_abandon: Optional[Callable[[], None]] = None
+
+    def join(self) -> bool:
+        """Add a subscriber; False if the call was already abandoned"""
+        with self.cond:
+            if self.abandoned:
+                return False
+            self.waiters += 1
+            return True
+
+    def pump(self, source: Iterable[str]):
+        """Drain the upstream iterator into the shared chunk buffer"""
+        try:
+            for chunk in source:
+                with self.cond:
+                    if self.abandoned:
+                        # Every subscriber left (e.g. the user pressed stop): stop paying for tokens
+                        break
+                    self.chunks.append(chunk)
+                    self.cond.notify_all()
+        except BaseException as e:
+            self.error = e
+        finally:
+            if self.abandoned and hasattr(source, 'close'):
+                source.close()
+            with self.cond:
+                self.finished = True
+                self.cond.notify_all()
+
+    def wake(self):
+        with self.cond:
+            self.cond.notify_all()
+
+    def subscribe(self, cancel=None) -> '_Subscription':
+        """An iterator over the stream for a subscriber already counted in `waiters`"""
+        return _Subscription(self, cancel)
+
+    def follow(self, cancel=None) -> Iterator[str]:
+        """Replay buffered chunks, then follow the live stream until it ends or cancel fires"""
+        index = 0
+        unregister = cancel.on_cancel(self.wake) if cancel is not None else None
+        try:
+            while True:
+                with self.cond:
+                    while index >= len(self.chunks) and not self.finished and not (cancel and cancel.cancelled):
+                        self.cond.wait()
+                    pending = self.chunks[index:]
+                    finished = self.finished
+                if cancel is not None and cancel.cancelled:
+                    return
+                for chunk in pending:
+                    yield chunk
+                index += len(pending)
+                if finished and index >= len(self.chunks):
+                    break
+        finally:
+            if unregister is not None:
+                unregister()
+        if self.error is not None:
+            raise self.error
+
+    def leave(self):
+        """Remove a subscriber; the last one to leave an unfinished call abandons it"""
+        with self.cond:
+            self.waiters -= 1
+            abandon = self.waiters == 0 and not self.finished
+            if abandon:
+                self.abandoned = True
+        if abandon and self.on_abandon is not None:
+            # The last reader left: abort the upstream call instead of waiting for its next chunk
+            self.on_abandon()
+
+
+class _Subscription:
+    """
+    One subscriber's iterator over a shared stream
+
+    The subscriber was counted when it joined, so it must be released even if
+    it is closed or dropped before its first chunk; a generator would never
+    run its cleanup in that case and the call could not be abandoned.
+    """
+
+    def __init__(self, call: _StreamCall, cancel=None):
+        self._call = call
+        self._chunks = call.follow(cancel)
+        self._released = False
+
+    def __iter__(self) -> '_Subscription':
+        return self
+
+    def __next__(self) -> str:
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        with self._call.cond:
+            if self._released:
+                return
+            self._released = True
+        self._chunks.close()
+        self._call.leave()
+
+    def __del__(self):
+        self.close()
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into a single execution"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _StreamCall] = {}
+        self.stats = {'leaders': 0, 'coalesced': 0}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn once for all concurrent callers sharing the same key
+
+        Args:
+            key: Identity of the request (see request_key)
+            fn: Zero-argument callable performing the upstream call
+
+        Returns:
+            The result of fn, shared with every concurrent caller
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.stats['leaders'] += 1
+            else:
+                call.waiters += 1
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def stream(self, key: str, fn: Callable[[], Iterable[str]], cancel=None,
+               on_abandon: Optional[Callable[[], None]] = None) -> Iterator[str]:
+        """
+        Stream the output of fn to every concurrent caller sharing the same key
+
+        The upstream iterator is drained by a background thread so a slow or
+        abandoned subscriber never stalls the others. Callers that join late
+        first receive the chunks already produced.
+
+        Args:
+            key: Identity of the request (see request_key)
+            fn: Zero-argument callable returning an iterator of text chunks
+            cancel: CancelToken that ends this caller's subscription early
+            on_abandon: Called (for the leader's call) once every subscriber has left
+
+        Yields:
+            Text chunks of the shared response
+        """
+        with self._lock:
+            call = self._streams.get(key)
+            leader = call is None or not call.join()
+            if leader:
+                call = _StreamCall()
+                call.on_abandon = on_abandon
+                self._streams[key] = call
+                self.stats['leaders'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if leader:
+            def run():
+                try:
+                    call.pump(fn())
+                except BaseException as e:
+                    with call.cond:
+                        call.error = e
+                        call.finished = True
+                        call.cond.notify_all()
+                finally:
+                    with self._lock:
+                        if self._streams.get(key) is call:
+                            del self._streams[key]
+
+            # Carry the caller's context (e.g. the active trace span) into the pump thread
+            context = contextvars.copy_context()
+            threading.Thread(target=context.run, args=(run,), name=f"singleflight-{key[:8]}",
+                             daemon=True).start()
+
+        return call.subscribe(cancel)
+
+    def in_flight(self) -> int:
+        """Number of distinct upstream calls currently running"""
+        with self._lock:
+            return len(self._calls) + len(self._streams)
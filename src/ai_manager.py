@@ -1,24 +1,20 @@
-from openai import OpenAI
 import src.config as config
+from provider_registry import default_registry, get_openai_client
+
+# Models this manager uses instead of the catalog default
+DEFAULT_MODELS = {'openai': 'gpt-4o'}
 
 class AIManager:
     def __init__(self, provider_name):
+        # OpenAI-compatible providers from the registry UnifiedAIChatbot uses too
+        self.registry = default_registry
         self.providers = {
-            'openai': {
-                'base_url': 'https://api.openai.com/v1',
-                'api_key': config.OPENAI_API_KEY,
-                'default_model': 'gpt-4o'
-            },
-            'deepseek': {
-                'base_url': 'https://api.deepseek.com',
-                'api_key': config.DEEPSEEK_API_KEY,
-                'default_model': 'deepseek-chat'
-            },
-            'grok': {
-                'base_url': 'https://api.x.ai/v1',
-                'api_key': config.XAI_API_KEY,
-                'default_model': 'grok-beta'
+            spec.name: {
+                'base_url': spec.base_url,
+                'api_key': getattr(config, spec.api_key_setting, None),
+                'default_model': DEFAULT_MODELS.get(spec.name, spec.default_model)
             }
+            for spec in self.registry.specs.values() if spec.openai_compatible
         }
 
         if provider_name not in self.providers:
@@ -29,10 +25,7 @@ class AIManager:
         if not provider_config['api_key']:
             raise ValueError(f"API key for {provider_name} is not set. Please check your .env file.")
 
-        self.client = OpenAI(
-            base_url=provider_config['base_url'],
-            api_key=provider_config['api_key']
-        )
+        self.client = get_openai_client(provider_config['api_key'], provider_config['base_url'])
         self.model = provider_config['default_model']
 
     def chat(self, message):
@@ -1,8 +1,6 @@
-import os
-from dotenv import load_dotenv
+from config import Config
 
-load_dotenv()
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-XAI_API_KEY = os.getenv("XAI_API_KEY")
+# Kept for backwards compatibility; the root Config is the single source of settings
+OPENAI_API_KEY = Config.OPENAI_API_KEY
+DEEPSEEK_API_KEY = Config.DEEPSEEK_API_KEY
+XAI_API_KEY = Config.XAI_API_KEY
@@ -0,0 +1,23 @@
+"""
+Fake provider calls for tests of code that fans a prompt out to providers
+"""
+
+
+def provider_calls(answers, delays=None, called=None, cancelled=None):
+    """
+    A `call(provider, cancel)` returning answers[provider] after delays[provider] seconds
+
+    Providers are appended to `called` as they start; one whose token is
+    cancelled while it waits returns '' and records the reason in `cancelled`.
+    """
+    delays = delays or {}
+
+    def call(provider, cancel):
+        if called is not None:
+            called.append(provider)
+        if cancel.wait(delays.get(provider, 0)):
+            if cancelled is not None:
+                cancelled[provider] = cancel.reason
+            return ''
+        return answers[provider]
+    return call
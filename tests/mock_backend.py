@@ -0,0 +1,39 @@
+"""
+Shared setup for tests that talk to the mock OpenAI-compatible server
+"""
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from benchmarks.mock_server import MockServer, MockSettings
+from chatbot import UnifiedAIChatbot
+from config import Config
+from provider_registry import ProviderRegistry
+
+
+class MockBackendTestCase(unittest.TestCase):
+    """A TestCase whose chatbots only have the deepseek provider, pointed at a MockServer"""
+
+    def start_server(self, **settings) -> MockServer:
+        """Start a MockServer with the given MockSettings, stopped after the test"""
+        self.server = MockServer(settings=MockSettings(**settings)).start()
+        self.addCleanup(self.server.stop)
+        return self.server
+
+    def make_bot(self, **config) -> UnifiedAIChatbot:
+        """A chatbot built with Config patched for the mock server, plus any `config` overrides"""
+        output = tempfile.TemporaryDirectory()
+        self.addCleanup(output.cleanup)
+        settings = {
+            'OPENAI_API_KEY': '', 'GEMINI_API_KEY': '', 'XAI_API_KEY': '', 'REPLICATE_API_TOKEN': '',
+            'DEEPSEEK_API_KEY': 'test-key', 'DEEPSEEK_BASE_URL': f"{self.server.url}/v1",
+            'IMAGE_OUTPUT_DIR': Path(output.name) / 'images', 'VIDEO_OUTPUT_DIR': Path(output.name) / 'videos',
+            **config,
+        }
+        for name, value in settings.items():
+            p = patch.object(Config, name, value)
+            p.start()
+            self.addCleanup(p.stop)
+        # A registry of its own, since the default one was built before Config was patched
+        return UnifiedAIChatbot(ProviderRegistry())
@@ -1,11 +1,17 @@
 import unittest
 from unittest.mock import MagicMock, patch
+from chatbot import UnifiedAIChatbot
 from src.ai_manager import AIManager
+from provider_registry import clear_client_cache
 import src.config
 
 class TestAIManager(unittest.TestCase):
 
-    @patch('src.ai_manager.OpenAI')
+    def setUp(self):
+        # Clients are cached per (base_url, key) across managers
+        clear_client_cache()
+
+    @patch('provider_registry.OpenAI')
     @patch('src.config.OPENAI_API_KEY', 'test_openai_key')
     @patch('src.config.DEEPSEEK_API_KEY', 'test_deepseek_key')
     @patch('src.config.XAI_API_KEY', 'test_xai_key')
@@ -19,7 +25,7 @@ class TestAIManager(unittest.TestCase):
         )
         self.assertEqual(manager.model, 'gpt-4o')
 
-    @patch('src.ai_manager.OpenAI')
+    @patch('provider_registry.OpenAI')
     @patch('src.config.OPENAI_API_KEY', 'test_openai_key')
     @patch('src.config.DEEPSEEK_API_KEY', 'test_deepseek_key')
     @patch('src.config.XAI_API_KEY', 'test_xai_key')
@@ -31,7 +37,7 @@ class TestAIManager(unittest.TestCase):
         )
         self.assertEqual(manager.model, 'deepseek-chat')
 
-    @patch('src.ai_manager.OpenAI')
+    @patch('provider_registry.OpenAI')
     @patch('src.config.OPENAI_API_KEY', 'test_openai_key')
     @patch('src.config.DEEPSEEK_API_KEY', 'test_deepseek_key')
     @patch('src.config.XAI_API_KEY', 'test_xai_key')
@@ -43,17 +49,22 @@ class TestAIManager(unittest.TestCase):
         )
         self.assertEqual(manager.model, 'grok-beta')
 
+    @patch('provider_registry.OpenAI')
+    @patch('src.config.OPENAI_API_KEY', 'test_openai_key')
+    def test_shares_the_chatbot_registry(self, mock_openai):
+        self.assertIs(AIManager('openai').registry, UnifiedAIChatbot().providers)
+
     def test_init_invalid_provider(self):
         with self.assertRaises(ValueError):
             AIManager('invalid_provider')
 
-    @patch('src.ai_manager.OpenAI')
+    @patch('provider_registry.OpenAI')
     @patch('src.config.OPENAI_API_KEY', None)
     def test_init_missing_key(self, mock_openai):
         with self.assertRaises(ValueError):
             AIManager('openai')
 
-    @patch('src.ai_manager.OpenAI')
+    @patch('provider_registry.OpenAI')
     @patch('src.config.OPENAI_API_KEY', 'test_key')
     def test_chat(self, mock_openai):
         mock_client = MagicMock()
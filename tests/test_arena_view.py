@@ -0,0 +1,70 @@
+import io
+import time
+import unittest
+from unittest.mock import patch
+
+from rich.console import Console
+
+from arena_view import ArenaView
+from chatbot import UnifiedAIChatbot
+
+
+class TestArenaView(unittest.TestCase):
+
+    def test_lane_timings(self):
+        view = ArenaView('hi', ['fast', 'slow'], started=10.0)
+        for at in [10.2, 10.3, 10.4]:
+            view.feed('fast', 'word ' * 4, at)
+        view.feed('fast', None, 10.5)
+        view.feed('slow', 'Error: timed out', 12.0)
+        view.feed('slow', None, 12.0)
+
+        fast, slow = view.lanes['fast'], view.lanes['slow']
+        self.assertAlmostEqual(fast.ttft_ms, 200.0)
+        self.assertAlmostEqual(fast.tokens_per_second, 15 / 0.2)
+        self.assertAlmostEqual(fast.latency_ms(), 500.0)
+        self.assertEqual((fast.status, slow.status), ('done', 'error'))
+        self.assertIsNone(slow.tokens_per_second)
+        self.assertTrue(view.done)
+
+    def test_stopped_lanes_are_not_ranked(self):
+        view = ArenaView('hi', ['a', 'b'], started=0.0)
+        view.feed('a', None, 1.0)
+        view.stop()
+        view.feed('b', None, 1.1)
+        self.assertEqual((view.lanes['a'].status, view.lanes['b'].status), ('no reply', 'stopped'))
+        Console(file=io.StringIO()).print(*view.final(80))
+
+    def test_providers_are_paged_to_fit_the_terminal(self):
+        view = ArenaView('hi', [f"p{i}" for i in range(7)])
+        self.assertEqual([len(page) for page in view.pages(80)], [2, 2, 2, 1])
+        self.assertEqual([len(page) for page in view.pages(200)], [5, 2])
+
+        console = Console(width=80, height=30, record=True, file=io.StringIO())
+        view.feed('p0', 'line\n' * 100, time.perf_counter())
+        console.print(view.render(80, 30, now=0.0))
+        frame = console.export_text()
+        self.assertIn('Page 1/4', frame)
+        self.assertLessEqual(len(frame.splitlines()), 30)
+
+
+class TestArenaStream(unittest.TestCase):
+
+    def test_streams_are_interleaved_and_each_ends_with_none(self):
+        def stream_text(message, provider, cancel=None):
+            for i in range(3):
+                time.sleep(0.01 if provider == 'a' else 0.015)
+                yield f"{provider}{i} "
+
+        bot = UnifiedAIChatbot()
+        with patch.object(bot, 'stream_text', stream_text):
+            events = list(bot.arena_stream('hi', ['a', 'b']))
+
+        order = [provider for provider, chunk, _at in events if chunk is not None]
+        self.assertNotEqual(order, sorted(order))  # b's chunks arrive between a's
+        self.assertEqual([p for p, chunk, _at in events if chunk is None], ['a', 'b'])
+        self.assertEqual(''.join(c for p, c, _at in events if p == 'b' and c), 'b0 b1 b2 ')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import threading
+import time
+import unittest
+
+from cancellation import CancelToken, Cancelled
+from openai_provider import OpenAIProvider
+from tests.mock_backend import MockBackendTestCase
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestCancelToken(unittest.TestCase):
+
+    def test_callbacks_run_once(self):
+        token, calls = CancelToken(), []
+        token.on_cancel(lambda: calls.append('a'))
+        unregister = token.on_cancel(lambda: calls.append('b'))
+        unregister()
+
+        self.assertTrue(token.cancel('stop'))
+        self.assertFalse(token.cancel('again'))
+        self.assertEqual(calls, ['a'])
+        self.assertEqual(token.reason, 'stop')
+        with self.assertRaises(Cancelled):
+            token.raise_if_cancelled()
+
+        token.on_cancel(lambda: calls.append('late'))
+        self.assertEqual(calls, ['a', 'late'])
+
+
+class TestStreamCancellation(MockBackendTestCase):
+
+    def setUp(self):
+        # A long, slow reply so cancelling clearly cuts it short
+        self.start_server(latency_ms=10, jitter_ms=0, tokens=300, token_delay_ms=10)
+
+    def test_provider_stream_aborts_http_request(self):
+        provider = OpenAIProvider('test-key', base_url=f"{self.server.url}/v1", model='gpt-4')
+        token = CancelToken()
+        chunks = []
+        for chunk in provider.stream_chat([{'role': 'user', 'content': 'hi'}], cancel=token):
+            chunks.append(chunk)
+            if len(chunks) == 3:
+                # Cancel from another thread, as Ctrl+C handling or a web disconnect would
+                threading.Thread(target=token.cancel).start()
+
+        self.assertLess(len(chunks), 50)
+        self.assertFalse(any(c.startswith('Error') for c in chunks))
+        self.assertTrue(wait_for(lambda: self.server.counters['aborted_streams'] == 1))
+        self.assertLess(self.server.counters['streamed_tokens'], 100)
+
+    def make_bot(self):
+        return super().make_bot(COALESCE_REQUESTS=True)
+
+    def test_chatbot_records_partial_reply(self):
+        bot = self.make_bot()
+        token = CancelToken()
+        timer = threading.Timer(0.3, token.cancel, args=('test',))
+        timer.start()
+        start = time.perf_counter()
+        reply = bot.chat('hello', provider='deepseek', cancel=token)
+
+        self.assertLess(time.perf_counter() - start, 2.0)
+        self.assertTrue(reply)
+        self.assertEqual(bot.conversation_history[-1], {'role': 'assistant', 'content': reply})
+        self.assertTrue(wait_for(lambda: self.server.counters['aborted_streams'] == 1))
+        self.assertEqual(bot.inflight.in_flight(), 0)
+
+    def test_turn_cancelled_before_the_first_chunk_is_not_recorded(self):
+        bot = self.make_bot()
+        token = CancelToken()
+        token.cancel('test')
+
+        self.assertEqual(list(bot.stream_chat('hello', provider='deepseek', cancel=token)), [])
+        self.assertEqual(bot.conversation_history, [])
+
+    def test_arena_cancel_aborts_contestants(self):
+        bot = self.make_bot()
+        token = CancelToken()
+        threading.Timer(0.3, token.cancel, args=('test',)).start()
+        start = time.perf_counter()
+        results = bot.arena_chat('hello', ['deepseek'], cancel=token)
+
+        self.assertLess(time.perf_counter() - start, 2.0)
+        self.assertEqual(results, {'deepseek': 'Error: cancelled'})
+        self.assertTrue(wait_for(lambda: self.server.counters['aborted_streams'] == 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import time
+import unittest
+
+from cascade import CascadeRouter, escalation_reason
+from provider_catalog import ProviderSpec
+from tests.fake_providers import provider_calls
+
+SPECS = {
+    'cheap': ProviderSpec(name='cheap', kind='openai', input_price_per_1k=0.0005, output_price_per_1k=0.0015),
+    'strong': ProviderSpec(name='strong', kind='openai', input_price_per_1k=0.03, output_price_per_1k=0.06),
+}
+
+GOOD = 'Paris is the capital of France and has been the seat of its government for centuries.'
+
+
+class TestEscalationReason(unittest.TestCase):
+
+    def test_reasons(self):
+        self.assertEqual(escalation_reason('hi', 'Error in chat: timeout'), 'error')
+        self.assertEqual(escalation_reason('What is X?', "I'm not sure, but maybe Y."), 'uncertain')
+        self.assertEqual(escalation_reason('Explain how TCP works', 'It sends packets.'), 'too_short')
+        self.assertEqual(escalation_reason('Write a story', 'word ' * 200, max_tokens=200), 'truncated')
+        self.assertIsNone(escalation_reason('Capital of France?', 'Paris.'))
+
+
+class TestCascadeRouter(unittest.TestCase):
+
+    def router(self, **kwargs):
+        return CascadeRouter(SPECS.get, 'cheap', 'strong', **kwargs)
+
+    def test_cheap_answer_accepted(self):
+        called = []
+        router = self.router()
+        answer, served = router.run(provider_calls({'cheap': GOOD, 'strong': 'x'}, called=called),
+                                    'Capital of France?')
+
+        self.assertEqual((answer, served), (GOOD, 'cheap'))
+        self.assertEqual(called, ['cheap'])
+        stats = router.stats.to_dict()
+        self.assertEqual(stats['served_by_cheap'], 1)
+        self.assertGreater(stats['cost_saved_usd'], 0)
+
+    def test_escalates_on_failed_check(self):
+        router = self.router()
+        answer, served = router.run(provider_calls({'cheap': "I don't know.", 'strong': GOOD}),
+                                    'Capital of France?')
+
+        self.assertEqual((answer, served), (GOOD, 'strong'))
+        stats = router.stats.to_dict()
+        self.assertEqual(stats['escalations'], {'uncertain': 1})
+        # Paid for both calls, so nothing was saved
+        self.assertLess(stats['cost_saved_usd'], 0)
+
+    def test_race_hedges_slow_cheap_provider(self):
+        cancelled = {}
+        router = self.router(race=True, hedge_delay=0.05)
+        start = time.perf_counter()
+        answer, served = router.run(provider_calls({'cheap': GOOD, 'strong': GOOD},
+                                                   delays={'cheap': 1.0, 'strong': 0.1}, cancelled=cancelled),
+                                    'Capital?')
+
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(served, 'strong')
+        self.assertEqual(router.stats.to_dict()['escalations'], {'slow': 1})
+        deadline = time.perf_counter() + 1
+        while 'cheap' not in cancelled and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(cancelled, {'cheap': 'race lost'})
+
+    def test_race_prefers_fast_cheap_answer(self):
+        called = []
+        router = self.router(race=True, hedge_delay=0.5)
+        _, served = router.run(provider_calls({'cheap': GOOD, 'strong': GOOD}, called=called), 'Capital?')
+
+        self.assertEqual(served, 'cheap')
+        self.assertEqual(called, ['cheap'])
+
+    def test_weak_cheap_answer_beats_strong_error(self):
+        router = self.router(race=True, hedge_delay=0.5)
+        answer, served = router.run(provider_calls({'cheap': "I'm not sure. Paris?", 'strong': 'Error: down'}),
+                                    'Capital?')
+
+        self.assertEqual((answer, served), ("I'm not sure. Paris?", 'cheap'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+import json
+import queue
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import web_app
+from base_provider import VideoJob
+from chat_socket import ChatSocketSession
+from scheduler import INTERACTIVE, RequestScheduler
+
+
+class FakeBot:
+    current_provider = 'fake'
+
+    def __init__(self, chunks=100, delay=0.0):
+        self.chunks = chunks
+        self.delay = delay
+        self.recorded = []
+        self.job = VideoJob('clip')
+
+    def stream_chat(self, message, provider=None, cancel=None):
+        received = []
+        try:
+            for i in range(self.chunks):
+                if cancel is not None and cancel.cancelled:
+                    return
+                time.sleep(self.delay)
+                received.append(f"{i} ")
+                yield f"{i} "
+        finally:
+            self.recorded.append(''.join(received))
+
+    def set_provider(self, name):
+        return name == 'other'
+
+    def generate_images(self, prompts, n=1):
+        for i in range(n):
+            yield {'prompt': prompts[0], 'index': i, 'filepath': f"/tmp/{i}.png"}
+
+    def submit_video(self, prompt):
+        return self.job
+
+
+class Client:
+    """Drives a session the way the WebSocket route does"""
+
+    def __init__(self, bot, send_delay=0.0, outbox_size=64):
+        self.incoming = queue.Queue()
+        self.sent = queue.Queue()
+        self.send_delay = send_delay
+        self.session = ChatSocketSession(bot, self.send, outbox_size=outbox_size)
+        self.thread = threading.Thread(target=self.session.serve, args=(self.incoming.get,), daemon=True)
+        self.thread.start()
+
+    def send(self, text):
+        time.sleep(self.send_delay)
+        self.sent.put(json.loads(text))
+
+    def request(self, **message):
+        self.incoming.put(json.dumps(message))
+
+    def frames_until(self, kind, timeout=5):
+        frames = []
+        while True:
+            frame = self.sent.get(timeout=timeout)
+            frames.append(frame)
+            if frame['type'] == kind:
+                return frames
+
+    def close(self):
+        self.incoming.put(None)
+        self.thread.join(2)
+
+
+class TestChatSocket(unittest.TestCase):
+
+    def test_streams_tokens_then_done(self):
+        client = Client(FakeBot(chunks=5))
+        client.request(type='chat', id='t1', message='hi')
+        frames = client.frames_until('done')
+        client.close()
+
+        text = ''.join(f['text'] for f in frames if f['type'] == 'token')
+        self.assertEqual(text, '0 1 2 3 4 ')
+        self.assertEqual(frames[-1], {'type': 'done', 'id': 't1', 'stopped': False, 'provider': 'fake'})
+
+    def test_slow_client_gets_merged_frames(self):
+        client = Client(FakeBot(chunks=200), send_delay=0.005, outbox_size=4)
+        client.request(type='chat', id='t1', message='hi')
+        frames = client.frames_until('done')
+        client.close()
+
+        tokens = [f for f in frames if f['type'] == 'token']
+        self.assertLess(len(tokens), 200)
+        self.assertEqual(''.join(f['text'] for f in tokens), ''.join(f"{i} " for i in range(200)))
+
+    def test_stop_cancels_generation_and_keeps_partial_reply(self):
+        bot = FakeBot(chunks=1000, delay=0.01)
+        client = Client(bot)
+        client.request(type='chat', id='t1', message='hi')
+        client.frames_until('token')
+        client.request(type='stop', id='t1')
+        frames = client.frames_until('done')
+        client.close()
+
+        self.assertTrue(frames[-1]['stopped'])
+        self.assertEqual(len(bot.recorded), 1)
+        self.assertLess(len(bot.recorded[0].split()), 1000)
+
+    def test_switch_image_and_video_jobs(self):
+        bot = FakeBot()
+        client = Client(bot)
+        client.request(type='switch', provider='other')
+        self.assertEqual(client.frames_until('switched')[-1]['provider'], 'other')
+
+        client.request(type='image', id='j1', prompt='fox', n=2)
+        frames = client.frames_until('job')  # running
+        frames = client.frames_until('job')  # finished
+        self.assertEqual([f['index'] for f in frames if f['type'] == 'image'], [0, 1])
+        self.assertEqual(frames[-1]['status'], 'succeeded')
+
+        client.request(type='video', id='v1', prompt='clip')
+        self.assertEqual(client.frames_until('job')[-1]['status'], 'starting')
+        bot.job.finish(filepath='/tmp/clip.mp4')
+        final = client.frames_until('job')[-1]
+        client.close()
+        self.assertEqual((final['id'], final['status'], final['job']), ('v1', 'succeeded', bot.job.id))
+
+    def test_rejects_bad_messages(self):
+        client = Client(FakeBot())
+        client.incoming.put('not json')
+        client.request(type='nope')
+        errors = [client.frames_until('error')[-1], client.frames_until('error')[-1]]
+        client.close()
+        self.assertIn('JSON', errors[0]['error'])
+        self.assertIn('Unknown type', errors[1]['error'])
+
+
+class FakeSocket:
+    """A flask-sock connection that delivers `messages`, then closes once a reply was sent"""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.sent = []
+        self.replied = threading.Event()
+
+    def receive(self):
+        if self.messages:
+            return json.dumps(self.messages.pop(0))
+        self.replied.wait(5)
+        return None
+
+    def send(self, text):
+        self.sent.append(json.loads(text))
+        self.replied.set()
+
+
+class TestSocketScheduling(unittest.TestCase):
+
+    def test_chat_frames_wait_for_the_scheduler_like_http_requests(self):
+        scheduler = RequestScheduler(slots=1, interactive_reserve=0, queue_depth=0)
+        bot = FakeBot(chunks=3)
+        ws = FakeSocket([{'type': 'chat', 'id': 't1', 'message': 'hi'}])
+        held = scheduler.acquire(INTERACTIVE)
+        with patch.object(web_app, 'scheduler', scheduler), patch.object(web_app, 'session_bot', lambda: bot), \
+                patch.object(web_app, 'save_session', lambda sid, bot: None), \
+                web_app.app.test_request_context('/ws'):
+            web_app.chat_socket(ws)
+        held.release()
+
+        self.assertEqual(len(ws.sent), 1)
+        self.assertEqual((ws.sent[0]['type'], ws.sent[0]['id']), ('error', 't1'))
+        self.assertIn('Server busy', ws.sent[0]['error'])
+        self.assertGreaterEqual(ws.sent[0]['retry_after'], 1)
+        self.assertEqual(bot.recorded, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
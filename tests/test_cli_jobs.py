@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import unittest
+
+import cli
+from background_jobs import JobManager
+from base_provider import VideoJob
+
+
+class FakeBot:
+    """Images arrive one at a time, each after the test lets it through"""
+
+    def __init__(self):
+        self.release = threading.Semaphore(0)
+        self.video = None
+        self.cancelled_videos = []
+
+    def generate_images(self, prompts, n=1, cancel=None):
+        for prompt in prompts:
+            for index in range(n):
+                self.release.acquire()
+                yield {'prompt': prompt, 'index': index, 'filepath': f"/tmp/{prompt}-{index}.png"}
+
+    def submit_video(self, prompt):
+        self.video = VideoJob(prompt, canceller=lambda: self.cancelled_videos.append(prompt) or True)
+        return self.video
+
+    def arena_chat(self, message, providers, on_result=None, cancel=None):
+        for provider in providers:
+            on_result(provider, f"{provider}: {message}")
+        return {p: f"{p}: {message}" for p in providers}
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+
+class TestJobManager(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.announced = []
+        self.jobs = JobManager(self.announced.append)
+
+    async def test_prompt_stays_free_while_a_job_reports_progress(self):
+        bot = FakeBot()
+        job = self.jobs.start('image', 'cat | dog', cli.image_job(bot, ['cat', 'dog'], 2))
+
+        bot.release.release()
+        await wait_for(lambda: job.progress == '1/4')
+        self.assertTrue(job.running)
+        self.assertIn("#1 image 'cat | dog' 1/4", self.jobs.status_line())
+
+        for _ in range(3):
+            bot.release.release()
+        await job.task
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(len(job.result), 4)
+        self.assertEqual(self.announced, [job])
+        self.assertEqual(self.jobs.status_line(), '')
+
+    async def test_cancel_announces_without_waiting_for_the_thread(self):
+        bot = FakeBot()
+        job = self.jobs.start('image', 'cat', cli.image_job(bot, ['cat'], 5))
+
+        self.assertTrue(self.jobs.cancel(job.id))
+        await asyncio.wait_for(asyncio.shield(job.task), 1.0)
+        self.assertEqual(job.status, 'cancelled')
+        self.assertTrue(job.cancel.cancelled)
+        self.assertEqual(self.announced, [job])
+        self.assertFalse(self.jobs.cancel(job.id))
+        bot.release.release()  # let the abandoned thread see the token and stop
+
+    async def test_cancelling_a_video_job_cancels_the_prediction(self):
+        bot = FakeBot()
+        job = self.jobs.start('video', 'a wave', cli.video_job(bot, 'a wave'))
+        await wait_for(lambda: bot.video is not None)
+
+        self.assertTrue(self.jobs.cancel(job.id))
+        await job.task
+        self.assertEqual(bot.cancelled_videos, ['a wave'])
+        self.assertEqual(bot.video.error, 'Error generating video: cancelled')
+
+    async def test_failures_are_reported_not_raised(self):
+        def work(job):
+            raise RuntimeError("upstream timed out")
+
+        job = self.jobs.start('video', 'a cat', work)
+        await job.task
+        self.assertEqual((job.status, job.error), ('failed', 'upstream timed out'))
+        self.assertEqual(self.announced, [job])
+
+    async def test_arena_progress_counts_answers(self):
+        job = self.jobs.start('arena', 'hi', cli.arena_job(FakeBot(), 'hi', ['a', 'b']))
+        await job.task
+        self.assertEqual(job.progress, '2/2')
+        self.assertEqual(job.result, {'a': 'a: hi', 'b': 'b: hi'})
+
+    async def test_finished_jobs_are_pruned(self):
+        jobs = JobManager(lambda job: None, keep_finished=2)
+        for i in range(4):
+            await jobs.start('video', str(i), lambda job: None).task
+        jobs.start('video', 'last', lambda job: None)
+        self.assertEqual([job.label for job in jobs.jobs()], ['2', '3', 'last'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import datetime
+import gzip
+import json
+import unittest
+import zlib
+from unittest.mock import patch
+
+import fast_json
+import web_app
+from http_compression import compress_stream, negotiate
+
+
+class FakeBot:
+    current_provider = 'fake'
+
+    def __init__(self, history=None):
+        self.conversation_history = history or []
+
+    def fork(self, history=None, provider=None):
+        return FakeBot(history)
+
+    def generate_images(self, prompts, n=1):
+        for i in range(n):
+            yield {'prompt': prompts[0], 'index': i, 'filepath': f"/tmp/{i}.png"}
+
+
+class TestNegotiation(unittest.TestCase):
+
+    def test_picks_best_accepted_encoding(self):
+        preferred = ['zstd', 'br', 'gzip']
+        self.assertEqual(negotiate('gzip, deflate, br', preferred), 'br')
+        self.assertEqual(negotiate('gzip;q=1.0, br;q=0.5', preferred), 'gzip')
+        self.assertEqual(negotiate('*', preferred), 'zstd')
+        self.assertIsNone(negotiate('gzip;q=0, identity', preferred))
+        self.assertIsNone(negotiate('', preferred))
+
+    def test_stream_chunks_decode_as_they_arrive(self):
+        chunks = [json.dumps({'index': i}).encode() + b'\n' for i in range(5)]
+        decoder = zlib.decompressobj(31)
+        for original, compressed in zip(chunks, compress_stream(iter(chunks), 'gzip')):
+            self.assertEqual(decoder.decompress(compressed), original)
+
+
+class TestCompressedResponses(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(web_app, 'ENCODINGS', ['gzip'])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = web_app.app.test_client()
+
+    def get_history(self, messages, **headers):
+        history = [{'role': 'user' if i % 2 == 0 else 'assistant', 'content': f"Message {i}: " + 'lorem ipsum ' * 40}
+                   for i in range(messages)]
+        web_app.sessions.save('compression-test', history, None)
+        with patch.object(web_app, 'chatbot', FakeBot()):
+            return self.client.get('/api/history', headers={'X-Session-Id': 'compression-test', **headers})
+
+    def test_large_json_is_compressed(self):
+        response = self.get_history(20, **{'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        payload = json.loads(gzip.decompress(response.data))
+        self.assertEqual(len(payload['messages']), 20)
+        self.assertLess(len(response.data), len(json.dumps(payload)) / 4)
+
+    def test_small_or_unaccepted_bodies_are_sent_as_is(self):
+        small = self.get_history(1, **{'Accept-Encoding': 'gzip'})
+        plain = self.get_history(20)
+        for response in (small, plain):
+            self.assertNotIn('Content-Encoding', response.headers)
+            self.assertEqual(response.get_json()['provider'], 'fake')
+
+    def test_streamed_results_are_compressed(self):
+        with patch.object(web_app, 'chatbot', FakeBot()), patch.object(web_app, 'scheduler', None):
+            response = self.client.post('/api/generate-image', json={'prompt': 'fox', 'n': 3, 'stream': True},
+                                        headers={'Accept-Encoding': 'gzip'})
+            data = response.data
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(data).decode().splitlines()
+        self.assertEqual([json.loads(line)['index'] for line in lines], [0, 1, 2])
+
+
+class TestFastJSON(unittest.TestCase):
+
+    def test_matches_standard_library(self):
+        payload = {'text': 'héllo ✓', 'n': [1, 2.5, None, True], 1: 'int key',
+                   'when': datetime.date(2024, 5, 1)}
+        # The second payload has an integer orjson cannot encode and falls back to the json module
+        for extra in ({}, {'big': 2 ** 70}):
+            decoded = json.loads(fast_json.dumps({**payload, **extra}))
+            self.assertEqual(decoded['text'], 'héllo ✓')
+            self.assertEqual(decoded['1'], 'int key')
+            self.assertEqual(decoded['when'], 'Wed, 01 May 2024 00:00:00 GMT')
+            self.assertEqual(fast_json.loads(fast_json.dumps_bytes({**payload, **extra})), decoded)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import document_index
+from config import Config
+from document_index import DocumentIndex, chunk_text, open_index
+from tests.mock_backend import MockBackendTestCase
+
+ROTATION = """# Operations
+
+## Rotating the API key
+
+Create a new key in the dashboard, set DEEPSEEK_API_KEY to it and restart
+the web app. The old key keeps working for an hour after rotation.
+"""
+
+BACKUPS = """# Backups
+
+## Nightly backups
+
+The database is copied to object storage every night at two o'clock and
+the copies are kept for thirty days.
+"""
+
+
+@unittest.skipUnless(document_index.available(), 'numpy is not installed')
+class TestDocumentIndex(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.docs = self.root / 'docs'
+        self.docs.mkdir()
+        (self.docs / 'rotation.md').write_text(ROTATION)
+        (self.docs / 'backups.md').write_text(BACKUPS)
+        self.index = DocumentIndex(self.root / 'index')
+
+    def test_chunks_keep_their_heading_and_stay_small(self):
+        chunks = chunk_text(ROTATION + '\n\n' + 'word ' * 2000, max_tokens=100)
+        self.assertTrue(chunks[0].startswith('## Rotating the API key'))
+        self.assertGreater(len(chunks), 10)
+        self.assertTrue(all(len(chunk) <= 100 * 3 + 40 for chunk in chunks))
+        self.assertFalse(any(chunk.strip() == '# Operations' for chunk in chunks))
+
+    def test_ingest_is_incremental_and_search_finds_the_right_file(self):
+        self.assertEqual(self.index.ingest([self.docs])['added'], 2)
+        hits = self.index.search('how do I rotate the api key', k=2)
+        self.assertTrue(hits[0].source.endswith('rotation.md'))
+        self.assertIn('DEEPSEEK_API_KEY', hits[0].text)
+        self.assertGreater(hits[0].score, hits[-1].score)
+
+        summary = self.index.ingest([self.docs])
+        self.assertEqual((summary['unchanged'], summary['added'], summary['updated']), (2, 0, 0))
+
+        (self.docs / 'backups.md').write_text(BACKUPS.replace('thirty days', 'ninety days'))
+        os.utime(self.docs / 'backups.md', ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+        (self.docs / 'rotation.md').unlink()
+        summary = self.index.ingest([self.docs])
+        self.assertEqual((summary['updated'], summary['removed']), (1, 1))
+        texts = [hit.text for hit in self.index.search('backups kept days', k=4)]
+        self.assertTrue(any('ninety days' in text for text in texts))
+        self.assertFalse(any('thirty days' in text or 'rotation' in text for text in texts))
+
+    def test_other_processes_see_updates_and_compaction_drops_stale_rows(self):
+        self.index.ingest([self.docs])
+        reader = open_index(self.root / 'index')
+        self.assertEqual(reader.stats()['documents'], 2)
+
+        (self.docs / 'rotation.md').unlink()
+        with patch.object(document_index, 'MAX_STALE_SHARE', 1.0):
+            self.index.ingest([self.docs])
+        reader.reload()
+        self.assertEqual(reader.stats()['documents'], 1)
+        self.assertGreater(reader.stats()['stale_chunks'], 0)
+
+        self.index.compact()
+        reader.reload()
+        self.assertEqual(reader.stats()['stale_chunks'], 0)
+        self.assertEqual(reader.stats()['segments'], 1)
+        self.assertTrue(reader.search('nightly backups', k=1)[0].source.endswith('backups.md'))
+
+    def test_large_segments_are_clustered_and_still_found(self):
+        np = document_index.np
+        rng = np.random.default_rng(3)
+        vectors = rng.standard_normal((6000, self.index.embedder.dim), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.index.add([('synthetic', {}, [f"row {i}" for i in range(len(vectors))])], vectors=vectors)
+
+        segment = self.index._state[1][0]
+        self.assertGreater(len(segment.centroids), 1)
+        self.assertIsInstance(segment.vectors, np.memmap)
+        scores, rows = segment.search(vectors[1234], 1, len(segment.centroids), self.index._state[2])
+        self.assertEqual(segment.text_at(int(rows[0])), 'row 1234')
+        self.assertAlmostEqual(float(scores[0]), 1.0, places=4)
+
+
+@unittest.skipUnless(document_index.available(), 'numpy is not installed')
+class TestRetrievalInChat(MockBackendTestCase):
+
+    def setUp(self):
+        self.start_server(latency_ms=0, jitter_ms=0, tokens=4)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        root = Path(directory.name)
+        (root / 'rotation.md').write_text(ROTATION)
+        (root / 'backups.md').write_text(BACKUPS)
+        DocumentIndex(root / 'index').ingest([root])
+        self.bot = self.make_bot(RAG_ENABLED=True, RAG_INDEX_DIR=root / 'index', RAG_TOP_K=2)
+        self.bot.set_provider('deepseek')
+        self.sent = []
+        dispatch = self.bot._dispatch
+
+        def record(provider_name, method, payload, **kwargs):
+            self.sent.append(payload)
+            return dispatch(provider_name, method, payload, **kwargs)
+
+        p = patch.object(self.bot, '_dispatch', record)
+        p.start()
+        self.addCleanup(p.stop)
+
+    def test_relevant_excerpts_are_sent_but_not_stored(self):
+        reply = self.bot.chat('How do I rotate the API key?')
+        self.assertFalse(reply.startswith('Error'))
+        sent = self.sent[-1][-1]['content']
+        self.assertTrue(sent.startswith('Excerpts from the local documentation'))
+        self.assertIn('DEEPSEEK_API_KEY', sent)
+        self.assertTrue(sent.endswith('How do I rotate the API key?'))
+        self.assertEqual(self.bot.conversation_history[0]['content'], 'How do I rotate the API key?')
+
+    def test_unrelated_messages_and_tight_budgets_get_no_excerpts(self):
+        self.bot.chat('Tell me a joke about penguins')
+        self.assertEqual(self.sent[-1][-1]['content'], 'Tell me a joke about penguins')
+
+        with patch.object(Config, 'RAG_MAX_TOKENS', 20):
+            self.bot.chat('How do I rotate the API key?')
+        self.assertEqual(self.sent[-1][-1]['content'], 'How do I rotate the API key?')
+
+        self.bot.use_documents = False
+        self.bot.chat('How do I rotate the API key?')
+        self.assertEqual(self.sent[-1][-1]['content'], 'How do I rotate the API key?')
+
+
+if __name__ == '__main__':
+    unittest.main()
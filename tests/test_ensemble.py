@@ -0,0 +1,103 @@
+import time
+import unittest
+from unittest.mock import patch
+
+import web_app
+from ensemble import normalize_answer, run_ensemble
+from tests.fake_providers import provider_calls
+
+
+class TestEnsemble(unittest.TestCase):
+
+    def test_quorum_stops_waiting_for_slow_providers(self):
+        cancelled = {}
+        call = provider_calls({'a': 'Paris.', 'b': 'paris', 'c': 'Lyon'}, delays={'c': 2}, cancelled=cancelled)
+        start = time.perf_counter()
+        result = run_ensemble(call, ['a', 'b', 'c'], 'Capital of France?')
+
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(normalize_answer(result['answer']), 'paris')
+        self.assertEqual(result['strategy'], 'vote')
+        self.assertEqual(result['agreement'], '2/3')
+        self.assertEqual(result['providers']['c']['status'], 'cancelled')
+        deadline = time.perf_counter() + 1
+        while 'c' not in cancelled and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(cancelled, {'c': 'quorum'})
+        self.assertTrue(result['providers']['a']['contributed'])
+        self.assertIsNotNone(result['providers']['b']['latency_ms'])
+
+    def test_judge_picks_long_answers(self):
+        long_a = 'The first answer explains the topic in a lot of detail with many words and examples.'
+        long_b = 'The second answer is also rather long and goes into some depth about the question.'
+        call = provider_calls({'a': long_a, 'b': long_b})
+        prompts = []
+
+        def judge(prompt):
+            prompts.append(prompt)
+            return '2'
+
+        result = run_ensemble(call, ['a', 'b'], 'Explain', judge=judge)
+        self.assertEqual(result['strategy'], 'judge')
+        self.assertEqual(result['winner'], 'b')
+        self.assertIn('Answer 2:', prompts[0])
+
+    def test_errors_do_not_contribute(self):
+        call = provider_calls({'a': 'Error in chat: boom', 'b': 'yes'})
+        result = run_ensemble(call, ['a', 'b'], 'ok?', strategy='vote')
+
+        self.assertEqual(result['winner'], 'b')
+        self.assertEqual(result['providers']['a']['status'], 'error')
+        self.assertFalse(result['providers']['a']['contributed'])
+
+    def test_calls_run_concurrently(self):
+        called = []
+        call = provider_calls({'a': 'x', 'b': 'y', 'c': 'z'}, delays={'a': 0.3, 'b': 0.3, 'c': 0.3},
+                              called=called)
+        start = time.perf_counter()
+        run_ensemble(call, ['a', 'b', 'c'], 'q')
+        self.assertLess(time.perf_counter() - start, 0.8)
+        self.assertEqual(sorted(called), ['a', 'b', 'c'])
+
+
+class FakeBot:
+
+    def __init__(self):
+        self.calls = []
+
+    def list_providers(self):
+        return ['a', 'b']
+
+    def ensemble_chat(self, message, **kwargs):
+        self.calls.append(kwargs)
+        return {'answer': 'ok'}
+
+
+class TestEnsembleRoute(unittest.TestCase):
+
+    def post(self, bot, **body):
+        with patch.object(web_app, 'chatbot', bot), patch.object(web_app, 'scheduler', None):
+            return web_app.app.test_client().post('/api/ensemble', json={'message': 'hi', **body})
+
+    def test_invalid_options_are_rejected(self):
+        bot = FakeBot()
+        for body, field in [({'quorum': '2'}, 'quorum'), ({'quorum': 0}, 'quorum'), ({'quorum': -1}, 'quorum'),
+                            ({'quorum': True}, 'quorum'), ({'providers': 'a'}, 'providers'),
+                            ({'providers': []}, 'providers'), ({'providers': ['a', 'zz']}, 'providers'),
+                            ({'judge': 'zz'}, 'judge'), ({'judge': ['a']}, 'judge')]:
+            response = self.post(bot, **body)
+            self.assertEqual(response.status_code, 400, body)
+            self.assertIn(field, response.get_json()['error'])
+        self.assertEqual(bot.calls, [])
+
+    def test_valid_options_are_passed_on(self):
+        bot = FakeBot()
+        response = self.post(bot, providers=['a', 'b'], quorum=2, judge='b')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((bot.calls[0]['providers'], bot.calls[0]['quorum'], bot.calls[0]['judge']),
+                         (['a', 'b'], 2, 'b'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import unittest
+from unittest.mock import patch
+
+from gemini_provider import GeminiProvider
+
+
+class TestGeminiProvider(unittest.TestCase):
+
+    def test_each_chat_starts_a_session_from_its_messages(self):
+        with patch('gemini_provider.genai') as genai:
+            model = genai.GenerativeModel.return_value
+            model.model_name = 'models/gemini-pro'
+            session = model.start_chat.return_value
+            session.send_message.return_value.text = 'reply'
+            provider = GeminiProvider('test-key')
+
+            # Two conversations sharing the provider, as sessions share the registry
+            self.assertEqual(provider.chat([{'role': 'user', 'content': 'hi'}]), 'reply')
+            provider.chat([
+                {'role': 'system', 'content': 'Be brief.'},
+                {'role': 'user', 'content': 'a'},
+                {'role': 'assistant', 'content': 'b'},
+                {'role': 'user', 'content': 'c'},
+            ])
+
+        histories = [call.kwargs['history'] for call in model.start_chat.call_args_list]
+        self.assertEqual(histories, [[], [{'role': 'user', 'parts': ['a']}, {'role': 'model', 'parts': ['b']}]])
+        self.assertEqual([call.args[0] for call in session.send_message.call_args_list], ['hi', 'c'])
+        self.assertFalse(hasattr(provider, 'chat_session'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import web_app
+from benchmarks.mock_server import MockServer, MockSettings
+from health import HealthMonitor
+from openai_provider import OpenAIProvider
+
+
+class FakeProvider:
+
+    def __init__(self, error=None, delay=0.0):
+        self.error = error
+        self.delay = delay
+
+    def probe(self):
+        time.sleep(self.delay)
+        return self.error
+
+
+class TestHealthMonitor(unittest.TestCase):
+
+    def test_warm_up_runs_in_parallel_and_respects_the_deadline(self):
+        providers = {'fast': FakeProvider(delay=0.1), 'also-fast': FakeProvider(delay=0.1),
+                     'hung': FakeProvider(delay=2.0)}
+        monitor = HealthMonitor(providers, deadline=0.3, interval=0)
+
+        start = time.perf_counter()
+        snapshot = monitor.warm_up()
+        self.assertLess(time.perf_counter() - start, 0.6)
+
+        self.assertEqual(snapshot['fast']['state'], 'ok')
+        self.assertEqual(snapshot['also-fast']['state'], 'ok')
+        self.assertEqual(snapshot['hung']['state'], 'unknown')
+        self.assertEqual(monitor.ready(), (True, []))
+
+    def test_required_provider_must_be_healthy(self):
+        providers = {'good': FakeProvider(), 'bad': FakeProvider(error='Error probing: 401 invalid key')}
+        monitor = HealthMonitor(providers, required=['bad'])
+        self.assertEqual(monitor.ready(), (True, []))  # no warm-up expected, nothing known yet
+
+        monitor.warm_up()
+        self.assertEqual(monitor.ready(), (False, ['bad is not healthy']))
+        self.assertEqual(monitor.snapshot()['bad']['error'], 'Error probing: 401 invalid key')
+
+        any_provider = HealthMonitor(providers)
+        any_provider.warm_up()
+        self.assertEqual(any_provider.ready(), (True, []))
+
+    def test_request_errors_mark_a_provider_failing_after_the_threshold(self):
+        monitor = HealthMonitor({'only': FakeProvider()}, failure_threshold=3)
+        monitor.warm_up()
+        for _ in range(2):
+            monitor.record('only', 'Error in chat: Connection refused')
+        self.assertTrue(monitor.ready()[0])
+
+        monitor.record('only', 'Error in chat: Connection refused')
+        self.assertEqual(monitor.ready(), (False, ['no healthy provider']))
+
+        monitor.record('only', 'Hello!')
+        self.assertEqual(monitor.snapshot()['only']['consecutive_failures'], 0)
+        self.assertTrue(monitor.ready()[0])
+
+    def test_openai_probe_checks_credentials_and_model(self):
+        settings = MockSettings(latency_ms=0, jitter_ms=0)
+        with MockServer(settings=settings) as server:
+            known = OpenAIProvider('test-key', base_url=f"{server.url}/v1", model='gpt-4')
+            unknown = OpenAIProvider('test-key', base_url=f"{server.url}/v1", model='no-such-model')
+            self.assertIsNone(known.probe())
+            self.assertIn('model not offered', unknown.probe())
+            self.assertEqual(server.counters.get('requests', 0), 0)  # nothing was generated
+
+
+class TestHealthEndpoints(unittest.TestCase):
+
+    def test_readiness_waits_for_warm_up(self):
+        release = threading.Event()
+
+        class SlowProvider:
+            def probe(self):
+                release.wait(2)
+
+        class Bot:
+            health = HealthMonitor({'slow': SlowProvider()}, deadline=5, interval=0)
+
+        client = web_app.app.test_client()
+        with patch.object(web_app, 'chatbot', Bot()):
+            thread = Bot.health.start()
+            self.assertEqual(client.get('/livez').status_code, 200)
+            not_ready = client.get('/readyz')
+            self.assertEqual(not_ready.status_code, 503)
+            self.assertEqual(not_ready.get_json()['reasons'], ['warming up'])
+
+            release.set()
+            thread.join(2)
+            ready = client.get('/readyz')
+            self.assertEqual(ready.status_code, 200)
+            self.assertEqual(ready.get_json()['providers']['slow']['state'], 'ok')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from benchmarks.mock_server import MockServer, MockSettings
+from cancellation import CancelToken
+from cli import parse_image_args
+from openai_provider import DALLEGenerator
+
+
+class TestDALLEGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.output_dir.cleanup)
+        self.server = MockServer(settings=MockSettings(latency_ms=20, jitter_ms=0)).start()
+        self.addCleanup(self.server.stop)
+        self.generator = DALLEGenerator('test-key', Path(self.output_dir.name),
+                                        base_url=f"{self.server.url}/v1", concurrency=4)
+
+    def test_dalle3_splits_into_single_image_requests(self):
+        results = list(self.generator.generate_images(['a cat', 'a dog'], n=3))
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(self.server.counters['requests'], 6)
+        self.assertEqual(sorted((r['prompt'], r['index']) for r in results),
+                         [(p, i) for p in ('a cat', 'a dog') for i in range(3)])
+        # The mock returns the same pixel every time, which the media store keeps once
+        self.assertEqual(len({r['filepath'] for r in results}), 1)
+        self.assertTrue(all(Path(r['filepath']).is_file() for r in results))
+
+    def test_dalle2_batches_images_in_one_request(self):
+        results = list(self.generator.generate_images(['a cat'], n=3, model='dall-e-2'))
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(self.server.counters['requests'], 1)
+
+    def test_malformed_responses_yield_errors_instead_of_hanging(self):
+        class Images:
+            def generate(self, **kwargs):
+                return SimpleNamespace(data=None)
+
+        self.generator.client = SimpleNamespace(images=Images())
+        results = list(self.generator.generate_images(['a cat'], n=2, model='dall-e-2'))
+
+        self.assertEqual(sorted(r['index'] for r in results), [0, 1])
+        self.assertTrue(all(r['error'].startswith('Error generating image') for r in results))
+
+    def test_quality_is_only_sent_when_requested(self):
+        requests = []
+
+        class Images:
+            def generate(self, **kwargs):
+                requests.append(kwargs)
+                return SimpleNamespace(data=[SimpleNamespace(url=None, b64_json='cG5n')] * kwargs['n'])
+
+        self.generator.client = SimpleNamespace(images=Images())
+        results = list(self.generator.generate_images(['a cat'], n=2, model='gpt-image-1'))
+        self.generator.generate_image('a dog', model='gpt-image-1', quality='high')
+
+        self.assertTrue(all('filepath' in r for r in results))
+        self.assertEqual([(r['n'], r.get('quality')) for r in requests], [(2, None), (1, 'high')])
+
+    def test_cancelled_requests_are_not_sent(self):
+        cancel = CancelToken()
+        cancel.cancel()
+        results = list(self.generator.generate_images(['a cat'], n=3, cancel=cancel))
+
+        self.assertEqual(sorted(r['index'] for r in results), [0, 1, 2])
+        self.assertTrue(all(r['error'] == 'Error generating image: cancelled' for r in results))
+        self.assertEqual(self.server.counters['requests'], 0)
+
+    def test_single_image_returns_a_path(self):
+        filepath = self.generator.generate_image('a cat')
+        self.assertTrue(Path(filepath).is_file())
+
+
+class TestImageCommand(unittest.TestCase):
+
+    def test_parse_count_and_prompts(self):
+        self.assertEqual(parse_image_args('-n 3 a cat | a dog'), (3, ['a cat', 'a dog']))
+        self.assertEqual(parse_image_args('a sunset'), (1, ['a sunset']))
+        self.assertEqual(parse_image_args('-n 2'), (2, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
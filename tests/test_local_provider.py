@@ -0,0 +1,92 @@
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import local_provider
+from local_provider import LocalLlamaProvider, ModelPool
+
+
+class FakeLlama:
+    instances = 0
+
+    def __init__(self, **kwargs):
+        FakeLlama.instances += 1
+        self.kwargs = kwargs
+        self.state = None
+        self.loaded_states = []
+
+    def save_state(self):
+        return MagicMock(llama_state_size=1024, tokens=self.state)
+
+    def load_state(self, state):
+        self.loaded_states.append(state)
+
+    def create_chat_completion(self, messages, stream=False, **kwargs):
+        if stream:
+            return iter([
+                {'choices': [{'delta': {'role': 'assistant'}}]},
+                {'choices': [{'delta': {'content': 'Hel'}}]},
+                {'choices': [{'delta': {'content': 'lo'}}]},
+            ])
+        return {'choices': [{'message': {'content': 'Hello'}}]}
+
+
+class TestLocalLlamaProvider(unittest.TestCase):
+
+    def setUp(self):
+        FakeLlama.instances = 0
+        self.model_file = tempfile.NamedTemporaryFile(suffix='.gguf')
+        fake_module = MagicMock(Llama=FakeLlama)
+        patcher = patch.object(local_provider, 'llama_cpp', fake_module)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.model_file.close)
+
+    def test_chat_and_stream(self):
+        provider = LocalLlamaProvider(self.model_file.name, threads=2, preload=False)
+        messages = [{'role': 'user', 'content': 'hi'}]
+
+        self.assertEqual(provider.chat(messages), 'Hello')
+        self.assertEqual(list(provider.stream_chat(messages)), ['Hel', 'lo'])
+
+        instance = provider.pool.acquire()
+        self.assertTrue(instance.kwargs['use_mmap'])
+        self.assertEqual(instance.kwargs['n_threads'], 2)
+
+    def test_next_turn_restores_saved_prefix_state(self):
+        provider = LocalLlamaProvider(self.model_file.name, preload=False, prefix_cache_mb=1)
+        first_turn = [{'role': 'system', 'content': 'Be brief'}, {'role': 'user', 'content': 'hi'}]
+        self.assertEqual(provider.chat(first_turn), 'Hello')
+        self.assertEqual(len(provider.prefix_cache), 1)
+
+        second_turn = first_turn + [{'role': 'assistant', 'content': 'Hello'},
+                                    {'role': 'user', 'content': 'again'}]
+        list(provider.stream_chat(second_turn))
+
+        instance = provider.pool.acquire()
+        self.assertEqual(len(instance.loaded_states), 1)
+        self.assertEqual(provider.prefix_cache.hits, 1)
+
+    def test_preload_warms_the_pool(self):
+        provider = LocalLlamaProvider(self.model_file.name, pool_size=2, preload=True)
+        provider._warmup.join()
+        self.assertEqual(provider.pool.loaded, 2)
+        self.assertEqual(FakeLlama.instances, 2)
+
+    def test_missing_model_file(self):
+        with self.assertRaises(FileNotFoundError):
+            LocalLlamaProvider('/nonexistent/model.gguf')
+
+
+class TestModelPool(unittest.TestCase):
+
+    def test_instances_are_reused(self):
+        pool = ModelPool(object, size=2)
+        first = pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual(pool.loaded, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
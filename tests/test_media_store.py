@@ -0,0 +1,94 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import media_store
+import web_app
+from config import Config
+from media_store import MediaStore
+
+
+class TestMediaStore(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+
+    def make_store(self, quota_bytes=0):
+        store = MediaStore(Path(self.root.name) / 'images', quota_bytes)
+        self.addCleanup(store.close)
+        return store
+
+    def test_files_are_named_by_content_and_deduplicated(self):
+        store = self.make_store()
+        first = store.put_bytes(b'same bytes', '.png', 'a cat', 'dalle')
+        second = store.put_stream([b'same ', b'bytes'], '.png', 'a cat again', 'dalle')
+
+        self.assertEqual(first, second)
+        self.assertEqual(first.parent.parent.name, first.stem[:2])
+        self.assertEqual(first.read_bytes(), b'same bytes')
+        self.assertEqual(store.size_bytes, len(b'same bytes'))
+        self.assertEqual(store.info(first)['prompt'], 'a cat')
+        self.assertEqual(list(store.tmp_dir.iterdir()), [])
+
+    def test_least_recently_used_files_are_collected(self):
+        store = self.make_store(quota_bytes=250)
+        old = store.put_bytes(b'a' * 100, '.png')
+        recent = store.put_bytes(b'b' * 100, '.png')
+        store.touch(store.relative(old))
+        store.touch(store.relative(recent))
+        store.put_bytes(b'c' * 100, '.png')
+        store.flush()
+
+        self.assertFalse(old.exists())
+        self.assertTrue(recent.exists())
+        self.assertLessEqual(store.size_bytes, 225)
+
+    def test_index_survives_restart(self):
+        store = self.make_store()
+        path = store.put_bytes(b'video', '.mp4', 'a wave', 'replicate')
+        store.close()
+
+        reopened = MediaStore(Path(self.root.name) / 'images')
+        self.addCleanup(reopened.close)
+        self.assertEqual(reopened.size_bytes, 5)
+        self.assertEqual(reopened.info(path)['provider'], 'replicate')
+
+    def test_index_and_temporary_files_stay_out_of_the_served_directory(self):
+        served = Path(self.root.name) / 'images'
+        served.mkdir()
+        (served / 'index.sqlite3').write_bytes(b'')
+        (served / '.tmp').mkdir()
+        store = self.make_store()
+        path = store.put_bytes(b'image', '.png', 'a secret prompt')
+
+        self.assertEqual(store.index_dir, Path(self.root.name) / '.media-index' / 'images')
+        self.assertTrue((store.index_dir / 'index.sqlite3').exists())
+        self.assertEqual(sorted(p.name for p in served.iterdir()), [path.stem[:2]])
+        self.assertTrue(store.is_media_path(store.relative(path)))
+        for name in ('index.sqlite3', 'index.sqlite3-wal', '.tmp/x.png', f"{path.stem[:2]}/../{path.name}"):
+            self.assertFalse(store.is_media_path(name))
+
+    def test_only_stored_files_are_served(self):
+        served = Path(self.root.name) / 'images'
+        with patch.object(Config, 'IMAGE_OUTPUT_DIR', served), patch.object(Config, 'MEDIA_INDEX_DIR', ''):
+            store = web_app.get_store(served)
+            self.addCleanup(media_store._stores.pop, served.resolve(), None)
+            self.addCleanup(store.close)
+            path = store.put_bytes(b'image', '.png', 'a secret prompt')
+            client = web_app.app.test_client()
+            self.assertEqual(client.get(f"/images/{store.relative(path)}").status_code, 200)
+            for name in ('index.sqlite3', 'index.sqlite3-wal', '../.media-index/images/index.sqlite3'):
+                self.assertEqual(client.get(f"/images/{name}").status_code, 404)
+
+    def test_thumbnails_are_made_in_the_background(self):
+        store = self.make_store()
+        with patch.object(MediaStore, '_make_thumbnail') as make_thumbnail:
+            path = store.put_bytes(b'png', '.png')
+            store.flush()
+        make_thumbnail.assert_called_once_with(path.stem, path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from benchmarks.mock_server import MockServer, MockSettings
+from openai_provider import OpenAIProvider
+
+
+class TestMockServer(unittest.TestCase):
+
+    def test_chat_and_stream(self):
+        settings = MockSettings(latency_ms=0, jitter_ms=0, tokens=5, token_delay_ms=0)
+        with MockServer(settings=settings) as server:
+            provider = OpenAIProvider('test-key', base_url=f"{server.url}/v1")
+            messages = [{'role': 'user', 'content': 'hello'}]
+
+            reply = provider.chat(messages)
+            streamed = list(provider.stream_chat(messages))
+
+        self.assertEqual(len(reply.split()), 5)
+        self.assertEqual(len(streamed), 5)
+        self.assertEqual(''.join(streamed), reply)
+
+    def test_rate_limit_is_reported(self):
+        settings = MockSettings(latency_ms=0, jitter_ms=0, rate_limit_rate=1.0, retry_after=0)
+        with MockServer(settings=settings) as server:
+            provider = OpenAIProvider('test-key', base_url=f"{server.url}/v1")
+            provider.client = provider.client.with_options(max_retries=0)
+            reply = provider.generate_text('hello')
+
+        self.assertTrue(reply.startswith('Error'))
+        self.assertEqual(server.counters['rate_limited'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import video_provider
+from benchmarks.mock_server import MockServer, MockSettings
+from prediction_poller import PredictionPoller
+from video_provider import ReplicateVideoGenerator
+
+
+class FakePredictions:
+    """Predictions that succeed after a fixed number of status checks"""
+
+    def __init__(self, polls_needed=3, output='https://example.invalid/video.mp4'):
+        self.polls_needed = polls_needed
+        self.output = output
+        self.polls = {}
+        self.cancelled = []
+        self.lock = threading.Lock()
+
+    def create(self, **kwargs):
+        with self.lock:
+            prediction_id = f"p{len(self.polls)}"
+            self.polls[prediction_id] = 0
+        return SimpleNamespace(id=prediction_id, status='starting')
+
+    def get(self, prediction_id):
+        with self.lock:
+            self.polls[prediction_id] += 1
+            done = self.polls[prediction_id] >= self.polls_needed
+        return SimpleNamespace(id=prediction_id, status='succeeded' if done else 'processing',
+                               output=[self.output], error=None)
+
+    def cancel(self, prediction_id):
+        self.cancelled.append(prediction_id)
+
+
+class TestPredictionPoller(unittest.TestCase):
+
+    def test_tracks_hundreds_of_predictions_with_few_threads(self):
+        predictions = FakePredictions(polls_needed=3)
+        poller = PredictionPoller(predictions.get, workers=4, initial_interval=0.01, max_interval=0.05)
+        self.addCleanup(poller.stop)
+        finished = []
+        all_done = threading.Event()
+        threads_before = threading.active_count()
+
+        def on_done(prediction):
+            finished.append(prediction.id)
+            if len(finished) == 300:
+                all_done.set()
+
+        for _ in range(300):
+            poller.track(predictions.create().id, on_done)
+
+        self.assertTrue(all_done.wait(10))
+        self.assertEqual(sorted(finished), sorted(predictions.polls))
+        self.assertLessEqual(threading.active_count() - threads_before, 5)
+        self.assertEqual(poller.pending(), 0)
+
+    def test_poke_checks_immediately(self):
+        predictions = FakePredictions(polls_needed=1)
+        poller = PredictionPoller(predictions.get, initial_interval=60)
+        self.addCleanup(poller.stop)
+        done = threading.Event()
+        prediction_id = predictions.create().id
+        poller.track(prediction_id, lambda prediction: done.set())
+
+        self.assertTrue(poller.poke(prediction_id))
+        self.assertTrue(done.wait(5))
+        self.assertFalse(poller.poke('unknown'))
+
+
+class TestReplicateVideoGenerator(unittest.TestCase):
+
+    def make_generator(self, predictions, **kwargs):
+        output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(output_dir.cleanup)
+        patcher = patch.object(video_provider, 'replicate', MagicMock(predictions=predictions))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        generator = ReplicateVideoGenerator('token', Path(output_dir.name) / 'videos', max_poll_interval=0.05,
+                                            **kwargs)
+        generator.poller.initial_interval = 0.01
+        self.addCleanup(generator.poller.stop)
+        return generator
+
+    def test_submit_returns_a_handle_and_stores_the_video(self):
+        server = MockServer(settings=MockSettings(latency_ms=0, jitter_ms=0)).start()
+        self.addCleanup(server.stop)
+        predictions = FakePredictions(polls_needed=2, output=f"{server.url}/files/video.mp4")
+        generator = self.make_generator(predictions)
+        job = generator.submit_video('waves at sunset')
+
+        self.assertFalse(job.done())
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, 'succeeded')
+        self.assertTrue(Path(job.filepath).is_file())
+        self.assertEqual(generator.store.info(job.filepath)['prompt'], 'waves at sunset')
+
+    def test_downloads_do_not_hold_up_polling(self):
+        predictions = FakePredictions(polls_needed=1)
+        generator = self.make_generator(predictions, poll_workers=1)
+        release, started = threading.Event(), threading.Semaphore(0)
+        threads = []
+
+        def download(job, url):
+            threads.append(threading.current_thread().name)
+            started.release()
+            release.wait(5)
+            job.finish(filepath=f"/tmp/{job.prompt}.mp4")
+
+        with patch.object(generator, '_download', download):
+            first = generator.submit_video('first')
+            self.assertTrue(started.acquire(timeout=5))
+            # The only poll worker is free again while the first video is still downloading
+            second = generator.submit_video('second')
+            self.assertTrue(started.acquire(timeout=5))
+            release.set()
+            self.assertTrue(first.wait(5) and second.wait(5))
+
+        self.assertTrue(all(name.startswith('video-download') for name in threads))
+
+    def test_timed_out_predictions_are_cancelled_upstream(self):
+        predictions = FakePredictions(polls_needed=10 ** 6)
+        generator = self.make_generator(predictions, timeout=0.1)
+
+        result = generator.generate_video('waves at sunset')
+
+        self.assertTrue(result.startswith('Error generating video: timed out'))
+        self.assertEqual(predictions.cancelled, ['p0'])
+        self.assertEqual(generator.poller.pending(), 0)
+
+    def test_cancelling_a_job_cancels_its_prediction(self):
+        predictions = FakePredictions(polls_needed=10 ** 6)
+        generator = self.make_generator(predictions)
+
+        job = generator.submit_video('waves at sunset')
+
+        self.assertTrue(job.cancel())
+        self.assertEqual((job.status, job.error), ('failed', 'Error generating video: cancelled'))
+        self.assertEqual(predictions.cancelled, ['p0'])
+        self.assertEqual(generator.poller.pending(), 0)
+        self.assertFalse(job.cancel())
+
+    def test_stuck_predictions_expire_without_a_waiter(self):
+        predictions = FakePredictions(polls_needed=10 ** 6)
+        generator = self.make_generator(predictions, max_age=0.1)
+
+        job = generator.submit_video('waves at sunset')
+
+        self.assertTrue(job.wait(5))
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('still processing', job.error)
+        self.assertEqual(predictions.cancelled, ['p0'])
+        self.assertEqual(generator.poller.pending(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import json
+import unittest
+
+from prompt_cache import PrefixStateCache, canonical_messages, prefix_key
+
+
+class TestCanonicalMessages(unittest.TestCase):
+
+    def test_system_prompt_first_and_fixed_shape(self):
+        history = [
+            {'content': 'hi', 'role': 'user', 'timestamp': 123},
+            {'role': 'assistant', 'content': 'hello'},
+        ]
+        messages = canonical_messages(history, 'Be brief')
+
+        self.assertEqual(messages[0], {'role': 'system', 'content': 'Be brief'})
+        self.assertEqual(json.dumps(messages[1]), '{"role": "user", "content": "hi"}')
+        # The caller's history is not modified
+        self.assertIn('timestamp', history[0])
+
+    def test_existing_system_prompt_is_not_duplicated(self):
+        history = [{'role': 'user', 'content': 'hi'}, {'role': 'system', 'content': 'Be brief'}]
+        messages = canonical_messages(history, 'Be brief')
+        self.assertEqual([m['role'] for m in messages], ['system', 'user'])
+
+    def test_prefix_key_ignores_extra_fields(self):
+        a = canonical_messages([{'role': 'user', 'content': 'hi', 'name': 'x'}])
+        b = canonical_messages([{'content': 'hi', 'role': 'user'}])
+        self.assertEqual(prefix_key(a), prefix_key(b))
+
+
+class TestPrefixStateCache(unittest.TestCase):
+
+    def test_lru_eviction_by_size(self):
+        cache = PrefixStateCache(capacity_bytes=100)
+        cache.put('a', 'A', 40)
+        cache.put('b', 'B', 40)
+        cache.get('a')
+        cache.put('c', 'C', 40)
+
+        self.assertEqual(cache.get('a'), 'A')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.size_bytes, 80)
+
+    def test_oversized_state_is_not_cached(self):
+        cache = PrefixStateCache(capacity_bytes=10)
+        cache.put('a', 'A', 11)
+        self.assertEqual(len(cache), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
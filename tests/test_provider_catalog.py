@@ -0,0 +1,89 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from config import Config
+from provider_catalog import load_catalog, load_env
+from rate_limit import ProviderLimiter, RateLimitExceeded
+
+
+class TestProviderCatalog(unittest.TestCase):
+
+    def test_builtin_catalog(self):
+        specs = {s.name: s for s in load_catalog(Path('does-not-exist.toml'), environ={})}
+        self.assertEqual(specs['deepseek'].default_model, 'deepseek-chat')
+        self.assertTrue(specs['deepseek'].openai_compatible)
+        self.assertEqual(list(specs)[-1], 'duckduckgo')
+
+    def test_file_overrides_and_adds_providers(self):
+        catalog = (
+            '[providers.openai]\nmodel = "gpt-4o-mini"\n\n'
+            '[providers.vllm]\nbase_url = "http://127.0.0.1:8000/v1"\nmodel = "local"\npool_size = 4\n\n'
+            '[providers.grok]\nenabled = false\n'
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'providers.toml'
+            path.write_text(catalog)
+            specs = {s.name: s for s in load_catalog(path, environ={})}
+
+        self.assertEqual(specs['openai'].default_model, 'gpt-4o-mini')
+        self.assertEqual(specs['openai'].context_length, 8192)
+        self.assertNotIn('grok', specs)
+        # Keyless OpenAI-compatible endpoints are available when they have a URL
+        self.assertTrue(specs['vllm'].available)
+        self.assertEqual(specs['vllm'].pool_size, 4)
+
+    def test_environment_entries(self):
+        entries = load_env({
+            'PROVIDER_LLAMA_CPP_BASE_URL': 'http://127.0.0.1:8080/v1',
+            'PROVIDER_LLAMA_CPP_MAX_CONCURRENCY': '2',
+            'PROVIDER_CATALOG': 'ignored.toml',
+        })
+        self.assertEqual(entries, {'llama_cpp': {'base_url': 'http://127.0.0.1:8080/v1', 'max_concurrency': 2}})
+
+    @patch.object(Config, 'LOCAL_MODEL_PATH', '')
+    def test_environment_adds_a_server_beside_the_local_model(self):
+        # The documented .env.example entry must not merge into the built-in llama.cpp 'local'
+        environ = {'PROVIDER_VLLM_BASE_URL': 'http://127.0.0.1:8000/v1',
+                   'PROVIDER_VLLM_MODEL': 'Qwen/Qwen2.5-7B-Instruct'}
+        specs = {s.name: s for s in load_catalog(Path('does-not-exist.toml'), environ=environ)}
+        self.assertEqual(specs['vllm'].kind, 'openai')
+        self.assertTrue(specs['vllm'].available)
+        self.assertEqual(specs['vllm'].base_url, 'http://127.0.0.1:8000/v1')
+        self.assertEqual(specs['vllm'].default_model, 'Qwen/Qwen2.5-7B-Instruct')
+        self.assertEqual(specs['local'].kind, 'local')
+        self.assertFalse(specs['local'].available)
+
+    @patch.object(Config, 'XAI_API_KEY', '')
+    def test_api_keys_come_from_config(self):
+        specs = {s.name: s for s in load_catalog(Path('does-not-exist.toml'), environ={})}
+        self.assertFalse(specs['grok'].available)
+        self.assertAlmostEqual(specs['deepseek'].estimate_cost(1000, 1000), 0.00137)
+
+
+class TestProviderLimiter(unittest.TestCase):
+
+    def test_concurrency_cap(self):
+        limiter = ProviderLimiter(max_concurrency=1)
+        with limiter.admit():
+            with self.assertRaises(RateLimitExceeded):
+                with limiter.admit(timeout=0.01):
+                    pass
+        with limiter.admit(timeout=0.01):
+            pass
+
+    def test_requests_per_minute(self):
+        limiter = ProviderLimiter(requests_per_minute=6)
+        with limiter.admit(timeout=0):
+            pass
+        start = time.monotonic()
+        with self.assertRaises(RateLimitExceeded):
+            with limiter.admit(timeout=0.05):
+                pass
+        self.assertLess(time.monotonic() - start, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from unittest.mock import patch
+
+from config import Config
+from provider_registry import ProviderRegistry, clear_client_cache, client_count, get_openai_client
+
+
+class TestProviderRegistry(unittest.TestCase):
+
+    def setUp(self):
+        clear_client_cache()
+
+    @patch('provider_registry.OpenAI')
+    def test_clients_are_shared_per_endpoint_and_key(self, mock_openai):
+        a = get_openai_client('key-1', 'https://example.test/v1')
+        b = get_openai_client('key-1', 'https://example.test/v1')
+        c = get_openai_client('key-2', 'https://example.test/v1')
+        self.assertIs(a, b)
+        self.assertEqual(mock_openai.call_count, 2)
+        self.assertEqual(client_count(), 2)
+
+    @patch.object(Config, 'OPENAI_API_KEY', '')
+    @patch.object(Config, 'DEEPSEEK_API_KEY', 'test-key')
+    def test_availability_follows_config(self):
+        registry = ProviderRegistry()
+        self.assertIn('deepseek', registry)
+        self.assertNotIn('openai', registry)
+        self.assertIn('duckduckgo', registry.available())
+        with self.assertRaises(KeyError):
+            registry['openai']
+
+    @patch.object(Config, 'DEEPSEEK_API_KEY', 'test-key')
+    def test_providers_are_constructed_lazily_once(self):
+        registry = ProviderRegistry()
+        self.assertFalse(registry.is_loaded('deepseek'))
+        list(registry)
+        self.assertFalse(registry.is_loaded('deepseek'))
+
+        first = registry['deepseek']
+        self.assertTrue(registry.is_loaded('deepseek'))
+        self.assertIs(registry['deepseek'], first)
+        self.assertEqual(first.model, 'deepseek-chat')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+import web_app
+from base_provider import AIProvider
+from config import Config
+from request_options import InvalidOptions, parse_assignments, parse_options
+from tests.mock_backend import MockBackendTestCase
+
+
+class ListingProvider(AIProvider):
+
+    def __init__(self, models):
+        super().__init__(api_key='')
+        self.models = models
+        self.fetches = 0
+
+    def list_models(self):
+        self.fetches += 1
+        if isinstance(self.models, Exception):
+            raise self.models
+        return self.models
+
+    def generate_text(self, prompt, **kwargs):
+        return prompt
+
+    def chat(self, messages, **kwargs):
+        return messages[-1]['content']
+
+
+class TestParseOptions(unittest.TestCase):
+
+    def test_valid_options_are_normalized(self):
+        options = parse_options({'message': 'hi', 'model': ' gpt-4o-mini ', 'temperature': '0.2',
+                                 'max_tokens': 256.0, 'provider': None})
+        self.assertEqual(options, {'model': 'gpt-4o-mini', 'temperature': 0.2, 'max_tokens': 256})
+        self.assertEqual(parse_options({'model': '', 'temperature': None}), {})
+        self.assertEqual(parse_options(None), {})
+
+    def test_invalid_options_are_rejected(self):
+        for values in ({'temperature': 3}, {'temperature': 'warm'}, {'max_tokens': 0},
+                       {'max_tokens': 12.5}, {'max_tokens': True}, {'model': 42}, {'model': '  '}):
+            with self.assertRaises(InvalidOptions, msg=values):
+                parse_options(values)
+
+    def test_set_assignments(self):
+        self.assertEqual(parse_assignments('model=gpt-4 max-tokens=100 temperature='),
+                         {'model': 'gpt-4', 'max_tokens': '100', 'temperature': ''})
+        with self.assertRaises(InvalidOptions):
+            parse_assignments('top_p=0.9')
+
+
+class TestModelCache(unittest.TestCase):
+
+    def test_model_list_is_cached_until_it_expires(self):
+        provider = ListingProvider(['small', 'large'])
+        with patch.object(Config, 'MODELS_CACHE_TTL', 3600):
+            self.assertIsNone(provider.check_model('small'))
+            self.assertIn("model 'tiny' is not available", provider.check_model('tiny'))
+            self.assertEqual(provider.fetches, 1)
+
+        with patch.object(Config, 'MODELS_CACHE_TTL', 0):
+            provider.remember_models(['small'])
+            provider.models = ['small', 'tiny']
+            self.assertIsNone(provider.check_model('tiny'))
+            self.assertEqual(provider.fetches, 2)
+
+    def test_unknown_lists_allow_any_model(self):
+        self.assertIsNone(ListingProvider([]).check_model('anything'))
+        failing = ListingProvider(ConnectionError('offline'))
+        self.assertIsNone(failing.check_model('anything'))
+        self.assertIsNone(failing.check_model('anything'))
+        self.assertEqual(failing.fetches, 1)  # retried after MODELS_RETRY_SECONDS, not per request
+
+    def test_fetch_is_shared_and_does_not_hold_the_lock(self):
+        provider = ListingProvider(['small'])
+        started, release = threading.Event(), threading.Event()
+        fetch = provider.list_models
+
+        def slow_fetch():
+            started.set()
+            release.wait(2)
+            return fetch()
+
+        provider.list_models = slow_fetch
+        threads = [threading.Thread(target=provider.check_model, args=('small',)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        self.assertTrue(started.wait(1))
+        # Other callers (e.g. remember_models after a probe) are not stuck behind the fetch
+        self.assertTrue(provider._models_lock.acquire(timeout=0.5))
+        provider._models_lock.release()
+        release.set()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(provider.fetches, 1)
+
+
+class TestOptionsAgainstProviders(MockBackendTestCase):
+
+    def setUp(self):
+        self.start_server(latency_ms=0, jitter_ms=0, tokens=5)
+        self.bot = self.make_bot()
+        self.bot.set_provider('deepseek')
+
+    def test_unknown_model_fails_without_an_upstream_request(self):
+        reply = self.bot.chat('hello', model='deepseek-chatt')
+        self.assertIn("model 'deepseek-chatt' is not available", reply)
+        self.assertEqual(self.bot.conversation_history, [])
+        self.assertEqual(self.server.counters.get('requests', 0), 0)
+
+        reply = self.bot.chat('hello', model='gpt-4o-mini', max_tokens=3, temperature=0)
+        self.assertEqual(len(reply.split()), 3)
+        self.assertEqual(self.server.counters['requests'], 1)
+        self.assertIn('max_tokens 100000 exceeds', self.bot.generate_text('hi', max_tokens=100000))
+
+    def test_web_chat_validates_options(self):
+        client = web_app.app.test_client()
+        with patch.object(web_app, 'chatbot', self.bot), patch.object(web_app, 'scheduler', None):
+            bad_range = client.post('/api/chat', json={'message': 'hi', 'temperature': 5})
+            bad_model = client.post('/api/chat', json={'message': 'hi', 'model': 'nope'})
+            good = client.post('/api/chat', json={'message': 'hi', 'model': 'deepseek-chat', 'max_tokens': 2})
+            models = client.get('/api/models?provider=deepseek')
+
+        self.assertEqual(bad_range.status_code, 400)
+        self.assertIn('temperature', bad_range.get_json()['error'])
+        self.assertEqual(bad_model.status_code, 400)
+        self.assertEqual(good.status_code, 200)
+        self.assertEqual(len(good.get_json()['response'].split()), 2)
+        self.assertEqual(self.server.counters['requests'], 1)
+        self.assertIn('deepseek-chat', models.get_json()['models'])
+
+
+if __name__ == '__main__':
+    unittest.main()
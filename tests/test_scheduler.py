@@ -0,0 +1,137 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import web_app
+from scheduler import BACKGROUND, BATCH, INTERACTIVE, DeadlineExceeded, Overloaded, RequestScheduler
+
+
+def warm(scheduler, priority):
+    """Run quick requests so the service-time estimate admits short deadlines"""
+    for _ in range(30):
+        scheduler.acquire(priority).release()
+
+
+class TestRequestScheduler(unittest.TestCase):
+
+    def queue_waiters(self, scheduler, requests):
+        """Queue (priority, tenant) requests in order; each records its turn and releases at once"""
+        order, threads = [], []
+        for priority, tenant in requests:
+            def run(priority=priority, tenant=tenant):
+                with scheduler.slot(priority, tenant):
+                    order.append((priority, tenant))
+            thread = threading.Thread(target=run, daemon=True)
+            thread.start()
+            threads.append(thread)
+            queued = sum(scheduler.stats()[p]['queued'] for p in (INTERACTIVE, BATCH, BACKGROUND))
+            while queued < len(threads):
+                time.sleep(0.005)
+                queued = sum(scheduler.stats()[p]['queued'] for p in (INTERACTIVE, BATCH, BACKGROUND))
+        return order, threads
+
+    def test_reserved_slots_keep_interactive_unblocked(self):
+        scheduler = RequestScheduler(slots=4, interactive_reserve=1)
+        warm(scheduler, BACKGROUND)
+        held = [scheduler.acquire(BATCH, 'bulk') for _ in range(3)]
+        with self.assertRaises(DeadlineExceeded):
+            scheduler.acquire(BACKGROUND, 'bulk', deadline=time.monotonic() + 0.05)
+
+        start = time.monotonic()
+        scheduler.acquire(INTERACTIVE, 'user').release()
+        self.assertLess(time.monotonic() - start, 0.05)
+        for ticket in held:
+            ticket.release()
+
+    def test_higher_class_goes_first(self):
+        scheduler = RequestScheduler(slots=1, interactive_reserve=0)
+        held = scheduler.acquire(INTERACTIVE)
+        order, threads = self.queue_waiters(scheduler, [(BACKGROUND, 'a'), (BATCH, 'a'), (INTERACTIVE, 'a')])
+        held.release()
+        for thread in threads:
+            thread.join(1)
+        self.assertEqual([p for p, _ in order], [INTERACTIVE, BATCH, BACKGROUND])
+
+    def test_tenants_share_a_class_fairly(self):
+        scheduler = RequestScheduler(slots=1, interactive_reserve=0)
+        held = scheduler.acquire(BATCH)
+        order, threads = self.queue_waiters(scheduler, [(BATCH, 'bulk')] * 5 + [(BATCH, 'small')])
+        held.release()
+        for thread in threads:
+            thread.join(1)
+        # The small tenant's only request does not wait behind the whole backlog
+        self.assertLessEqual([t for _, t in order].index('small'), 1)
+
+    def test_hopeless_deadline_is_rejected_up_front(self):
+        scheduler = RequestScheduler(slots=1, interactive_reserve=0)
+        held = scheduler.acquire(INTERACTIVE)
+        # Nothing has finished yet, so the estimate assumes a second per request
+        with self.assertRaises(Overloaded):
+            scheduler.acquire(INTERACTIVE, deadline=time.monotonic() + 0.05)
+        held.release()
+        self.assertEqual(scheduler.stats()[INTERACTIVE]['queued'], 0)
+
+    def test_full_queue_is_rejected_with_retry_after(self):
+        scheduler = RequestScheduler(slots=1, interactive_reserve=0, queue_depth=1)
+        held = scheduler.acquire(INTERACTIVE)
+        order, threads = self.queue_waiters(scheduler, [(INTERACTIVE, 'a')])
+        with self.assertRaises(Overloaded) as raised:
+            scheduler.acquire(INTERACTIVE, 'b')
+        self.assertGreater(raised.exception.retry_after, 0)
+        held.release()
+        threads[0].join(1)
+        self.assertEqual(scheduler.stats()[INTERACTIVE]['rejected'], 1)
+
+    def test_expired_requests_are_dropped(self):
+        scheduler = RequestScheduler(slots=1, interactive_reserve=0)
+        warm(scheduler, INTERACTIVE)
+        held = scheduler.acquire(INTERACTIVE)
+        with self.assertRaises(DeadlineExceeded):
+            scheduler.acquire(INTERACTIVE, deadline=time.monotonic() + 0.05)
+        held.release()
+        self.assertEqual(scheduler.stats()[INTERACTIVE]['dropped'], 1)
+        self.assertEqual(scheduler.stats()[INTERACTIVE]['queued'], 0)
+
+
+class TestScheduledRoutes(unittest.TestCase):
+
+    def test_overload_returns_503_with_retry_after(self):
+        scheduler = RequestScheduler(slots=1, interactive_reserve=0, queue_depth=0)
+        with patch.object(web_app, 'scheduler', scheduler):
+            held = scheduler.acquire(INTERACTIVE)
+            response = web_app.app.test_client().post('/api/chat', json={'message': 'hi'})
+            held.release()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+
+    def test_priority_header_cannot_raise_priority(self):
+        scheduler = RequestScheduler(slots=2, interactive_reserve=1, queue_depth=0)
+        with patch.object(web_app, 'scheduler', scheduler):
+            held = scheduler.acquire(BACKGROUND)
+            # Media requests stay in the background class even when claiming to be interactive
+            response = web_app.app.test_client().post('/api/generate-image', json={'prompt': 'fox'},
+                                                      headers={'X-Priority': 'interactive'})
+            held.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.get_json()['priority'], BACKGROUND)
+
+    def test_only_configured_api_keys_become_tenants(self):
+        scheduler = RequestScheduler(slots=1, interactive_reserve=0, queue_depth=0,
+                                     tenant_weights={'team-key': 2})
+        client = web_app.app.test_client()
+        with patch.object(web_app, 'scheduler', scheduler), \
+                patch.object(scheduler, 'acquire', wraps=scheduler.acquire) as acquire:
+            held = scheduler.acquire(INTERACTIVE)
+            for key in ('team-key', 'made-up-key'):
+                client.post('/api/chat', json={'message': 'hi'}, headers={'X-API-Key': key})
+            client.post('/api/chat', json={'message': 'hi'})
+            held.release()
+
+        tenants = [call.args[1] for call in acquire.call_args_list[1:]]
+        self.assertEqual(tenants, ['team-key', '127.0.0.1', '127.0.0.1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
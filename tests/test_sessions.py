@@ -0,0 +1,98 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import shared_state
+import web_app
+from chatbot import UnifiedAIChatbot
+from config import Config
+from session_store import SessionStore
+
+
+class FakeBot:
+    """Stands in for one replica's process-wide chatbot"""
+
+    current_provider = 'fake'
+
+    def __init__(self, name, history=None):
+        self.name = name
+        self.conversation_history = list(history or [])
+
+    def fork(self, history=None, provider=None):
+        return FakeBot(self.name, history)
+
+    def oversized(self, provider, message, options):
+        return None
+
+    def chat(self, message, provider=None, cancel=None):
+        reply = f"{self.name} saw {len(self.conversation_history)} earlier messages"
+        self.conversation_history += [{'role': 'user', 'content': message}, {'role': 'assistant', 'content': reply}]
+        return reply
+
+
+class TestStatelessReplicas(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patches = [
+            patch.object(Config, 'SHARED_STATE_URL', f"sqlite:///{Path(directory.name) / 'state.sqlite3'}"),
+            patch.object(web_app, 'scheduler', None),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        shared_state.reset_state()
+        self.addCleanup(shared_state.reset_state)
+
+    def post_chat(self, replica, message, **headers):
+        with patch.object(web_app, 'chatbot', FakeBot(replica)):
+            return web_app.app.test_client().post('/api/chat', json={'message': message}, headers=headers)
+
+    def test_any_replica_continues_a_session(self):
+        first = self.post_chat('replica-a', 'hello', **{'X-Session-Id': 'session-one'})
+        second = self.post_chat('replica-b', 'again', **{'X-Session-Id': 'session-one'})
+        other = self.post_chat('replica-b', 'hi', **{'X-Session-Id': 'session-two'})
+
+        self.assertEqual(first.get_json()['response'], 'replica-a saw 0 earlier messages')
+        self.assertEqual(second.get_json()['response'], 'replica-b saw 2 earlier messages')
+        self.assertEqual(other.get_json()['response'], 'replica-b saw 0 earlier messages')
+
+    def test_browsers_get_a_session_cookie(self):
+        client = web_app.app.test_client()
+        with patch.object(web_app, 'chatbot', FakeBot('replica-a')):
+            client.post('/api/chat', json={'message': 'hello'})
+        cookie = client.get_cookie(web_app.SESSION_COOKIE)
+        self.assertIsNotNone(cookie)
+
+        with patch.object(web_app, 'chatbot', FakeBot('replica-b')):
+            reply = client.post('/api/chat', json={'message': 'again'}).get_json()['response']
+            history = client.get('/api/history').get_json()['messages']
+        self.assertEqual(reply, 'replica-b saw 2 earlier messages')
+        self.assertEqual(len(history), 4)
+
+
+class TestSessionStore(unittest.TestCase):
+
+    def test_local_sessions_trim_and_expire(self):
+        store = SessionStore(ttl=0.05, max_messages=3)
+        store.save('session-one', [{'n': i} for i in range(5)], 'openai')
+        self.assertEqual(store.load('session-one'), {'history': [{'n': 2}, {'n': 3}, {'n': 4}], 'provider': 'openai'})
+        time.sleep(0.1)
+        self.assertEqual(store.load('session-one'), {})
+
+    def test_fork_shares_providers_but_not_the_conversation(self):
+        bot = UnifiedAIChatbot()
+        fork = bot.fork([{'role': 'user', 'content': 'hi'}], provider='no-such-provider')
+        fork.conversation_history.append({'role': 'assistant', 'content': 'hello'})
+
+        self.assertIs(fork.providers, bot.providers)
+        self.assertEqual(fork.current_provider, bot.current_provider)
+        self.assertEqual(bot.conversation_history, [])
+        self.assertEqual(len(fork.conversation_history), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
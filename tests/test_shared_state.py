@@ -0,0 +1,90 @@
+import multiprocessing
+import tempfile
+import time
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from unittest.mock import patch
+
+import shared_state
+from config import Config
+from rate_limit import ProviderLimiter, RateLimitExceeded
+from shared_state import Counters, SQLiteState
+
+
+def take_tokens(path, attempts):
+    """Runs in a separate worker process"""
+    state = SQLiteState(path)
+    return sum(1 for _ in range(attempts) if state.take_token('rpm:test', 0.001, 10) == 0)
+
+
+class TestSQLiteState(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = str(Path(self.dir.name) / 'state.sqlite3')
+
+    def test_processes_share_one_bucket(self):
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(4, mp_context=context) as pool:
+            granted = sum(pool.map(take_tokens, [self.path] * 4, [10] * 4))
+        self.assertEqual(granted, 10)
+
+    def test_leases_cap_concurrency_and_expire(self):
+        worker_a, worker_b = SQLiteState(self.path), SQLiteState(self.path)
+        first = worker_a.acquire_lease('slots', 2, ttl=60)
+        self.assertIsNotNone(worker_b.acquire_lease('slots', 2, ttl=0.05))
+        self.assertIsNone(worker_a.acquire_lease('slots', 2, ttl=60))
+
+        time.sleep(0.1)  # the second holder "died" without releasing
+        self.assertIsNotNone(worker_a.acquire_lease('slots', 2, ttl=60))
+        worker_a.release_lease('slots', first)
+        self.assertIsNotNone(worker_b.acquire_lease('slots', 2, ttl=60))
+
+    def test_cache_entries_expire(self):
+        state = SQLiteState(self.path)
+        state.set('job', {'status': 'running'}, ttl=0.05)
+        state.set('forever', [1, 2])
+        self.assertEqual(SQLiteState(self.path).get('job'), {'status': 'running'})
+        time.sleep(0.1)
+        self.assertIsNone(state.get('job'))
+        self.assertEqual(state.get('forever'), [1, 2])
+
+
+class TestSharedWorkers(unittest.TestCase):
+    """Two limiters or counter sets on one store behave like two worker processes"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        url = f"sqlite:///{Path(directory.name) / 'state.sqlite3'}"
+        patcher = patch.object(Config, 'SHARED_STATE_URL', url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        shared_state.reset_state()
+        self.addCleanup(shared_state.reset_state)
+
+    def test_concurrency_limit_spans_workers(self):
+        state = shared_state.get_state()
+        worker_a = ProviderLimiter(max_concurrency=1, name='openai', state=state)
+        worker_b = ProviderLimiter(max_concurrency=1, name='openai', state=state)
+        with worker_a.admit(timeout=0):
+            with self.assertRaises(RateLimitExceeded):
+                with worker_b.admit(timeout=0.1):
+                    pass
+        with worker_b.admit(timeout=0):
+            pass
+
+    def test_counters_sum_across_workers(self):
+        worker_a, worker_b = Counters('metrics', flush_interval=60), Counters('metrics', flush_interval=60)
+        worker_a.add('requests', 2)
+        worker_b.update({'requests': 1, 'cost_usd': 0.25})
+        worker_b.flush()
+        # worker_a's increment is still buffered; its own snapshot flushes it first
+        self.assertEqual(worker_b.snapshot(), {'requests': 1, 'cost_usd': 0.25})
+        self.assertEqual(worker_a.snapshot(), {'requests': 3, 'cost_usd': 0.25})
+
+
+if __name__ == '__main__':
+    unittest.main()
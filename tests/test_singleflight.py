@@ -0,0 +1,118 @@
+import threading
+import time
+import unittest
+
+from singleflight import SingleFlight, request_key
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_request_key_is_stable(self):
+        a = request_key('openai', 'chat', [{'role': 'user', 'content': 'hi'}], temperature=0.5, model='x')
+        b = request_key('openai', 'chat', [{'role': 'user', 'content': 'hi'}], model='x', temperature=0.5)
+        c = request_key('openai', 'chat', [{'role': 'user', 'content': 'hi'}], model='y', temperature=0.5)
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+        started = threading.Event()
+
+        def upstream():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return "answer"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do('k', upstream))) for _ in range(5)]
+        threads[0].start()
+        started.wait()
+        for t in threads[1:]:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["answer"] * 5)
+        self.assertEqual(flight.stats['coalesced'], 4)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_error_is_shared(self):
+        flight = SingleFlight()
+
+        def upstream():
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            flight.do('k', upstream)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_stream_fans_out_to_every_waiter(self):
+        flight = SingleFlight()
+        calls = []
+        gate = threading.Event()
+
+        def upstream():
+            calls.append(1)
+            yield "a"
+            gate.wait()
+            yield "b"
+            yield "c"
+
+        first = flight.stream('k', upstream)
+        self.assertEqual(next(first), "a")
+        second = flight.stream('k', upstream)
+        gate.set()
+
+        self.assertEqual("a" + "".join(first), "abc")
+        self.assertEqual("".join(second), "abc")
+        self.assertEqual(len(calls), 1)
+
+    def test_stream_stops_upstream_when_every_subscriber_leaves(self):
+        flight = SingleFlight()
+        produced, closed = [], threading.Event()
+
+        def upstream():
+            try:
+                for i in range(100):
+                    produced.append(i)
+                    time.sleep(0.01)
+                    yield str(i)
+            finally:
+                closed.set()
+
+        stream = flight.stream('k', upstream)
+        next(stream)
+        stream.close()
+
+        self.assertTrue(closed.wait(1))
+        self.assertLess(len(produced), 100)
+        deadline = time.monotonic() + 1
+        while flight.in_flight() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_unread_subscription_releases_the_upstream(self):
+        flight = SingleFlight()
+        abandoned, gate = threading.Event(), threading.Event()
+
+        def upstream():
+            yield "a"
+            gate.wait(1)
+            yield "b"
+
+        first = flight.stream('k', upstream, on_abandon=abandoned.set)
+        second = flight.stream('k', upstream)
+        first.close()
+        self.assertFalse(abandoned.is_set())
+        # Dropped without ever being read
+        del second
+
+        self.assertTrue(abandoned.wait(1))
+        gate.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
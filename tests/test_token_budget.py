@@ -0,0 +1,120 @@
+import time
+import unittest
+from unittest.mock import patch
+
+import token_budget
+import web_app
+from tests.mock_backend import MockBackendTestCase
+from token_budget import ESTIMATE, Tokenizer, family_for, tokenizer_for
+
+LOG_LINE = "2024-05-01 12:00:00 ERROR worker-3 connection reset by peer while reading response\n"
+
+
+class TestTokenizer(unittest.TestCase):
+
+    def test_estimate_truncates_and_splits_within_budget(self):
+        tokenizer = Tokenizer(ESTIMATE)
+        text = LOG_LINE * 500
+        self.assertEqual(tokenizer.count(text), -(-len(text) // 3))
+        self.assertTrue(tokenizer.fits('short', 5))
+        self.assertFalse(tokenizer.fits(text, 1000))
+
+        truncated = tokenizer.truncate(text, 1000)
+        self.assertLessEqual(tokenizer.count(truncated), 1000)
+        self.assertTrue(truncated.startswith(LOG_LINE))
+        self.assertIn('tokens omitted', truncated)
+
+        chunks = tokenizer.split(text, 1000)
+        self.assertEqual(''.join(chunks), text)
+        self.assertTrue(all(tokenizer.count(chunk) <= 1000 for chunk in chunks))
+        self.assertTrue(all(chunk.endswith('\n') for chunk in chunks))
+
+    def test_tokenizers_are_cached_per_family(self):
+        self.assertIs(tokenizer_for('deepseek-chat'), tokenizer_for('grok-beta'))
+        with patch.object(token_budget, 'tiktoken', None):
+            self.assertEqual(family_for('gpt-4o-mini'), ESTIMATE)
+        if token_budget.tiktoken is not None:
+            self.assertEqual(family_for('gpt-4o-mini'), 'o200k_base')
+            self.assertEqual(family_for('openai/gpt-4'), 'cl100k_base')
+            self.assertIs(tokenizer_for('gpt-4'), tokenizer_for('gpt-3.5-turbo'))
+
+
+class TestInputPolicy(MockBackendTestCase):
+
+    def setUp(self):
+        self.start_server(latency_ms=20, jitter_ms=0, tokens=8)
+        self.bot = self.make_bot(SUMMARY_CONCURRENCY=4)
+        self.bot.set_provider('deepseek')
+        # deepseek-chat has a 65,536-token window, so this is several times too large
+        self.pasted = LOG_LINE * 6000
+
+    def test_oversized_message_is_rejected_locally(self):
+        start = time.perf_counter()
+        reply = self.bot.chat(self.pasted)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertRegex(reply, r"^Error: the message is [\d,]+ tokens but deepseek \(deepseek-chat\) has room for")
+        self.assertEqual(self.bot.conversation_history, [])
+        self.assertEqual(self.server.counters.get('requests', 0), 0)
+
+    def test_truncate_policy_sends_the_start_and_end(self):
+        self.bot.input_policy = 'truncate'
+        reply = self.bot.chat(self.pasted, max_tokens=500)
+        self.assertFalse(reply.startswith('Error'))
+        sent = self.bot.conversation_history[0]['content']
+        self.assertIn('tokens omitted', sent)
+        self.assertLess(len(sent), len(self.pasted))
+        self.assertEqual(self.server.counters['requests'], 1)
+
+    def test_summarize_policy_maps_chunks_concurrently(self):
+        self.server.settings.latency_ms = 300
+        prompts = []
+        generate_text = self.bot.generate_text
+
+        def record(prompt, *args, **kwargs):
+            prompts.append(prompt)
+            return generate_text(prompt, *args, **kwargs)
+
+        self.bot.input_policy = 'summarize'
+        start = time.perf_counter()
+        with patch.object(self.bot, 'generate_text', record):
+            reply = self.bot.chat(self.pasted)
+        elapsed = time.perf_counter() - start
+
+        self.assertFalse(reply.startswith('Error'))
+        self.assertTrue(self.bot.conversation_history[0]['content'].startswith('[The original message was'))
+        parts = [p for p in prompts if p.startswith('This is part')]
+        self.assertGreaterEqual(len(parts), 3)
+        self.assertTrue(prompts[-1].startswith('These are summaries'))
+        # The parts, one combining call and the turn itself; the parts overlap rather than queue
+        self.assertEqual(self.server.counters['requests'], len(parts) + 2)
+        self.assertLess(elapsed, 0.3 * (len(parts) + 2))
+
+
+class TestWebPayloadGuard(unittest.TestCase):
+
+    def test_large_bodies_and_messages_are_refused(self):
+        client = web_app.app.test_client()
+        with patch.dict(web_app.app.config, {'MAX_CONTENT_LENGTH': 1024}):
+            too_big = client.post('/api/chat', json={'message': 'x' * 2048})
+        self.assertEqual(too_big.status_code, 413)
+        self.assertIn('larger than', too_big.get_json()['error'])
+
+        class Bot:
+            current_provider = 'tiny'
+            providers = {'tiny': None}
+            input_policy = 'reject'
+
+            def fork(self, history=None, provider=None):
+                return self
+
+            def oversized(self, provider, message, options):
+                return token_budget.InputTooLarge('Error: the message is 9,000 tokens', 9000, 3000)
+
+        with patch.object(web_app, 'chatbot', Bot()), patch.object(web_app, 'scheduler', None):
+            rejected = client.post('/api/chat', json={'message': 'long'})
+        self.assertEqual(rejected.status_code, 413)
+        self.assertEqual(rejected.get_json()['budget'], 3000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import tracing
+from config import Config
+
+
+class TestTracing(unittest.TestCase):
+
+    def test_disabled_spans_are_noops(self):
+        with patch.object(Config, 'TRACING_ENABLED', False):
+            with tracing.span('anything') as current:
+                self.assertIsNone(current)
+                tracing.add_event('ignored')
+
+    def test_trace_is_exported_as_otlp_json(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            export_path = Path(tmp) / 'spans.jsonl'
+            with patch.object(Config, 'TRACING_ENABLED', True), \
+                    patch.object(Config, 'TRACE_EXPORT_PATH', export_path):
+                with tracing.span('root', route='/api/chat') as root:
+                    with tracing.span('child'):
+                        tracing.add_event('http.request_sent')
+                        tracing.add_event('http.response_headers')
+
+            lines = export_path.read_text().splitlines()
+
+        self.assertEqual(len(lines), 1)
+        spans = json.loads(lines[0])['resourceSpans'][0]['scopeSpans'][0]['spans']
+        by_name = {s['name']: s for s in spans}
+        self.assertEqual(by_name['child']['parentSpanId'], root.span_id)
+        self.assertEqual(by_name['child']['traceId'], root.trace_id)
+        child_keys = {a['key'] for a in by_name['child']['attributes']}
+        self.assertIn('stage.network_ms', child_keys)
+
+    def test_children_ending_after_the_root_are_exported(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            export_path = Path(tmp) / 'spans.jsonl'
+            with patch.object(Config, 'TRACING_ENABLED', True), \
+                    patch.object(Config, 'TRACE_EXPORT_PATH', export_path):
+                with tracing.span('root') as root:
+                    # e.g. a response body streamed after the request span ends
+                    late = tracing.Span('streamed body', parent=root)
+                late.end()
+
+            lines = [json.loads(line)['resourceSpans'][0]['scopeSpans'][0]['spans']
+                     for line in export_path.read_text().splitlines()]
+
+        self.assertEqual([[s['name'] for s in spans] for spans in lines], [['root'], ['streamed body']])
+        self.assertEqual(lines[1][0]['parentSpanId'], root.span_id)
+
+    def test_profiling_modes(self):
+        with patch.object(Config, 'PROFILING', 'off'):
+            self.assertFalse(tracing.profiling_requested(True))
+        with patch.object(Config, 'PROFILING', 'param'):
+            self.assertTrue(tracing.profiling_requested(True))
+            self.assertFalse(tracing.profiling_requested(False))
+        with patch.object(Config, 'PROFILING', 'always'):
+            self.assertTrue(tracing.profiling_requested(False))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import stat
+import sys
+import tempfile
+import textwrap
+import unittest
+from pathlib import Path
+
+from media_store import MediaStore
+from video_postprocess import TranscodeError, VideoPostProcessor
+
+# Stand-in for ffmpeg: writes each output file named on the command line
+FAKE_FFMPEG = textwrap.dedent(f"""\
+    #!{sys.executable}
+    import sys
+    from pathlib import Path
+    args = sys.argv[1:]
+    if 'broken' in args[args.index('-i') + 1]:
+        sys.stderr.write('Invalid data found when processing input\\n')
+        sys.exit(1)
+    if '-hls_segment_filename' in args:
+        out = Path(args[-1])
+        out.write_text('#EXTM3U\\n')
+        (out.parent / 'segment_000.ts').write_bytes(b'ts')
+    else:
+        for index, arg in enumerate(args):
+            if arg.endswith(('.mp4', '.jpg')) and args[index - 1] not in ('-i',):
+                Path(arg).write_bytes(b'encoded ' + arg.encode())
+""")
+
+
+class TestVideoPostProcessor(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.store = MediaStore(Path(self.root.name) / 'videos')
+        self.addCleanup(self.store.close)
+        self.ffmpeg = Path(self.root.name) / 'ffmpeg'
+        self.ffmpeg.write_text(FAKE_FFMPEG)
+        self.ffmpeg.chmod(self.ffmpeg.stat().st_mode | stat.S_IEXEC)
+
+    def test_transcode_stores_video_poster_and_hls(self):
+        processor = VideoPostProcessor(self.store, hls=True, ffmpeg=str(self.ffmpeg))
+        self.addCleanup(processor.shutdown)
+
+        result = processor.submit('https://example.invalid/out.mp4', 'waves', 'replicate').result(10)
+
+        self.assertTrue(Path(result['filepath']).is_file())
+        self.assertTrue(result['poster'].endswith('.jpg'))
+        self.assertTrue(Path(result['hls']).is_file())
+        self.assertEqual(self.store.info(result['filepath'])['prompt'], 'waves')
+        self.assertEqual(os.listdir(self.store.tmp_dir), [])
+
+    def test_command_is_web_friendly(self):
+        processor = VideoPostProcessor(self.store, ffmpeg='ffmpeg')
+        command = processor.command('in.mp4', Path('out.mp4'), Path('poster.jpg'))
+        self.assertIn('+faststart', command)
+        self.assertIn('libx264', command)
+        self.assertIn('yuv420p', command)
+
+    def test_failure_raises(self):
+        processor = VideoPostProcessor(self.store, ffmpeg=str(self.ffmpeg))
+        self.addCleanup(processor.shutdown)
+        with self.assertRaises(TranscodeError):
+            processor.process('broken.mp4')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+"""
+Local token counting and input budgets
+
+Before a message is sent, UnifiedAIChatbot counts its tokens here and checks
+them against the provider's context window, so an oversized paste fails (or
+is truncated or summarized, see INPUT_POLICY) in milliseconds instead of
+after an upstream round trip.
+
+Counting uses tiktoken when it is installed, with one cached encoder per
+model family (o200k_base for gpt-4o and the o-series, cl100k_base for gpt-4
+and gpt-3.5). Other vendors do not publish a tokenizer that matches their
+models, and without tiktoken nothing is exact, so those counts use a
+character estimate that errs high and budgets keep a safety margin.
+"""
+import functools
+import math
+from typing import Dict, List, Optional
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Model name prefixes and the tiktoken encoding their models use (most specific first)
+FAMILIES = (
+    ('gpt-4o', 'o200k_base'),
+    ('gpt-4.1', 'o200k_base'),
+    ('o1', 'o200k_base'),
+    ('o3', 'o200k_base'),
+    ('o4', 'o200k_base'),
+    ('gpt-4', 'cl100k_base'),
+    ('gpt-3.5', 'cl100k_base'),
+)
+ESTIMATE = 'estimate'
+# Conservative characters per token for the estimate (English averages about four)
+CHARS_PER_TOKEN = 3.0
+# Share of an estimated budget that is used, since the estimate may still be low for some text
+ESTIMATE_MARGIN = 0.9
+# Tokens each chat message adds for its role and separators
+MESSAGE_OVERHEAD = 4
+
+
+class InputTooLarge(ValueError):
+    """An input does not fit the provider's context window"""
+
+    def __init__(self, message: str, tokens: int, budget: int):
+        super().__init__(message)
+        self.tokens = tokens
+        self.budget = budget
+
+
+class Tokenizer:
+    """Counts, truncates and splits text in one model family's tokens"""
+
+    def __init__(self, family: str):
+        self.family = family
+        self.encoding = tiktoken.get_encoding(family) if family != ESTIMATE else None
+        # Conversation history is recounted every turn; each message only needs tokenizing once
+        self._count_cached = functools.lru_cache(maxsize=4096)(self.count)
+
+    @property
+    def exact(self) -> bool:
+        return self.encoding is not None
+
+    def _encode(self, text: str) -> List[int]:
+        # User text may contain special-token strings such as <|endoftext|>; count them as plain text
+        return self.encoding.encode(text, disallowed_special=())
+
+    def count(self, text: str) -> int:
+        """Number of tokens in `text`"""
+        if not text:
+            return 0
+        if self.encoding is None:
+            return math.ceil(len(text) / CHARS_PER_TOKEN)
+        return len(self._encode(text))
+
+    def count_messages(self, messages: List[Dict]) -> int:
+        """Number of tokens a list of chat messages takes up"""
+        return sum(self._count_cached(m['content']) + MESSAGE_OVERHEAD for m in messages)
+
+    def fits(self, text: str, budget: int) -> bool:
+        """Whether `text` is at most `budget` tokens, without tokenizing short text"""
+        # A token covers at least one UTF-8 byte, and the estimate gives fewer tokens than characters
+        return len(text) * 4 <= budget or self.count(text) <= budget
+
+    def budget(self, tokens: int) -> int:
+        """The usable part of a token budget, keeping a margin when counts are estimated"""
+        return tokens if self.exact else int(tokens * ESTIMATE_MARGIN)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Keep the start and the end of `text` within `max_tokens`, marking what was cut"""
+        total = self.count(text)
+        if total <= max_tokens:
+            return text
+        marker = "\n\n[... {:,} tokens omitted ...]\n\n"
+        keep = max(0, max_tokens - self.count(marker.format(total)))
+        head, tail = keep - keep // 2, keep // 2
+        if self.encoding is None:
+            head_chars, tail_chars = int(head * CHARS_PER_TOKEN), int(tail * CHARS_PER_TOKEN)
+            start, end = text[:head_chars], text[len(text) - tail_chars:] if tail_chars else ''
+        else:
+            tokens = self._encode(text)
+            start = self.encoding.decode(tokens[:head])
+            end = self.encoding.decode(tokens[len(tokens) - tail:]) if tail else ''
+        return start + marker.format(total - keep) + end
+
+    def split(self, text: str, max_tokens: int) -> List[str]:
+        """Cut `text` into consecutive chunks of at most `max_tokens` (estimated ones end at a line break if they can)"""
+        max_tokens = max(1, max_tokens)
+        if self.encoding is not None:
+            tokens = self._encode(text)
+            return [self.encoding.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens)]
+        width = max(1, int(max_tokens * CHARS_PER_TOKEN))
+        chunks, start = [], 0
+        while start < len(text):
+            end = min(len(text), start + width)
+            if end < len(text):
+                newline = text.rfind('\n', start + width // 2, end)
+                if newline != -1:
+                    end = newline + 1
+            chunks.append(text[start:end])
+            start = end
+        return chunks
+
+
+def family_for(model: Optional[str]) -> str:
+    """The tiktoken encoding for a model name, or ESTIMATE"""
+    if tiktoken is not None and model:
+        name = model.lower().rsplit('/', 1)[-1]
+        for prefix, encoding in FAMILIES:
+            if name.startswith(prefix):
+                return encoding
+    return ESTIMATE
+
+
+@functools.lru_cache(maxsize=None)
+def _tokenizer(family: str) -> Tokenizer:
+    return Tokenizer(family)
+
+
+def tokenizer_for(model: Optional[str]) -> Tokenizer:
+    """The cached tokenizer for a model's family (building an encoder takes a while, counting does not)"""
+    return _tokenizer(family_for(model))
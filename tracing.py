@@ -0,0 +1,293 @@
+"""
+Opt-in request tracing and sampling profiler
+
+Spans follow the OpenTelemetry data model and are exported locally as OTLP/JSON
+lines (one trace per line), which the OpenTelemetry Collector `otlpjsonfile`
+receiver and most trace viewers can ingest. When tracing is disabled every
+helper here is a cheap no-op.
+
+The sampling profiler records folded stacks (`frame;frame;frame count`) for a
+single request thread, ready for flamegraph.pl or speedscope.
+"""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from config import Config
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+_export_lock = threading.Lock()
+
+
+class _Trace:
+    """
+    Finished spans of one trace, exported together when the root span ends
+
+    Children can outlive the root (a streamed response body read after the
+    request hook, fan-out calls still finishing after a quorum); those are
+    exported on their own as they end instead of being dropped.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans: List['Span'] = []
+        self.exported = False
+
+    def finish(self, span: 'Span'):
+        with self.lock:
+            if self.exported:
+                batch = [span]
+            else:
+                self.spans.append(span)
+                if span.parent is not None:
+                    return
+                batch, self.spans, self.exported = self.spans, [], True
+        export(batch)
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    def __init__(self, name: str, parent: Optional['Span'] = None, attributes: Optional[Dict] = None):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.attributes = dict(attributes or {})
+        self.events: List[Dict] = []
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+        # Finished spans of the whole trace are collected until the root ends
+        self.trace = _Trace() if parent is None else parent.trace
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def add_event(self, name: str, **attributes):
+        self.events.append({'name': name, 'time_ns': time.time_ns(), 'attributes': attributes})
+
+    def end(self):
+        self.end_ns = time.time_ns()
+        self._derive_stages()
+        self.trace.finish(self)
+
+    def _derive_stages(self):
+        """Split an HTTP-backed span into prepare/network/response stage timings"""
+        marks = {e['name']: e['time_ns'] for e in self.events}
+        sent = marks.get('http.request_sent')
+        headers = marks.get('http.response_headers')
+        if sent is None or headers is None:
+            return
+        self.attributes['stage.prepare_ms'] = round((sent - self.start_ns) / 1e6, 3)
+        self.attributes['stage.network_ms'] = round((headers - sent) / 1e6, 3)
+        self.attributes['stage.response_ms'] = round((self.end_ns - headers) / 1e6, 3)
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns or time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Record a span around a block of code
+
+    Args:
+        name: Span name, e.g. 'chatbot.chat' or 'openai.request'
+        **attributes: Span attributes
+
+    Yields:
+        The active Span, or None when tracing is disabled
+    """
+    if not Config.TRACING_ENABLED:
+        yield None
+        return
+
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _reset(token)
+        current.end()
+
+
+def _reset(token):
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # Generators closed from another context cannot restore the previous span
+        pass
+
+
+def start_span(name: str, **attributes):
+    """
+    Start a span that outlives a single block (e.g. across Flask request hooks)
+
+    Returns:
+        (span, token) to pass to finish_span, or (None, None) when disabled
+    """
+    if not Config.TRACING_ENABLED:
+        return None, None
+    current = Span(name, _current_span.get(), attributes)
+    return current, _current_span.set(current)
+
+
+def finish_span(current: Optional[Span], token, error: Optional[BaseException] = None):
+    """End a span started with start_span"""
+    if current is None:
+        return
+    if error is not None:
+        current.error = f"{type(error).__name__}: {error}"
+    _reset(token)
+    current.end()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def add_event(name: str, **attributes):
+    """Attach a timestamped event to the active span, if any"""
+    active = _current_span.get()
+    if active is not None:
+        active.add_event(name, **attributes)
+
+
+def set_attribute(key: str, value):
+    """Set an attribute on the active span, if any"""
+    active = _current_span.get()
+    if active is not None:
+        active.set_attribute(key, value)
+
+
+def http_event_hooks() -> Optional[Dict]:
+    """
+    httpx event hooks that mark request-sent and response-headers events on
+    the active span, or None when tracing is off
+
+    These events split a provider call into SDK serialization, network wait
+    and response handling.
+    """
+    if not Config.TRACING_ENABLED:
+        return None
+    return {
+        'request': [lambda request: add_event('http.request_sent', url=str(request.url))],
+        'response': [lambda response: add_event('http.response_headers', status=response.status_code)],
+    }
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes: Dict) -> List[Dict]:
+    return [{'key': k, 'value': _otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+
+def to_otlp(spans: List[Span]) -> Dict:
+    """Convert finished spans into an OTLP/JSON ExportTraceServiceRequest"""
+    return {'resourceSpans': [{
+        'resource': {'attributes': _otlp_attributes({'service.name': Config.TRACE_SERVICE_NAME})},
+        'scopeSpans': [{
+            'scope': {'name': 'pilothub.tracing'},
+            'spans': [{
+                'traceId': s.trace_id,
+                'spanId': s.span_id,
+                'parentSpanId': s.parent.span_id if s.parent else '',
+                'name': s.name,
+                'kind': 1,
+                'startTimeUnixNano': str(s.start_ns),
+                'endTimeUnixNano': str(s.end_ns),
+                'attributes': _otlp_attributes(s.attributes),
+                'events': [{
+                    'timeUnixNano': str(e['time_ns']),
+                    'name': e['name'],
+                    'attributes': _otlp_attributes(e['attributes']),
+                } for e in s.events],
+                'status': {'code': 2, 'message': s.error} if s.error else {'code': 1},
+            } for s in spans],
+        }],
+    }]}
+
+
+def export(spans: List[Span]):
+    """Append a finished trace to the local OTLP/JSON export file"""
+    path = Path(Config.TRACE_EXPORT_PATH)
+    line = json.dumps(to_otlp(spans))
+    try:
+        with _export_lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+    except OSError as e:
+        print(f"Warning: could not export trace: {e}", file=sys.stderr)
+
+
+class SamplingProfiler:
+    """Periodically samples one thread's stack and aggregates folded stacks"""
+
+    def __init__(self, thread_id: Optional[int] = None, interval_ms: Optional[float] = None):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = (interval_ms or Config.PROFILE_INTERVAL_MS) / 1000.0
+        self.stacks: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'SamplingProfiler':
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ';'.join(reversed(names))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def dump(self, name: str) -> Optional[str]:
+        """Write folded stacks to PROFILE_OUTPUT_DIR and return the file path"""
+        if not self.stacks:
+            return None
+        directory = Path(Config.PROFILE_OUTPUT_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        filepath = directory / f"{time.strftime('%Y%m%d_%H%M%S')}_{name}.folded"
+        with open(filepath, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+        return str(filepath)
+
+
+def profiling_requested(query_flag: bool = False) -> bool:
+    """Whether a request should be profiled under the PROFILING setting"""
+    mode = Config.PROFILING
+    return mode == 'always' or (mode == 'param' and query_flag)
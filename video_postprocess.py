@@ -0,0 +1,129 @@
+"""
+Video post-processing with ffmpeg
+
+Generated videos arrive in whatever container and codec the model produced.
+VideoPostProcessor re-encodes them to H.264/AAC MP4 with the moov atom at the
+front (faststart), so browsers start playing while the file is still
+downloading, and grabs a poster frame in the same pass. HLS segments can be
+cut from the result as well. ffmpeg reads the source URL directly, so the
+download streams into the encoder instead of being fetched first.
+
+Each transcode is a separate ffmpeg process; a fixed number of workers caps
+how many run at once, so CPU-heavy encodes never occupy request threads.
+"""
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import tracing
+
+
+class TranscodeError(Exception):
+    """Raised when ffmpeg fails"""
+
+
+class VideoPostProcessor:
+    """Bounded pool of ffmpeg transcodes that write into a media store"""
+
+    def __init__(self, store, workers: int = 2, hls: bool = False, threads_per_job: int = 2,
+                 timeout: float = 600.0, ffmpeg: Optional[str] = None):
+        """
+        Args:
+            store: MediaStore receiving the outputs
+            workers: Maximum concurrent ffmpeg processes
+            hls: Also produce HLS segments
+            threads_per_job: Encoder threads per ffmpeg process
+            timeout: Seconds before a transcode is killed
+            ffmpeg: ffmpeg executable (defaults to the one on PATH)
+        """
+        self.store = store
+        self.hls = hls
+        self.threads_per_job = threads_per_job
+        self.timeout = timeout
+        self.ffmpeg = ffmpeg or shutil.which('ffmpeg')
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='transcode')
+
+    @property
+    def available(self) -> bool:
+        return self.ffmpeg is not None
+
+    def submit(self, source: str, prompt: str = '', provider: str = '',
+               on_done: Optional[Callable[[Future], None]] = None) -> Future:
+        """Queue a transcode; the future resolves to the dict returned by process()"""
+        future = self._pool.submit(self.process, source, prompt, provider)
+        if on_done is not None:
+            future.add_done_callback(on_done)
+        return future
+
+    def command(self, source: str, output: Path, poster: Path) -> List[str]:
+        """ffmpeg arguments for the MP4 and poster outputs"""
+        return [
+            self.ffmpeg, '-nostdin', '-y', '-loglevel', 'error',
+            # The source URL comes from the upstream API; only allow plain file and web protocols
+            '-protocol_whitelist', 'file,http,https,tcp,tls', '-i', source,
+            # Web-friendly MP4: H.264 yuv420p, AAC if there is audio, moov atom first
+            '-map', '0:v:0', '-map', '0:a:0?',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-pix_fmt', 'yuv420p',
+            '-threads', str(self.threads_per_job),
+            '-c:a', 'aac', '-b:a', '128k',
+            '-movflags', '+faststart',
+            str(output),
+            # Poster from the same decode
+            '-map', '0:v:0', '-frames:v', '1', '-q:v', '3', str(poster),
+        ]
+
+    def hls_command(self, source: Path, directory: Path) -> List[str]:
+        """ffmpeg arguments to cut an already-encoded MP4 into HLS segments without re-encoding"""
+        return [
+            self.ffmpeg, '-nostdin', '-y', '-loglevel', 'error', '-i', str(source),
+            '-c', 'copy', '-f', 'hls', '-hls_time', '2', '-hls_playlist_type', 'vod',
+            '-hls_segment_filename', str(directory / 'segment_%03d.ts'),
+            str(directory / 'index.m3u8'),
+        ]
+
+    def process(self, source: str, prompt: str = '', provider: str = '') -> Dict[str, str]:
+        """
+        Transcode a video (URL or path) and store the results
+
+        Returns:
+            {'filepath', 'poster'} and, with HLS enabled, 'hls' (the playlist path)
+        """
+        if not self.available:
+            raise TranscodeError("ffmpeg not found. Install it or disable VIDEO_TRANSCODE")
+        with tracing.span('video.transcode', hls=self.hls):
+            work = Path(tempfile.mkdtemp(dir=self.store.tmp_dir))
+            try:
+                output, poster = work / 'video.mp4', work / 'poster.jpg'
+                self._run(self.command(str(source), output, poster))
+                tracing.add_event('video.encoded')
+
+                hls_dir = None
+                if self.hls:
+                    hls_dir = work / 'hls'
+                    hls_dir.mkdir()
+                    self._run(self.hls_command(output, hls_dir))
+
+                filepath = self.store.put_file(output, prompt, provider)
+                result = {'filepath': str(filepath)}
+                if poster.exists():
+                    result['poster'] = str(self.store.put_file(poster, prompt, provider))
+                if hls_dir is not None:
+                    result['hls'] = str(self.store.attach(filepath, hls_dir) / 'index.m3u8')
+                return result
+            finally:
+                shutil.rmtree(work, ignore_errors=True)
+
+    def _run(self, args: List[str]):
+        try:
+            completed = subprocess.run(args, capture_output=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            raise TranscodeError(f"ffmpeg timed out after {self.timeout:.0f}s")
+        if completed.returncode != 0:
+            message = completed.stderr.decode('utf-8', 'replace').strip().splitlines()
+            raise TranscodeError(f"ffmpeg failed: {message[-1] if message else completed.returncode}")
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
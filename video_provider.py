@@ -2,89 +2,191 @@
 Video Generation Provider using Replicate
 """
 import os
-import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from datetime import datetime
+from typing import Optional
 try:
     import replicate
 except ImportError:
     replicate = None
 
-from base_provider import VideoGenerator
+from base_provider import VideoGenerator, VideoJob
+from media_store import get_store
+from prediction_poller import PredictionPoller
+from video_postprocess import VideoPostProcessor
+import tracing
 
 
 class ReplicateVideoGenerator(VideoGenerator):
     """Video generator using Replicate API"""
     
-    def __init__(self, api_key: str, output_dir: Path):
+    DEFAULT_MODEL = 'anotherjesse/zeroscope-v2-xl:9f747673945c62801b13b84701c783929c0ee784e4748ec062204894dda1a351'
+    
+    def __init__(self, api_key: str, output_dir: Path, quota_mb: int = 0, webhook_url: str = '',
+                 poll_workers: int = 4, max_poll_interval: float = 30.0, timeout: float = 900.0,
+                 max_age: float = 3600.0, download_workers: int = 4,
+                 postprocessor: Optional[VideoPostProcessor] = None):
         super().__init__(api_key)
         if replicate is None:
             raise ImportError("Replicate library not installed. Install with: pip install replicate")
         
         os.environ["REPLICATE_API_TOKEN"] = api_key
         self.output_dir = output_dir
-        self.output_dir.mkdir(exist_ok=True)
+        self.store = get_store(output_dir, quota_mb)
+        self.webhook_url = webhook_url
+        self.timeout = timeout
+        # One poller tracks every prediction. Predictions still running after max_age are cancelled,
+        # even for jobs nobody waits on
+        self.poller = PredictionPoller(replicate.predictions.get, workers=poll_workers,
+                                       max_interval=max_poll_interval, max_age=max_age,
+                                       on_expire=self._cancel_prediction)
+        # Finished videos are streamed into the store on threads of their own, so a few large
+        # downloads never hold up status checks for the other predictions
+        self._downloads = ThreadPoolExecutor(max_workers=max(1, download_workers),
+                                             thread_name_prefix='video-download')
+        self.session = requests.Session()
+        self.postprocessor = postprocessor if postprocessor is not None and postprocessor.available else None
     
     def generate_video(self, prompt: str, **kwargs) -> str:
         """Generate a video using Replicate's text-to-video models"""
-        try:
-            # Using a text-to-video model (e.g., zeroscope or similar)
-            model = kwargs.get('model', 'anotherjesse/zeroscope-v2-xl:9f747673945c62801b13b84701c783929c0ee784e4748ec062204894dda1a351')
-            
-            output = replicate.run(
-                model,
-                input={
+        job = self.submit_video(prompt, **kwargs)
+        if not job.wait(self.timeout):
+            error = f"Error generating video: timed out after {self.timeout:.0f}s (job {job.id})"
+            # Stop paying for a prediction nobody will collect (one already downloading is left to finish)
+            job.cancel(error)
+            return error
+        return job.result()
+    
+    def submit_video(self, prompt: str, **kwargs) -> VideoJob:
+        """
+        Create a prediction and return immediately
+        
+        Args:
+            prompt: Description of the video
+            **kwargs: model, num_frames and fps
+        
+        Returns:
+            A VideoJob that finishes once the video is in the media store
+        """
+        # Using a text-to-video model (e.g., zeroscope or similar)
+        model = kwargs.get('model', self.DEFAULT_MODEL)
+        with tracing.span('provider.submit_video', provider=type(self).__name__, model=model):
+            options = {
+                'version': model.split(':', 1)[-1],
+                'input': {
                     "prompt": prompt,
                     "num_frames": kwargs.get('num_frames', 24),
                     "fps": kwargs.get('fps', 8),
-                }
-            )
-            
-            # Download the video
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"video_{timestamp}.mp4"
-            filepath = self.output_dir / filename
-            
-            # Output might be a URL or file
-            if isinstance(output, str):
-                video_url = output
-            elif hasattr(output, 'url'):
-                video_url = output.url
-            else:
-                # If output is an iterator, get the first item
-                video_url = next(iter(output)) if hasattr(output, '__iter__') else str(output)
-            
-            response = requests.get(video_url)
-            
-            with open(filepath, 'wb') as f:
-                f.write(response.content)
+                },
+            }
+            if self.webhook_url:
+                options['webhook'] = self.webhook_url
+                options['webhook_events_filter'] = ['completed']
+            try:
+                prediction = replicate.predictions.create(**options)
+            except Exception as e:
+                tracing.set_attribute('error', str(e))
+                job = VideoJob(prompt)
+                job.finish(error=f"Error generating video: {str(e)}")
+                return job
             
-            return str(filepath)
+            job = VideoJob(prompt, prediction.id, canceller=lambda: self._cancel(prediction.id))
+            job.status = prediction.status or 'starting'
+            self.poller.track(prediction.id, lambda finished: self._finish(job, finished))
+            return job
+    
+    def _cancel(self, prediction_id: str) -> bool:
+        """Stop polling a prediction and cancel it upstream; False if it has already finished"""
+        if not self.poller.untrack(prediction_id):
+            return False
+        self._cancel_prediction(prediction_id)
+        return True
+    
+    def _cancel_prediction(self, prediction_id: str):
+        """Cancel a prediction on Replicate (best effort; it may have just finished)"""
+        with tracing.span('provider.cancel_video', provider=type(self).__name__, id=prediction_id):
+            try:
+                replicate.predictions.cancel(prediction_id)
+            except Exception as e:
+                tracing.set_attribute('error', str(e))
+    
+    def poke(self, prediction_id: str) -> bool:
+        """Check a prediction now instead of at its next poll (called from the webhook receiver)"""
+        return self.poller.poke(prediction_id)
+    
+    def _finish(self, job: VideoJob, prediction):
+        """Stream a finished prediction's output into the media store"""
+        with tracing.span('provider.download_video', provider=type(self).__name__, id=job.id):
+            try:
+                if prediction.status != 'succeeded':
+                    job.finish(error=f"Error generating video: prediction {prediction.status}"
+                                     f"{': ' + str(prediction.error) if prediction.error else ''}")
+                    return
+                
+                video_url = self._output_url(prediction.output)
+                if self.postprocessor is not None:
+                    # ffmpeg streams the download itself; the job finishes when the transcode does
+                    job.status = 'processing'
+                    self.postprocessor.submit(video_url, job.prompt, 'replicate',
+                                              on_done=lambda future: self._transcoded(job, video_url, future))
+                    return
+                job.status = 'downloading'
+                self._downloads.submit(self._download, job, video_url)
+            except Exception as e:
+                tracing.set_attribute('error', str(e))
+                job.finish(error=f"Error generating video: {str(e)}")
+    
+    def _transcoded(self, job: VideoJob, video_url: str, future):
+        try:
+            result = future.result()
         except Exception as e:
-            return f"Error generating video: {str(e)}"
+            # Keep the original rather than losing the video
+            with tracing.span('provider.transcode_failed', id=job.id, error=str(e)):
+                self._download(job, video_url)
+            return
+        job.assets = {k: v for k, v in result.items() if k != 'filepath'}
+        job.finish(filepath=result['filepath'])
+    
+    def _download(self, job: VideoJob, video_url: str):
+        """Stream the model's output file into the media store unchanged"""
+        with tracing.span('provider.download', url=video_url):
+            try:
+                with self.session.get(video_url, stream=True, timeout=300) as response:
+                    response.raise_for_status()
+                    filepath = self.store.put_stream(response.iter_content(1024 * 1024), '.mp4',
+                                                     job.prompt, 'replicate')
+                job.finish(filepath=str(filepath))
+            except Exception as e:
+                tracing.set_attribute('error', str(e))
+                job.finish(error=f"Error generating video: {str(e)}")
+    
+    @staticmethod
+    def _output_url(output) -> str:
+        # Output might be a URL or file
+        if isinstance(output, str):
+            return output
+        if hasattr(output, 'url'):
+            return output.url
+        # If output is a list, use the first item
+        first = next(iter(output)) if hasattr(output, '__iter__') else output
+        return first if isinstance(first, str) else getattr(first, 'url', str(first))
 
 
 class SimpleVideoGenerator(VideoGenerator):
     """Simplified video generator for demonstration"""
     
-    def __init__(self, api_key: str, output_dir: Path):
+    def __init__(self, api_key: str, output_dir: Path, quota_mb: int = 0):
         super().__init__(api_key)
         self.output_dir = output_dir
-        self.output_dir.mkdir(exist_ok=True)
+        self.store = get_store(output_dir, quota_mb)
     
     def generate_video(self, prompt: str, **kwargs) -> str:
         """Generate a placeholder for video generation"""
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"video_placeholder_{timestamp}.txt"
-            filepath = self.output_dir / filename
-            
-            with open(filepath, 'w') as f:
-                f.write(f"Video generation requested with prompt:\n{prompt}\n\n")
-                f.write("Note: To enable actual video generation, set up Replicate API token.\n")
-                f.write("Video generation requires additional setup and API access.\n")
-            
-            return str(filepath)
+            text = (f"Video generation requested with prompt:\n{prompt}\n\n"
+                    "Note: To enable actual video generation, set up Replicate API token.\n"
+                    "Video generation requires additional setup and API access.\n")
+            return str(self.store.put_bytes(text.encode('utf-8'), '.txt', prompt, 'simple'))
         except Exception as e:
             return f"Error creating video placeholder: {str(e)}"
@@ -2,17 +2,60 @@
 """
 Web Interface for the Unified AI Chatbot
 """
-from flask import Flask, render_template, request, jsonify, send_from_directory
+from flask import (Flask, Response, render_template, request, jsonify, send_from_directory, g, make_response,
+                   stream_with_context)
 from pathlib import Path
+from werkzeug.middleware.proxy_fix import ProxyFix
+import functools
 import os
+import select
+import socket
+import threading
+import time
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
 
+from cancellation import CancelToken
+from chat_socket import ChatSocketSession
 from chatbot import UnifiedAIChatbot
 from config import Config
+from fast_json import FastJSONProvider, dumps_bytes
+from http_compression import available_encodings, compress_response
+from media_store import get_store
+from request_options import InvalidOptions, parse_options
+from session_store import SessionStore, new_session_id, valid_session_id
+from scheduler import (PRIORITIES, DeadlineExceeded, Overloaded, RequestScheduler, parse_pairs,
+                       retry_after_header)
+import tracing
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+# Oversized bodies are refused from their Content-Length, before anything is read or tokenized
+app.config['MAX_CONTENT_LENGTH'] = Config.MAX_REQUEST_BYTES or None
+if Config.PROXY_HOPS:
+    # Behind a load balancer: take the client address from X-Forwarded-For (used for scheduler tenants)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=Config.PROXY_HOPS, x_proto=Config.PROXY_HOPS)
+# WebSocket endpoint (/ws) when flask-sock is installed; the page falls back to the REST API otherwise
+sock = Sock(app) if Sock is not None else None
+
+# Admission and priority scheduling for requests that call providers (see scheduler.py)
+scheduler = RequestScheduler(
+    Config.SCHEDULER_SLOTS, Config.SCHEDULER_INTERACTIVE_RESERVE, Config.SCHEDULER_QUEUE_DEPTH,
+    parse_pairs(Config.SCHEDULER_TENANT_WEIGHTS)
+) if Config.SCHEDULER_ENABLED else None
+DEADLINES = parse_pairs(Config.SCHEDULER_DEADLINES)
+ENCODINGS = [e.strip() for e in Config.COMPRESSION_ENCODINGS.split(',') if e.strip() in available_encodings()]
+
+# Conversations per browser or API client, in the shared store when configured, so any
+# replica can serve any request (see session_store.py)
+sessions = SessionStore(Config.SESSION_TTL, Config.SESSION_MAX_MESSAGES)
+SESSION_COOKIE = 'session_id'
 
 # Initialize chatbot globally (will be set in main)
 chatbot = None
+STARTED_AT = time.time()
 
 
 def get_chatbot():
@@ -23,87 +66,407 @@ def get_chatbot():
     return chatbot
 
 
+def session_id() -> str:
+    """This request's session id (X-Session-Id header or cookie); a new one is issued if missing"""
+    if 'session_id' not in g:
+        sid = request.headers.get('X-Session-Id') or request.cookies.get(SESSION_COOKIE)
+        if not valid_session_id(sid):
+            sid = new_session_id()
+            g.new_session = True
+        g.session_id = sid
+    return g.session_id
+
+
+def session_bot():
+    """The chatbot for this request's session: its own conversation, shared providers"""
+    data = sessions.load(session_id())
+    return get_chatbot().fork(data.get('history'), data.get('provider'))
+
+
+def save_session(sid: str, bot):
+    sessions.save(sid, bot.conversation_history, bot.current_provider)
+
+
+@app.before_request
+def start_request_trace():
+    """Open the root span and, if requested, start the sampling profiler"""
+    g.trace_span, g.trace_token = tracing.start_span(
+        'http.request', **{'http.method': request.method, 'http.route': request.path}
+    )
+    g.profiler = None
+    if tracing.profiling_requested(request.args.get('profile') == '1'):
+        g.profiler = tracing.SamplingProfiler().start()
+
+
+@app.after_request
+def add_trace_headers(response):
+    """Expose the trace id so a slow request can be looked up in the export"""
+    trace_span = g.get('trace_span')
+    if trace_span is not None:
+        trace_span.set_attribute('http.status_code', response.status_code)
+        response.headers['X-Trace-Id'] = trace_span.trace_id
+    return response
+
+
+@app.after_request
+def issue_session_cookie(response):
+    """Give a browser without a session its new session id"""
+    if g.get('new_session'):
+        response.set_cookie(SESSION_COOKIE, g.session_id, max_age=int(Config.SESSION_TTL),
+                            httponly=True, samesite='Lax')
+    return response
+
+
+@app.after_request
+def compress(response):
+    """Compress text and JSON bodies for clients that accept it; streams are flushed per chunk"""
+    if not Config.COMPRESSION_ENABLED or not ENCODINGS:
+        return response
+    with tracing.span('web.compress'):
+        return compress_response(response, request.headers.get('Accept-Encoding', ''),
+                                 Config.COMPRESSION_MIN_BYTES, ENCODINGS)
+
+
+@app.teardown_request
+def finish_request_trace(error=None):
+    """Close the root span and dump profiler samples to disk"""
+    watcher = g.pop('disconnect_watcher', None)
+    if watcher is not None:
+        watcher.set()
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        trace_span = g.get('trace_span')
+        name = (request.endpoint or 'request') + (f"_{trace_span.trace_id[:8]}" if trace_span else '')
+        path = profiler.dump(name)
+        if path:
+            app.logger.info("Profile written to %s", path)
+    tracing.finish_span(g.pop('trace_span', None), g.pop('trace_token', None), error)
+
+
+def _tenant() -> str:
+    """
+    The client's scheduler tenant: its `X-API-Key` if that key is configured
+    in SCHEDULER_TENANT_WEIGHTS, else its address
+
+    Any other key is ignored, since a client minting a fresh key per request
+    would otherwise get a fair share of its own for each one.
+    """
+    key = request.headers.get('X-API-Key')
+    if key and key in scheduler.tenant_weights:
+        return key
+    return request.remote_addr or ''
+
+
+def scheduled(priority: str):
+    """
+    Run the view in a scheduler slot of the given priority class
+    
+    Clients may lower their priority with an `X-Priority` header (e.g. batch
+    jobs calling /api/chat) but not raise it, set a deadline in milliseconds
+    with `X-Deadline-Ms`, and are accounted by a configured `X-API-Key` or their address.
+    Overload is answered with 503 and Retry-After.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if scheduler is None:
+                return view(*args, **kwargs)
+            requested = request.headers.get('X-Priority', priority)
+            if requested not in PRIORITIES:
+                return jsonify({'error': f"X-Priority must be one of {', '.join(PRIORITIES)}"}), 400
+            effective = max(requested, priority, key=PRIORITIES.index)
+            try:
+                budget = float(request.headers.get('X-Deadline-Ms', 0)) / 1000 or DEADLINES.get(effective)
+            except ValueError:
+                return jsonify({'error': 'X-Deadline-Ms must be a number'}), 400
+            try:
+                ticket = scheduler.acquire(effective, _tenant(), time.monotonic() + budget if budget else None)
+            except (Overloaded, DeadlineExceeded) as e:
+                retry_after = e.retry_after if isinstance(e, Overloaded) else 1
+                response = jsonify({'error': f"Server busy: {e}", 'priority': effective})
+                response.headers['Retry-After'] = retry_after_header(retry_after)
+                return response, 503
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                ticket.release()
+                raise
+            if response.is_streamed:
+                # Streaming bodies are produced after the view returns; hold the slot until they finish
+                response.call_on_close(ticket.release)
+            else:
+                ticket.release()
+            return response
+        return wrapper
+    return decorator
+
+
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({'error': f"Request body larger than {Config.MAX_REQUEST_BYTES:,} bytes"}), 413
+
+
 @app.route('/')
 def index():
     """Serve the main page"""
+    # Issue the session cookie before the page opens its WebSocket
+    session_id()
     return render_template('index.html')
 
 
 @app.route('/api/status', methods=['GET'])
 def get_status():
     """Get chatbot status"""
-    return jsonify(get_chatbot().get_status())
+    status = session_bot().get_status()
+    if scheduler is not None:
+        status['scheduler'] = scheduler.stats()
+    status['health'] = get_chatbot().health.snapshot()
+    return jsonify(status)
+
+
+@app.route('/livez', methods=['GET'])
+def liveness():
+    """The process is up and answering; provider health deliberately plays no part"""
+    return jsonify({'alive': True, 'uptime_s': round(time.time() - STARTED_AT, 1)})
+
+
+@app.route('/readyz', methods=['GET'])
+def readiness():
+    """Whether to route traffic here: warmed up and a healthy provider (503 when not)"""
+    if chatbot is None:
+        return jsonify({'ready': False, 'reasons': ['starting'], 'providers': {}}), 503
+    ready, reasons = chatbot.health.ready()
+    return jsonify({'ready': ready, 'reasons': reasons, 'providers': chatbot.health.snapshot()}), \
+        200 if ready else 503
 
 
 @app.route('/api/providers', methods=['GET'])
 def get_providers():
     """Get available providers"""
-    bot = get_chatbot()
+    bot = session_bot()
     return jsonify({
         'providers': bot.list_providers(),
-        'current': bot.current_provider
+        'current': bot.current_provider,
+        'cascade': bot.cascade_router() is not None,
+        'websocket': sock is not None
     })
 
 
+@app.route('/api/models', methods=['GET'])
+def get_models():
+    """Models offered by a provider (?provider=, default the current one), from the cached list"""
+    bot = session_bot()
+    provider = request.args.get('provider') or bot.current_provider
+    if provider not in bot.providers:
+        return jsonify({'error': 'Provider not available'}), 400
+    return jsonify({'provider': provider, 'models': bot.list_models(provider)})
+
+
 @app.route('/api/switch-provider', methods=['POST'])
 def switch_provider():
     """Switch AI provider"""
     data = request.json
     provider = data.get('provider')
     
-    bot = get_chatbot()
+    bot = session_bot()
     if bot.set_provider(provider):
+        save_session(session_id(), bot)
         return jsonify({'success': True, 'provider': provider})
     else:
         return jsonify({'success': False, 'error': 'Provider not available'}), 400
 
 
+def _cancel_on_disconnect() -> CancelToken:
+    """
+    A token cancelled when the client closes its connection mid-request
+    
+    Needs the raw socket, which the built-in server exposes as `werkzeug.socket`;
+    under other servers the token is simply never cancelled.
+    """
+    token = CancelToken()
+    connection = request.environ.get('werkzeug.socket')
+    if connection is None:
+        return token
+    finished = g.disconnect_watcher = threading.Event()
+    
+    def watch():
+        while not finished.wait(0.25):
+            try:
+                readable, _, _ = select.select([connection], [], [], 0)
+                # A readable socket with nothing to read has been closed by the peer
+                if readable and not connection.recv(1, socket.MSG_PEEK):
+                    token.cancel('client disconnected')
+                    return
+            except (OSError, ValueError):
+                return
+    
+    threading.Thread(target=watch, name='disconnect-watch', daemon=True).start()
+    return token
+
+
 @app.route('/api/chat', methods=['POST'])
+@scheduled('interactive')
 def chat():
     """Handle chat messages"""
-    data = request.json
+    with tracing.span('web.parse_request'):
+        data = request.json
     message = data.get('message', '')
     provider = data.get('provider')
     
     if not message:
         return jsonify({'error': 'No message provided'}), 400
+    try:
+        options = parse_options(data)
+    except InvalidOptions as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        bot = session_bot()
+        # Unknown models and out-of-range options are rejected before any upstream call
+        error = options and bot.check_options(provider or bot.current_provider, options)
+        if error:
+            return jsonify({'error': error}), 400
+        too_large = bot.oversized(provider or bot.current_provider, message, options)
+        if too_large is not None:
+            return jsonify({'error': str(too_large), 'tokens': too_large.tokens, 'budget': too_large.budget}), 413
+        # A closed tab aborts the upstream request; the partial reply stays in the history
+        try:
+            response = bot.chat(message, provider=provider, cancel=_cancel_on_disconnect(), **options)
+        finally:
+            save_session(session_id(), bot)
+        with tracing.span('web.serialize_response'):
+            return jsonify({
+                'response': response,
+                'provider': provider or bot.current_provider
+            })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/summarize', methods=['POST'])
+@scheduled('batch')
+def summarize():
+    """Summarize text of any length (map-reduce over chunks that fit the provider's context window)"""
+    data = request.json
+    text = data.get('text', '')
+    
+    if not text:
+        return jsonify({'error': 'No text provided'}), 400
+    try:
+        options = parse_options(data)
+    except InvalidOptions as e:
+        return jsonify({'error': str(e)}), 400
     
     try:
         bot = get_chatbot()
-        response = bot.chat(message, provider=provider)
-        return jsonify({
-            'response': response,
-            'provider': provider or bot.current_provider
-        })
+        provider = data.get('provider') or bot.current_provider
+        error = options and bot.check_options(provider, options)
+        if error:
+            return jsonify({'error': error}), 400
+        summary = bot.summarize(text, provider, focus=data.get('focus', ''), cancel=_cancel_on_disconnect(),
+                                **options)
+        if summary.startswith('Error'):
+            return jsonify({'error': summary}), 502
+        return jsonify({'summary': summary, 'provider': provider})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/ensemble', methods=['POST'])
+@scheduled('interactive')
+def ensemble():
+    """Ask several providers and return the agreed answer with per-provider details"""
+    data = request.json
+    message = data.get('message', '')
+    strategy = data.get('strategy', 'auto')
+    
+    if not message:
+        return jsonify({'error': 'No message provided'}), 400
+    if strategy not in ('auto', 'vote', 'judge'):
+        return jsonify({'error': "strategy must be 'auto', 'vote' or 'judge'"}), 400
+    
+    bot = get_chatbot()
+    known = bot.list_providers()
+    providers, quorum, judge = data.get('providers'), data.get('quorum'), data.get('judge')
+    if providers is not None and (not isinstance(providers, list) or not providers
+                                  or any(p not in known for p in providers)):
+        return jsonify({'error': f"providers must be a list of available providers: {', '.join(known)}"}), 400
+    if quorum is not None and (not isinstance(quorum, int) or isinstance(quorum, bool) or quorum < 1):
+        return jsonify({'error': 'quorum must be a whole number of at least 1'}), 400
+    if judge is not None and judge not in known:
+        return jsonify({'error': f"judge must be one of the available providers: {', '.join(known)}"}), 400
+    
+    try:
+        result = bot.ensemble_chat(message, providers=providers, strategy=strategy, quorum=quorum, judge=judge,
+                                   cancel=_cancel_on_disconnect())
+        return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/generate-image', methods=['POST'])
+@scheduled('background')
 def generate_image():
-    """Generate an image"""
+    """
+    Generate images
+    
+    Accepts `prompt` or a list of `prompts`, and `n` images per prompt. With
+    `"stream": true` the results are sent as newline-delimited JSON as each
+    image completes.
+    """
     data = request.json
     prompt = data.get('prompt', '')
+    prompts = data.get('prompts') or ([prompt] if prompt else [])
     
-    if not prompt:
+    if not prompts:
         return jsonify({'error': 'No prompt provided'}), 400
     
+    try:
+        n = int(data.get('n', 1))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'n must be an integer'}), 400
+    if not 1 <= n <= 10 or len(prompts) * n > 40:
+        return jsonify({'error': 'Between 1 and 10 images per prompt, at most 40 per request'}), 400
+    
     try:
         bot = get_chatbot()
-        filepath = bot.generate_image(prompt)
-        filename = Path(filepath).name
-        return jsonify({
-            'success': True,
-            'filepath': filepath,
-            'url': f'/images/{filename}'
-        })
+        if len(prompts) == 1 and n == 1 and not data.get('stream'):
+            filepath = bot.generate_image(prompts[0])
+            return jsonify({
+                'success': True,
+                'filepath': filepath,
+                'url': _media_url('/images', Config.IMAGE_OUTPUT_DIR, filepath)
+            })
+        
+        results = (_image_result(r) for r in bot.generate_images(prompts, n))
+        if data.get('stream'):
+            return Response(stream_with_context(dumps_bytes(r) + b'\n' for r in results),
+                            mimetype='application/x-ndjson')
+        return jsonify({'success': True, 'images': list(results)})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def _image_result(result: dict) -> dict:
+    """Add the download URL to a generated image result"""
+    if 'filepath' in result:
+        result['url'] = _media_url('/images', Config.IMAGE_OUTPUT_DIR, result['filepath'])
+    return result
+
+
+def _media_url(prefix: str, root: Path, filepath: str):
+    """URL of a file in a media store, or None if it is not one (e.g. an error message)"""
+    try:
+        return f"{prefix}/{get_store(root).relative(filepath)}"
+    except ValueError:
+        return None
+
+
 @app.route('/api/generate-video', methods=['POST'])
+@scheduled('background')
 def generate_video():
-    """Generate a video"""
+    """Generate a video (with `"async": true`, return a job to poll instead of waiting)"""
     data = request.json
     prompt = data.get('prompt', '')
     
@@ -112,33 +475,104 @@ def generate_video():
     
     try:
         bot = get_chatbot()
+        if data.get('async'):
+            job = bot.submit_video(prompt)
+            return jsonify(_video_job(job)), 202
         filepath = bot.generate_video(prompt)
-        filename = Path(filepath).name
         return jsonify({
             'success': True,
             'filepath': filepath,
-            'url': f'/videos/{filename}'
+            'url': _media_url('/videos', Config.VIDEO_OUTPUT_DIR, filepath)
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/videos/<job_id>', methods=['GET'])
+def video_job(job_id):
+    """Status of a video job started with async generation"""
+    job = get_chatbot().video_job_status(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(_video_job(job))
+
+
+@app.route('/webhooks/replicate', methods=['POST'])
+def replicate_webhook():
+    """Replicate completion webhook; triggers an immediate status check of the prediction"""
+    data = request.get_json(silent=True) or {}
+    get_chatbot().video_webhook(str(data.get('id', '')))
+    return '', 204
+
+
+def _video_job(job) -> dict:
+    """Client view of a VideoJob or of its to_dict() snapshot"""
+    payload = job if isinstance(job, dict) else job.to_dict()
+    payload['status_url'] = f"/api/videos/{payload['id']}"
+    if payload['filepath']:
+        payload['url'] = _media_url('/videos', Config.VIDEO_OUTPUT_DIR, payload['filepath'])
+    payload['assets'] = {name: _media_url('/videos', Config.VIDEO_OUTPUT_DIR, path)
+                         for name, path in payload['assets'].items()}
+    return payload
+
+
+def _socket_admission():
+    """Scheduler slots for a socket's turns and jobs, accounted to the same tenant as its HTTP requests"""
+    if scheduler is None:
+        return None
+    admitting, tenant = scheduler, _tenant()
+    
+    def admit(priority):
+        budget = DEADLINES.get(priority)
+        return admitting.slot(priority, tenant, time.monotonic() + budget if budget else None)
+    return admit
+
+
+def chat_socket(ws):
+    """One long-lived connection for chat turns, streamed tokens, provider switches and job updates"""
+    sid, bot = session_id(), session_bot()
+    session = ChatSocketSession(bot, ws.send, describe_image=_image_result, describe_video=_video_job,
+                                on_change=lambda: save_session(sid, bot), admit=_socket_admission())
+    session.serve(ws.receive)
+
+
+if sock is not None:
+    sock.route('/ws')(chat_socket)
+
+
+@app.route('/api/history', methods=['GET'])
+def get_history():
+    """Return the current conversation"""
+    bot = session_bot()
+    return jsonify({'provider': bot.current_provider, 'messages': bot.conversation_history})
+
+
 @app.route('/api/reset', methods=['POST'])
 def reset_conversation():
     """Reset conversation history"""
-    get_chatbot().reset_conversation()
+    bot = session_bot()
+    bot.reset_conversation()
+    save_session(session_id(), bot)
     return jsonify({'success': True})
 
 
 @app.route('/images/<path:filename>')
 def serve_image(filename):
     """Serve generated images"""
+    store = get_store(Config.IMAGE_OUTPUT_DIR)
+    if not store.is_media_path(filename):
+        return jsonify({'error': 'Not found'}), 404
+    store.touch(filename)
     return send_from_directory(Config.IMAGE_OUTPUT_DIR, filename)
 
 
 @app.route('/videos/<path:filename>')
 def serve_video(filename):
     """Serve generated videos"""
+    store = get_store(Config.VIDEO_OUTPUT_DIR)
+    if not store.is_media_path(filename):
+        return jsonify({'error': 'Not found'}), 404
+    store.touch(filename)
     return send_from_directory(Config.VIDEO_OUTPUT_DIR, filename)
 
 
@@ -158,6 +592,10 @@ def main():
     # Initialize chatbot
     Config.ensure_output_dirs()
     chatbot = UnifiedAIChatbot()
+    if Config.WARMUP_ENABLED:
+        # Connect to and check every provider before the first request needs it; /readyz
+        # answers 503 until this finishes or WARMUP_DEADLINE passes
+        chatbot.health.start()
     
     # Create templates directory if it doesn't exist
     templates_dir = Path(__file__).parent / 'templates'
@@ -173,6 +611,8 @@ def main():
     print("=" * 60)
     print(f"Available providers: {', '.join(chatbot.list_providers())}")
     print(f"Current provider: {chatbot.current_provider}")
+    if Config.WARMUP_ENABLED:
+        print(f"Warming up providers (at most {Config.WARMUP_DEADLINE:g}s); readiness at /readyz")
     print(f"\nStarting server at http://127.0.0.1:{port}")
     if host == '0.0.0.0':
         print("⚠️  Server is accessible from external networks")